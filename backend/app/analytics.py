@@ -0,0 +1,127 @@
+import importlib.util
+import ipaddress
+import os
+import threading
+import time
+from datetime import datetime
+from app.config import Config
+from app.queries import QueryError, parse_time
+
+# Consultas de tráfego no PostgreSQL, sobre os agregados por minuto do
+# database/init_db.sql (preenchidos pelo database/bulk_loader.py). O SQL
+# fica só no database/analytics.py (carregado de Config.DATABASE_DIR); aqui
+# ficam o pool de conexões, a validação dos parâmetros e o formato JSON. O
+# psycopg2 só é importado na primeira consulta, e sem ele ou sem banco as
+# rotas respondem 503.
+
+MAX_TOP = 100
+
+
+class AnalyticsUnavailable(Exception):
+    pass
+
+
+_pool = None
+_queries = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            try:
+                from psycopg2.pool import ThreadedConnectionPool
+                _pool = ThreadedConnectionPool(1, Config.DB_POOL_SIZE, dbname=Config.DB_NAME, user=Config.DB_USER,
+                                               password=Config.DB_PASSWORD, host=Config.DB_HOST, port=Config.DB_PORT,
+                                               connect_timeout=Config.DB_CONNECT_TIMEOUT)
+            except Exception as e:
+                raise AnalyticsUnavailable(f"Banco de dados indisponível: {e}")
+    return _pool
+
+
+def _get_queries():
+    """
+    Módulo database/analytics.py, carregado pelo caminho (o diretório
+    database/ não é um pacote do backend).
+    """
+    global _queries
+    with _pool_lock:
+        if _queries is None:
+            path = os.path.join(Config.DATABASE_DIR, "analytics.py")
+            try:
+                spec = importlib.util.spec_from_file_location("sehenos_db_analytics", path)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+            except (ImportError, OSError) as e:
+                raise AnalyticsUnavailable(f"Consultas do banco indisponíveis ({path}): {e}")
+            _queries = module
+    return _queries
+
+
+def _query(name, *args):
+    """
+    Executa a consulta `name` do database/analytics.py com uma conexão do pool.
+    """
+    query = getattr(_get_queries(), name)
+    pool = _get_pool()
+    from psycopg2 import Error
+
+    try:
+        conn = pool.getconn()
+    except Error as e:
+        raise AnalyticsUnavailable(f"Banco de dados indisponível: {e}")
+    try:
+        return query(conn, *args)
+    except Error as e:
+        if not conn.closed:
+            conn.rollback()
+        raise AnalyticsUnavailable(f"Erro na consulta ao banco: {e}")
+    finally:
+        # Conexões quebradas são descartadas em vez de voltar ao pool
+        pool.putconn(conn, close=bool(conn.closed))
+
+
+def parse_window(args, default_seconds=3600):
+    """
+    Intervalo [start, end) dos parâmetros start/end (epoch ou ISO 8601);
+    padrão: a última hora.
+    :return: (start, end) como datetime local (mesmo horário dos registros).
+    """
+    end = parse_time(args["end"]) if args.get("end") else time.time()
+    start = parse_time(args["start"]) if args.get("start") else end - default_seconds
+    if start >= end:
+        raise QueryError("start deve ser anterior a end.")
+    return datetime.fromtimestamp(start), datetime.fromtimestamp(end)
+
+
+def top_talkers(start, end, n=10):
+    """
+    Hosts com mais bytes (enviados + recebidos) no intervalo.
+    """
+    if not 1 <= n <= MAX_TOP:
+        raise QueryError(f"n deve estar entre 1 e {MAX_TOP}.")
+    rows = _query("top_talkers", start, end, n)
+    return [{"host": row["host"], "packets": int(row["packets"]), "bytes": int(row["bytes"])} for row in rows]
+
+
+def host_activity(host, start, end):
+    """
+    Tráfego de um host por minuto e par (direção "in"/"out").
+    """
+    try:
+        host = str(ipaddress.ip_address(host))
+    except ValueError:
+        raise QueryError(f"IP inválido: {host}")
+    rows = _query("host_activity", host, start, end)
+    return [dict(row, minute=row["minute"].isoformat()) for row in rows]
+
+
+def loaded_files(names):
+    """
+    Arquivos de backup que o database/bulk_loader.py já carregou por
+    completo (ingest_checkpoints.done).
+    :param names: Nomes dos arquivos (sem diretório).
+    :return: Conjunto com os nomes concluídos.
+    """
+    return _query("loaded_files", names) if names else set()
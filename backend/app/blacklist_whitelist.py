@@ -1,50 +1,200 @@
-from config import Config
+import ipaddress
+import json
+import logging
+import uuid
+from app.config import Config
+from config.redis_config import redis_client
 
-def load_blacklist():
+# As listas ficam em sets do Redis (fonte da verdade, compartilhada entre a
+# API e os processos de captura/detecção). Cada alteração incrementa a
+# versão da lista e publica o delta no canal LIST_CHANNEL; os arquivos de
+# lista servem apenas para popular o Redis na primeira execução.
+LIST_FILES = {
+    "blacklist": Config.BLACKLIST_FILE,
+    "whitelist": Config.WHITELIST_FILE,
+}
+LIST_CHANNEL = "lists:changes"
+IMPORT_CHUNK = 1000
+
+# SADD/SREM + INCR da versão + PUBLISH do delta de forma atômica. A época
+# (KEYS[3]) identifica a instância da lista: se o Redis for limpo
+# (flushdb/clear_data), a versão recomeça do zero com uma época nova e os
+# processos que acompanham a lista sabem que precisam recarregá-la.
+_APPLY_DELTA = redis_client.register_script("""
+local epoch = redis.call('GET', KEYS[3])
+if not epoch then
+    epoch = ARGV[4]
+    redis.call('SET', KEYS[3], epoch)
+end
+local changed
+if ARGV[1] == 'add' then
+    changed = redis.call('SADD', KEYS[1], unpack(ARGV, 5))
+else
+    changed = redis.call('SREM', KEYS[1], unpack(ARGV, 5))
+end
+local version = redis.call('INCR', KEYS[2])
+redis.call('PUBLISH', ARGV[2], cjson.encode({list = ARGV[3], action = ARGV[1], version = version,
+                                              epoch = epoch, entries = {unpack(ARGV, 5)}}))
+return {changed, version}
+""")
+
+
+def list_key(name):
+    return f"lists:{name}"
+
+
+def version_key(name):
+    return f"lists:{name}:version"
+
+
+def epoch_key(name):
+    return f"lists:{name}:epoch"
+
+
+def normalize_entry(entry):
     """
-    Carrega a blacklist do arquivo.
+    Valida e normaliza um IP ou rede CIDR ("10.0.0.1", "10.0.0.0/8").
+    IPs individuais são guardados sem o prefixo.
     """
-    try:
-        with open(Config.BLACKLIST_FILE, 'r') as f:
-            return set(line.strip() for line in f)
-    except FileNotFoundError:
-        return set()
+    network = ipaddress.ip_network(str(entry).strip(), strict=False)
+    if network.num_addresses == 1:
+        return str(network.network_address)
+    return str(network)
 
-def load_whitelist():
+
+def normalize_entries(entries, source=None):
+    """
+    Normaliza várias entradas, ignorando (com aviso) as inválidas.
+    :param source: Origem das entradas, para o log (ex.: arquivo da lista).
+    :return: Conjunto de entradas normalizadas.
     """
-    Carrega a whitelist do arquivo.
+    normalized = set()
+    for entry in entries:
+        try:
+            normalized.add(normalize_entry(entry))
+        except ValueError:
+            logging.warning(f"Entrada inválida ignorada em {source or 'lista'}: {entry!r}")
+    return normalized
+
+
+def load_from_file(file_path):
+    """
+    Carrega uma lista do arquivo.
     """
     try:
-        with open(Config.WHITELIST_FILE, 'r') as f:
-            return set(line.strip() for line in f)
+        with open(file_path, 'r') as f:
+            return set(line.strip() for line in f if line.strip() and not line.startswith("#"))
     except FileNotFoundError:
         return set()
 
-def save_to_file(file_path, data):
+
+def seed_list(name):
     """
-    Salva uma lista no arquivo.
+    Popula o set do Redis com o arquivo da lista, apenas se a lista ainda
+    não existir no Redis.
     """
-    with open(file_path, 'w') as f:
-        f.writelines(f"{item}\n" for item in data)
+    if not redis_client.set(version_key(name), 0, nx=True):
+        return
+    redis_client.set(epoch_key(name), uuid.uuid4().hex)
+    entries = sorted(normalize_entries(load_from_file(LIST_FILES[name]), LIST_FILES[name]))
+    pipe = redis_client.pipeline(transaction=False)
+    for i in range(0, len(entries), IMPORT_CHUNK):
+        pipe.sadd(list_key(name), *entries[i:i + IMPORT_CHUNK])
+    pipe.execute()
+
+
+def versioned_snapshot(name):
+    """
+    Retorna (época, versão, entradas) da lista de forma consistente.
+    """
+    seed_list(name)
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.get(epoch_key(name))
+    pipe.get(version_key(name))
+    pipe.smembers(list_key(name))
+    epoch, version, members = pipe.execute()
+    return (epoch.decode() if epoch else None, int(version or 0),
+            {m.decode() if isinstance(m, bytes) else m for m in members})
+
+
+def list_snapshot(name):
+    """
+    Retorna (versão, entradas) da lista de forma consistente.
+    """
+    return versioned_snapshot(name)[1:]
+
+
+def list_state(name):
+    """
+    Retorna (época, versão) da lista sem ler as entradas.
+    """
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.get(epoch_key(name))
+    pipe.get(version_key(name))
+    epoch, version = pipe.execute()
+    return epoch.decode() if epoch else None, int(version or 0)
+
+
+def update_list(name, entries, action):
+    """
+    Aplica um delta (add/remove) a uma lista.
+    :param name: 'blacklist' ou 'whitelist'.
+    :param entries: IPs ou redes CIDR.
+    :param action: 'add' ou 'remove'.
+    :return: (quantidade alterada, nova versão).
+    """
+    if name not in LIST_FILES:
+        raise ValueError(f"Lista desconhecida: {name}")
+    if action not in ("add", "remove"):
+        raise ValueError(f"Ação inválida: {action}")
+    entries = sorted({normalize_entry(e) for e in entries})
+    if not entries:
+        return 0, list_snapshot(name)[0]
+
+    seed_list(name)
+    changed = 0
+    version = 0
+    # Importações grandes são enviadas em blocos, cada um com sua versão
+    for i in range(0, len(entries), IMPORT_CHUNK):
+        chunk = entries[i:i + IMPORT_CHUNK]
+        count, version = _APPLY_DELTA(
+            keys=[list_key(name), version_key(name), epoch_key(name)],
+            args=[action, LIST_CHANNEL, name, uuid.uuid4().hex, *chunk],
+        )
+        changed += count
+    return changed, version
+
+
+def load_blacklist():
+    """
+    Carrega a blacklist do Redis.
+    """
+    return list_snapshot("blacklist")[1]
+
+
+def load_whitelist():
+    """
+    Carrega a whitelist do Redis.
+    """
+    return list_snapshot("whitelist")[1]
+
 
 def update_blacklist(ip, action):
     """
     Adiciona ou remove um IP da blacklist.
     """
-    blacklist = load_blacklist()
-    if action == "add":
-        blacklist.add(ip)
-    elif action == "remove":
-        blacklist.discard(ip)
-    save_to_file(Config.BLACKLIST_FILE, blacklist)
+    return update_list("blacklist", [ip], action)
+
 
 def update_whitelist(ip, action):
     """
     Adiciona ou remove um IP da whitelist.
     """
-    whitelist = load_whitelist()
-    if action == "add":
-        whitelist.add(ip)
-    elif action == "remove":
-        whitelist.discard(ip)
-    save_to_file(Config.WHITELIST_FILE, whitelist)
+    return update_list("whitelist", [ip], action)
+
+
+def parse_delta(message):
+    """
+    Decodifica uma mensagem publicada em LIST_CHANNEL.
+    """
+    return json.loads(message)
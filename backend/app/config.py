@@ -1,15 +1,172 @@
 import os
+import socket
 
 class Config:
     # Configurações Redis
     REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT = int(os.getenv("REDIS_PORT", 6380))
     REDIS_DB = int(os.getenv("REDIS_DB", 0))
+    REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "")
+    # Socket unix (ex.: /run/redis/redis.sock); quando definido substitui host/porta
+    REDIS_SOCKET = os.getenv("REDIS_SOCKET", "")
+    # Parser das respostas: "auto" (hiredis se instalado), "hiredis" ou "python"
+    REDIS_PARSER = os.getenv("REDIS_PARSER", "auto")
+    # Pool por processo: conexões no máximo e espera (s) por uma conexão livre
+    REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 32))
+    REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 10))
+    # Timeouts (s); o de leitura deve ser maior que os bloqueios de XREAD
+    # (STREAM_BLOCK_MS); 0 = sem timeout
+    REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 30))
+    REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 5))
+    # PING antes de usar uma conexão ociosa há mais de N s
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+    # Reconexão: tentativas e backoff exponencial com jitter (s)
+    REDIS_RETRIES = int(os.getenv("REDIS_RETRIES", 3))
+    REDIS_RETRY_BASE = float(os.getenv("REDIS_RETRY_BASE", 0.05))
+    REDIS_RETRY_CAP = float(os.getenv("REDIS_RETRY_CAP", 2))
+    # Itens por comando nas escritas/leituras em bloco (bulk_push, range_chunks)
+    REDIS_BULK_CHUNK = int(os.getenv("REDIS_BULK_CHUNK", 1000))
+
+    # PostgreSQL (consultas de /analytics sobre os agregados do init_db.sql)
+    DB_NAME = os.getenv("DB_NAME", "sehenos-db")
+    DB_USER = os.getenv("DB_USER", "cypher")
+    DB_PASSWORD = os.getenv("DB_PASSWORD", "piswos")
+    DB_HOST = os.getenv("DB_HOST", "localhost")
+    DB_PORT = int(os.getenv("DB_PORT", 5432))
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 4))
+    DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", 5))
+    # Diretório do database/ (analytics.py com as consultas SQL compartilhadas
+    # com o bulk_loader); no Docker, montado em /database
+    DATABASE_DIR = os.getenv("DATABASE_DIR", os.path.join(os.path.dirname(__file__), "..", "..", "database"))
+
+    # Captura de pacotes ("ring" = AF_PACKET TPACKET_V3, "scapy" ou "pcap")
+    CAPTURE_BACKEND = os.getenv("CAPTURE_BACKEND", "ring")
+    CAPTURE_INTERFACE = os.getenv("CAPTURE_INTERFACE", "eth0")
+    CAPTURE_PCAP = os.getenv("CAPTURE_PCAP", "")
+    RING_BLOCK_SIZE = int(os.getenv("RING_BLOCK_SIZE", 1 << 20))
+    RING_BLOCK_NR = int(os.getenv("RING_BLOCK_NR", 64))
+    RING_FRAME_SIZE = int(os.getenv("RING_FRAME_SIZE", 2048))
+    RING_TIMEOUT_MS = int(os.getenv("RING_TIMEOUT_MS", 100))
+
+    # Escritor em lote da captura (fila -> pipeline Redis)
+    WRITER_QUEUE_SIZE = int(os.getenv("WRITER_QUEUE_SIZE", 50000))
+    WRITER_BATCH_SIZE = int(os.getenv("WRITER_BATCH_SIZE", 500))
+    WRITER_FLUSH_INTERVAL = float(os.getenv("WRITER_FLUSH_INTERVAL", 0.5))
+
+    # Transporte captura -> detecção (Redis Streams com grupo de consumidores)
+    PACKET_STREAM = os.getenv("PACKET_STREAM", "network_packets")
+    STREAM_MAXLEN = int(os.getenv("STREAM_MAXLEN", 200000))
+    STREAM_GROUP = os.getenv("STREAM_GROUP", "detectors")
+    STREAM_CONSUMER = os.getenv("STREAM_CONSUMER", socket.gethostname())
+    # Tamanho de cada leitura do stream (e inicial dos lotes da detecção)
+    STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 5000))
+    STREAM_BLOCK_MS = int(os.getenv("STREAM_BLOCK_MS", 5000))
+    STREAM_CLAIM_IDLE = float(os.getenv("STREAM_CLAIM_IDLE", 60))
+    # Lotes adaptativos da detecção (core.batching): o tamanho parte de
+    # STREAM_BATCH_SIZE e varia entre BATCH_MIN_SIZE e BATCH_MAX_SIZE;
+    # BATCH_POLICY = "latency", "balanced" ou "throughput"
+    BATCH_MAX_LATENCY_MS = float(os.getenv("BATCH_MAX_LATENCY_MS", 500))
+    BATCH_MIN_SIZE = int(os.getenv("BATCH_MIN_SIZE", 256))
+    BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 50000))
+    BATCH_POLICY = os.getenv("BATCH_POLICY", "balanced")
+    # Processos detectores (um shard do stream por processo, por hash src/dst)
+    DETECTOR_WORKERS = int(os.getenv("DETECTOR_WORKERS", os.cpu_count() or 1))
+    WORKER_RESTART_DELAY = float(os.getenv("WORKER_RESTART_DELAY", 1))
+    # Paginação da API: itens por página (padrão e máximo) e quantas entradas
+    # uma requisição filtrada examina antes de devolver o cursor
+    PACKETS_API_LIMIT = int(os.getenv("PACKETS_API_LIMIT", 1000))
+    ANOMALIES_API_LIMIT = int(os.getenv("ANOMALIES_API_LIMIT", 1000))
+    API_MAX_LIMIT = int(os.getenv("API_MAX_LIMIT", 10000))
+    API_SCAN_LIMIT = int(os.getenv("API_SCAN_LIMIT", 200000))
+    API_SCAN_CHUNK = int(os.getenv("API_SCAN_CHUNK", 1000))
+    # Retenção (s) dos registros de anomalia e dos índices por IP e minuto
+    ANOMALY_RETENTION = int(os.getenv("ANOMALY_RETENTION", 7 * 24 * 3600))
+
+    # Feed ao vivo das anomalias (SSE em /anomalies/stream): lotes mantidos
+    # no stream para retomada (Last-Event-ID), eventos em memória, janela de
+    # agrupamento de rajadas e intervalo dos heartbeats
+    ANOMALY_FEED_MAXLEN = int(os.getenv("ANOMALY_FEED_MAXLEN", 10000))
+    SSE_BUFFER = int(os.getenv("SSE_BUFFER", 1000))
+    SSE_REPLAY_LIMIT = int(os.getenv("SSE_REPLAY_LIMIT", 1000))
+    SSE_COALESCE_MS = int(os.getenv("SSE_COALESCE_MS", 250))
+    SSE_HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", 15))
+
+    # Resolução reversa de DNS (cache LRU+TTL e pool de consultas)
+    RDNS_CACHE_SIZE = int(os.getenv("RDNS_CACHE_SIZE", 10000))
+    RDNS_TTL = float(os.getenv("RDNS_TTL", 3600))
+    RDNS_NEGATIVE_TTL = float(os.getenv("RDNS_NEGATIVE_TTL", 300))
+    RDNS_WORKERS = int(os.getenv("RDNS_WORKERS", 4))
+    RDNS_MAX_INFLIGHT = int(os.getenv("RDNS_MAX_INFLIGHT", 256))
+    RDNS_TIMEOUT = float(os.getenv("RDNS_TIMEOUT", 1.0))
+
+    # Intervalo (s) entre logs de estatísticas dos processos
+    STATS_INTERVAL = float(os.getenv("STATS_INTERVAL", 60))
+
+    # Telemetria do sistema (/system_info e /system_info/history): intervalo
+    # de amostragem (s), amostras no buffer circular (1 h com 2 s), pontos
+    # padrão do histórico, disco medido e diretório das zonas térmicas
+    SYSTEM_SAMPLE_INTERVAL = float(os.getenv("SYSTEM_SAMPLE_INTERVAL", 2))
+    SYSTEM_HISTORY_SIZE = int(os.getenv("SYSTEM_HISTORY_SIZE", 1800))
+    SYSTEM_HISTORY_POINTS = int(os.getenv("SYSTEM_HISTORY_POINTS", 300))
+    SYSTEM_DISK_PATH = os.getenv("SYSTEM_DISK_PATH", "/")
+    THERMAL_DIR = os.getenv("THERMAL_DIR", "/sys/class/thermal")
+
+    # Métricas (core.metrics): publicação do snapshot de cada processo no
+    # Redis a cada METRICS_INTERVAL s, lido pelo /metrics da API
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", 10))
+
+    # Detecção ("flow" = modelos sobre registros de fluxo, "packet" = por pacote)
+    DETECTION_MODE = os.getenv("DETECTION_MODE", "flow")
+    FLOW_IDLE_TIMEOUT = float(os.getenv("FLOW_IDLE_TIMEOUT", 30))
+    FLOW_ACTIVE_TIMEOUT = float(os.getenv("FLOW_ACTIVE_TIMEOUT", 300))
+    FLOW_MAX_FLOWS = int(os.getenv("FLOW_MAX_FLOWS", 100000))
+    # Espera (s) após o RST ou o segundo FIN antes de emitir o fluxo
+    FLOW_CLOSE_LINGER = float(os.getenv("FLOW_CLOSE_LINGER", 2))
+    # Escalonador persistente, um por shard (scaler-<shard>.pkl, partindo do
+    # scaler.pkl ajustado offline se existir), atualizado a cada lote e salvo
+    # junto dos modelos; com SCALER_UPDATE=false o escalonador fica congelado
+    SCALER_UPDATE = os.getenv("SCALER_UPDATE", "true").lower() == "true"
+    SCALER_SAVE_INTERVAL = float(os.getenv("SCALER_SAVE_INTERVAL", 300))
+    # Limiares da detecção. Em cascata, a pontuação do PCA (erro de
+    # reconstrução e T², baratos) decide quais linhas seguem para o Isolation
+    # Forest e o autoencoder; sem CASCADE_PCA_THRESHOLD usa o limiar
+    # calibrado no treino para que os níveis 2 ainda vejam a fração
+    # CASCADE_RECALL das linhas que o pipeline completo marca nos dados de treino
+    AUTOENCODER_THRESHOLD = float(os.getenv("AUTOENCODER_THRESHOLD", 0.05))
+    DETECTION_CASCADE = os.getenv("DETECTION_CASCADE", "false").lower() == "true"
+    CASCADE_PCA_THRESHOLD = float(os.getenv("CASCADE_PCA_THRESHOLD")) if os.getenv("CASCADE_PCA_THRESHOLD") else None
+    CASCADE_RECALL = float(os.getenv("CASCADE_RECALL", 0.99))
+    # Linhas por bloco no forward em NumPy do autoencoder
+    INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", 4096))
 
     # Caminhos de arquivos
     BACKUP_DIR = os.getenv("BACKUP_DIR", "backup")
+    # Backup em segmentos: registros por bloco lido do Redis, rotação do
+    # segmento por tamanho (bytes comprimidos) ou idade (s) e intervalo (s)
+    BACKUP_CHUNK = int(os.getenv("BACKUP_CHUNK", 5000))
+    BACKUP_SEGMENT_BYTES = int(os.getenv("BACKUP_SEGMENT_BYTES", 64 * 1024 * 1024))
+    BACKUP_SEGMENT_AGE = float(os.getenv("BACKUP_SEGMENT_AGE", 3600))
+    BACKUP_INTERVAL = float(os.getenv("BACKUP_INTERVAL", 180))
+    # Backups manuais da API, fora do diretório lido pelo bulk_loader e pela
+    # conversão Parquet (não duplicam os segmentos do BackupJob)
+    BACKUP_SNAPSHOT_DIR = os.getenv("BACKUP_SNAPSHOT_DIR", os.path.join(BACKUP_DIR, "snapshots"))
+    # Formato final dos backups: "ndjson" ou "parquet" (segmentos finalizados
+    # convertidos em arquivos por hora com manifesto; requer pyarrow)
+    BACKUP_FORMAT = os.getenv("BACKUP_FORMAT", "ndjson").lower()
+    BACKUP_PARQUET_DIR = os.getenv("BACKUP_PARQUET_DIR", os.path.join(BACKUP_DIR, "parquet"))
+    BACKUP_PARQUET_COMPRESSION = os.getenv("BACKUP_PARQUET_COMPRESSION", "zstd")
+    BACKUP_ROW_GROUP = int(os.getenv("BACKUP_ROW_GROUP", 65536))
+    # Taxa de falsos positivos do filtro de Bloom dos IPs no manifesto
+    BACKUP_BLOOM_FPR = float(os.getenv("BACKUP_BLOOM_FPR", 0.01))
+    MODEL_DIR = os.getenv("MODEL_DIR", "/home/zrdax/SehenOS/backend/models/pipes/")
     BLACKLIST_FILE = os.getenv("BLACKLIST_FILE", "/home/zrdax/SehenOS/backend/list/blacklist.txt")  
     WHITELIST_FILE = os.getenv("WHITELIST_FILE", "/home/zrdax/SehenOS/backend/list/whitelist.txt")
+    REPUTATION_CACHE = os.getenv("REPUTATION_CACHE", "/home/zrdax/SehenOS/backend/list/remote_blacklist.npz")
+    REPUTATION_CACHE_MAX_AGE = float(os.getenv("REPUTATION_CACHE_MAX_AGE", 86400))
+    # Intervalo (s) da conferência de versão/época das listas com o Redis
+    # (detecta flushdb, reconexões e mensagens perdidas sem novas edições)
+    LIST_SYNC_INTERVAL = float(os.getenv("LIST_SYNC_INTERVAL", 30))
 
     # Logs
     LOG_FILE = os.getenv("LOG_FILE", "/home/zrdax/SehenOS/backend/logs/system.log")
@@ -0,0 +1,164 @@
+import logging
+import threading
+import time
+from collections import deque
+from app.config import Config
+from core.anomaly_index import FEED_FIELD, FEED_STREAM
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _id_key(entry_id):
+    ms, _, seq = _decode(entry_id).partition("-")
+    return int(ms), int(seq or 0)
+
+
+def _merge(batches):
+    # Concatena arrays JSON ("[...]") sem decodificar as anomalias
+    items = [batch[1:-1] for batch in batches if len(batch) > 2]
+    return b"[" + b",".join(items) + b"]"
+
+
+def format_event(event_id, data):
+    return b"id: " + event_id.encode() + b"\ndata: " + data + b"\n\n"
+
+
+class AnomalyBroadcaster:
+    """
+    Feed de anomalias para os clientes SSE.
+
+    Uma única thread lê o stream anomalies:feed (XREAD BLOCK) e guarda os
+    eventos recentes em memória; os clientes apenas esperam na mesma
+    condição, sem conexão ao Redis nem thread própria (com o worker gevent
+    do gunicorn cada cliente é um greenlet). Lotes que chegam dentro de
+    coalesce_ms viram um único evento, cujo id é o id da última entrada do
+    stream, usado na retomada por Last-Event-ID.
+    """
+
+    def __init__(self, redis_client, stream=FEED_STREAM, buffer=None, coalesce_ms=None, block_ms=5000,
+                 replay_limit=None):
+        self.redis_client = redis_client
+        self.stream = stream
+        self.coalesce = (Config.SSE_COALESCE_MS if coalesce_ms is None else coalesce_ms) / 1000
+        self.block_ms = block_ms
+        self.replay_limit = replay_limit or Config.SSE_REPLAY_LIMIT
+        # (chave do primeiro id, chave do último id, último id, dados)
+        self.events = deque(maxlen=buffer or Config.SSE_BUFFER)
+        self.last_id = None
+        # Chave da última entrada já publicada para os clientes
+        self.position = None
+        self.clients = 0
+        self._condition = threading.Condition()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                latest = self.redis_client.xrevrange(self.stream, "+", "-", count=1)
+                self.last_id = _decode(latest[0][0]) if latest else "0-0"
+                self.position = _id_key(self.last_id)
+                self._thread = threading.Thread(target=self._run, name="anomaly-feed", daemon=True)
+                self._thread.start()
+        return self
+
+    def _read(self, block_ms):
+        response = self.redis_client.xread({self.stream: self.last_id}, block=block_ms)
+        entries = response[0][1] if response else []
+        if entries:
+            self.last_id = _decode(entries[-1][0])
+        return entries
+
+    def _run(self):
+        while True:
+            try:
+                entries = self._read(self.block_ms)
+                if not entries:
+                    continue
+                # Rajada: continuar lendo até fechar a janela de agrupamento
+                deadline = time.monotonic() + self.coalesce
+                while (remaining := deadline - time.monotonic()) > 0:
+                    more = self._read(max(1, int(remaining * 1000)))
+                    if not more:
+                        break
+                    entries += more
+                self._publish(entries)
+            except Exception as e:
+                logging.error(f"Erro ao ler o feed de anomalias: {e}")
+                time.sleep(1)
+
+    def _publish(self, entries):
+        data = _merge([fields.get(FEED_FIELD, b"[]") for _, fields in entries])
+        last_id = _decode(entries[-1][0])
+        with self._condition:
+            self.events.append((_id_key(entries[0][0]), _id_key(last_id), last_id, data))
+            self.position = _id_key(last_id)
+            self._condition.notify_all()
+
+    def _replay(self, after_id):
+        # Eventos que já saíram da memória: reler do stream (até replay_limit lotes)
+        entries = self.redis_client.xrange(self.stream, f"({after_id}", "+", count=self.replay_limit)
+        if not entries:
+            return None
+        data = _merge([fields.get(FEED_FIELD, b"[]") for _, fields in entries])
+        return _decode(entries[-1][0]), data
+
+    def _pending(self, events, cursor, cursor_id):
+        """
+        Eventos depois do cursor, agrupados em um só: (último id, dados) ou None.
+        """
+        if cursor >= self.position:
+            return None
+        if cursor_id is not None and (not events or cursor < events[0][0]):
+            replayed = self._replay(cursor_id)
+            if replayed is None:
+                return None
+            # O stream alcançou a memória: completar com os eventos restantes
+            cursor = _id_key(replayed[0])
+            newer = [event for event in events if event[1] > cursor]
+            if not newer:
+                return replayed
+            return newer[-1][2], _merge([replayed[1]] + [event[3] for event in newer])
+        newer = [event for event in events if event[1] > cursor]
+        if not newer:
+            return None
+        return newer[-1][2], _merge([event[3] for event in newer])
+
+    def subscribe(self, last_event_id=None, heartbeat=None):
+        """
+        Gerador de eventos SSE (bytes) para um cliente.
+        :param last_event_id: Id do último evento recebido (retomada); sem ele
+                              o cliente recebe apenas as anomalias novas.
+        :param heartbeat: Intervalo (s) dos comentários que mantêm a conexão.
+        """
+        self.start()
+        heartbeat = heartbeat or Config.SSE_HEARTBEAT
+        if last_event_id:
+            try:
+                cursor = _id_key(last_event_id)
+            except ValueError:
+                last_event_id, cursor = None, self.position
+        else:
+            cursor = self.position
+        cursor_id = last_event_id
+
+        self.clients += 1
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                with self._condition:
+                    if cursor >= self.position:
+                        self._condition.wait(heartbeat)
+                    events = list(self.events)
+                # Releitura do stream (se necessária) fora da condição
+                pending = self._pending(events, cursor, cursor_id)
+                if pending is None:
+                    yield b": ping\n\n"
+                    continue
+                cursor_id, data = pending
+                cursor = _id_key(cursor_id)
+                yield format_event(cursor_id, data)
+        finally:
+            self.clients -= 1
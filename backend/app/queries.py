@@ -0,0 +1,279 @@
+import ipaddress
+import json
+from datetime import datetime
+from itertools import islice
+import numpy as np
+from app.config import Config
+from core.anomaly_index import fetch_records, ip_entries, time_entries
+from core.packet_stream import merged_records_reverse
+from core.record import decode_batch, decode_record, to_json_safe
+
+# Consultas paginadas de /packets e /anomalies.
+#
+# As páginas vão da entrada mais recente para a mais antiga; cada página é
+# devolvida em ordem cronológica junto com o cursor da próxima (mais
+# antiga). Os itens saem já serializados em JSON (bytes): anomalias sem
+# projeção são repassadas exatamente como estão no Redis.
+
+PROTOCOLS = {"icmp": 1, "tcp": 6, "udp": 17, "icmpv6": 58}
+FILTERS = ("ip", "port", "protocol", "start", "end")
+
+# Atraso máximo (s) entre a captura de um pacote e a gravação no stream; os
+# ids do stream são o horário da gravação e limitam a busca por tempo
+WRITE_DELAY_SLACK = 60
+
+
+class QueryError(ValueError):
+    pass
+
+
+def parse_time(value):
+    """
+    Epoch em segundos ou data ISO 8601 (horário local, como os registros).
+    """
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise QueryError(f"Data inválida: {value}")
+
+
+def _int_arg(args, name, default=None):
+    value = args.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise QueryError(f"Parâmetro {name} inválido: {value}")
+
+
+def parse_query(args, default_limit):
+    """
+    Lê paginação, filtros e projeção dos parâmetros da requisição.
+    :param args: request.args (limit, cursor, ip, port, protocol, from, to, fields).
+    :param default_limit: Itens por página quando limit não é informado.
+    """
+    limit = _int_arg(args, "limit", default_limit)
+    if not 0 < limit <= Config.API_MAX_LIMIT:
+        raise QueryError(f"limit deve estar entre 1 e {Config.API_MAX_LIMIT}.")
+
+    ip = args.get("ip") or None
+    if ip:
+        try:
+            ip = str(ipaddress.ip_address(ip))
+        except ValueError:
+            raise QueryError(f"IP inválido: {ip}")
+
+    protocol = args.get("protocol") or None
+    if protocol:
+        protocol = PROTOCOLS.get(protocol.lower()) or _int_arg(args, "protocol")
+
+    fields = [f for f in (args.get("fields") or "").split(",") if f] or None
+    return {
+        "limit": limit,
+        "cursor": args.get("cursor") or None,
+        "ip": ip,
+        "port": _int_arg(args, "port"),
+        "protocol": protocol,
+        "start": parse_time(args["from"]) if args.get("from") else None,
+        "end": parse_time(args["to"]) if args.get("to") else None,
+        "fields": fields,
+    }
+
+
+def _project(item, fields):
+    return {name: item[name] for name in fields if name in item} if fields else item
+
+
+def _packet_mask(batch, query):
+    mask = np.ones(len(batch["timestamp"]), dtype=bool)
+    if query["ip"]:
+        mask &= (batch["src_ip"] == query["ip"]) | (batch["dst_ip"] == query["ip"])
+    if query["port"] is not None:
+        mask &= (batch["src_port"] == query["port"]) | (batch["dst_port"] == query["port"])
+    if query["protocol"] is not None:
+        mask &= batch["protocol"] == query["protocol"]
+    if query["start"] is not None:
+        mask &= batch["timestamp"] >= query["start"]
+    if query["end"] is not None:
+        mask &= batch["timestamp"] <= query["end"]
+    return mask
+
+
+def _id_ms(entry_id):
+    return int(entry_id.lstrip("(").split("-", 1)[0])
+
+
+def _packet_cursor(cursor, shards):
+    """
+    Cursor "id|shard" da última entrada examinada (um id sem shard, de
+    versões antigas, vale para todos os shards).
+    :return: (id, shard).
+    """
+    entry_id, _, shard = cursor.partition("|")
+    try:
+        ms, seq = entry_id.split("-")
+        int(ms), int(seq)
+        return entry_id, int(shard) if shard else shards
+    except ValueError:
+        raise QueryError(f"Cursor inválido: {cursor}")
+
+
+def packet_page(redis_client, streams, query):
+    """
+    Página de pacotes dos streams (shards), filtrada no lote decodificado.
+    O cursor é "id|shard" da última entrada examinada: cada shard gera os
+    seus ids, então o mesmo id pode existir em mais de um; na ordem (id,
+    shard) decrescente, os shards de índice menor ainda têm esse id pela
+    frente (limite inclusivo) e os demais não (exclusivo).
+    :return: (itens JSON em bytes, cursor da próxima página ou None).
+    """
+    end = "+"
+    if query["end"] is not None:
+        end = f"{int((query['end'] + WRITE_DELAY_SLACK) * 1000)}-0"
+    ends = [end] * len(streams)
+    if query["cursor"]:
+        cursor_id, cursor_shard = _packet_cursor(query["cursor"], len(streams))
+        if end == "+" or _id_ms(cursor_id) < _id_ms(end):
+            ends = [cursor_id if shard < cursor_shard else f"({cursor_id}" for shard in range(len(streams))]
+    # Pacote capturado em t só é gravado depois de t: limite inferior exato
+    start = f"{int(query['start'] * 1000)}-0" if query["start"] is not None else "-"
+
+    items = []
+    scanned = 0
+    chunk = Config.API_SCAN_CHUNK
+    entries = merged_records_reverse(redis_client, streams, ends, start, chunk)
+    while True:
+        examined = list(islice(entries, chunk))
+        if not examined:
+            return items[::-1], None
+        # Entradas sem registro (removidas) são puladas, sem encerrar a busca
+        block = [entry for entry in examined if entry[2] is not None]
+        cursors = [f"{entry_id}|{shard}" for entry_id, shard, _ in block]
+        records = [record for _, _, record in block]
+        mask = _packet_mask(decode_batch(records), query) if records else []
+        for i in np.flatnonzero(mask):
+            item = _project(to_json_safe(decode_record(records[i])), query["fields"])
+            items.append(json.dumps(item).encode())
+            if len(items) == query["limit"]:
+                return items[::-1], cursors[i]
+        scanned += len(examined)
+        if scanned >= Config.API_SCAN_LIMIT:
+            # Orçamento da requisição esgotado: o cliente continua pelo cursor
+            entry_id, shard, _ = examined[-1]
+            return items[::-1], f"{entry_id}|{shard}"
+
+
+def _anomaly_match(raw, query):
+    anomaly = json.loads(raw)
+    if query["ip"] and query["ip"] not in (anomaly.get("src_ip"), anomaly.get("dst_ip")):
+        return False
+    if query["port"] is not None and query["port"] not in (anomaly.get("src_port"), anomaly.get("dst_port")):
+        return False
+    if query["protocol"] is not None and anomaly.get("protocol") != query["protocol"]:
+        return False
+    if query["start"] is not None or query["end"] is not None:
+        timestamp = anomaly.get("timestamp")
+        if timestamp is None:
+            return False
+        timestamp = parse_time(str(timestamp))
+        if query["start"] is not None and timestamp < query["start"]:
+            return False
+        if query["end"] is not None and timestamp > query["end"]:
+            return False
+    return True
+
+
+def _index_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        score, member = cursor.split("|", 1)
+        return float(score), member
+    except ValueError:
+        raise QueryError(f"Cursor inválido: {cursor}")
+
+
+def indexed_anomaly_page(redis_client, query):
+    """
+    Página de anomalias pelos índices secundários (core.anomaly_index): ZSET
+    do IP ou baldes de minuto, em O(log n + k). Os demais filtros são
+    aplicados nos registros encontrados. O cursor é "score|id" da última
+    anomalia examinada.
+    :return: (itens JSON em bytes, cursor da próxima página ou None).
+    """
+    after = _index_cursor(query["cursor"])
+    if query["ip"]:
+        entries = ip_entries(redis_client, query["ip"], query["start"], query["end"], after)
+    else:
+        entries = time_entries(redis_client, query["start"], query["end"], after)
+    rest = dict(query, ip=None, start=None, end=None)
+    filtered = any(rest[name] is not None for name in FILTERS)
+
+    items = []
+    scanned = 0
+    chunk = Config.API_SCAN_CHUNK if filtered else query["limit"]
+    while True:
+        block = list(islice(entries, chunk))
+        if not block:
+            return items[::-1], None
+        for (score, member), raw in zip(block, fetch_records(redis_client, [member for _, member in block])):
+            # Registro expirado ainda presente no índice
+            if raw is None or (filtered and not _anomaly_match(raw, rest)):
+                continue
+            items.append(json.dumps(_project(json.loads(raw), query["fields"])).encode() if query["fields"] else raw)
+            if len(items) == query["limit"]:
+                return items[::-1], f"{score!r}|{member}"
+        scanned += len(block)
+        if scanned >= Config.API_SCAN_LIMIT:
+            score, member = block[-1]
+            return items[::-1], f"{score!r}|{member}"
+
+
+def anomaly_page(redis_client, key, query):
+    """
+    Página de anomalias da lista (rpush: a mais recente no fim). O cursor é
+    o índice absoluto da próxima entrada a examinar, contando as entradas já
+    arquivadas e removidas do início pelo backup (<chave>:trimmed); índices
+    não mudam com novos rpush nem com a remoção. Consultas por IP ou
+    intervalo de tempo usam os índices (indexed_anomaly_page).
+    :return: (itens JSON em bytes, cursor da próxima página ou None).
+    """
+    if query["ip"] or query["start"] is not None or query["end"] is not None:
+        return indexed_anomaly_page(redis_client, query)
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.get(f"{key}:trimmed")
+    pipe.llen(key)
+    trimmed, length = pipe.execute()
+    trimmed = int(trimmed or 0)
+    end = length - 1
+    if query["cursor"]:
+        try:
+            end = min(int(query["cursor"]) - trimmed, end)
+        except ValueError:
+            raise QueryError(f"Cursor inválido: {query['cursor']}")
+    filtered = any(query[name] is not None for name in FILTERS)
+
+    items = []
+    scanned = 0
+    chunk = Config.API_SCAN_CHUNK
+    while end >= 0:
+        start = max(0, end - chunk + 1)
+        raws = redis_client.lrange(key, start, end)
+        for offset in range(len(raws) - 1, -1, -1):
+            raw = raws[offset]
+            if filtered and not _anomaly_match(raw, query):
+                continue
+            items.append(json.dumps(_project(json.loads(raw), query["fields"])).encode() if query["fields"] else raw)
+            if len(items) == query["limit"]:
+                index = start + offset
+                return items[::-1], str(trimmed + index - 1) if index > 0 else None
+        scanned += len(raws)
+        end = start - 1
+        if scanned >= Config.API_SCAN_LIMIT and end >= 0:
+            return items[::-1], str(trimmed + end)
+    return items[::-1], None
@@ -1,34 +1,123 @@
-from flask import Flask, Blueprint, jsonify, request
-from redis import Redis
-from blacklist_whitelist import update_blacklist, update_whitelist
-from system_info import get_system_info
-from config.redis_config import redis_client
+from flask import Flask, Blueprint, Response, g, jsonify, request, stream_with_context
+from app.blacklist_whitelist import update_blacklist, update_whitelist, update_list, list_snapshot
+from app.system_info import HistoryError, get_system_history, get_system_info_json
+from app.config import Config
+from config.redis_config import redis_client, redis_stats
+from backup.backup_manager import save_packet_backup, save_anomaly_backup
+from backup.segments import PART_SUFFIX
+from backup.columnar import BackupManifest, query_page
+from app.queries import QueryError, anomaly_page, packet_page, parse_query
+from app.analytics import AnalyticsUnavailable, host_activity, parse_window, top_talkers
+from app.live import AnomalyBroadcaster
+from core.packet_stream import shard_streams
+from core.anomaly_index import ANOMALY_LIST
+from core.metrics import REGISTRY, counter, histogram, merge, process_snapshots, render, start_publisher
 import os
-import json
 import subprocess
 import logging
+import time
 
 # Configuração do logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 api_blueprint = Blueprint('api', __name__)
-redis_client = Redis(host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=Config.REDIS_DB)
+
+# Feed ao vivo: uma leitura do Redis por processo, compartilhada pelos clientes SSE
+broadcaster = AnomalyBroadcaster(redis_client)
+
+# Métricas da API (por rota; o SSE conta até o início da resposta) e
+# publicação do snapshot deste worker para o /metrics
+HTTP_REQUESTS = counter("sehenos_http_requests_total", "Requisições atendidas pela API", ("endpoint", "method", "status"))
+HTTP_LATENCY = histogram("sehenos_http_request_seconds", "Duração das requisições da API", ("endpoint",))
+start_publisher(redis_client, "api")
+
+
+@api_blueprint.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@api_blueprint.after_request
+def record_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+    if "request_start" in g:
+        HTTP_LATENCY.labels(endpoint).observe(time.perf_counter() - g.request_start)
+    return response
 
 
 # |-------------------------↓ CAPT/ANOM ↓----------------------------------|
 
-# Endpoint para pacotes capturados
+# Resposta paginada: array JSON (padrão) ou NDJSON em streaming
+# (format=ndjson ou Accept: application/x-ndjson). Os itens já chegam
+# serializados e são concatenados sem decodificar; o cursor da próxima
+# página vai no cabeçalho X-Next-Cursor.
+def paged_response(items, cursor):
+    if request.args.get("format") == "ndjson" or \
+            request.accept_mimetypes.best == "application/x-ndjson":
+        def generate():
+            for item in items:
+                yield item + b"\n"
+        response = Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+    else:
+        response = Response(b"[" + b",".join(items) + b"]", mimetype="application/json")
+    if cursor is not None:
+        response.headers["X-Next-Cursor"] = cursor
+    return response
+
+# Endpoint para pacotes capturados (mais recentes primeiro, paginados por
+# cursor; filtros ip, port, protocol, from, to e projeção fields)
 @api_blueprint.route('/packets', methods=['GET'])
 def get_packets():
-    packets = redis_client.lrange("network_packets", 0, -1)
-    return jsonify([json.loads(packet) for packet in packets])
+    try:
+        query = parse_query(request.args, Config.PACKETS_API_LIMIT)
+        items, cursor = packet_page(redis_client, shard_streams(), query)
+    except QueryError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return paged_response(items, cursor)
 
-# Endpoint para anomalias detectadas
+# Endpoint para anomalias detectadas (mesmos parâmetros de /packets)
 @api_blueprint.route('/anomalies', methods=['GET'])
 def get_anomalies():
-    anomalies = redis_client.lrange("network_anomalies", 0, -1)
-    return jsonify([json.loads(anomaly) for anomaly in anomalies])
+    try:
+        query = parse_query(request.args, Config.ANOMALIES_API_LIMIT)
+        items, cursor = anomaly_page(redis_client, "network_anomalies", query)
+    except QueryError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return paged_response(items, cursor)
+
+# Endpoint SSE com as anomalias novas (um evento por lote ou rajada de
+# lotes, com o array JSON das anomalias). Retoma a partir do cabeçalho
+# Last-Event-ID, enviado automaticamente pelo EventSource ao reconectar.
+@api_blueprint.route('/anomalies/stream', methods=['GET'])
+def stream_anomalies():
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    return Response(broadcaster.subscribe(last_event_id), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Hosts com mais bytes no intervalo (start/end, padrão: última hora), a
+# partir dos agregados por minuto do PostgreSQL
+@api_blueprint.route('/analytics/top_talkers', methods=['GET'])
+def get_top_talkers():
+    try:
+        start, end = parse_window(request.args)
+        return jsonify(top_talkers(start, end, request.args.get("n", 10, type=int)))
+    except QueryError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except AnalyticsUnavailable as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+
+# Tráfego de um host por minuto e par no intervalo (start/end)
+@api_blueprint.route('/analytics/hosts/<ip>', methods=['GET'])
+def get_host_activity(ip):
+    try:
+        start, end = parse_window(request.args)
+        return jsonify(host_activity(ip, start, end))
+    except QueryError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except AnalyticsUnavailable as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
 
 # |-------------------------↓  LIST  ↓-------------------------------------|
 
@@ -43,8 +132,11 @@ def edit_blacklist():
         return jsonify({"status": "error", "message": "IP não fornecido."}), 400
 
     try:
-        update_blacklist(ip, action)
-        return jsonify({"status": "success", "message": f"IP {action}ed com sucesso na blacklist."})
+        changed, version = update_blacklist(ip, action)
+        return jsonify({"status": "success", "message": f"IP {action}ed com sucesso na blacklist.",
+                        "changed": changed, "version": version})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
     
@@ -59,17 +151,111 @@ def edit_whitelist():
         return jsonify({"status": "error", "message": "IP não fornecido."}), 400
 
     try:
-        update_whitelist(ip, action)
-        return jsonify({"status": "success", "message": f"IP {action}ed com sucesso na whitelist."})
+        changed, version = update_whitelist(ip, action)
+        return jsonify({"status": "success", "message": f"IP {action}ed com sucesso na whitelist.",
+                        "changed": changed, "version": version})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# Endpoint para importar/remover IPs em massa de uma lista
+# Corpo JSON {"action": "add"|"remove", "ips": [...]} ou texto com um IP/CIDR por linha
+@api_blueprint.route('/<any(blacklist, whitelist):name>_import', methods=['POST'])
+def import_list(name):
+    if request.is_json:
+        data = request.json
+        action = data.get("action", "add")
+        ips = data.get("ips") or []
+    else:
+        action = request.args.get("action", "add")
+        ips = [line for line in request.get_data(as_text=True).splitlines() if line.strip()]
+
+    if not ips:
+        return jsonify({"status": "error", "message": "Nenhum IP fornecido."}), 400
+
+    try:
+        changed, version = update_list(name, ips, action)
+        return jsonify({"status": "success", "changed": changed, "version": version})
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+# Endpoint para consultar uma lista
+@api_blueprint.route('/<any(blacklist, whitelist):name>', methods=['GET'])
+def get_list(name):
+    version, entries = list_snapshot(name)
+    return jsonify({"version": version, "entries": sorted(entries)})
+
 # |-------------------------↓ SISTEMA ↓------------------------------------|
 
-# Endpoint para informações do sistema
+# Endpoint para informações do sistema (última leitura do amostrador, já em JSON)
 @api_blueprint.route('/system_info', methods=['GET'])
 def get_system_info_endpoint():
-    return jsonify(get_system_info())
+    return Response(get_system_info_json(), mimetype="application/json")
+
+# Histórico da telemetria para gráficos (seconds = janela, points = máximo de pontos)
+@api_blueprint.route('/system_info/history', methods=['GET'])
+def get_system_history_endpoint():
+    try:
+        seconds = request.args.get("seconds", type=float)
+        points = request.args.get("points", type=int)
+        return jsonify(get_system_history(seconds, points and min(points, Config.SYSTEM_HISTORY_SIZE)))
+    except HistoryError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+# Estado da conexão com o Redis e latência por comando (deste processo)
+@api_blueprint.route('/redis/stats', methods=['GET'])
+def get_redis_stats():
+    return jsonify(redis_stats())
+
+# Profundidade das filas no Redis (valores globais, sem rótulo de processo)
+def queue_metrics():
+    streams = shard_streams()
+    pipe = redis_client.pipeline(transaction=False)
+    for stream in streams:
+        pipe.xlen(stream)
+        pipe.xinfo_groups(stream)
+    pipe.llen(ANOMALY_LIST)
+    results = pipe.execute(raise_on_error=False)
+    length, pending, lag = {}, {}, {}
+    for i, stream in enumerate(streams):
+        key = (("stream", stream),)
+        length[key] = results[2 * i] if isinstance(results[2 * i], int) else 0
+        groups = results[2 * i + 1] if isinstance(results[2 * i + 1], list) else []
+        for info in groups:
+            if info.get("name", b"").decode() == Config.STREAM_GROUP:
+                pending[key] = info.get("pending") or 0
+                # "lag" só existe a partir do Redis 7
+                if info.get("lag") is not None:
+                    lag[key] = info["lag"]
+    anomalies = results[-1] if isinstance(results[-1], int) else 0
+    return {
+        "sehenos_stream_length": {"type": "gauge", "help": "Entradas nos streams de pacotes", "series": length},
+        "sehenos_stream_pending": {"type": "gauge", "help": "Entradas lidas e ainda não confirmadas pelos detectores",
+                                   "series": pending},
+        "sehenos_stream_lag": {"type": "gauge", "help": "Entradas ainda não entregues ao grupo dos detectores",
+                               "series": lag},
+        "sehenos_anomaly_list_length": {"type": "gauge", "help": "Anomalias aguardando backup na lista",
+                                        "series": {(): anomalies}},
+    }
+
+# Métricas no formato do Prometheus: processos da captura, da detecção e
+# workers da API (publicados no Redis) e as filas
+@api_blueprint.route('/metrics', methods=['GET'])
+def get_metrics():
+    try:
+        snapshots = process_snapshots(redis_client, "api")
+    except Exception as e:
+        logger.error(f"Erro ao ler as métricas dos processos no Redis: {e}")
+        snapshots = [("api", os.getpid(), REGISTRY.snapshot())]
+    families = merge(snapshots)
+    try:
+        families.update(queue_metrics())
+    except Exception as e:
+        logger.error(f"Erro ao ler as filas para o /metrics: {e}")
+    return Response(render(families), mimetype="text/plain; version=0.0.4; charset=utf-8")
 
 # Endpoint para limpar dados
 @api_blueprint.route('/clear_data', methods=['POST'])
@@ -97,11 +283,19 @@ def reboot_system():
 
 # |-------------------------↓ BACKUPS ↓------------------------------------|
 
+# Segmentos finalizados de um tipo e, em snapshots/, os backups manuais
+def list_backup_files(prefix):
+    files = [f for f in os.listdir(Config.BACKUP_DIR) if f.startswith(prefix) and not f.endswith(PART_SUFFIX)]
+    if os.path.isdir(Config.BACKUP_SNAPSHOT_DIR):
+        files += [os.path.join("snapshots", f) for f in sorted(os.listdir(Config.BACKUP_SNAPSHOT_DIR))
+                  if f.startswith(prefix) and not f.endswith(PART_SUFFIX)]
+    return files
+
 # Endpoint para backups de pacotes
 @api_blueprint.route('/list_packet_backup', methods=['GET'])
 def list_packet_backup():
     try:
-        backup_files = [f for f in os.listdir(Config.BACKUP_DIR) if f.startswith('packets')]
+        backup_files = list_backup_files('packets')
         return jsonify({"backups": backup_files})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -110,11 +304,35 @@ def list_packet_backup():
 @api_blueprint.route('/list_anomaly_backup', methods=['GET'])
 def list_anomaly_backup():
     try:
-        backup_files = [f for f in os.listdir(Config.BACKUP_DIR) if f.startswith('anomalies')]
+        backup_files = list_backup_files('anomalies')
         return jsonify({"backups": backup_files})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
     
+# Manifesto dos backups Parquet (sem os filtros de Bloom)
+@api_blueprint.route('/backups/manifest', methods=['GET'])
+def backup_manifest():
+    dataset = request.args.get("dataset")
+    entries = [{key: value for key, value in entry.items() if key != "ips"}
+               for entry in BackupManifest().entries() if dataset in (None, entry["dataset"])]
+    return jsonify({"files": entries})
+
+# Consulta histórica nos backups Parquet (mesmos parâmetros de /packets e
+# dataset=packets|anomalies), em ordem cronológica
+@api_blueprint.route('/backups/query', methods=['GET'])
+def backup_query():
+    dataset = request.args.get("dataset", "packets")
+    if dataset not in ("packets", "anomalies"):
+        return jsonify({"status": "error", "message": f"Tipo de backup inválido: {dataset}"}), 400
+    try:
+        query = parse_query(request.args, Config.PACKETS_API_LIMIT)
+        items, cursor = query_page(query, dataset)
+    except QueryError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 501
+    return paged_response(items, cursor)
+
 #        |-------------↓ MANUAL-BACKUPS ↓--------|
     
 # Endpoint para salvar backup manualmente de pacotes
@@ -1,26 +1,221 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
 import psutil
-import subprocess
+from app.config import Config
+
+# Telemetria do sistema: uma thread por processo lê CPU, memória, disco,
+# contadores das interfaces de rede e as zonas térmicas (/sys/class/thermal,
+# sem subprocessos) a cada SYSTEM_SAMPLE_INTERVAL. A última leitura fica
+# pronta (dicionário e JSON) para o /system_info e cada amostra vai para um
+# buffer circular em NumPy de SYSTEM_HISTORY_SIZE linhas, usado pelo
+# histórico reduzido dos gráficos.
+
+FIELDS = ("timestamp", "cpu_percent", "memory_used", "memory_total", "disk_used", "disk_total",
+          "net_sent_rate", "net_recv_rate", "temperature")
+
+
+class HistoryError(ValueError):
+    pass
+
+
+def thermal_zones(directory=None):
+    """
+    Zonas térmicas disponíveis.
+    :return: Lista de (nome, caminho do arquivo temp).
+    """
+    zones = []
+    for zone in sorted(glob.glob(os.path.join(directory or Config.THERMAL_DIR, "thermal_zone*"))):
+        path = os.path.join(zone, "temp")
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(os.path.join(zone, "type")) as f:
+                name = f.read().strip()
+        except OSError:
+            name = os.path.basename(zone)
+        zones.append((name, path))
+    return zones
+
+
+def read_temperatures(zones):
+    """
+    Temperaturas em °C por zona (valores em miligraus no sysfs).
+    """
+    temperatures = {}
+    for name, path in zones:
+        try:
+            with open(path) as f:
+                temperatures[name] = int(f.read()) / 1000
+        except (OSError, ValueError):
+            continue
+    return temperatures
+
+
+def _gb(value):
+    return f"{value / 1e9:.2f}GB"
+
+
+class SystemSampler:
+    """
+    Amostrador da telemetria em segundo plano com buffer circular de tamanho
+    fixo (uma linha por amostra, colunas em FIELDS).
+    """
+
+    def __init__(self, interval=None, capacity=None, disk_path=None, thermal_dir=None):
+        self.interval = interval or Config.SYSTEM_SAMPLE_INTERVAL
+        self.disk_path = disk_path or Config.SYSTEM_DISK_PATH
+        self.zones = thermal_zones(thermal_dir)
+        self.buffer = np.full((capacity or Config.SYSTEM_HISTORY_SIZE, len(FIELDS)), np.nan)
+        self.index = 0
+        self.count = 0
+        self.snapshot = None
+        self.snapshot_json = None
+        self._last_net = None
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        # Primeira chamada de cpu_percent(None) só marca o início da medição
+        psutil.cpu_percent(None)
+
+    def sample(self):
+        """
+        Lê todas as métricas uma vez, atualiza o snapshot e grava a linha no buffer.
+        """
+        now = time.time()
+        cpu = psutil.cpu_percent(None)
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage(self.disk_path)
+        interfaces = psutil.net_io_counters(pernic=True)
+        temperatures = read_temperatures(self.zones)
+
+        sent = sum(counters.bytes_sent for counters in interfaces.values())
+        recv = sum(counters.bytes_recv for counters in interfaces.values())
+        sent_rate = recv_rate = 0.0
+        if self._last_net is not None:
+            elapsed = now - self._last_net[0]
+            if elapsed > 0:
+                # Contadores zerados (interface reiniciada) não geram taxa negativa
+                sent_rate = max(0, sent - self._last_net[1]) / elapsed
+                recv_rate = max(0, recv - self._last_net[2]) / elapsed
+        self._last_net = (now, sent, recv)
+        temperature = max(temperatures.values()) if temperatures else None
+
+        snapshot = {
+            "cpu_usage": f"{cpu}%",
+            "memory_usage": f"{_gb(memory.used)} / {_gb(memory.total)}",
+            "disk_usage": f"{_gb(disk.used)} / {_gb(disk.total)}",
+            "temperature": f"{temperature:.1f}°C" if temperature is not None else "N/A",
+            "timestamp": now,
+            "cpu_percent": cpu,
+            "memory": {"used": memory.used, "total": memory.total, "percent": memory.percent},
+            "disk": {"used": disk.used, "total": disk.total, "percent": disk.percent},
+            "network": {
+                "bytes_sent": sent,
+                "bytes_recv": recv,
+                "sent_rate": round(sent_rate, 1),
+                "recv_rate": round(recv_rate, 1),
+                "interfaces": {name: {"bytes_sent": counters.bytes_sent, "bytes_recv": counters.bytes_recv,
+                                      "packets_sent": counters.packets_sent, "packets_recv": counters.packets_recv,
+                                      "errin": counters.errin, "errout": counters.errout,
+                                      "dropin": counters.dropin, "dropout": counters.dropout}
+                               for name, counters in interfaces.items()},
+            },
+            "temperatures": temperatures,
+        }
+        row = (now, cpu, memory.used, memory.total, disk.used, disk.total, sent_rate, recv_rate,
+               np.nan if temperature is None else temperature)
+        encoded = json.dumps(snapshot).encode()
+        with self._lock:
+            self.buffer[self.index] = row
+            self.index = (self.index + 1) % len(self.buffer)
+            self.count = min(self.count + 1, len(self.buffer))
+            self.snapshot, self.snapshot_json = snapshot, encoded
+        return snapshot
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.sample()
+            except Exception as e:
+                logging.error(f"Erro ao amostrar a telemetria do sistema: {e}")
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def start(self):
+        """
+        Faz a primeira leitura e inicia a thread de amostragem (uma vez).
+        """
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self.sample()
+                    self._thread = threading.Thread(target=self._run, name="system-sampler", daemon=True)
+                    self._thread.start()
+        return self
+
+    def rows(self):
+        """
+        Amostras do buffer em ordem cronológica (cópia).
+        """
+        with self._lock:
+            if self.count < len(self.buffer):
+                return self.buffer[:self.count].copy()
+            return np.concatenate((self.buffer[self.index:], self.buffer[:self.index]))
+
+    def history(self, seconds=None, points=None):
+        """
+        Histórico das últimas `seconds` segundos reduzido a no máximo
+        `points` pontos (média de cada balde; o timestamp é o do fim do balde).
+        :return: {campo: lista de valores} (None onde não há leitura).
+        """
+        points = points or Config.SYSTEM_HISTORY_POINTS
+        if points < 1 or (seconds is not None and seconds <= 0):
+            raise HistoryError("Parâmetros do histórico devem ser positivos.")
+        rows = self.rows()
+        if seconds is not None and len(rows):
+            rows = rows[rows[:, 0] >= rows[-1, 0] - seconds]
+        if len(rows) > points:
+            bounds = np.linspace(0, len(rows), points + 1).astype(int)
+            # nanmean por balde: soma dos valores válidos / quantidade de válidos
+            valid = ~np.isnan(rows)
+            sums = np.add.reduceat(np.where(valid, rows, 0), bounds[:-1])
+            totals = np.add.reduceat(valid.astype(np.int64), bounds[:-1])
+            with np.errstate(invalid="ignore", divide="ignore"):
+                reduced = sums / totals
+            reduced[:, 0] = rows[bounds[1:] - 1, 0]
+            rows = reduced
+        history = {}
+        for i, name in enumerate(FIELDS):
+            column = rows[:, i]
+            history[name] = [None if value != value else round(value, 3) for value in column.tolist()]
+        history["interval"] = self.interval
+        return history
+
+
+sampler = SystemSampler()
+
 
 def get_system_info():
     """
-    Retorna informações sobre o sistema.
+    Retorna informações sobre o sistema (última leitura do amostrador).
+    """
+    return sampler.start().snapshot
+
+
+def get_system_info_json():
     """
-    info = {
-        "cpu_usage": f"{psutil.cpu_percent()}%",
-        "memory_usage": f"{psutil.virtual_memory().used / 1e9:.2f}GB / {psutil.virtual_memory().total / 1e9:.2f}GB",
-        "disk_usage": f"{psutil.disk_usage('/').used / 1e9:.2f}GB / {psutil.disk_usage('/').total / 1e9:.2f}GB",
-        "temperature": get_temperature(),
-    }
-    return info
+    Última leitura já serializada em JSON (bytes).
+    """
+    return sampler.start().snapshot_json
+
 
-def get_temperature():
+def get_system_history(seconds=None, points=None):
     """
-    Obtém a temperatura do sistema. Funciona apenas em sistemas compatíveis.
+    Histórico reduzido da telemetria para gráficos.
     """
-    try:
-        # Método para sistemas Linux
-        result = subprocess.run(["vcgencmd", "measure_temp"], stdout=subprocess.PIPE)
-        temp_output = result.stdout.decode()
-        return temp_output.split("=")[1].strip() if "temp" in temp_output else "N/A"
-    except Exception:
-        return "N/A"
+    return sampler.start().history(seconds, points)
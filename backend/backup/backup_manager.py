@@ -1,47 +1,40 @@
-import os
-import json
-from datetime import datetime
 from app.config import Config
 from config.redis_config import redis_client
+from core.anomaly_index import ANOMALY_LIST
+from core.packet_stream import shard_streams
+from backup.segments import ListSource, StreamSource, export_snapshot
 
-def save_backup(data, backup_type):
+def save_backup(source, backup_type):
     """
-    Salva um backup no diretório apropriado.
-    :param data: Dados a serem salvos.
+    Salva um backup completo da origem em um segmento NDJSON gzip, lido do
+    Redis em blocos (sem carregar tudo em memória e sem remover os dados).
+    Fica em BACKUP_SNAPSHOT_DIR, separado dos segmentos do BackupJob, para
+    não ser carregado de novo no PostgreSQL nem convertido para Parquet.
+    :param source: Origem dos dados (StreamSource ou ListSource).
     :param backup_type: Tipo do backup ('packets' ou 'anomalies').
-    :return: Caminho do arquivo de backup salvo.
+    :return: Caminho do arquivo de backup salvo ou None se não havia dados.
     """
-    backup_file = f"{Config.BACKUP_DIR}/{backup_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    os.makedirs(Config.BACKUP_DIR, exist_ok=True)  # Garantir que o diretório existe
-    with open(backup_file, "w") as f:
-        json.dump(data, f)
+    backup_file, _ = export_snapshot(source, Config.BACKUP_SNAPSHOT_DIR, backup_type)
     return backup_file
 
-def get_data_from_redis(redis_key):
-    """
-    Recupera dados do Redis por uma chave específica.
-    :param redis_key: Chave no Redis ('network_packets' ou 'network_anomalies').
-    :return: Lista de dados do Redis.
-    """
-    data = redis_client.lrange(redis_key, 0, -1)
-    return [json.loads(item) for item in data] if data else []
-
 def save_packet_backup():
     """
     Salva manualmente um backup de pacotes capturados.
     :return: Caminho do arquivo de backup salvo.
     """
-    packets = get_data_from_redis("network_packets")
-    if not packets:
+    # Os pacotes ficam nos Redis Streams dos shards (lidos sem consumir as entradas)
+    source = StreamSource(redis_client, shard_streams(Config.PACKET_STREAM), legacy_cursor=False)
+    backup_file = save_backup(source, "packets")
+    if backup_file is None:
         raise ValueError("Nenhum pacote encontrado para backup.")
-    return save_backup(packets, "packets")
+    return backup_file
 
 def save_anomaly_backup():
     """
     Salva manualmente um backup de anomalias detectadas.
     :return: Caminho do arquivo de backup salvo.
     """
-    anomalies = get_data_from_redis("network_anomalies")
-    if not anomalies:
+    backup_file = save_backup(ListSource(redis_client, ANOMALY_LIST), "anomalies")
+    if backup_file is None:
         raise ValueError("Nenhuma anomalia encontrada para backup.")
-    return save_backup(anomalies, "anomalies")
+    return backup_file
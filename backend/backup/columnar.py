@@ -0,0 +1,543 @@
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import sys
+from datetime import datetime, timezone
+import numpy as np
+from app.config import Config
+from backup.segments import PART_SUFFIX, SEGMENT_SUFFIX, fsync_dir
+from core.record import to_json_safe
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # Backups colunares são opcionais (BACKUP_FORMAT=parquet)
+    pa = None
+
+# Backups colunares (Parquet) particionados por hora.
+#
+# Os segmentos NDJSON finalizados (backup.segments) são convertidos em
+#   <BACKUP_PARQUET_DIR>/<tipo>/dt=<AAAA-MM-DD>/hour=<HH>/<segmento>-<n>.parquet
+# (hora UTC), com colunas tipadas e IPs em dicionário. Cada arquivo tem uma
+# linha em manifest.jsonl com intervalo de tempo, linhas, colunas e um
+# filtro de Bloom dos IPs (origem e destino). As consultas descartam
+# arquivos pelo manifesto, grupos de linhas pelas estatísticas do
+# timestamp e leem só as colunas necessárias, com memory map.
+
+MANIFEST = "manifest.jsonl"
+
+IP_COLUMNS = ("src_ip", "dst_ip")
+
+
+def _schema():
+    text = pa.dictionary(pa.int32(), pa.string())
+    return {
+        "timestamp": pa.float64(),
+        "src_ip": text,
+        "dst_ip": text,
+        "protocol": pa.uint8(),
+        "time_to_live": pa.uint8(),
+        "length": pa.uint32(),
+        "bytes": pa.uint32(),
+        "src_port": pa.uint16(),
+        "dst_port": pa.uint16(),
+        "mac_src": text,
+        "mac_dst": text,
+        "is_blacklisted": pa.bool_(),
+        "is_whitelisted": pa.bool_(),
+        "dns_queries": pa.string(),
+        "fqdns": pa.string(),
+        "src_hostname": text,
+        "dst_hostname": text,
+        "payload": pa.binary(),
+    }
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow não está instalado (necessário para backups Parquet).")
+
+
+class BloomFilter:
+    """
+    Filtro de Bloom (bits em NumPy, hashes duplos de um BLAKE2b de 128 bits).
+    """
+
+    def __init__(self, bits, hashes, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = np.zeros(bits // 8, dtype=np.uint8) if data is None else data
+
+    @classmethod
+    def build(cls, values, fpr=None):
+        values = set(values) - {None}
+        fpr = fpr or Config.BACKUP_BLOOM_FPR
+        n = max(len(values), 1)
+        bits = max(64, math.ceil(-n * math.log(fpr) / math.log(2) ** 2 / 64) * 64)
+        bloom = cls(bits, min(16, max(1, round(bits / n * math.log(2)))))
+        for value in values:
+            positions = bloom._positions(value)
+            np.bitwise_or.at(bloom.data, positions >> 3, (1 << (positions & 7)).astype(np.uint8))
+        return bloom
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return np.array([(h1 + i * h2) % self.bits for i in range(self.hashes)], dtype=np.int64)
+
+    def __contains__(self, value):
+        positions = self._positions(value)
+        return bool(np.all(self.data[positions >> 3] & (1 << (positions & 7)).astype(np.uint8)))
+
+    def to_dict(self):
+        return {"bits": self.bits, "hashes": self.hashes, "data": base64.b64encode(self.data.tobytes()).decode()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["bits"], data["hashes"], np.frombuffer(base64.b64decode(data["data"]), dtype=np.uint8))
+
+
+class BackupManifest:
+    """
+    Índice dos arquivos Parquet (uma linha JSON por arquivo, só acréscimos).
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or Config.BACKUP_PARQUET_DIR
+        self.path = os.path.join(self.directory, MANIFEST)
+        self._entries = []
+        self._stamp = None
+
+    def entries(self):
+        # Releitura apenas quando o arquivo muda
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp != self._stamp:
+            with open(self.path) as f:
+                entries = {}
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        # Reconversão de um segmento substitui a entrada do arquivo
+                        entries[entry["file"]] = entry
+            self._entries = sorted(entries.values(), key=lambda entry: entry["file"])
+            self._stamp = stamp
+        return self._entries
+
+    def append(self, entries):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path, "a") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def sources(self, dataset):
+        return {entry["source"] for entry in self.entries() if entry["dataset"] == dataset}
+
+    def select(self, dataset, start=None, end=None, ip=None):
+        """
+        Arquivos que podem conter linhas do intervalo e do IP, em ordem
+        cronológica.
+        """
+        selected = []
+        for entry in self.entries():
+            if entry["dataset"] != dataset:
+                continue
+            if start is not None and entry["end"] < start:
+                continue
+            if end is not None and entry["start"] > end:
+                continue
+            if ip and "ips" in entry and ip not in BloomFilter.from_dict(entry["ips"]):
+                continue
+            selected.append(entry)
+        return selected
+
+
+def _epoch(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).timestamp()
+    return value
+
+
+def _infer(values):
+    present = [v for v in values if v is not None]
+    kinds = {type(v) for v in present}
+    if kinds == {bool}:
+        return pa.array(values, type=pa.bool_())
+    if kinds and kinds <= {int}:
+        return pa.array(values, type=pa.int64())
+    if kinds and kinds <= {int, float}:
+        return pa.array(values, type=pa.float64())
+    # Texto, objetos e colunas vazias como string (tipo estável entre blocos)
+    return pa.array([v if v is None or isinstance(v, str) else json.dumps(v) for v in values], type=pa.string())
+
+
+def records_to_table(records):
+    """
+    Monta uma tabela Arrow tipada a partir de registros JSON (to_json_safe).
+    Colunas conhecidas usam os tipos de _schema(); as demais são inferidas.
+    """
+    _require_pyarrow()
+    schema = _schema()
+    names = list(dict.fromkeys(name for record in records for name in record))
+    arrays = []
+    for name in names:
+        values = [record.get(name) for record in records]
+        if name == "timestamp":
+            values = [_epoch(v) for v in values]
+        elif name == "payload":
+            values = [bytes.fromhex(v) if isinstance(v, str) else v for v in values]
+        kind = schema.get(name)
+        try:
+            if kind is None:
+                raise TypeError
+            if pa.types.is_dictionary(kind):
+                array = pa.array(values, type=pa.string()).dictionary_encode()
+            else:
+                array = pa.array(values, type=kind)
+        except (TypeError, ValueError, pa.ArrowException):
+            array = _infer(values)
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def _read_lines(path, chunk):
+    # Segmentos NDJSON em blocos; backups JSON antigos (lista única) inteiros
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        if path.endswith(SEGMENT_SUFFIX):
+            block = []
+            for line in f:
+                if line.strip():
+                    block.append(json.loads(line))
+                if len(block) == chunk:
+                    yield block
+                    block = []
+            if block:
+                yield block
+        else:
+            records = json.load(f)
+            for i in range(0, len(records), chunk):
+                yield records[i:i + chunk]
+
+
+def _source_name(path):
+    name = os.path.basename(path)
+    for suffix in (SEGMENT_SUFFIX, ".json.gz", ".json"):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+class _HourFile:
+    """
+    Arquivo Parquet de uma hora em escrita (.tmp até ser finalizado).
+    """
+
+    def __init__(self, path, schema, row_group):
+        self.path = path
+        self.schema = schema
+        self.row_group = row_group
+        self.writer = pq.ParquetWriter(f"{path}.tmp", schema, compression=Config.BACKUP_PARQUET_COMPRESSION)
+        self.pending = []
+        self.pending_rows = 0
+        self.rows = 0
+        self.start = math.inf
+        self.end = -math.inf
+        self.ips = set()
+
+    def write(self, table):
+        self.pending.append(table)
+        self.pending_rows += table.num_rows
+        self.rows += table.num_rows
+        timestamps = table["timestamp"]
+        self.start = min(self.start, pc.min(timestamps).as_py())
+        self.end = max(self.end, pc.max(timestamps).as_py())
+        for name in IP_COLUMNS:
+            if name in table.column_names:
+                self.ips.update(table[name].unique().to_pylist())
+        if self.pending_rows >= self.row_group:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.writer.write_table(pa.concat_tables(self.pending), row_group_size=self.row_group)
+            self.pending = []
+            self.pending_rows = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        with open(f"{self.path}.tmp", "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+def convert_segment(path, dataset, directory=None, manifest=None, chunk=None, row_group=None):
+    """
+    Converte um segmento NDJSON finalizado (ou backup JSON antigo) em
+    arquivos Parquet por hora e registra-os no manifesto.
+    :return: Entradas adicionadas ao manifesto.
+    """
+    _require_pyarrow()
+    directory = directory or Config.BACKUP_PARQUET_DIR
+    manifest = manifest or BackupManifest(directory)
+    chunk = chunk or Config.BACKUP_CHUNK
+    row_group = row_group or Config.BACKUP_ROW_GROUP
+    source = _source_name(path)
+
+    files = {}
+    parts = {}
+    done = []
+    try:
+        for records in _read_lines(path, chunk):
+            table = records_to_table(records)
+            hours = pc.floor(pc.divide(table["timestamp"], 3600.0)).cast(pa.int64()).to_numpy(zero_copy_only=False)
+            for hour in np.unique(hours):
+                rows = table.filter(pa.array(hours == hour))
+                current = files.get(hour)
+                if current is not None and not current.schema.equals(rows.schema):
+                    # Colunas diferentes no meio da hora: novo arquivo
+                    current.close()
+                    done.append(current)
+                    current = None
+                if current is None:
+                    moment = datetime.fromtimestamp(int(hour) * 3600, timezone.utc)
+                    folder = os.path.join(directory, dataset, f"dt={moment:%Y-%m-%d}", f"hour={moment:%H}")
+                    os.makedirs(folder, exist_ok=True)
+                    parts[hour] = parts.get(hour, -1) + 1
+                    current = files[hour] = _HourFile(
+                        os.path.join(folder, f"{source}-{parts[hour]}.parquet"), rows.schema, row_group)
+                current.write(rows)
+        for current in files.values():
+            current.close()
+            done.append(current)
+    except Exception:
+        for current in files.values():
+            if os.path.exists(f"{current.path}.tmp"):
+                current.writer.close()
+                os.remove(f"{current.path}.tmp")
+        raise
+
+    entries = [{
+        "file": os.path.relpath(current.path, directory),
+        "dataset": dataset,
+        "source": source,
+        "start": current.start,
+        "end": current.end,
+        "rows": current.rows,
+        "bytes": os.path.getsize(current.path),
+        "columns": current.schema.names,
+        "ips": BloomFilter.build(current.ips).to_dict(),
+    } for current in done]
+    for folder in {os.path.dirname(current.path) for current in done}:
+        fsync_dir(folder)
+    manifest.append(entries)
+    return entries
+
+
+def convert_pending(backup_dir, dataset, directory=None, remove=False, legacy=False):
+    """
+    Converte os segmentos finalizados de um tipo que ainda não estão no
+    manifesto (retomada após queda). Os segmentos NDJSON continuam sendo a
+    entrada do database/bulk_loader.py: com remove, só são apagados os já
+    convertidos que o loader marcou como carregados (ingest_checkpoints).
+    :return: Segmentos convertidos.
+    """
+    manifest = BackupManifest(directory)
+    suffixes = (SEGMENT_SUFFIX, ".json", ".json.gz") if legacy else (SEGMENT_SUFFIX,)
+    converted = []
+    segments = []
+    for name in sorted(os.listdir(backup_dir)):
+        if not name.startswith(f"{dataset}_") or name.endswith(PART_SUFFIX) or not name.endswith(suffixes):
+            continue
+        path = os.path.join(backup_dir, name)
+        if _source_name(path) not in manifest.sources(dataset):
+            convert_segment(path, dataset, manifest.directory, manifest)
+            converted.append(path)
+        segments.append(name)
+    if remove and segments:
+        remove_loaded(backup_dir, segments)
+    return converted
+
+
+def remove_loaded(backup_dir, names):
+    """
+    Apaga os segmentos que o bulk_loader já carregou no PostgreSQL; sem
+    acesso ao banco nada é apagado.
+    :return: Segmentos apagados.
+    """
+    from app.analytics import AnalyticsUnavailable, loaded_files
+    try:
+        loaded = loaded_files(names)
+    except AnalyticsUnavailable as e:
+        logging.warning(f"Segmentos mantidos: não foi possível confirmar a carga no banco ({e}).")
+        return []
+    removed = []
+    for name in names:
+        if name in loaded:
+            os.remove(os.path.join(backup_dir, name))
+            removed.append(name)
+    if len(removed) < len(names):
+        logging.info(f"{len(names) - len(removed)} segmentos mantidos até a carga no banco.")
+    return removed
+
+
+def segment_converter(dataset, backup_dir=None):
+    """
+    Callback de BackupJob (on_segment) para BACKUP_FORMAT=parquet: converte
+    o segmento finalizado e os que ficaram pendentes. Sem argumento, apenas
+    os pendentes (início do serviço).
+    """
+    backup_dir = backup_dir or Config.BACKUP_DIR
+
+    def convert(path=None):
+        try:
+            convert_pending(backup_dir, dataset)
+        except Exception as e:
+            logging.error(f"Erro ao converter backups de {dataset} para Parquet: {e}")
+    return convert
+
+
+def _row_mask(table, start, end, ip, port, protocol):
+    mask = None
+
+    def both(condition):
+        nonlocal mask
+        mask = condition if mask is None else pc.and_kleene(mask, condition)
+
+    if start is not None:
+        both(pc.greater_equal(table["timestamp"], start))
+    if end is not None:
+        both(pc.less_equal(table["timestamp"], end))
+    if ip:
+        matches = [pc.equal(table[name], ip) for name in IP_COLUMNS if name in table.column_names]
+        both(pc.or_kleene(*matches) if len(matches) == 2 else matches[0])
+    if port is not None:
+        both(pc.or_kleene(pc.equal(table["src_port"], port), pc.equal(table["dst_port"], port)))
+    if protocol is not None:
+        both(pc.equal(table["protocol"], protocol))
+    return pc.fill_null(mask, False) if mask is not None else None
+
+
+def _row_groups(parquet, start, end):
+    # Grupos de linhas fora do intervalo são descartados pelas estatísticas
+    index = parquet.schema_arrow.get_field_index("timestamp")
+    for i in range(parquet.metadata.num_row_groups):
+        column = parquet.metadata.row_group(i).column(index) if index >= 0 else None
+        stats = column.statistics if column is not None else None
+        if stats is not None and stats.has_min_max:
+            if (start is not None and stats.max < start) or (end is not None and stats.min > end):
+                continue
+        yield i
+
+
+def scan(dataset, start=None, end=None, ip=None, port=None, protocol=None, fields=None, cursor=None,
+         directory=None, manifest=None):
+    """
+    Linhas dos backups Parquet em ordem cronológica de arquivo.
+    :param cursor: "arquivo|n" devolvido junto com cada linha (retomada).
+    :return: Gerador de (cursor, linha JSON-safe).
+    """
+    _require_pyarrow()
+    directory = directory or Config.BACKUP_PARQUET_DIR
+    manifest = manifest or BackupManifest(directory)
+    after, skip = None, 0
+    if cursor:
+        after, _, skip = cursor.rpartition("|")
+        skip = int(skip)
+    filters = {"timestamp": start is not None or end is not None, "src_ip": bool(ip), "dst_ip": bool(ip),
+               "src_port": port is not None, "dst_port": port is not None, "protocol": protocol is not None}
+
+    for entry in manifest.select(dataset, start, end, ip):
+        if after is not None and entry["file"] < after:
+            continue
+        delivered = skip if entry["file"] == after else 0
+        available = set(entry["columns"])
+        if (port is not None and "src_port" not in available) or (protocol is not None and "protocol" not in available):
+            continue
+        wanted = [name for name in (fields or entry["columns"]) if name in available]
+        needed = list(dict.fromkeys(wanted + [name for name, used in filters.items() if used and name in available]))
+        parquet = pq.ParquetFile(os.path.join(directory, entry["file"]), memory_map=True)
+        position = 0
+        for group in _row_groups(parquet, start, end):
+            table = parquet.read_row_group(group, columns=needed)
+            mask = _row_mask(table, start, end, ip, port, protocol)
+            if mask is not None:
+                table = table.filter(mask)
+            if position + table.num_rows <= delivered:
+                position += table.num_rows
+                continue
+            table = table.select(wanted).slice(max(0, delivered - position))
+            position = max(position, delivered)
+            for batch in table.to_batches():
+                for row in batch.to_pylist():
+                    position += 1
+                    yield f"{entry['file']}|{position}", to_json_safe(row)
+
+
+def query_page(query, dataset="packets", directory=None):
+    """
+    Página de linhas dos backups Parquet a partir de app.queries.parse_query.
+    :return: (itens JSON em bytes, cursor da próxima página ou None).
+    """
+    from app.queries import QueryError
+    if query["cursor"] and not query["cursor"].rpartition("|")[2].isdigit():
+        raise QueryError(f"Cursor inválido: {query['cursor']}")
+    items = []
+    cursor = None
+    for cursor, row in scan(dataset, query["start"], query["end"], query["ip"], query["port"], query["protocol"],
+                            query["fields"], query["cursor"], directory):
+        items.append(json.dumps(row).encode())
+        if len(items) == query["limit"]:
+            return items, cursor
+    return items, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m backup.columnar", description="Backups Parquet do SehenOS")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert = commands.add_parser("convert", help="converte os segmentos NDJSON finalizados")
+    convert.add_argument("dataset", choices=("packets", "anomalies"))
+    convert.add_argument("--legacy", action="store_true", help="inclui os backups JSON antigos")
+    convert.add_argument("--remove", action="store_true", help="apaga os segmentos convertidos já carregados no PostgreSQL")
+    query = commands.add_parser("query", help="consulta os backups Parquet (NDJSON na saída)")
+    query.add_argument("dataset", choices=("packets", "anomalies"))
+    query.add_argument("--ip")
+    query.add_argument("--port", type=int)
+    query.add_argument("--protocol", type=int)
+    query.add_argument("--from", dest="start")
+    query.add_argument("--to", dest="end")
+    query.add_argument("--fields")
+    query.add_argument("--limit", type=int)
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        for path in convert_pending(Config.BACKUP_DIR, args.dataset, remove=args.remove, legacy=args.legacy):
+            print(f"Convertido: {path}")
+        return
+
+    from app.queries import parse_time
+    rows = scan(args.dataset, parse_time(args.start) if args.start else None,
+                parse_time(args.end) if args.end else None, args.ip, args.port, args.protocol,
+                args.fields.split(",") if args.fields else None)
+    for n, (_, row) in enumerate(rows, 1):
+        sys.stdout.write(json.dumps(row) + "\n")
+        if n == args.limit:
+            break
+
+
+if __name__ == "__main__":
+    # Uso: python -m backup.columnar convert packets | query packets --ip 10.0.0.5 --from 2024-11-19
+    main()
@@ -0,0 +1,360 @@
+import gzip
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from app.config import Config
+from config.redis_config import range_chunks, trim_until
+from core.metrics import counter, histogram
+from core.packet_stream import RECORD_FIELD
+from core.record import decode_record, to_json_safe
+
+# Backups em segmentos NDJSON comprimidos, só com acréscimos.
+#
+# Os dados são lidos do Redis em blocos de tamanho fixo (memória constante
+# qualquer que seja o acúmulo). Cada bloco vira um membro gzip completo
+# acrescentado ao segmento em escrita (<prefixo>_<data>.ndjson.gz.part),
+# seguido de fsync; um arquivo gzip com vários membros é lido como um só,
+# então o segmento é válido em todo offset confirmado. Depois do fsync o
+# checkpoint (.<prefixo>.checkpoint) registra o segmento, o offset e a
+# posição no Redis, e só então os dados são removidos da origem (listas).
+# Na rotação (tamanho ou idade) o .part é renomeado para .ndjson.gz.
+
+SEGMENT_SUFFIX = ".ndjson.gz"
+PART_SUFFIX = ".part"
+
+BACKUP_RECORDS = counter("sehenos_backup_records_total", "Registros gravados nos segmentos de backup", ("backup",))
+BACKUP_SEGMENTS = counter("sehenos_backup_segments_total", "Segmentos de backup finalizados", ("backup",))
+BACKUP_WRITE = histogram("sehenos_backup_write_seconds", "Gravação de um bloco no segmento (com fsync)", ("backup",))
+BACKUP_ERRORS = counter("sehenos_backup_errors_total", "Execuções do backup que falharam", ("backup",))
+BACKUP_GAPS = counter("sehenos_backup_gaps_total",
+                      "Retomadas em que o MAXLEN já tinha descartado entradas após a posição salva", ("stream",))
+
+
+def fsync_dir(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_json_atomic(path, data):
+    """
+    Grava um JSON de forma atômica e durável (arquivo temporário, fsync e rename).
+    """
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.tmp", path)
+    fsync_dir(os.path.dirname(path) or ".")
+
+
+class SegmentWriter:
+    """
+    Escritor de segmentos NDJSON gzip com rotação por tamanho (bytes
+    comprimidos) ou idade (s).
+    """
+
+    def __init__(self, directory, prefix, max_bytes=None, max_age=None, compresslevel=6):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes or Config.BACKUP_SEGMENT_BYTES
+        self.max_age = max_age or Config.BACKUP_SEGMENT_AGE
+        self.compresslevel = compresslevel
+        self.path = None
+        self.offset = 0
+        self._file = None
+        self._opened_at = 0.0
+
+    def _new_path(self):
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        name = f"{self.prefix}_{stamp}"
+        n = 1
+        while any(os.path.exists(os.path.join(self.directory, f"{name}{SEGMENT_SUFFIX}{suffix}"))
+                  for suffix in ("", PART_SUFFIX)):
+            name = f"{self.prefix}_{stamp}_{n}"
+            n += 1
+        return os.path.join(self.directory, f"{name}{SEGMENT_SUFFIX}{PART_SUFFIX}")
+
+    def open(self, path=None, offset=0):
+        """
+        Abre um segmento novo ou retoma um .part, descartando o que foi
+        escrito depois do último offset confirmado.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        if path and os.path.exists(path):
+            self._file = open(path, "r+b")
+            self._file.truncate(offset)
+            self._file.seek(offset)
+        else:
+            path, offset = self._new_path(), 0
+            self._file = open(path, "wb")
+        self.path = path
+        self.offset = offset
+        self._opened_at = time.monotonic()
+        return self
+
+    def write(self, lines):
+        """
+        Acrescenta um bloco de linhas JSON (bytes) como um membro gzip e
+        faz fsync.
+        :return: Offset confirmado no segmento.
+        """
+        if self._file is None:
+            self.open()
+        self._file.write(gzip.compress(b"\n".join(lines) + b"\n", self.compresslevel))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.offset = self._file.tell()
+        return self.offset
+
+    def should_rotate(self):
+        return self._file is not None and self.offset > 0 and (
+            self.offset >= self.max_bytes or time.monotonic() - self._opened_at >= self.max_age)
+
+    def close(self):
+        """
+        Finaliza o segmento atual (rename do .part).
+        :return: Caminho do segmento finalizado ou None.
+        """
+        if self._file is None:
+            return None
+        self._file.close()
+        self._file = None
+        path, self.path, self.offset = self.path, None, 0
+        if os.path.getsize(path) == 0:
+            os.remove(path)
+            return None
+        final = path[:-len(PART_SUFFIX)]
+        os.replace(path, final)
+        fsync_dir(self.directory)
+        return final
+
+
+def _stream_id(entry_id):
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class StreamSource:
+    """
+    Origem Redis Streams (shards dos pacotes). Posição: último id salvo de
+    cada stream. As entradas não são removidas (o descarte é feito pelo
+    MAXLEN da captura); se o MAXLEN já passou da posição salva, as entradas
+    descartadas antes do backup são registradas como lacuna (log e
+    sehenos_backup_gaps_total).
+    """
+
+    def __init__(self, redis_client, streams, legacy_cursor=True):
+        self.redis_client = redis_client
+        self.streams = list(streams)
+        self.legacy_cursor = legacy_cursor
+        self.gaps = 0
+
+    def _check_gap(self, stream, saved_id):
+        first = self.redis_client.xrange(stream, "-", "+", count=1)
+        if not first:
+            return
+        first_id = first[0][0].decode()
+        if _stream_id(first_id) > _stream_id(saved_id):
+            self.gaps += 1
+            BACKUP_GAPS.labels(stream).inc()
+            logging.warning(f"Backup de {stream}: entradas entre {saved_id} e {first_id} foram descartadas "
+                            f"pelo MAXLEN antes de serem salvas.")
+
+    def initial_position(self):
+        # Continuar de onde o backup antigo parou (chave <stream>:backup_cursor)
+        position = {}
+        for stream in self.streams:
+            cursor = self.redis_client.get(f"{stream}:backup_cursor") if self.legacy_cursor else None
+            if cursor:
+                position[stream] = cursor.decode()
+        return position
+
+    def read(self, position, count):
+        """
+        :return: (linhas JSON em bytes, nova posição).
+        """
+        position = dict(position)
+        for stream in self.streams:
+            if stream in position:
+                self._check_gap(stream, position[stream])
+            start = f"({position[stream]}" if stream in position else "-"
+            entries = self.redis_client.xrange(stream, start, "+", count=count)
+            if not entries:
+                continue
+            position[stream] = entries[-1][0].decode()
+            lines = [json.dumps(to_json_safe(decode_record(fields[RECORD_FIELD]))).encode()
+                     for _, fields in entries if fields.get(RECORD_FIELD) is not None]
+            return lines, position
+        return [], position
+
+    def commit(self, position):
+        pass
+
+
+class ListSource:
+    """
+    Origem lista do Redis (rpush). Posição: índice absoluto já salvo,
+    contando os itens removidos do início (<chave>:trimmed). Depois do
+    checkpoint os itens salvos são removidos com LTRIM + INCRBY (script Lua
+    trim_until); índices absolutos não mudam com a remoção. A chave
+    <chave>:epoch identifica a lista: se ela sumir (flushdb/clear_data), a
+    posição salva deixa de valer e nada é removido com base nela (a época é
+    conferida no mesmo script que remove).
+    """
+
+    def __init__(self, redis_client, key):
+        self.redis_client = redis_client
+        self.key = key
+        self.trimmed_key = f"{key}:trimmed"
+        self.epoch_key = f"{key}:epoch"
+
+    def _state(self):
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.set(self.epoch_key, uuid.uuid4().hex, nx=True)
+        pipe.get(self.epoch_key)
+        pipe.get(self.trimmed_key)
+        pipe.llen(self.key)
+        _, epoch, trimmed, length = pipe.execute()
+        return epoch.decode(), int(trimmed or 0), length
+
+    def initial_position(self):
+        epoch, trimmed, _ = self._state()
+        return {"index": trimmed, "epoch": epoch}
+
+    def read(self, position, count):
+        epoch, trimmed, length = self._state()
+        index = position.get("index", trimmed)
+        if position.get("epoch", epoch) != epoch or not trimmed <= index <= trimmed + length:
+            if "index" in position:
+                logging.warning(f"Posição do backup de {self.key} não corresponde à lista; recomeçando do início.")
+            index = trimmed
+        start = index - trimmed
+        # Blocos de LRANGE em pipeline: sem uma resposta gigante por bloco do backup
+        lines = [line for block in range_chunks(self.redis_client, self.key, start, start + count - 1)
+                 for line in block]
+        return lines, {"index": index + len(lines), "epoch": epoch}
+
+    def commit(self, position):
+        if position.get("epoch"):
+            trim_until(self.redis_client, self.key, self.trimmed_key, self.epoch_key,
+                       position["epoch"], position["index"])
+
+
+class BackupJob:
+    """
+    Copia uma origem (StreamSource ou ListSource) para segmentos, bloco a
+    bloco, com checkpoint após cada fsync.
+    """
+
+    def __init__(self, source, directory, prefix, chunk=None, max_bytes=None, max_age=None, on_segment=None):
+        self.source = source
+        self.directory = directory
+        self.prefix = prefix
+        self.chunk = chunk or Config.BACKUP_CHUNK
+        self.checkpoint_path = os.path.join(directory, f".{prefix}.checkpoint")
+        self.writer = SegmentWriter(directory, prefix, max_bytes, max_age)
+        self.position = None
+        self.saved = 0
+        # Chamado com o caminho de cada segmento finalizado (ex.: conversão Parquet)
+        self.on_segment = on_segment
+
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            checkpoint = {"position": self.source.initial_position()}
+        self.position = checkpoint["position"]
+        if checkpoint.get("segment"):
+            self.writer.open(checkpoint["segment"], checkpoint.get("offset", 0))
+        # Dados salvos antes de uma queda entre o checkpoint e a remoção
+        self.source.commit(self.position)
+
+    def _checkpoint(self):
+        write_json_atomic(self.checkpoint_path, {
+            "segment": self.writer.path,
+            "offset": self.writer.offset,
+            "position": self.position,
+        })
+
+    def run_once(self):
+        """
+        Salva tudo o que estiver pendente na origem.
+        :return: Quantidade de registros salvos.
+        """
+        if self.position is None:
+            self._load()
+        saved = 0
+        while True:
+            lines, position = self.source.read(self.position, self.chunk)
+            if not lines:
+                # Blocos de entradas inválidas/removidas: só avançar a posição
+                if position != self.position:
+                    self.position = position
+                    self._checkpoint()
+                    continue
+                break
+            with BACKUP_WRITE.labels(self.prefix).time():
+                self.writer.write(lines)
+            self.position = position
+            self._checkpoint()
+            self.source.commit(position)
+            saved += len(lines)
+            BACKUP_RECORDS.labels(self.prefix).inc(len(lines))
+            if self.writer.should_rotate():
+                self.rotate()
+        if self.writer.should_rotate():
+            self.rotate()
+        self.saved += saved
+        return saved
+
+    def rotate(self):
+        final = self.writer.close()
+        self._checkpoint()
+        if final:
+            BACKUP_SEGMENTS.labels(self.prefix).inc()
+            logging.info(f"Segmento de backup finalizado: {final}")
+            if self.on_segment:
+                self.on_segment(final)
+        return final
+
+    def run_forever(self, interval=None):
+        interval = interval or Config.BACKUP_INTERVAL
+        while True:
+            try:
+                saved = self.run_once()
+                if saved:
+                    logging.info(f"Backup {self.prefix}: {saved} registros salvos em {self.writer.path}")
+            except Exception as e:
+                BACKUP_ERRORS.labels(self.prefix).inc()
+                logging.error(f"Erro ao salvar backup {self.prefix}: {e}")
+            time.sleep(interval)
+
+
+def export_snapshot(source, directory, prefix, chunk=None):
+    """
+    Cópia completa da origem em um único segmento, em blocos e sem remover
+    nada (backups manuais da API).
+    :return: (caminho do segmento ou None se não havia dados, registros).
+    """
+    chunk = chunk or Config.BACKUP_CHUNK
+    writer = SegmentWriter(directory, prefix, max_bytes=float("inf"), max_age=float("inf"))
+    position = {}
+    total = 0
+    try:
+        while True:
+            lines, position = source.read(position, chunk)
+            if not lines:
+                break
+            writer.write(lines)
+            total += len(lines)
+    finally:
+        path = writer.close()
+    return path, total
@@ -1,14 +1,265 @@
+import logging
+import threading
+import time
 import redis
+from redis.backoff import ExponentialWithJitterBackoff
+from redis.client import Pipeline
+from redis.connection import UnixDomainSocketConnection, _HiredisParser, _RESP2Parser
+from redis.retry import Retry
+from redis.utils import HIREDIS_AVAILABLE
 from app.config import Config
+from core.metrics import counter, histogram
 
-def get_redis_connection():
+# Camada única de acesso ao Redis: todos os componentes usam o redis_client
+# deste módulo (um pool de conexões por processo). O pool é limitado a
+# REDIS_MAX_CONNECTIONS e espera até REDIS_POOL_TIMEOUT por uma conexão livre.
+# Conexões ociosas há mais de REDIS_HEALTH_CHECK_INTERVAL são testadas com
+# PING antes do uso. Falhas de conexão e timeouts são repetidos com backoff
+# exponencial (REDIS_RETRIES tentativas). Cada comando e cada pipeline é
+# contabilizado em command_stats (chamadas, erros e latência) e nas métricas
+# sehenos_redis_* (core.metrics).
+
+# Remove o início da lista até o índice absoluto ARGV[2], apenas se a época
+# (KEYS[3]) ainda for ARGV[1]: a verificação e a remoção são atômicas
+TRIM_UNTIL = """
+if redis.call('GET', KEYS[3]) ~= ARGV[1] then
+    return 0
+end
+local trimmed = tonumber(redis.call('GET', KEYS[2]) or '0')
+local count = math.min(tonumber(ARGV[2]) - trimmed, redis.call('LLEN', KEYS[1]))
+if count <= 0 then
+    return 0
+end
+redis.call('LTRIM', KEYS[1], count, -1)
+redis.call('INCRBY', KEYS[2], count)
+return count
+"""
+
+
+class CommandStats:
+    """
+    Contadores de latência por comando. Pipelines são contados como
+    "PIPELINE" (ou "MULTI", com transação), com o número de comandos enviados.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._commands = {}
+
+    def record(self, name, elapsed, error=False, commands=1):
+        with self._lock:
+            entry = self._commands.get(name)
+            if entry is None:
+                entry = self._commands[name] = [0, 0, 0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += error
+            entry[2] += commands
+            entry[3] += elapsed
+            if elapsed > entry[4]:
+                entry[4] = elapsed
+
+    def snapshot(self):
+        """
+        :return: {comando: {calls, errors, commands, total_ms, avg_ms, max_ms}}.
+        """
+        with self._lock:
+            commands = {name: list(entry) for name, entry in self._commands.items()}
+        return {
+            name: {
+                "calls": calls,
+                "errors": errors,
+                "commands": sent,
+                "total_ms": round(total * 1000, 3),
+                "avg_ms": round(total * 1000 / calls, 3),
+                "max_ms": round(peak * 1000, 3),
+            }
+            for name, (calls, errors, sent, total, peak) in sorted(commands.items())
+        }
+
+    def reset(self):
+        with self._lock:
+            self._commands.clear()
+
+
+command_stats = CommandStats()
+
+# Mesmas medidas no /metrics (todos os clientes do processo)
+REDIS_LATENCY = histogram("sehenos_redis_command_seconds", "Latência dos comandos e pipelines no Redis",
+                          ("command",))
+REDIS_ERRORS = counter("sehenos_redis_errors_total", "Comandos e pipelines do Redis com erro", ("command",))
+
+
+def _record(stats, name, elapsed, error, commands=1):
+    stats.record(name, elapsed, error, commands)
+    REDIS_LATENCY.labels(name).observe(elapsed)
+    if error:
+        REDIS_ERRORS.labels(name).inc()
+
+
+def _command_name(args):
+    name = args[0] if args else "?"
+    return (name.decode() if isinstance(name, bytes) else str(name)).upper()
+
+
+class InstrumentedPipeline(Pipeline):
+    """
+    Pipeline que registra o tempo de cada execute() em command_stats.
+    """
+
+    stats = command_stats
+
+    def execute(self, raise_on_error=True):
+        commands = len(self.command_stack)
+        start = time.perf_counter()
+        error = False
+        try:
+            return super().execute(raise_on_error)
+        except Exception:
+            error = True
+            raise
+        finally:
+            if commands:
+                _record(self.stats, "MULTI" if self.transaction else "PIPELINE",
+                        time.perf_counter() - start, error, commands)
+
+
+class InstrumentedRedis(redis.Redis):
+    """
+    Cliente que registra a latência de cada comando em command_stats.
+    """
+
+    def __init__(self, *args, stats=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = stats or command_stats
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        error = False
+        try:
+            return super().execute_command(*args, **options)
+        except Exception:
+            error = True
+            raise
+        finally:
+            _record(self.stats, _command_name(args), time.perf_counter() - start, error)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+        pipe.stats = self.stats
+        return pipe
+
+
+def parser_class(name=None):
+    """
+    Parser das respostas: "hiredis" (em C, se instalado), "python" ou "auto".
+    """
+    name = (name or Config.REDIS_PARSER).lower()
+    if name == "python":
+        return _RESP2Parser
+    if name == "hiredis" and not HIREDIS_AVAILABLE:
+        logging.warning("REDIS_PARSER=hiredis, mas o pacote hiredis não está instalado; usando o parser em Python.")
+    return _HiredisParser if HIREDIS_AVAILABLE else _RESP2Parser
+
+
+def create_pool(**overrides):
+    """
+    Cria o pool de conexões a partir da configuração (TCP ou socket unix
+    quando REDIS_SOCKET estiver definido).
+    """
+    kwargs = {
+        "db": Config.REDIS_DB,
+        "password": Config.REDIS_PASSWORD or None,
+        "max_connections": Config.REDIS_MAX_CONNECTIONS,
+        "timeout": Config.REDIS_POOL_TIMEOUT,
+        "socket_timeout": Config.REDIS_SOCKET_TIMEOUT or None,
+        "socket_connect_timeout": Config.REDIS_CONNECT_TIMEOUT,
+        "health_check_interval": Config.REDIS_HEALTH_CHECK_INTERVAL,
+        "retry": Retry(ExponentialWithJitterBackoff(cap=Config.REDIS_RETRY_CAP, base=Config.REDIS_RETRY_BASE),
+                       Config.REDIS_RETRIES),
+        "parser_class": parser_class(),
+    }
+    if Config.REDIS_SOCKET:
+        kwargs.update(connection_class=UnixDomainSocketConnection, path=Config.REDIS_SOCKET)
+    else:
+        kwargs.update(host=Config.REDIS_HOST, port=Config.REDIS_PORT, socket_keepalive=True)
+    kwargs.update(overrides)
+    return redis.BlockingConnectionPool(**kwargs)
+
+
+def get_redis_connection(pool=None):
     """
     Inicializa e retorna a conexão com o Redis.
     """
-    return redis.StrictRedis(
-        host=Config.REDIS_HOST,
-        port=Config.REDIS_PORT,
-        db=Config.REDIS_DB
-    )
+    return InstrumentedRedis(connection_pool=pool or create_pool())
+
 
 redis_client = get_redis_connection()
+_trim_until = redis_client.register_script(TRIM_UNTIL)
+
+
+def bulk_push(client, key, values, chunk=None):
+    """
+    RPUSH de muitos valores em blocos, enviados em um único pipeline.
+    :return: Tamanho da lista após a escrita.
+    """
+    if not values:
+        return None
+    chunk = chunk or Config.REDIS_BULK_CHUNK
+    pipe = client.pipeline(transaction=False)
+    for i in range(0, len(values), chunk):
+        pipe.rpush(key, *values[i:i + chunk])
+    return pipe.execute()[-1]
+
+
+def range_chunks(client, key, start=0, end=-1, chunk=None, window=4):
+    """
+    Lê a lista em blocos de LRANGE, `window` blocos por pipeline.
+    :return: Gerador de listas de itens (em ordem).
+    """
+    chunk = chunk or Config.REDIS_BULK_CHUNK
+    if start < 0 or end < 0:
+        length = client.llen(key)
+        start = max(0, length + start) if start < 0 else start
+        end = length + end if end < 0 else end
+    while start <= end:
+        pipe = client.pipeline(transaction=False)
+        for i in range(window):
+            first = start + i * chunk
+            if first > end:
+                break
+            pipe.lrange(key, first, min(first + chunk - 1, end))
+        for items in pipe.execute():
+            if not items:
+                return
+            yield items
+            start += len(items)
+            if len(items) < chunk:
+                return
+
+
+def trim_until(client, key, trimmed_key, epoch_key, epoch, index):
+    """
+    Remove o início da lista até o índice absoluto `index`, se a época da
+    lista ainda for `epoch` (verificação e remoção atômicas, em Lua).
+    :return: Quantidade de itens removidos.
+    """
+    return _trim_until(keys=[key, trimmed_key, epoch_key], args=[epoch, index], client=client)
+
+
+def redis_stats(client=None):
+    """
+    Estado da conexão e contadores de latência por comando.
+    """
+    client = client or redis_client
+    try:
+        healthy = bool(client.ping())
+    except redis.RedisError:
+        healthy = False
+    pool = client.connection_pool
+    return {
+        "healthy": healthy,
+        "endpoint": Config.REDIS_SOCKET or f"{Config.REDIS_HOST}:{Config.REDIS_PORT}",
+        "parser": pool.connection_kwargs["parser_class"].__name__.strip("_"),
+        "max_connections": pool.max_connections,
+        "commands": client.stats.snapshot(),
+    }
@@ -0,0 +1,138 @@
+import math
+import time
+import uuid
+from app.config import Config
+
+# Índices secundários das anomalias.
+#
+# Cada anomalia também é gravada em anomaly:<id> (com TTL de
+# ANOMALY_RETENTION) e indexada por:
+#   anomalies:ip:<ip>          ZSET id -> timestamp (origem e destino)
+#   anomalies:minute:<minuto>  ZSET id -> timestamp das anomalias do minuto
+#   anomalies:minutes          ZSET minuto -> minuto dos baldes não vazios
+# Registro, lista network_anomalies, índices e o lote no feed ao vivo
+# (stream anomalies:feed, uma entrada por lote com o array JSON das
+# anomalias, lido por app.live) são escritos na mesma transação (MULTI/EXEC). Os índices perdem as entradas mais antigas que a
+# retenção a cada escrita, de forma que nunca apontam para registros
+# expirados por muito tempo.
+
+ANOMALY_LIST = "network_anomalies"
+MINUTES_KEY = "anomalies:minutes"
+FEED_STREAM = "anomalies:feed"
+FEED_FIELD = b"d"
+
+
+def record_key(anomaly_id):
+    return f"anomaly:{anomaly_id}"
+
+
+def ip_key(ip):
+    return f"anomalies:ip:{ip}"
+
+
+def minute_key(minute):
+    return f"anomalies:minute:{minute}"
+
+
+def write_anomalies(redis_client, anomalies, retention=None, now=None):
+    """
+    Grava as anomalias e os índices em uma única transação.
+    :param anomalies: Lista de (timestamp, src_ip, dst_ip, JSON serializado).
+    :return: Ids atribuídos às anomalias.
+    """
+    if not anomalies:
+        return []
+    retention = int(retention or Config.ANOMALY_RETENTION)
+    now = time.time() if now is None else now
+    oldest = now - retention
+
+    pipe = redis_client.pipeline(transaction=True)
+    ids = []
+    ips = set()
+    minutes = set()
+    for timestamp, src_ip, dst_ip, raw in anomalies:
+        anomaly_id = uuid.uuid4().hex
+        ids.append(anomaly_id)
+        minute = int(timestamp // 60)
+        pipe.rpush(ANOMALY_LIST, raw)
+        pipe.set(record_key(anomaly_id), raw, ex=retention)
+        for ip in {src_ip, dst_ip} - {None}:
+            pipe.zadd(ip_key(ip), {anomaly_id: timestamp})
+            ips.add(ip)
+        pipe.zadd(minute_key(minute), {anomaly_id: timestamp})
+        minutes.add(minute)
+
+    # Retenção dos índices igual à dos registros
+    for ip in ips:
+        pipe.zremrangebyscore(ip_key(ip), "-inf", f"({oldest}")
+        pipe.expire(ip_key(ip), retention)
+    for minute in minutes:
+        pipe.expire(minute_key(minute), retention)
+    pipe.zadd(MINUTES_KEY, {str(minute): minute for minute in minutes})
+    pipe.zremrangebyscore(MINUTES_KEY, "-inf", f"({math.floor(oldest / 60)}")
+    batch = b",".join(raw.encode() if isinstance(raw, str) else raw for _, _, _, raw in anomalies)
+    pipe.xadd(FEED_STREAM, {FEED_FIELD: b"[" + batch + b"]"}, maxlen=Config.ANOMALY_FEED_MAXLEN, approximate=True)
+    pipe.execute()
+    return ids
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def zrev_scan(redis_client, key, max_score="+inf", min_score="-inf", after=None, chunk=1000):
+    """
+    Percorre um ZSET do maior para o menor score (ZREVRANGEBYSCORE em blocos).
+    :param after: (score, membro) já entregue: retoma logo depois dele.
+    :return: Gerador de (score, membro).
+    """
+    if after is not None:
+        max_score = after[0]
+    while True:
+        entries = redis_client.zrevrangebyscore(key, max_score, min_score, start=0, num=chunk, withscores=True)
+        fresh = 0
+        for member, score in entries:
+            member = _decode(member)
+            # Empates no score saem em ordem lexicográfica reversa
+            if after is not None and score == after[0] and member >= after[1]:
+                continue
+            fresh += 1
+            after = (score, member)
+            yield score, member
+        if len(entries) < chunk:
+            return
+        if not fresh:
+            # Bloco inteiro com o mesmo score: avançar com offset
+            chunk *= 2
+            continue
+        max_score = after[0]
+
+
+def ip_entries(redis_client, ip, start=None, end=None, after=None):
+    """
+    Anomalias de um IP (origem ou destino), das mais recentes para as mais
+    antigas: O(log n + k) no ZSET do IP.
+    """
+    return zrev_scan(redis_client, ip_key(ip), "+inf" if end is None else end,
+                     "-inf" if start is None else start, after)
+
+
+def time_entries(redis_client, start=None, end=None, after=None):
+    """
+    Anomalias de um intervalo de tempo pelos baldes de minuto, das mais
+    recentes para as mais antigas. Só os baldes não vazios são visitados.
+    """
+    if after is not None:
+        end = after[0] if end is None else min(end, after[0])
+    first = "-inf" if start is None else math.floor(start / 60)
+    last = "+inf" if end is None else math.floor(end / 60)
+    for minute in redis_client.zrevrangebyscore(MINUTES_KEY, last, first):
+        yield from zrev_scan(redis_client, minute_key(_decode(minute)), "+inf" if end is None else end,
+                             "-inf" if start is None else start, after)
+
+
+def fetch_records(redis_client, ids):
+    """
+    Registros das anomalias (MGET); ids expirados retornam None.
+    """
+    return redis_client.mget([record_key(anomaly_id) for anomaly_id in ids]) if ids else []
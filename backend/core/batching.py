@@ -0,0 +1,137 @@
+import logging
+import time
+from app.config import Config
+
+# Política latência x vazão: fração de BATCH_MAX_LATENCY_MS que o lote pode
+# esperar por mais pacotes depois que o primeiro chegou
+POLICIES = {"latency": 0.0, "balanced": 0.5, "throughput": 1.0}
+
+
+def _entry_ms(entry_id):
+    # Ids do stream começam com o horário (ms) em que a captura gravou a entrada
+    entry_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+    return int(entry_id.split("-", 1)[0])
+
+
+class AdaptiveBatcher:
+    """
+    Forma os lotes da detecção a partir de um StreamConsumer.
+
+    Sem dados, bloqueia no stream (XREADGROUP BLOCK) até chegar o primeiro
+    pacote; depois continua lendo até atingir o tamanho alvo ou esgotar a
+    espera permitida pela política. O alvo dobra enquanto houver fila
+    (leituras cheias) e cai pela metade quando o tráfego diminui ou quando o
+    processamento do lote anterior passou da latência máxima, entre
+    min_batch e max_batch.
+    """
+
+    def __init__(self, consumer, max_latency_ms=None, max_batch=None, min_batch=None, policy=None):
+        self.consumer = consumer
+        self.max_latency = (Config.BATCH_MAX_LATENCY_MS if max_latency_ms is None else max_latency_ms) / 1000
+        self.max_batch = max_batch or Config.BATCH_MAX_SIZE
+        self.min_batch = min(min_batch or Config.BATCH_MIN_SIZE, self.max_batch)
+        policy = policy or Config.BATCH_POLICY
+        if policy not in POLICIES:
+            raise ValueError(f"Política de lotes desconhecida: {policy} (use {', '.join(POLICIES)})")
+        self.policy = policy
+        self.fill_wait = self.max_latency * POLICIES[policy]
+        self.target = min(max(consumer.count, self.min_batch), self.max_batch)
+
+        # Medidas do lote atual e acumulados desde o último stats()
+        self.last = {}
+        self._started = 0.0
+        self._read_time = 0.0
+        self._oldest_ms = None
+        self._size = 0
+        self.batches = 0
+        self.rows = 0
+        self.wait_time = 0.0
+        self.process_time = 0.0
+        self.max_queue_latency = 0.0
+
+    def next_batch(self):
+        """
+        Lê o próximo lote (bloqueando enquanto o stream estiver vazio).
+        :return: (ids, registros binários); listas vazias se nada chegou
+                 dentro de STREAM_BLOCK_MS.
+        """
+        ids, records = self.consumer.read_batch(count=self.target)
+        start = time.monotonic()
+        # Leitura cheia: ainda há fila no stream
+        backlog = len(ids) >= self.target
+        deadline = start + self.fill_wait
+        while ids and not backlog:
+            remaining = deadline - time.monotonic()
+            requested = self.target - len(ids)
+            # Sem espera (política "latency"): só o que já está no stream
+            more_ids, more_records = self.consumer.read_batch(
+                count=requested, block_ms=int(remaining * 1000) if remaining > 0.001 else 0)
+            if not more_ids:
+                break
+            ids += more_ids
+            records += more_records
+            backlog = len(more_ids) >= requested
+
+        self._started = time.monotonic()
+        self._read_time = self._started - start
+        self._size = len(ids)
+        self._oldest_ms = min(map(_entry_ms, ids)) if ids else None
+        if ids:
+            self._adapt(len(ids), backlog)
+        return ids, records
+
+    def done(self, rows=None):
+        """
+        Registra o fim do processamento do lote lido por next_batch().
+        :param rows: Linhas processadas (padrão: entradas lidas).
+        """
+        if self._oldest_ms is None:
+            return
+        rows = self._size if rows is None else rows
+        now = time.monotonic()
+        process = now - self._started
+        queue_latency = time.time() - self._oldest_ms / 1000
+        self.last = {
+            "rows": rows,
+            "target": self.target,
+            "wait_ms": round(self._read_time * 1000, 1),
+            "process_ms": round(process * 1000, 1),
+            "latency_ms": round(queue_latency * 1000, 1),
+        }
+        logging.debug(f"Lote processado: {self.last}")
+
+        self.batches += 1
+        self.rows += rows
+        self.wait_time += self._read_time
+        self.process_time += process
+        self.max_queue_latency = max(self.max_queue_latency, queue_latency)
+        # Processamento acima da latência máxima: lotes menores, exceto
+        # quando a prioridade é a vazão
+        if process > self.max_latency and self.policy != "throughput":
+            self.target = max(self.min_batch, self.target // 2)
+        self._oldest_ms = None
+
+    def _adapt(self, size, backlog):
+        if backlog:
+            self.target = min(self.max_batch, self.target * 2)
+        elif size < self.target // 2:
+            self.target = max(self.min_batch, self.target // 2)
+
+    def stats(self):
+        """
+        Retorna as médias por lote desde a última chamada e zera os acumulados.
+        """
+        batches = self.batches or 1
+        stats = {
+            "policy": self.policy,
+            "target": self.target,
+            "batches": self.batches,
+            "avg_rows": round(self.rows / batches, 1),
+            "avg_wait_ms": round(self.wait_time * 1000 / batches, 1),
+            "avg_process_ms": round(self.process_time * 1000 / batches, 1),
+            "max_latency_ms": round(self.max_queue_latency * 1000, 1),
+            "last": self.last,
+        }
+        self.batches = self.rows = 0
+        self.wait_time = self.process_time = self.max_queue_latency = 0.0
+        return stats
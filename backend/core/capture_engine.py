@@ -0,0 +1,432 @@
+import mmap
+import select
+import socket
+import struct
+import logging
+from app.config import Config
+
+try:
+    import scapy.all as scapy
+    from scapy.layers.inet import IP, TCP, UDP
+    from scapy.layers.inet6 import IPv6
+    from scapy.layers.dns import DNS
+    from scapy.layers.l2 import Ether
+except ImportError:  # A captura pelo anel AF_PACKET não depende do scapy
+    scapy = None
+
+# |-------------------------↓ PARSER ↓-------------------------------------|
+
+_U16 = struct.Struct("!H")
+_IPV4 = struct.Struct("!BBHHHBBH4s4s")
+_IPV6 = struct.Struct("!IHBB16s16s")
+_PORTS = struct.Struct("!HH")
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+_VLAN_TYPES = (0x8100, 0x88A8)
+
+# Cabeçalhos de extensão IPv6 que são percorridos até a camada de transporte
+_IPV6_EXT_HEADERS = (0, 43, 60)
+_IPV6_FRAGMENT = 44
+
+_DNS_UDP_PORTS = (53, 5353)
+_DNS_TCP_PORTS = (53,)
+
+
+def _dns_qname(msg):
+    """
+    Extrai o nome da primeira pergunta de uma mensagem DNS (memoryview),
+    no mesmo formato do scapy ("exemplo.com."). Retorna None se não houver
+    perguntas e False se a mensagem não puder ser dissecada.
+    """
+    if len(msg) < 12:
+        return False
+    if not _U16.unpack_from(msg, 4)[0]:
+        return None
+
+    labels = []
+    pos = 12
+    jumps = 0
+    while pos < len(msg):
+        size = msg[pos]
+        if size == 0:
+            break
+        if size & 0xC0 == 0xC0:
+            # Ponteiro de compressão
+            if pos + 1 >= len(msg) or jumps > 16:
+                break
+            pos = ((size & 0x3F) << 8) | msg[pos + 1]
+            jumps += 1
+            continue
+        labels.append(bytes(msg[pos + 1:pos + 1 + size]))
+        pos += 1 + size
+    name = b".".join(labels) + b"."
+    return name.decode("utf-8", errors="ignore")
+
+
+def parse_frame(frame, timestamp, vlan_stripped=False):
+    """
+    Extrai de um quadro Ethernet os mesmos campos que scapy_to_record obtém
+    pelo scapy, lendo os cabeçalhos direto do buffer com struct.unpack_from,
+    sem dissecar o pacote inteiro.
+    :param frame: memoryview (ou bytes) do quadro, a partir do cabeçalho Ethernet.
+    :param timestamp: Epoch da captura em segundos.
+    :param vlan_stripped: Se o kernel removeu a tag 802.1Q do quadro (anel),
+        os 4 bytes são somados ao tamanho, como faz a libpcap.
+    :return: Dicionário do registro ou None se o quadro não for IP.
+    """
+    size = len(frame)
+    if size < 14:
+        return None
+
+    ethertype = _U16.unpack_from(frame, 12)[0]
+    off = 14
+    while ethertype in _VLAN_TYPES and size >= off + 4:
+        ethertype = _U16.unpack_from(frame, off + 2)[0]
+        off += 4
+
+    if ethertype == ETH_P_IP:
+        if size < off + 20:
+            return None
+        vihl, _, total_len, _, frag, ttl, proto, _, src, dst = _IPV4.unpack_from(frame, off)
+        l4 = off + (vihl & 0x0F) * 4
+        payload_len = total_len - (vihl & 0x0F) * 4
+        end = min(l4 + payload_len, size) if payload_len >= 0 else size
+        src_ip = socket.inet_ntoa(src)
+        dst_ip = socket.inet_ntoa(dst)
+        # Fragmentos com offset não trazem cabeçalho de transporte
+        l4_proto = proto if not frag & 0x1FFF else None
+        payload_start = l4
+    elif ethertype == ETH_P_IPV6:
+        if size < off + 40:
+            return None
+        _, plen, proto, ttl, src, dst = _IPV6.unpack_from(frame, off)
+        payload_start = off + 40
+        end = min(payload_start + plen, size) if plen else size
+        src_ip = socket.inet_ntop(socket.AF_INET6, src)
+        dst_ip = socket.inet_ntop(socket.AF_INET6, dst)
+        l4_proto = proto
+        l4 = payload_start
+        while l4_proto in _IPV6_EXT_HEADERS and l4 + 8 <= end:
+            l4_proto, ext_len = frame[l4], frame[l4 + 1]
+            l4 += (ext_len + 1) * 8
+        if l4_proto == _IPV6_FRAGMENT and l4 + 8 <= end:
+            frag_offset = _U16.unpack_from(frame, l4 + 2)[0] >> 3
+            l4_proto = frame[l4] if not frag_offset else None
+            l4 += 8
+    else:
+        return None
+
+    wire_size = size + 4 if vlan_stripped else size
+    data = {
+        "timestamp": timestamp,
+        "src_ip": src_ip,
+        "dst_ip": dst_ip,
+        "protocol": proto,
+        "length": wire_size,
+        "mac_src": frame[6:12].hex(":"),
+        "mac_dst": frame[0:6].hex(":"),
+        "time_to_live": ttl,
+    }
+
+    dns_msg = None
+    if l4_proto == 6 and end - l4 >= 20:
+        sport, dport = _PORTS.unpack_from(frame, l4)
+        data["src_port"] = sport
+        data["dst_port"] = dport
+        data["tcp_flags"] = ((frame[l4 + 12] & 0x01) << 8) | frame[l4 + 13]
+        if sport in _DNS_TCP_PORTS or dport in _DNS_TCP_PORTS:
+            start = l4 + (frame[l4 + 12] >> 4) * 4
+            if end - start >= 2:
+                dns_len = _U16.unpack_from(frame, start)[0]
+                if dns_len >= 14 and end - start >= dns_len:
+                    dns_msg = frame[start + 2:end]
+    elif l4_proto == 17 and end - l4 >= 8:
+        sport, dport = _PORTS.unpack_from(frame, l4)
+        data["src_port"] = sport
+        data["dst_port"] = dport
+        if sport in _DNS_UDP_PORTS or dport in _DNS_UDP_PORTS:
+            dns_msg = frame[l4 + 8:end]
+
+    if dns_msg is not None:
+        qname = _dns_qname(dns_msg)
+        if qname is not False:
+            data["dns_queries"] = qname
+
+    payload = bytes(frame[payload_start:end])
+    data["payload"] = payload if payload else None
+    data["bytes"] = wire_size
+    return data
+
+
+def scapy_to_record(packet):
+    """
+    Extrai o registro de um pacote já dissecado pelo scapy (caminho antigo,
+    usado como fallback e como referência nos testes).
+    """
+    if packet.haslayer(IP):
+        ip = packet[IP]
+        protocol, ttl = getattr(ip, "proto", None), getattr(ip, "ttl", None)
+    elif packet.haslayer(IPv6):
+        ip = packet[IPv6]
+        protocol, ttl = getattr(ip, "nh", None), getattr(ip, "hlim", None)
+    else:
+        return None
+
+    data = {
+        "timestamp": float(packet.time),
+        "src_ip": ip.src,
+        "dst_ip": ip.dst,
+        "protocol": protocol,
+        "length": len(packet),
+        "mac_src": packet[Ether].src if packet.haslayer(Ether) else None,
+        "mac_dst": packet[Ether].dst if packet.haslayer(Ether) else None,
+        "time_to_live": ttl,
+    }
+
+    # Portas e flags TCP/UDP
+    if packet.haslayer(TCP):
+        data.update({
+            "src_port": getattr(packet[TCP], "sport", None),
+            "dst_port": getattr(packet[TCP], "dport", None),
+            "tcp_flags": int(packet[TCP].flags),
+        })
+    elif packet.haslayer(UDP):
+        data.update({
+            "src_port": getattr(packet[UDP], "sport", None),
+            "dst_port": getattr(packet[UDP], "dport", None),
+        })
+
+    # DNS
+    if packet.haslayer(DNS):
+        dns_layer = packet[DNS]
+        dns_queries = None
+        if hasattr(dns_layer, "qd") and dns_layer.qd:
+            dns_queries = getattr(dns_layer.qd[0], "qname", b"").decode("utf-8", errors="ignore")
+        data["dns_queries"] = dns_queries
+
+    # Payload
+    raw_payload = bytes(ip.payload)
+    data["payload"] = raw_payload if raw_payload else None
+
+    # Volume (bytes)
+    data["bytes"] = len(packet)
+    return data
+
+# |-------------------------↓ BACKENDS ↓-----------------------------------|
+
+# Constantes de linux/if_packet.h
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+ETH_P_ALL = 0x0003
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+TP_STATUS_VLAN_VALID = 1 << 4
+PACKET_OUTGOING = 4
+
+# struct tpacket_block_desc / tpacket_hdr_v1: block_status, num_pkts, offset_to_first_pkt
+_BLOCK_HDR = struct.Struct("=III")
+_BLOCK_HDR_OFFSET = 8
+# struct tpacket3_hdr: tp_next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len, tp_status, tp_mac, tp_net
+_PKT_HDR = struct.Struct("=IIIIIIHH")
+# sockaddr_ll fica logo após o tpacket3_hdr (48 bytes); sll_pkttype no offset 10
+_SLL_PKTTYPE_OFFSET = 48 + 10
+
+
+class ScapyCapture:
+    """
+    Captura pelo scapy.sniff: disseca cada quadro inteiro, mais lento.
+    """
+
+    name = "scapy"
+
+    def __init__(self, callback, iface=None):
+        if scapy is None:
+            raise RuntimeError("scapy não está instalado.")
+        self.callback = callback
+        self.iface = iface
+        self.packets = 0
+
+    def _handle(self, packet):
+        data = scapy_to_record(packet)
+        if data is not None:
+            self.callback(data)
+        self.packets += 1
+
+    def run(self):
+        scapy.sniff(prn=self._handle, store=False, iface=self.iface)
+
+    def stats(self):
+        return {"packets": self.packets}
+
+    def close(self):
+        pass
+
+
+class RingCapture:
+    """
+    Captura por socket AF_PACKET com anel TPACKET_V3 mapeado em memória.
+    O kernel preenche blocos inteiros de quadros; cada bloco é percorrido
+    direto no mmap e devolvido ao kernel depois de processado.
+    """
+
+    name = "ring"
+
+    def __init__(self, callback, iface=None, block_size=None, block_nr=None, frame_size=None, timeout_ms=None):
+        self.callback = callback
+        self.iface = iface or Config.CAPTURE_INTERFACE
+        self.block_size = block_size or Config.RING_BLOCK_SIZE
+        self.block_nr = block_nr or Config.RING_BLOCK_NR
+        self.frame_size = frame_size or Config.RING_FRAME_SIZE
+        self.timeout_ms = timeout_ms or Config.RING_TIMEOUT_MS
+        self.skip_outgoing = self.iface == "lo"  # Evita quadros duplicados no loopback
+        self.packets = 0
+        self._running = False
+        self._sock = None
+        self._ring = None
+        self._open()
+
+    def _open(self):
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        try:
+            sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            frame_nr = (self.block_size * self.block_nr) // self.frame_size
+            req = struct.pack("=7I", self.block_size, self.block_nr, self.frame_size, frame_nr,
+                              self.timeout_ms, 0, 0)
+            sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+            self._ring = mmap.mmap(sock.fileno(), self.block_size * self.block_nr,
+                                   mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            sock.bind((self.iface, ETH_P_ALL))
+        except Exception:
+            sock.close()
+            raise
+        self._sock = sock
+
+    def _process_block(self, view, base):
+        num_pkts, first = _BLOCK_HDR.unpack_from(view, base + _BLOCK_HDR_OFFSET)[1:]
+        pos = base + first
+        for _ in range(num_pkts):
+            next_offset, sec, nsec, snaplen, _, status, mac, _ = _PKT_HDR.unpack_from(view, pos)
+            if not (self.skip_outgoing and view[pos + _SLL_PKTTYPE_OFFSET] == PACKET_OUTGOING):
+                data = parse_frame(view[pos + mac:pos + mac + snaplen], sec + nsec * 1e-9,
+                                   vlan_stripped=bool(status & TP_STATUS_VLAN_VALID))
+                if data is not None:
+                    self.callback(data)
+            self.packets += 1
+            pos += next_offset
+
+    def run(self):
+        view = memoryview(self._ring)
+        poller = select.poll()
+        poller.register(self._sock, select.POLLIN | select.POLLERR)
+        block = 0
+        self._running = True
+        try:
+            while self._running:
+                base = block * self.block_size
+                status = _BLOCK_HDR.unpack_from(view, base + _BLOCK_HDR_OFFSET)[0]
+                if not status & TP_STATUS_USER:
+                    poller.poll(self.timeout_ms)
+                    continue
+                try:
+                    self._process_block(view, base)
+                finally:
+                    # Devolver o bloco ao kernel
+                    struct.pack_into("=I", view, base + _BLOCK_HDR_OFFSET, TP_STATUS_KERNEL)
+                block = (block + 1) % self.block_nr
+        finally:
+            view.release()
+
+    def stop(self):
+        self._running = False
+
+    def stats(self):
+        """
+        Contadores do kernel desde a última leitura (tpacket_stats_v3).
+        """
+        raw = self._sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 12)
+        packets, drops, freeze = struct.unpack("=III", raw)
+        return {"kernel_packets": packets, "kernel_drops": drops, "freeze_count": freeze}
+
+    def close(self):
+        self._running = False
+        if self._ring is not None:
+            self._ring.close()
+            self._ring = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def read_pcap(path):
+    """
+    Lê um arquivo pcap (Ethernet) e gera (timestamp, quadro).
+    """
+    with open(path, "rb") as f:
+        header = f.read(24)
+        magic = header[:4]
+        if magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+            endian = "<"
+        elif magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+            endian = ">"
+        else:
+            raise ValueError(f"Formato pcap não suportado: {path}")
+        nano = magic in (b"\x4d\x3c\xb2\xa1", b"\xa1\xb2\x3c\x4d")
+        linktype = struct.unpack(endian + "I", header[20:24])[0]
+        if linktype != 1:
+            raise ValueError(f"Linktype {linktype} não suportado (apenas Ethernet).")
+
+        record = struct.Struct(endian + "IIII")
+        divisor = 1e9 if nano else 1e6
+        while True:
+            raw = f.read(16)
+            if len(raw) < 16:
+                return
+            sec, frac, incl_len, _ = record.unpack(raw)
+            yield sec + frac / divisor, f.read(incl_len)
+
+
+class PcapReplay:
+    """
+    Reproduz um arquivo pcap pelo mesmo parser do anel, para validar a
+    captura rápida contra o scapy sem precisar de tráfego real.
+    """
+
+    name = "pcap"
+
+    def __init__(self, callback, path=None):
+        self.callback = callback
+        self.path = path or Config.CAPTURE_PCAP
+        self.packets = 0
+
+    def run(self):
+        for timestamp, frame in read_pcap(self.path):
+            self.packets += 1
+            data = parse_frame(memoryview(frame), timestamp)
+            if data is not None:
+                self.callback(data)
+
+    def stats(self):
+        return {"packets": self.packets}
+
+    def close(self):
+        pass
+
+
+def create_capture(callback, backend=None, iface=None):
+    """
+    Cria o backend de captura configurado. Se o anel AF_PACKET não puder ser
+    aberto (sem permissão ou fora do Linux), cai para o scapy.
+    """
+    backend = backend or Config.CAPTURE_BACKEND
+    if backend == "pcap":
+        return PcapReplay(callback)
+    if backend == "ring":
+        try:
+            return RingCapture(callback, iface=iface)
+        except (OSError, AttributeError) as e:
+            logging.warning(f"Anel AF_PACKET indisponível ({e}), usando scapy.")
+    return ScapyCapture(callback, iface=iface)
@@ -0,0 +1,307 @@
+import json
+import logging
+import time
+import numpy as np
+from app.config import Config
+from config.redis_config import redis_client
+from models.anomaly_models import load_autoencoder, load_isolation_forest, load_models, model_dir_for
+from models.inference import PCAResidual
+from models.preprocessing import StreamingPreprocessor, feature_columns, to_columns
+from core.record import decode_batch, invalid_records, to_json_safe
+from core.dns_enrichment import ReverseDNSResolver
+from config.settings import REMOTE_BLACKLIST_URL
+from core.reputation import load_remote_index, load_reputation
+from core.flows import FlowTable
+from core.packet_stream import StreamConsumer, shard_streams
+from core.batching import AdaptiveBatcher
+from core.anomaly_index import write_anomalies
+from core.metrics import SIZE_BUCKETS, counter, histogram, start_publisher
+
+# Listas do processo detector (carregadas em run_worker)
+blacklist = None
+whitelist = None
+
+# DNS reverso das anomalias (com orçamento de tempo por lote)
+rdns = ReverseDNSResolver()
+
+# Métricas da detecção: tempo de cada etapa por lote ("fetch" inclui a
+# espera no stream), tamanho dos lotes, linhas avaliadas e anomalias salvas
+DETECTION_STAGE = histogram("sehenos_detection_stage_seconds", "Tempo de cada etapa da detecção por lote", ("stage",))
+STAGES = {stage: DETECTION_STAGE.labels(stage) for stage in
+          ("fetch", "decode", "preprocess", "pca", "isolation_forest", "autoencoder", "save")}
+DETECTION_BATCH = histogram("sehenos_detection_batch_size", "Pacotes por lote lido do stream", buckets=SIZE_BUCKETS)
+DETECTION_ROWS = counter("sehenos_detection_rows_total", "Linhas (pacotes ou fluxos) avaliadas pelos modelos")
+ANOMALIES = counter("sehenos_anomalies_total", "Anomalias detectadas e salvas")
+ANOMALY_ERRORS = counter("sehenos_anomaly_save_errors_total", "Lotes de anomalias que falharam ao salvar no Redis")
+INVALID_RECORDS = counter("sehenos_invalid_records_total", "Registros do stream descartados por não decodificarem")
+
+# Buscar um lote do stream de pacotes (registros binários decodificados em
+# colunas NumPy). Os ids só são confirmados depois que o lote foi processado;
+# registros que não decodificam são confirmados e descartados na hora (uma
+# nova tentativa falharia igual) e o resto do lote segue normalmente.
+def fetch_packets(batcher):
+    with STAGES["fetch"].time():
+        ids, packets = batcher.next_batch()
+    if not packets:
+        return ids, None
+    DETECTION_BATCH.observe(len(packets))
+    with STAGES["decode"].time():
+        try:
+            batch = decode_batch(packets)
+        except ValueError as e:
+            invalid = set(invalid_records(packets))
+            logging.error(f"{len(invalid)} registros inválidos descartados do lote: {e} "
+                          f"(ids {[ids[i] for i in sorted(invalid)][:10]})")
+            INVALID_RECORDS.inc(len(invalid))
+            batcher.consumer.ack([ids[i] for i in invalid])
+            ids = [entry_id for i, entry_id in enumerate(ids) if i not in invalid]
+            packets = [record for i, record in enumerate(packets) if i not in invalid]
+            if not packets:
+                return ids, None
+            batch = decode_batch(packets)
+
+        # Reavaliar as listas para o lote inteiro (busca vetorizada por CIDR)
+        batch["is_blacklisted"] = blacklist.contains_many(batch["src_ip"]) | blacklist.contains_many(batch["dst_ip"])
+        batch["is_whitelisted"] = whitelist.contains_many(batch["src_ip"]) | whitelist.contains_many(batch["dst_ip"])
+    return ids, batch
+
+# Detectar anomalias
+def detect_anomalies(models, data):
+    isolation_forest, autoencoder, pca = models
+
+    with STAGES["isolation_forest"].time():
+        isolation_preds = isolation_forest.predict(data)  # -1 indica anomalia
+    with STAGES["autoencoder"].time():
+        reconstruction = autoencoder.predict(data)
+    reconstruction_error = ((data - reconstruction) ** 2).mean(axis=1)
+
+    reconstruction_anomalies = reconstruction_error > Config.AUTOENCODER_THRESHOLD
+    isolation_anomalies = isolation_preds == -1
+
+    combined_anomalies = isolation_anomalies | reconstruction_anomalies
+    return isolation_preds, reconstruction_error, combined_anomalies
+
+class CascadeDetector:
+    """
+    Detecção em níveis: a pontuação do PCA (erro de reconstrução e T², duas
+    multiplicações de matrizes para o lote inteiro) filtra as linhas, e só
+    as que passam do limiar seguem para o Isolation Forest e o autoencoder. As demais são
+    tratadas como normais (isolation_preds = 1, reconstruction_error = 0).
+    """
+
+    def __init__(self, models, threshold=None):
+        self.models = models
+        self.tier1 = PCAResidual(models[2])
+        if threshold is None:
+            threshold = Config.CASCADE_PCA_THRESHOLD
+        if threshold is None:
+            threshold = self.tier1.threshold
+        if threshold is None:
+            logging.warning("PCA sem limiar calibrado (treine novamente); todas as linhas seguem para o nível 2.")
+        self.threshold = threshold
+
+        self.rows = 0
+        self.escalated = 0
+        self.isolation_anomalies = 0
+        self.reconstruction_anomalies = 0
+        self.tier1_time = 0.0
+        self.tier2_time = 0.0
+
+    def detect(self, data):
+        """
+        Mesmo retorno de detect_anomalies.
+        """
+        start = time.perf_counter()
+        if self.threshold is None:
+            escalate = np.arange(len(data))
+        else:
+            escalate = np.flatnonzero(self.tier1.score(data) > self.threshold)
+        middle = time.perf_counter()
+        STAGES["pca"].observe(middle - start)
+
+        isolation_preds = np.ones(len(data), dtype=np.int64)
+        reconstruction_error = np.zeros(len(data), dtype=np.float32)
+        if len(escalate):
+            preds, errors, _ = detect_anomalies(self.models, data[escalate])
+            isolation_preds[escalate] = preds
+            reconstruction_error[escalate] = errors
+        combined_anomalies = (isolation_preds == -1) | (reconstruction_error > Config.AUTOENCODER_THRESHOLD)
+
+        self.rows += len(data)
+        self.escalated += len(escalate)
+        self.isolation_anomalies += int(np.count_nonzero(isolation_preds == -1))
+        self.reconstruction_anomalies += int(np.count_nonzero(reconstruction_error > Config.AUTOENCODER_THRESHOLD))
+        self.tier1_time += middle - start
+        self.tier2_time += time.perf_counter() - middle
+        return isolation_preds, reconstruction_error, combined_anomalies
+
+    def stats(self):
+        """
+        Taxa de passagem de cada nível: fração das linhas que o PCA
+        escalou e fração das escaladas que cada modelo marcou.
+        """
+        return {
+            "rows": self.rows,
+            "threshold": self.threshold,
+            "tier1_pass_rate": round(self.escalated / self.rows, 4) if self.rows else 0.0,
+            "isolation_rate": round(self.isolation_anomalies / self.escalated, 4) if self.escalated else 0.0,
+            "reconstruction_rate": round(self.reconstruction_anomalies / self.escalated, 4) if self.escalated else 0.0,
+            "tier1_ms": round(self.tier1_time * 1000, 1),
+            "tier2_ms": round(self.tier2_time * 1000, 1),
+        }
+
+# Salvar anomalias detectadas no Redis (erros do Redis são repassados para
+# que o lote não seja confirmado)
+def save_anomalies(columns, isolation_preds, reconstruction_error):
+    isolation_anomaly = isolation_preds == -1
+    reconstruction_anomaly = reconstruction_error > Config.AUTOENCODER_THRESHOLD
+    # Montar registros apenas para as linhas anômalas
+    records = []
+    for i in np.flatnonzero(isolation_anomaly | reconstruction_anomaly):
+        anomaly = {name: values[i] for name, values in columns.items()}
+        anomaly["isolation_anomaly"] = isolation_anomaly[i]
+        anomaly["reconstruction_error"] = reconstruction_error[i]
+        anomaly["reconstruction_anomaly"] = reconstruction_anomaly[i]
+        records.append(anomaly)
+
+    # Marcar hostnames apenas nas anomalias, fora do caminho da captura
+    hostnames = rdns.resolve_many([r["src_ip"] for r in records] + [r["dst_ip"] for r in records])
+    for anomaly in records:
+        anomaly["src_hostname"] = hostnames.get(anomaly["src_ip"])
+        anomaly["dst_hostname"] = hostnames.get(anomaly["dst_ip"])
+        if anomaly.get("dns_queries") and not anomaly.get("fqdns"):
+            anomaly["fqdns"] = anomaly["dst_hostname"]
+
+    # Lista, registros com TTL e índices (IP e minuto) em uma transação
+    try:
+        write_anomalies(redis_client, [
+            (float(anomaly["timestamp"]), anomaly["src_ip"], anomaly["dst_ip"], json.dumps(to_json_safe(anomaly)))
+            for anomaly in records
+        ])
+        ANOMALIES.inc(len(records))
+    except Exception as e:
+        ANOMALY_ERRORS.inc()
+        logging.error(f"Erro ao salvar anomalias no Redis: {e}")
+        logging.debug(f"Anomalias: {records}")
+        raise
+
+    logging.info(f"{len(records)} anomalias detectadas e salvas no Redis. DNS reverso: {rdns.stats()}")
+
+# Agregar pacotes em fluxos e retornar os fluxos encerrados/expirados
+def collect_flows(flow_table, packets):
+    flows = flow_table.update_batch(packets) if packets is not None else []
+    # A expiração usa o relógio para fechar fluxos mesmo sem pacotes novos
+    flow_table.now = max(flow_table.now, time.time())
+    return flows + flow_table.expire()
+
+# Processar pacotes continuamente
+def process_packets(models, consumer, model_dir=None, shard=None):
+    mode = Config.DETECTION_MODE
+    features = feature_columns(mode)
+    flow_table = FlowTable() if mode == "flow" else None
+    # Escalonador persistente do shard, salvo junto dos modelos do modo
+    preprocessor = StreamingPreprocessor(features, model_dir=model_dir, shard=shard)
+    # Em cascata, o PCA decide quais linhas chegam aos modelos pesados
+    cascade = CascadeDetector(models) if Config.DETECTION_CASCADE else None
+    # Bloqueia no stream até chegar o primeiro pacote (ou STREAM_BLOCK_MS) e
+    # completa o lote conforme a política de latência
+    batcher = AdaptiveBatcher(consumer)
+    last_save = last_stats = time.time()
+    while True:
+        ids, packets = fetch_packets(batcher)
+        columns = None
+        if flow_table is not None:
+            # Modo por fluxo: os modelos só veem fluxos encerrados
+            flows = collect_flows(flow_table, packets)
+            if flows:
+                logging.info(f"Processando {len(flows)} fluxos... {flow_table.stats()}")
+                columns = to_columns(flows, list(flows[0]))
+            else:
+                logging.debug("Nenhum fluxo encerrado para processar.")
+        elif packets is not None:
+            logging.info(f"Processando {len(packets['timestamp'])} pacotes...")
+            columns = packets
+        else:
+            logging.info("Nenhum pacote para processar.")
+
+        if columns is not None:
+            with STAGES["preprocess"].time():
+                columns, scaled_data = preprocessor.transform(columns)
+            DETECTION_ROWS.inc(len(scaled_data))
+            if cascade is not None:
+                isolation_preds, reconstruction_error, combined_anomalies = cascade.detect(scaled_data)
+            else:
+                isolation_preds, reconstruction_error, combined_anomalies = detect_anomalies(models, scaled_data)
+            try:
+                with STAGES["save"].time():
+                    save_anomalies(columns, isolation_preds, reconstruction_error)
+            except Exception:
+                if flow_table is None:
+                    # Por pacote: o lote fica pendente e volta pelo XAUTOCLAIM
+                    # depois de STREAM_CLAIM_IDLE s (pelo menos uma vez)
+                    logging.warning(f"Lote de {len(ids)} pacotes mantido pendente para nova tentativa.")
+                    batcher.done()
+                    continue
+                logging.warning(f"{len(scaled_data)} fluxos perdidos sem salvar as anomalias.")
+        # Por pacote, o ack vem depois de salvar as anomalias do lote. Por
+        # fluxo, os pacotes são confirmados assim que entram na FlowTable (no
+        # máximo uma vez): segurar o ack até o fluxo sair manteria pendentes
+        # os pacotes de até FLOW_ACTIVE_TIMEOUT s; uma queda do detector perde
+        # os fluxos ainda abertos na tabela
+        consumer.ack(ids)
+        batcher.done()
+
+        if time.time() - last_save >= Config.SCALER_SAVE_INTERVAL:
+            preprocessor.save()
+            last_save = time.time()
+        if time.time() - last_stats >= Config.STATS_INTERVAL:
+            logging.info(f"Consumidor do stream: {consumer.stats()}")
+            logging.info(f"Lotes: {batcher.stats()}")
+            if cascade is not None:
+                logging.info(f"Detecção em cascata: {cascade.stats()}")
+            last_stats = time.time()
+
+
+def run_worker(shard=0, shards=None):
+    """
+    Processo detector: carrega as listas e os modelos uma única vez e
+    consome o stream do seu shard até ser encerrado.
+    :param shard: Índice do shard (ver core.packet_stream.shard_for).
+    :param shards: Quantidade de shards (padrão: Config.DETECTOR_WORKERS).
+    """
+    global blacklist, whitelist
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s - detector-{shard} - %(levelname)s - %(message)s")
+    blacklist, whitelist = load_reputation()
+
+    logging.info("Carregando modelos...")
+    models = load_models()
+    if models[0] is None:
+        raise RuntimeError("Erro ao carregar modelos. Verifique se foram treinados e salvos corretamente.")
+
+    try:
+        # Teste inicial dos modelos
+        sample_data = np.random.rand(10, len(feature_columns(Config.DETECTION_MODE)))
+        detect_anomalies(models, sample_data)
+        logging.info("Modelos testados com sucesso.")
+    except Exception as e:
+        logging.error(f"Erro ao testar os modelos: {e}")
+
+    start_publisher(redis_client, f"detector-{shard}")
+    stream = shard_streams(shards=shards)[shard]
+    consumer = StreamConsumer(redis_client, stream=stream, consumer=f"{Config.STREAM_CONSUMER}-{shard}").ensure_group()
+    logging.info(f"Detector {shard} consumindo {stream} (lotes de {Config.BATCH_MIN_SIZE} a "
+                 f"{Config.BATCH_MAX_SIZE} pacotes, política {Config.BATCH_POLICY})")
+    process_packets(models, consumer, model_dir=model_dir_for(Config.DETECTION_MODE), shard=shard)
+
+
+def prepare_worker_files(mode=None):
+    """
+    Executado uma vez no supervisor, antes de iniciar os detectores: gera
+    o autoencoder.npz e o isolation_forest.npz (se desatualizados) e baixa
+    a blacklist remota (se o cache expirou), para que os processos apenas
+    leiam esses arquivos.
+    """
+    model_dir = model_dir_for(mode or Config.DETECTION_MODE)
+    load_autoencoder(model_dir)
+    load_isolation_forest(model_dir)
+    load_remote_index(REMOTE_BLACKLIST_URL)
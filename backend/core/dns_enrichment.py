@@ -0,0 +1,147 @@
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from app.config import Config
+
+
+class ReverseDNSResolver:
+    """
+    Resolução reversa de DNS fora do caminho da captura.
+
+    Os resultados ficam em um cache LRU com TTL (falhas também são guardadas,
+    com TTL menor) e as consultas pendentes são resolvidas por um pool de
+    threads, sem duplicar consultas para o mesmo IP. Quem consulta nunca
+    espera mais que o orçamento de tempo informado.
+    """
+
+    def __init__(self, max_entries=None, ttl=None, negative_ttl=None, workers=None, max_inflight=None,
+                 resolver=socket.gethostbyaddr):
+        self.max_entries = max_entries or Config.RDNS_CACHE_SIZE
+        self.ttl = ttl or Config.RDNS_TTL
+        self.negative_ttl = negative_ttl or Config.RDNS_NEGATIVE_TTL
+        self.max_inflight = max_inflight or Config.RDNS_MAX_INFLIGHT
+        self._resolver = resolver
+        self._cache = OrderedDict()  # ip -> (hostname ou None, expira_em)
+        self._inflight = {}  # ip -> Future
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers or Config.RDNS_WORKERS,
+                                            thread_name_prefix="rdns")
+
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.lookups = 0
+        self.failures = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def _cached(self, ip):
+        entry = self._cache.get(ip)
+        if entry is None:
+            return False, None
+        hostname, expires = entry
+        if expires < time.monotonic():
+            del self._cache[ip]
+            return False, None
+        self._cache.move_to_end(ip)
+        return True, hostname
+
+    def _store(self, ip, hostname):
+        ttl = self.ttl if hostname is not None else self.negative_ttl
+        self._cache[ip] = (hostname, time.monotonic() + ttl)
+        self._cache.move_to_end(ip)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _lookup(self, ip):
+        start = time.perf_counter()
+        try:
+            hostname = self._resolver(ip)[0]
+        except (socket.herror, socket.gaierror, OSError):
+            hostname = None
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.lookups += 1
+            if hostname is None:
+                self.failures += 1
+            self.latency_total += elapsed
+            self.latency_max = max(self.latency_max, elapsed)
+            self._store(ip, hostname)
+            self._inflight.pop(ip, None)
+        return hostname
+
+    def _get(self, ip):
+        """
+        Retorna (encontrado, hostname, future). Agenda a consulta se o IP não
+        estiver no cache e ainda não houver uma pendente.
+        """
+        with self._lock:
+            found, hostname = self._cached(ip)
+            if found:
+                self.hits += 1
+                return True, hostname, None
+            self.misses += 1
+            future = self._inflight.get(ip)
+            if future is None:
+                if len(self._inflight) >= self.max_inflight:
+                    self.skipped += 1
+                    return False, None, None
+                future = self._executor.submit(self._lookup, ip)
+                self._inflight[ip] = future
+            return False, None, future
+
+    def lookup_nowait(self, ip):
+        """
+        Retorna o hostname se já estiver no cache; caso contrário agenda a
+        consulta em segundo plano e retorna None imediatamente.
+        """
+        return self._get(ip)[1]
+
+    def resolve_many(self, ips, timeout=None):
+        """
+        Resolve vários IPs dentro de um orçamento total de tempo.
+        :param ips: IPs a resolver (duplicados são ignorados).
+        :param timeout: Orçamento em segundos; consultas que não terminarem
+            a tempo retornam None e continuam em segundo plano.
+        :return: Dicionário ip -> hostname (ou None).
+        """
+        timeout = Config.RDNS_TIMEOUT if timeout is None else timeout
+        results = {}
+        pending = {}
+        for ip in set(ips):
+            found, hostname, future = self._get(ip)
+            if found or future is None:
+                results[ip] = hostname
+            else:
+                pending[ip] = future
+
+        if pending:
+            wait(pending.values(), timeout=timeout)
+        for ip, future in pending.items():
+            results[ip] = future.result() if future.done() else None
+        return results
+
+    def stats(self):
+        """
+        Retorna taxa de acerto do cache e latência do resolvedor.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "skipped": self.skipped,
+                "lookups": self.lookups,
+                "failures": self.failures,
+                "avg_latency_ms": 1000 * self.latency_total / self.lookups if self.lookups else 0.0,
+                "max_latency_ms": 1000 * self.latency_max,
+                "cache_size": len(self._cache),
+                "inflight": len(self._inflight),
+            }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
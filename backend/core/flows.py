@@ -0,0 +1,287 @@
+import math
+from collections import OrderedDict
+from app.config import Config
+from models.preprocessing import payload_features
+
+# Bits das flags TCP (mesma ordem de core.record.TCP_FLAG_LETTERS)
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+TCP_URG = 0x20
+
+
+def flow_key(src_ip, dst_ip, src_port, dst_port, protocol):
+    """
+    Chave bidirecional do fluxo: os dois sentidos da conexão geram a mesma
+    chave. Retorna (chave, True se o pacote vai do lado "a" para o "b").
+    """
+    a = (src_ip, src_port)
+    b = (dst_ip, dst_port)
+    if a <= b:
+        return (src_ip, src_port, dst_ip, dst_port, protocol), True
+    return (dst_ip, dst_port, src_ip, src_port, protocol), False
+
+
+class FlowState:
+    """
+    Contadores de um fluxo. Usa __slots__ para manter o custo por fluxo
+    pequeno (dezenas de milhares de fluxos ativos em um Orange Pi).
+    """
+
+    __slots__ = (
+        "src_ip", "dst_ip", "src_port", "dst_port", "protocol", "forward_is_a",
+        "first_seen", "last_seen", "packets_fwd", "packets_bwd", "bytes_fwd", "bytes_bwd",
+        "iat_n", "iat_mean", "iat_m2", "iat_min", "iat_max",
+        "syn", "ack", "fin", "rst", "psh", "urg", "fin_fwd", "fin_bwd",
+        "payload_bytes", "entropy_sum", "is_blacklisted", "is_whitelisted", "closed",
+    )
+
+    def __init__(self, src_ip, dst_ip, src_port, dst_port, protocol, forward_is_a, timestamp):
+        # O primeiro pacote visto define o sentido "forward" (iniciador)
+        self.src_ip = src_ip
+        self.dst_ip = dst_ip
+        self.src_port = src_port
+        self.dst_port = dst_port
+        self.protocol = protocol
+        self.forward_is_a = forward_is_a
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.packets_fwd = 0
+        self.packets_bwd = 0
+        self.bytes_fwd = 0
+        self.bytes_bwd = 0
+        self.iat_n = 0
+        self.iat_mean = 0.0
+        self.iat_m2 = 0.0
+        self.iat_min = 0.0
+        self.iat_max = 0.0
+        self.syn = 0
+        self.ack = 0
+        self.fin = 0
+        self.rst = 0
+        self.psh = 0
+        self.urg = 0
+        self.fin_fwd = False
+        self.fin_bwd = False
+        self.payload_bytes = 0
+        self.entropy_sum = 0.0
+        self.is_blacklisted = False
+        self.is_whitelisted = False
+        self.closed = False
+
+    def update(self, a_to_b, timestamp, nbytes, tcp_flags, payload_len, entropy, blacklisted, whitelisted):
+        forward = a_to_b == self.forward_is_a
+        if forward:
+            self.packets_fwd += 1
+            self.bytes_fwd += nbytes
+        else:
+            self.packets_bwd += 1
+            self.bytes_bwd += nbytes
+
+        # Tempo entre chegadas (média/variância online de Welford)
+        if self.packets_fwd + self.packets_bwd > 1:
+            iat = max(timestamp - self.last_seen, 0.0)
+            self.iat_n += 1
+            delta = iat - self.iat_mean
+            self.iat_mean += delta / self.iat_n
+            self.iat_m2 += delta * (iat - self.iat_mean)
+            if self.iat_n == 1 or iat < self.iat_min:
+                self.iat_min = iat
+            if iat > self.iat_max:
+                self.iat_max = iat
+        if timestamp > self.last_seen:
+            self.last_seen = timestamp
+
+        if tcp_flags:
+            self.syn += bool(tcp_flags & TCP_SYN)
+            self.ack += bool(tcp_flags & TCP_ACK)
+            self.fin += bool(tcp_flags & TCP_FIN)
+            self.rst += bool(tcp_flags & TCP_RST)
+            self.psh += bool(tcp_flags & TCP_PSH)
+            self.urg += bool(tcp_flags & TCP_URG)
+            # Encerrado por RST ou pelo FIN dos dois lados (um FIN só fecha
+            # metade da conexão; o outro lado ainda manda dados e o seu FIN)
+            if tcp_flags & TCP_FIN:
+                if forward:
+                    self.fin_fwd = True
+                else:
+                    self.fin_bwd = True
+            if tcp_flags & TCP_RST or (self.fin_fwd and self.fin_bwd):
+                self.closed = True
+
+        if payload_len:
+            self.payload_bytes += payload_len
+            self.entropy_sum += entropy * payload_len
+        self.is_blacklisted |= blacklisted
+        self.is_whitelisted |= whitelisted
+
+    def to_record(self, end_reason):
+        packets = self.packets_fwd + self.packets_bwd
+        nbytes = self.bytes_fwd + self.bytes_bwd
+        duration = self.last_seen - self.first_seen
+        rate_base = duration if duration > 0 else 1.0
+        return {
+            "timestamp": self.first_seen,
+            "last_seen": self.last_seen,
+            "src_ip": self.src_ip,
+            "dst_ip": self.dst_ip,
+            "src_port": self.src_port,
+            "dst_port": self.dst_port,
+            "protocol": self.protocol,
+            "duration": duration,
+            "packets": packets,
+            "bytes": nbytes,
+            "packets_fwd": self.packets_fwd,
+            "packets_bwd": self.packets_bwd,
+            "bytes_fwd": self.bytes_fwd,
+            "bytes_bwd": self.bytes_bwd,
+            "bytes_per_second": nbytes / rate_base,
+            "packets_per_second": packets / rate_base,
+            "iat_mean": self.iat_mean,
+            "iat_std": math.sqrt(self.iat_m2 / self.iat_n) if self.iat_n else 0.0,
+            "iat_min": self.iat_min,
+            "iat_max": self.iat_max,
+            "syn_count": self.syn,
+            "ack_count": self.ack,
+            "fin_count": self.fin,
+            "rst_count": self.rst,
+            "psh_count": self.psh,
+            "urg_count": self.urg,
+            "payload_bytes": self.payload_bytes,
+            "payload_entropy": self.entropy_sum / self.payload_bytes if self.payload_bytes else 0.0,
+            "is_blacklisted": self.is_blacklisted,
+            "is_whitelisted": self.is_whitelisted,
+            "end_reason": end_reason,
+        }
+
+
+class FlowTable:
+    """
+    Tabela de fluxos bidirecionais entre a captura e a detecção.
+
+    Os fluxos ficam em um OrderedDict ordenado pelo último pacote, de modo
+    que a expiração por inatividade só olha o início da fila. Fluxos longos
+    são emitidos pelo timeout ativo e, acima do limite de memória, os mais
+    antigos são emitidos antes do tempo. Fluxos TCP encerrados (RST ou FIN
+    dos dois lados) são emitidos depois de close_linger s sem pacotes, para
+    que o ACK final entre no mesmo fluxo em vez de abrir um novo.
+    """
+
+    def __init__(self, idle_timeout=None, active_timeout=None, max_flows=None, close_linger=None):
+        self.idle_timeout = idle_timeout or Config.FLOW_IDLE_TIMEOUT
+        self.active_timeout = active_timeout or Config.FLOW_ACTIVE_TIMEOUT
+        self.max_flows = max_flows or Config.FLOW_MAX_FLOWS
+        self.close_linger = Config.FLOW_CLOSE_LINGER if close_linger is None else close_linger
+        self.flows = OrderedDict()
+        self.now = 0.0
+        self._last_active_scan = 0.0
+        # Chaves dos fluxos encerrados aguardando o fim do close_linger
+        self._closed = {}
+
+        self.packets = 0
+        self.emitted = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.flows)
+
+    def update_batch(self, batch):
+        """
+        Atualiza os fluxos com um lote de pacotes (colunas de decode_batch).
+        :return: Registros de fluxos emitidos por excesso de memória.
+        """
+        n = len(batch["timestamp"])
+        # Entropia de todos os payloads do lote em uma passada
+        payload = payload_features(batch["payload"])
+        payload_lengths = payload["payload_len"].tolist()
+        entropies = payload["payload_entropy"].tolist()
+        timestamps = batch["timestamp"].tolist()
+        rows = zip(
+            batch["src_ip"].tolist(), batch["dst_ip"].tolist(),
+            batch["src_port"].tolist(), batch["dst_port"].tolist(), batch["protocol"].tolist(),
+            timestamps, batch["bytes"].tolist(), batch["tcp_flags"].tolist(),
+            batch["is_blacklisted"].tolist(), batch["is_whitelisted"].tolist(),
+        )
+        flows = self.flows
+        emitted = []
+        for i, (src, dst, sport, dport, proto, ts, nbytes, flags, black, white) in enumerate(rows):
+            key, a_to_b = flow_key(src, dst, sport, dport, proto)
+            flow = flows.get(key)
+            if flow is None:
+                flow = FlowState(src, dst, sport, dport, proto, a_to_b, ts)
+                flows[key] = flow
+            else:
+                flows.move_to_end(key)
+            flow.update(a_to_b, ts, nbytes, flags, payload_lengths[i], entropies[i], black, white)
+            if flow.closed:
+                self._closed[key] = None
+
+        self.packets += n
+        if n:
+            self.now = max(self.now, max(timestamps))
+
+        # Limite de memória: emitir os fluxos menos recentes
+        while len(flows) > self.max_flows:
+            _, flow = flows.popitem(last=False)
+            emitted.append(flow.to_record("memory"))
+            self.evicted += 1
+        self.emitted += len(emitted)
+        return emitted
+
+    def expire(self, now=None):
+        """
+        Emite os fluxos encerrados, inativos e os que excederam o timeout ativo.
+        :param now: Tempo de referência (padrão: maior timestamp já visto).
+        :return: Lista de registros de fluxo.
+        """
+        now = self.now if now is None else now
+        flows = self.flows
+        emitted = []
+
+        for key in list(self._closed):
+            flow = flows.get(key)
+            if flow is not None and now - flow.last_seen < self.close_linger:
+                continue
+            del self._closed[key]
+            if flow is not None:
+                del flows[key]
+                emitted.append(flow.to_record("closed"))
+
+        while flows:
+            key, flow = next(iter(flows.items()))
+            if now - flow.last_seen < self.idle_timeout:
+                break
+            del flows[key]
+            emitted.append(flow.to_record("idle"))
+
+        # O timeout ativo exige percorrer a tabela; feito no máximo algumas
+        # vezes por período
+        if now - self._last_active_scan >= self.active_timeout / 4:
+            self._last_active_scan = now
+            expired = [k for k, f in flows.items() if now - f.first_seen >= self.active_timeout]
+            for key in expired:
+                emitted.append(flows.pop(key).to_record("active"))
+
+        self.emitted += len(emitted)
+        return emitted
+
+    def flush(self):
+        """
+        Emite todos os fluxos (encerramento do processo).
+        """
+        emitted = [flow.to_record("flush") for flow in self.flows.values()]
+        self.flows.clear()
+        self._closed = {}
+        self.emitted += len(emitted)
+        return emitted
+
+    def stats(self):
+        return {
+            "active_flows": len(self.flows),
+            "packets": self.packets,
+            "emitted": self.emitted,
+            "evicted": self.evicted,
+            "packets_per_flow": self.packets / self.emitted if self.emitted else 0.0,
+        }
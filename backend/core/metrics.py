@@ -0,0 +1,375 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import get_ident
+from app.config import Config
+
+# Métricas do pipeline (contadores, gauges e histogramas de baldes fixos).
+#
+# Cada métrica guarda um valor por thread (dicionário indexado pelo id da
+# thread): só a própria thread escreve na sua posição, então inc() e
+# observe() não usam lock e não perdem incrementos; a leitura soma as
+# posições. Métricas com valor calculado na leitura (set_function) servem
+# para contadores que já existem nos componentes (ex.: RedisBatchWriter).
+#
+# Cada processo publica periodicamente o seu snapshot no Redis
+# (metrics:process:<papel>:<pid>, com TTL) e registra a chave no ZSET
+# metrics:processes. O /metrics da API junta os snapshots vivos e exporta no
+# formato texto do Prometheus com os rótulos process=<papel> e pid=<pid>.
+# Cada processo é uma série própria: quando um processo reinicia, a série
+# nova começa do zero e a antiga some, sem parecer um reset de contador
+# (somar os processos de um papel faria o total cair quando o antigo expira).
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+PROCESSES_KEY = "metrics:processes"
+PROCESS_PREFIX = "metrics:process:"
+
+
+def process_key(role, pid=None):
+    return f"{PROCESS_PREFIX}{role}:{pid or os.getpid()}"
+
+
+class CounterChild:
+    __slots__ = ("_shards", "_function")
+
+    def __init__(self):
+        self._shards = {}
+        self._function = None
+
+    def inc(self, amount=1):
+        shards = self._shards
+        ident = get_ident()
+        shards[ident] = shards.get(ident, 0) + amount
+
+    def set_function(self, function):
+        self._function = function
+
+    def value(self):
+        if self._function is not None:
+            return self._function()
+        return sum(list(self._shards.values()))
+
+
+class GaugeChild:
+    __slots__ = ("_value", "_function", "_lock")
+
+    def __init__(self):
+        self._value = 0
+        self._function = None
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        self._function = function
+
+    def value(self):
+        return self._function() if self._function is not None else self._value
+
+
+class HistogramChild:
+    __slots__ = ("bounds", "_shards")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self._shards = {}
+
+    def observe(self, value):
+        shard = self._shards.get(get_ident())
+        if shard is None:
+            shard = self._shards[get_ident()] = [[0] * (len(self.bounds) + 1), 0.0]
+        shard[0][bisect_left(self.bounds, value)] += 1
+        shard[1] += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def value(self):
+        counts = [0] * (len(self.bounds) + 1)
+        total = 0.0
+        for shard_counts, shard_sum in list(self._shards.values()):
+            for i, count in enumerate(list(shard_counts)):
+                counts[i] += count
+            total += shard_sum
+        return {"counts": counts, "sum": total}
+
+
+class Metric:
+    """
+    Família de métricas com rótulos; sem rótulos, os métodos do filho
+    padrão (inc, set, observe, time, set_function) são usados direto.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # Sem rótulos: inc/set/observe/... do filho padrão direto na métrica
+            default = self.labels()
+            for method in ("inc", "dec", "set", "observe", "time", "set_function"):
+                if hasattr(default, method):
+                    setattr(self, method, getattr(default, method))
+
+    def _child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} espera os rótulos {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(tuple(str(v) for v in values), self._child())
+                self._children.setdefault(values, child)
+        return child
+
+    def samples(self):
+        samples = {}
+        for values, child in list(self._children.items()):
+            samples[tuple(str(v) for v in values)] = child
+        return [[dict(zip(self.labelnames, values)), child.value()] for values, child in samples.items()]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _child(self):
+        return CounterChild()
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _child(self):
+        return GaugeChild()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(float(b) for b in buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _child(self):
+        return HistogramChild(self.bounds)
+
+    def samples(self):
+        return [[labels, dict(value, buckets=self.bounds)] for labels, value in super().samples()]
+
+
+class Registry:
+    """
+    Métricas do processo e coletores (funções chamadas antes de cada
+    snapshot, ex.: contadores do kernel que zeram a cada leitura).
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, cls, name, documentation, labelnames=(), **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Métrica {name} já registrada com outro tipo ou rótulos")
+            return metric
+
+    def add_collector(self, function):
+        self._collectors.append(function)
+
+    def snapshot(self):
+        """
+        :return: {nome: {type, help, samples: [[rótulos, valor]]}} (serializável em JSON).
+        """
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as e:
+                logging.error(f"Erro no coletor de métricas {collector}: {e}")
+        families = {}
+        for name, metric in list(self._metrics.items()):
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                logging.error(f"Erro ao ler a métrica {name}: {e}")
+                continue
+            families[name] = {"type": metric.type, "help": metric.documentation, "samples": samples}
+        return families
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labels=(), registry=None):
+    return (registry or REGISTRY).register(Counter, name, documentation, labels)
+
+
+def gauge(name, documentation, labels=(), registry=None):
+    return (registry or REGISTRY).register(Gauge, name, documentation, labels)
+
+
+def histogram(name, documentation, labels=(), buckets=DEFAULT_BUCKETS, registry=None):
+    return (registry or REGISTRY).register(Histogram, name, documentation, labels, buckets=buckets)
+
+
+class MetricsPublisher:
+    """
+    Publica o snapshot do processo no Redis a cada `interval` segundos.
+    """
+
+    def __init__(self, redis_client, role, registry=None, interval=None):
+        self.redis_client = redis_client
+        self.role = role
+        self.registry = registry or REGISTRY
+        self.interval = interval or Config.METRICS_INTERVAL
+        self._thread = None
+
+    def publish(self):
+        key = process_key(self.role)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.set(key, json.dumps(self.registry.snapshot()), ex=max(1, int(self.interval * 3)))
+        pipe.zadd(PROCESSES_KEY, {key: time.time()})
+        pipe.execute()
+
+    def _run(self):
+        while True:
+            try:
+                self.publish()
+            except Exception as e:
+                logging.error(f"Erro ao publicar métricas no Redis: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metrics-publisher", daemon=True)
+            self._thread.start()
+        return self
+
+
+_publisher = None
+
+
+def start_publisher(redis_client, role, interval=None):
+    """
+    Inicia (uma vez por processo) a publicação das métricas com o papel dado.
+    """
+    global _publisher
+    if not Config.METRICS_ENABLED:
+        return None
+    if _publisher is None or _publisher.role != role:
+        _publisher = MetricsPublisher(redis_client, role, interval=interval).start()
+    return _publisher
+
+
+def process_snapshots(redis_client, role=None, registry=None, interval=None):
+    """
+    Snapshots dos processos vivos; o do processo atual (papel `role`) é
+    lido na hora em vez do publicado.
+    :return: Lista de (papel, pid, snapshot).
+    """
+    ttl = (interval or Config.METRICS_INTERVAL) * 3
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zremrangebyscore(PROCESSES_KEY, "-inf", time.time() - ttl)
+    pipe.zrange(PROCESSES_KEY, 0, -1)
+    keys = [key.decode() for key in pipe.execute()[1]]
+    own = process_key(role) if role else None
+    keys = [key for key in keys if key != own]
+    snapshots = []
+    if role:
+        snapshots.append((role, str(os.getpid()), (registry or REGISTRY).snapshot()))
+    for key, raw in zip(keys, redis_client.mget(keys) if keys else []):
+        if raw is not None:
+            key_role, pid = key[len(PROCESS_PREFIX):].rsplit(":", 1)
+            snapshots.append((key_role, pid, json.loads(raw)))
+    return snapshots
+
+
+def merge(snapshots):
+    """
+    Junta os snapshots (papel, pid, snapshot) acrescentando os rótulos
+    process e pid; séries repetidas são somadas.
+    :return: {nome: {type, help, series: {rótulos ordenados: valor}}}.
+    """
+    families = {}
+    for role, pid, snapshot in snapshots:
+        for name, family in snapshot.items():
+            merged = families.setdefault(name, {"type": family["type"], "help": family["help"], "series": {}})
+            if merged["type"] != family["type"]:
+                continue
+            for labels, value in family["samples"]:
+                key = tuple(sorted(dict(labels, process=role, pid=str(pid)).items()))
+                current = merged["series"].get(key)
+                if family["type"] != "histogram":
+                    merged["series"][key] = (current or 0) + value
+                elif current is None:
+                    merged["series"][key] = {"buckets": list(value["buckets"]), "counts": list(value["counts"]),
+                                             "sum": value["sum"]}
+                elif list(current["buckets"]) == list(value["buckets"]):
+                    current["counts"] = [a + b for a, b in zip(current["counts"], value["counts"])]
+                    current["sum"] += value["sum"]
+    return families
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(families):
+    """
+    Formato texto de exposição do Prometheus (0.0.4).
+    """
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        lines.append(f"# HELP {name} {_escape(family['help'])}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for pairs, value in sorted(family["series"].items()):
+            if family["type"] != "histogram":
+                lines.append(f"{name}{_labels(pairs)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(value["buckets"]) + [float("inf")], value["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(pairs + (('le', _number(float(bound))),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(pairs)} {_number(float(value['sum']))}")
+            lines.append(f"{name}_count{_labels(pairs)} {cumulative}")
+    return "\n".join(lines) + "\n"
@@ -1,142 +1,103 @@
-import scapy.all as scapy
 import time
-import json
 import threading
-import requests
-from datetime import datetime
-from scapy.layers.inet import IP, TCP, UDP
-from scapy.layers.dns import DNS
-from scapy.layers.l2 import Ether
-import socket
 from config.redis_config import redis_client
 from app.config import Config
-from config.settings import REMOTE_BLACKLIST_URL
-import os
+from core.redis_writer import StreamBatchWriter
+from core.packet_stream import shard_streams
+from core.record import encode_record
+from backup.columnar import segment_converter
+from backup.segments import BackupJob, StreamSource
+from core.capture_engine import create_capture
+from core.dns_enrichment import ReverseDNSResolver
+from core.reputation import load_reputation
+from core.metrics import REGISTRY, counter, start_publisher
 import logging
-import gzip
 
 # Configuração de logs
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# Carregar Blacklist e Whitelist
+# Carregar Blacklist (local + remota em cache) e Whitelist como índices CIDR
 def load_blacklist_whitelist():
-    try:
-        with open(Config.BLACKLIST_FILE, 'r') as f:
-            blacklist = set(line.strip() for line in f)
-    except FileNotFoundError:
-        blacklist = set()
-
-    try:
-        with open(Config.WHITELIST_FILE, 'r') as f:
-            whitelist = set(line.strip() for line in f)
-    except FileNotFoundError:
-        whitelist = set()
-
+    blacklist, whitelist = load_reputation()
+    logging.info(f"Listas carregadas: blacklist={len(blacklist)} intervalos, whitelist={len(whitelist)} intervalos")
     return blacklist, whitelist
 
-# Buscar Blacklist Remota
-def fetch_remote_blacklist():
-    try:
-        response = requests.get(REMOTE_BLACKLIST_URL)
-        response.raise_for_status()
-        return set(response.text.splitlines())
-    except Exception as e:
-        logging.error(f"Erro ao buscar blacklist remota: {e}")
-        return set()
-
-# Resolução Reversa de DNS
-def reverse_dns(ip):
-    try:
-        return socket.gethostbyaddr(ip)[0]
-    except socket.herror:
-        return None
-
 processed_packets = set()
 
-def process_packet(packet):
-    if not packet.haslayer(IP):
-        return
-
-    data = {
-        "timestamp": datetime.now().isoformat(),
-        "src_ip": packet[IP].src,
-        "dst_ip": packet[IP].dst,
-        "protocol": getattr(packet[IP], "proto", None),
-        "length": len(packet),
-        "mac_src": packet[Ether].src if packet.haslayer(Ether) else None,
-        "mac_dst": packet[Ether].dst if packet.haslayer(Ether) else None,
-        "time_to_live": getattr(packet[IP], "ttl", None),
-        "is_blacklisted": (packet[IP].src in blacklist or packet[IP].dst in blacklist),
-        "is_whitelisted": (packet[IP].src in whitelist or packet[IP].dst in whitelist),
-    }
-
-    # Portas e flags TCP/UDP
-    if packet.haslayer(TCP):
-        data.update({
-            "src_port": getattr(packet[TCP], "sport", None),
-            "dst_port": getattr(packet[TCP], "dport", None),
-            "tcp_flags": str(getattr(packet[TCP], "flags", None)),
-        })
-    elif packet.haslayer(UDP):
-        data.update({
-            "src_port": getattr(packet[UDP], "sport", None),
-            "dst_port": getattr(packet[UDP], "dport", None),
-        })
-
-    # DNS
-    if packet.haslayer(DNS):
-        dns_layer = packet[DNS]
-        dns_queries = None
-        if hasattr(dns_layer, "qd") and dns_layer.qd:
-            dns_queries = getattr(dns_layer.qd, "qname", b"").decode("utf-8", errors="ignore")
-        data.update({
-            "dns_queries": dns_queries,
-            "fqdns": reverse_dns(packet[IP].dst),
-        })
-
-    # Payload
-    if hasattr(packet[IP], "payload"):
-        raw_payload = bytes(packet[IP].payload)
-        data["payload"] = raw_payload.hex() if raw_payload else None
-    else:
-        data["payload"] = None
-
-    # Volume (bytes)
-    data["bytes"] = len(packet)
-
-    # Serialização e envio para Redis
+# Escritor em lote: o callback do sniffer só enfileira; os registros vão
+# para o stream consumido pelos detectores
+packet_writer = StreamBatchWriter(redis_client, Config.PACKET_STREAM)
+
+# DNS reverso assíncrono: a captura só consulta o cache
+rdns = ReverseDNSResolver()
+
+# Métricas da captura (os registros enfileirados/descartados vêm do escritor)
+CAPTURE_FRAMES = counter("sehenos_capture_frames_total", "Quadros lidos pelo backend de captura")
+KERNEL_PACKETS = counter("sehenos_capture_kernel_packets_total",
+                         "Pacotes contados pelo kernel no anel AF_PACKET (received, dropped)", ("result",))
+CAPTURE_ERRORS = counter("sehenos_capture_errors_total", "Registros que falharam na serialização")
+
+def process_record(data):
+    """
+    Completa o registro extraído pelo backend de captura (listas e DNS
+    reverso já em cache) e envia ao escritor em lote.
+    """
+    data["is_blacklisted"] = blacklist.contains(data["src_ip"]) or blacklist.contains(data["dst_ip"])
+    data["is_whitelisted"] = whitelist.contains(data["src_ip"]) or whitelist.contains(data["dst_ip"])
+    if "dns_queries" in data:
+        data["fqdns"] = rdns.lookup_nowait(data["dst_ip"])
+
+    # Serialização binária e envio para o escritor em lote
     try:
-        redis_client.rpush("network_packets", json.dumps(data))
-    except TypeError as e:
+        packet_writer.put(encode_record(data), data["src_ip"], data["dst_ip"])
+    except (TypeError, ValueError, OSError) as e:
+        CAPTURE_ERRORS.inc()
         logging.error(f"Erro ao serializar pacote: {e}")
         logging.debug(f"Dados problemáticos: {data}")
 
 
 # Iniciar Captura de Pacotes
 def start_capture():
-    logging.info("Iniciando captura de pacotes...")
-    scapy.sniff(prn=process_packet, store=False)
+    capture = create_capture(process_record)
+    logging.info(f"Iniciando captura de pacotes (backend: {capture.name})...")
+
+    # Os contadores do kernel zeram a cada leitura: acumulados a cada snapshot
+    def collect_kernel_stats():
+        stats = capture.stats()
+        KERNEL_PACKETS.labels("received").inc(stats.get("kernel_packets", 0))
+        KERNEL_PACKETS.labels("dropped").inc(stats.get("kernel_drops", 0))
+    CAPTURE_FRAMES.set_function(lambda: getattr(capture, "packets", 0))
+    REGISTRY.add_collector(collect_kernel_stats)
+    packet_writer.start()
+    try:
+        capture.run()
+    finally:
+        capture.close()
+        packet_writer.stop()
+        rdns.close()
+        logging.info(f"Escritor de pacotes finalizado: {packet_writer.stats()}")
+
+# Estatísticas periódicas da captura
+def log_stats():
+    while True:
+        time.sleep(Config.STATS_INTERVAL)
+        logging.info(f"Escritor: {packet_writer.stats()} | DNS reverso: {rdns.stats()}")
 
 # Gerenciamento de Backup de Pacotes
 def save_backup():
-    while True:
-        time.sleep(180)
-        packets = redis_client.lrange("network_packets", 0, -1)
-        redis_client.delete("network_packets")
-
-        os.makedirs(Config.BACKUP_DIR, exist_ok=True)
-        backup_file = f"{Config.BACKUP_DIR}/packets_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json.gz"
-        try:
-            with gzip.open(backup_file, "wt", encoding="utf-8") as f:
-                f.write(json.dumps([json.loads(packet) for packet in packets]))
-            logging.info(f"Backup de pacotes salvo: {backup_file}")
-        except Exception as e:
-            logging.error(f"Erro ao salvar backup: {e}")
+    # O backup só lê os streams (o descarte é feito pelo MAXLEN), em blocos,
+    # para segmentos NDJSON gzip com checkpoint em disco
+    on_segment = None
+    if Config.BACKUP_FORMAT == "parquet":
+        on_segment = segment_converter("packets")
+        on_segment()
+    job = BackupJob(StreamSource(redis_client, shard_streams()), Config.BACKUP_DIR, "packets", on_segment=on_segment)
+    job.run_forever(Config.BACKUP_INTERVAL)
 
 if __name__ == "__main__":
     blacklist, whitelist = load_blacklist_whitelist()
-    remote_blacklist = fetch_remote_blacklist()
-    blacklist.update(remote_blacklist)
 
     threading.Thread(target=save_backup, daemon=True).start()
+    threading.Thread(target=log_stats, daemon=True).start()
+    start_publisher(redis_client, "capture")
     start_capture()
@@ -0,0 +1,242 @@
+import heapq
+import logging
+import time
+import zlib
+from redis.exceptions import ResponseError
+from app.config import Config
+
+# Campo de cada entrada do stream com o registro binário (core.record)
+RECORD_FIELD = b"r"
+
+
+def _decode_id(entry_id):
+    return entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+
+
+def shard_for(src_ip, dst_ip, shards):
+    """
+    Shard de um pacote pelo par de IPs, igual nos dois sentidos, de forma
+    que os pacotes de um fluxo sempre chegam ao mesmo detector.
+    """
+    if shards <= 1:
+        return 0
+    a, b = (src_ip, dst_ip) if src_ip <= dst_ip else (dst_ip, src_ip)
+    return zlib.crc32(f"{a}|{b}".encode()) % shards
+
+
+def shard_streams(stream=None, shards=None):
+    """
+    Nomes dos streams de cada shard ("network_packets:0", ...). Com um
+    único detector é usado o próprio stream base.
+    """
+    stream = stream or Config.PACKET_STREAM
+    shards = shards or Config.DETECTOR_WORKERS
+    if shards <= 1:
+        return [stream]
+    return [f"{stream}:{n}" for n in range(shards)]
+
+
+def _id_key(entry_id):
+    ms, seq = _decode_id(entry_id).split("-")
+    return int(ms), int(seq)
+
+
+def stream_records(redis_client, stream, start="-", end="+", chunk=1000):
+    """
+    Percorre as entradas do stream em ordem, em blocos de XRANGE.
+    :return: Gerador de (id, registro binário).
+    """
+    while True:
+        entries = redis_client.xrange(stream, start, end, count=chunk)
+        for entry_id, fields in entries:
+            yield _decode_id(entry_id), fields.get(RECORD_FIELD)
+        if len(entries) < chunk:
+            return
+        start = f"({_decode_id(entries[-1][0])}"
+
+
+def stream_records_reverse(redis_client, stream, end="+", start="-", chunk=1000):
+    """
+    Percorre as entradas do stream da mais recente para a mais antiga, em
+    blocos de XREVRANGE.
+    :return: Gerador de (id, registro binário).
+    """
+    while True:
+        entries = redis_client.xrevrange(stream, end, start, count=chunk)
+        for entry_id, fields in entries:
+            yield _decode_id(entry_id), fields.get(RECORD_FIELD)
+        if len(entries) < chunk:
+            return
+        end = f"({_decode_id(entries[-1][0])}"
+
+
+def _tagged(entries, shard):
+    """ Acrescenta o índice do shard a cada (id, registro) do stream. """
+    for entry_id, record in entries:
+        yield entry_id, shard, record
+
+
+def merged_records_reverse(redis_client, streams, end="+", start="-", chunk=1000):
+    """
+    Entradas de todos os shards, da mais recente para a mais antiga, pelo
+    id e, no mesmo id (shards gravados no mesmo ms), pelo índice do shard.
+    :param end: Limite superior, o mesmo para todos ou uma lista por stream.
+    :return: Gerador de (id, índice do shard, registro binário).
+    """
+    ends = end if isinstance(end, (list, tuple)) else [end] * len(streams)
+    per_stream = [_tagged(stream_records_reverse(redis_client, stream, stream_end, start, chunk), shard)
+                  for shard, (stream, stream_end) in enumerate(zip(streams, ends))]
+    return heapq.merge(*per_stream, key=lambda entry: (_id_key(entry[0]), entry[1]), reverse=True)
+
+
+def latest_records(redis_client, streams, count):
+    """
+    Retorna os últimos registros dos streams (shards) em ordem cronológica.
+    """
+    per_stream = [reversed(redis_client.xrevrange(stream, "+", "-", count=count)) for stream in streams]
+    entries = list(heapq.merge(*per_stream, key=lambda entry: _id_key(entry[0])))[-count:]
+    return [fields.get(RECORD_FIELD) for _, fields in entries]
+
+
+class StreamConsumer:
+    """
+    Consumidor de um grupo do Redis Streams para os pacotes da captura.
+
+    Cada leitura entrega no máximo `count` entradas (XREADGROUP com BLOCK),
+    que ficam pendentes até o ack() explícito depois que o lote foi
+    processado. Entradas pendentes de consumidores que morreram são
+    reassumidas com XAUTOCLAIM depois de `claim_idle` segundos, de forma que
+    vários detectores dividem o stream sem perder pacotes.
+    """
+
+    def __init__(self, redis_client, stream=None, group=None, consumer=None, count=None, block_ms=None,
+                 claim_idle=None):
+        self.redis_client = redis_client
+        self.stream = stream or Config.PACKET_STREAM
+        self.group = group or Config.STREAM_GROUP
+        self.consumer = consumer or Config.STREAM_CONSUMER
+        self.count = count or Config.STREAM_BATCH_SIZE
+        self.block_ms = Config.STREAM_BLOCK_MS if block_ms is None else block_ms
+        self.claim_idle = Config.STREAM_CLAIM_IDLE if claim_idle is None else claim_idle
+        self._claim_cursor = "0-0"
+        self._last_claim = 0.0
+        # Após reiniciar com o mesmo nome, reler primeiro as próprias
+        # pendências, a partir do cursor (cada pendência é entregue uma vez)
+        self._own_pending = True
+        self._pending_cursor = "0"
+
+        self.read = 0
+        self.acked = 0
+        self.reclaimed = 0
+        self.discarded = 0
+
+    def ensure_group(self):
+        """
+        Cria o grupo (e o stream) se ainda não existir.
+        """
+        try:
+            self.redis_client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        return self
+
+    def _split(self, entries):
+        ids, records = [], []
+        for entry_id, fields in entries:
+            record = fields.get(RECORD_FIELD) if fields else None
+            if record is None:
+                # Entrada removida pelo MAXLEN enquanto estava pendente
+                self.discarded += 1
+                self.ack([entry_id])
+                continue
+            ids.append(entry_id)
+            records.append(record)
+        return ids, records
+
+    def _claim(self, count):
+        if time.monotonic() - self._last_claim < self.claim_idle:
+            return [], []
+        result = self.redis_client.xautoclaim(
+            self.stream, self.group, self.consumer, min_idle_time=int(self.claim_idle * 1000),
+            start_id=self._claim_cursor, count=count,
+        )
+        self._claim_cursor = _decode_id(result[0])
+        if self._claim_cursor == "0-0":
+            # Varredura completa; a próxima só depois de claim_idle
+            self._last_claim = time.monotonic()
+        # Entradas já removidas do stream (Redis 7) também saem da fila de pendências
+        if len(result) > 2 and result[2]:
+            self.discarded += len(result[2])
+            self.ack(result[2])
+        ids, records = self._split(result[1])
+        self.reclaimed += len(ids)
+        return ids, records
+
+    def read_batch(self, count=None, block_ms=None):
+        """
+        Lê o próximo lote: pendências próprias, depois entradas reassumidas
+        de consumidores parados e por fim entradas novas (bloqueando até
+        block_ms se o stream estiver vazio).
+        :param count: Máximo de entradas (padrão: self.count).
+        :param block_ms: Espera máxima em ms (padrão: self.block_ms; 0 não bloqueia).
+        :return: (ids, registros binários); listas vazias se não houver nada.
+        """
+        count = count or self.count
+        block_ms = self.block_ms if block_ms is None else block_ms
+        while self._own_pending:
+            # Com "0" o XREADGROUP devolve o histórico de pendências; o cursor
+            # evita que as leituras seguintes (antes do ack) repitam as mesmas
+            response = self.redis_client.xreadgroup(self.group, self.consumer, {self.stream: self._pending_cursor},
+                                                    count=count)
+            entries = response[0][1] if response else []
+            if not entries:
+                self._own_pending = False
+                self._pending_cursor = "0"
+                break
+            self._pending_cursor = _decode_id(entries[-1][0])
+            ids, records = self._split(entries)
+            if ids:
+                self.read += len(ids)
+                return ids, records
+
+        ids, records = self._claim(count)
+        if ids:
+            self.read += len(ids)
+            return ids, records
+
+        # BLOCK 0 no Redis espera para sempre; sem espera, a opção é omitida
+        response = self.redis_client.xreadgroup(self.group, self.consumer, {self.stream: ">"},
+                                                count=count, block=block_ms or None)
+        if not response:
+            return [], []
+        ids, records = self._split(response[0][1])
+        self.read += len(ids)
+        return ids, records
+
+    def ack(self, ids):
+        """
+        Confirma o processamento das entradas.
+        """
+        if ids:
+            self.acked += self.redis_client.xack(self.stream, self.group, *ids)
+
+    def stats(self):
+        """
+        Retorna os contadores do consumidor e o estado do grupo.
+        """
+        stats = {
+            "consumer": self.consumer,
+            "read": self.read,
+            "acked": self.acked,
+            "reclaimed": self.reclaimed,
+            "discarded": self.discarded,
+        }
+        try:
+            for info in self.redis_client.xinfo_groups(self.stream):
+                if _decode_id(info["name"]) == self.group:
+                    stats["pending"] = info.get("pending")
+                    stats["lag"] = info.get("lag")
+        except ResponseError as e:
+            logging.debug(f"XINFO GROUPS indisponível: {e}")
+        return stats
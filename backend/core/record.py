@@ -0,0 +1,366 @@
+import json
+import socket
+import struct
+from datetime import datetime
+import numpy as np
+
+# Formato binário dos registros de pacote na fila network_packets.
+#
+# Cada registro é um cabeçalho de tamanho fixo (RECORD_HEADER) seguido dos
+# campos variáveis na ordem: dns_queries, fqdns, payload. Os campos opcionais
+# são sinalizados no bitmap "flags"; os tamanhos dos campos variáveis ficam no
+# cabeçalho, o que permite decodificar lotes inteiros direto para NumPy.
+#
+#   version     B   versão do formato (RECORD_VERSION)
+#   flags       H   bitmap de campos opcionais (F_*)
+#   timestamp   d   epoch em segundos (packet.time)
+#   src_ip      16s endereço IPv6 ou IPv4 mapeado (::ffff:a.b.c.d)
+#   dst_ip      16s
+#   protocol    B
+#   ttl         B   TTL (IPv4) ou hop limit (IPv6)
+#   length      I
+#   bytes       I
+#   src_port    H
+#   dst_port    H
+#   tcp_flags   H   bits no mesmo formato do campo flags do TCP
+#   mac_src     6s
+#   mac_dst     6s
+#   dns_len     H
+#   fqdn_len    H
+#   payload_len I
+
+RECORD_VERSION = 1
+RECORD_HEADER = struct.Struct("<BHd16s16sBBIIHHH6s6sHHI")
+HEADER_SIZE = RECORD_HEADER.size
+
+HEADER_DTYPE = np.dtype([
+    ("version", "u1"),
+    ("flags", "<u2"),
+    ("timestamp", "<f8"),
+    ("src_ip", "V16"),
+    ("dst_ip", "V16"),
+    ("protocol", "u1"),
+    ("ttl", "u1"),
+    ("length", "<u4"),
+    ("bytes", "<u4"),
+    ("src_port", "<u2"),
+    ("dst_port", "<u2"),
+    ("tcp_flags", "<u2"),
+    ("mac_src", "V6"),
+    ("mac_dst", "V6"),
+    ("dns_len", "<u2"),
+    ("fqdn_len", "<u2"),
+    ("payload_len", "<u4"),
+])
+
+# Bitmap de campos opcionais
+F_IPV6 = 1 << 0
+F_MAC = 1 << 1
+F_PORTS = 1 << 2
+F_TCP_FLAGS = 1 << 3
+F_DNS = 1 << 4
+F_DNS_QUERY = 1 << 5
+F_FQDN = 1 << 6
+F_PAYLOAD = 1 << 7
+F_BLACKLISTED = 1 << 8
+F_WHITELISTED = 1 << 9
+F_PROTOCOL = 1 << 10
+F_TTL = 1 << 11
+
+# Letras das flags TCP na ordem dos bits (mesma representação do scapy)
+TCP_FLAG_LETTERS = "FSRPAUECN"
+
+_V4_PREFIX = b"\x00" * 10 + b"\xff\xff"
+_NO_MAC = b"\x00" * 6
+
+assert HEADER_DTYPE.itemsize == HEADER_SIZE
+
+
+def tcp_flags_to_str(value):
+    """
+    Converte o inteiro das flags TCP para a string usada pelo scapy (ex.: "PA").
+    """
+    return "".join(letter for i, letter in enumerate(TCP_FLAG_LETTERS) if value & (1 << i))
+
+
+def tcp_flags_from_str(flags):
+    """
+    Converte a string de flags TCP (ex.: "SA") para inteiro.
+    """
+    return sum(1 << TCP_FLAG_LETTERS.index(c) for c in flags if c in TCP_FLAG_LETTERS)
+
+
+def pack_ip(ip):
+    """
+    Retorna (16 bytes, is_ipv6) para um endereço em texto.
+    """
+    if ":" in ip:
+        return socket.inet_pton(socket.AF_INET6, ip), True
+    return _V4_PREFIX + socket.inet_aton(ip), False
+
+
+def unpack_ip(raw, is_ipv6):
+    if is_ipv6:
+        return socket.inet_ntop(socket.AF_INET6, raw)
+    return socket.inet_ntoa(raw[12:])
+
+
+def _pack_mac(mac):
+    return bytes.fromhex(mac.replace(":", "")) if mac else _NO_MAC
+
+
+def _unpack_mac(raw):
+    return ":".join(f"{b:02x}" for b in raw)
+
+
+def encode_record(data):
+    """
+    Serializa o dicionário de um pacote capturado no formato binário.
+    :param data: Dicionário com as chaves produzidas por parse_frame.
+    :return: bytes do registro.
+    """
+    flags = 0
+    src_ip, v6 = pack_ip(data["src_ip"])
+    dst_ip, _ = pack_ip(data["dst_ip"])
+    if v6:
+        flags |= F_IPV6
+
+    protocol = data.get("protocol")
+    if protocol is not None:
+        flags |= F_PROTOCOL
+    ttl = data.get("time_to_live")
+    if ttl is not None:
+        flags |= F_TTL
+
+    mac_src, mac_dst = data.get("mac_src"), data.get("mac_dst")
+    if mac_src or mac_dst:
+        flags |= F_MAC
+
+    src_port, dst_port = data.get("src_port"), data.get("dst_port")
+    if "src_port" in data:
+        flags |= F_PORTS
+
+    tcp_flags = data.get("tcp_flags")
+    if "tcp_flags" in data:
+        flags |= F_TCP_FLAGS
+        if isinstance(tcp_flags, str):
+            tcp_flags = tcp_flags_from_str(tcp_flags)
+
+    dns = b""
+    fqdn = b""
+    if "dns_queries" in data or "fqdns" in data:
+        flags |= F_DNS
+        if data.get("dns_queries") is not None:
+            flags |= F_DNS_QUERY
+            dns = data["dns_queries"].encode("utf-8")
+        if data.get("fqdns") is not None:
+            flags |= F_FQDN
+            fqdn = data["fqdns"].encode("utf-8")
+
+    payload = data.get("payload") or b""
+    if isinstance(payload, str):
+        payload = bytes.fromhex(payload)
+    if payload:
+        flags |= F_PAYLOAD
+
+    if data.get("is_blacklisted"):
+        flags |= F_BLACKLISTED
+    if data.get("is_whitelisted"):
+        flags |= F_WHITELISTED
+
+    header = RECORD_HEADER.pack(
+        RECORD_VERSION,
+        flags,
+        float(data["timestamp"]),
+        src_ip,
+        dst_ip,
+        protocol or 0,
+        ttl or 0,
+        data.get("length") or 0,
+        data.get("bytes") or 0,
+        src_port or 0,
+        dst_port or 0,
+        tcp_flags or 0,
+        _pack_mac(mac_src),
+        _pack_mac(mac_dst),
+        len(dns),
+        len(fqdn),
+        len(payload),
+    )
+    return b"".join((header, dns, fqdn, payload))
+
+
+def decode_record(raw):
+    """
+    Decodifica um registro para o mesmo dicionário produzido pela captura.
+    Registros JSON antigos (anteriores ao formato binário) continuam aceitos.
+    """
+    if raw[:1] == b"{":
+        return json.loads(raw)
+
+    if len(raw) < HEADER_SIZE:
+        raise ValueError(f"Registro truncado: {len(raw)} bytes (cabeçalho de {HEADER_SIZE}).")
+    (version, flags, timestamp, src_ip, dst_ip, protocol, ttl, length, nbytes,
+     src_port, dst_port, tcp_flags, mac_src, mac_dst,
+     dns_len, fqdn_len, payload_len) = RECORD_HEADER.unpack_from(raw)
+    if version != RECORD_VERSION:
+        raise ValueError(f"Versão de registro não suportada: {version}")
+    if len(raw) != HEADER_SIZE + dns_len + fqdn_len + payload_len:
+        raise ValueError(f"Registro com {len(raw)} bytes; o cabeçalho indica "
+                         f"{HEADER_SIZE + dns_len + fqdn_len + payload_len}.")
+
+    v6 = bool(flags & F_IPV6)
+    has_mac = bool(flags & F_MAC)
+    data = {
+        "timestamp": timestamp,
+        "src_ip": unpack_ip(src_ip, v6),
+        "dst_ip": unpack_ip(dst_ip, v6),
+        "protocol": protocol if flags & F_PROTOCOL else None,
+        "length": length,
+        "mac_src": _unpack_mac(mac_src) if has_mac else None,
+        "mac_dst": _unpack_mac(mac_dst) if has_mac else None,
+        "time_to_live": ttl if flags & F_TTL else None,
+        "is_blacklisted": bool(flags & F_BLACKLISTED),
+        "is_whitelisted": bool(flags & F_WHITELISTED),
+    }
+    if flags & F_PORTS:
+        data["src_port"] = src_port
+        data["dst_port"] = dst_port
+    if flags & F_TCP_FLAGS:
+        data["tcp_flags"] = tcp_flags_to_str(tcp_flags)
+
+    offset = HEADER_SIZE
+    if flags & F_DNS:
+        dns = bytes(raw[offset:offset + dns_len]).decode("utf-8", errors="ignore")
+        fqdn = bytes(raw[offset + dns_len:offset + dns_len + fqdn_len]).decode("utf-8", errors="ignore")
+        data["dns_queries"] = dns if flags & F_DNS_QUERY else None
+        data["fqdns"] = fqdn if flags & F_FQDN else None
+    offset += dns_len + fqdn_len
+
+    data["payload"] = bytes(raw[offset:offset + payload_len]) if payload_len else None
+    data["bytes"] = nbytes
+    return data
+
+
+def _from_legacy(raw):
+    data = json.loads(raw)
+    try:
+        data["timestamp"] = datetime.fromisoformat(data["timestamp"]).timestamp()
+        return encode_record(data)
+    except (KeyError, TypeError, AttributeError, OSError) as e:
+        raise ValueError(f"Registro JSON inválido: {e!r}") from e
+
+
+def decode_batch(records):
+    """
+    Decodifica um lote de registros direto para colunas NumPy.
+
+    Os campos de tamanho fixo são lidos com um único np.frombuffer sobre o
+    lote concatenado; apenas os campos de texto (IPs, DNS) e o payload são
+    montados por linha.
+    :param records: Lista de registros binários (bytes).
+    :return: Dicionário coluna -> np.ndarray, todos com o mesmo tamanho.
+    :raises ValueError: Se algum registro estiver truncado ou corrompido
+        (ver invalid_records para separar os registros ruins do lote).
+    """
+    records = [_from_legacy(r) if r[:1] == b"{" else r for r in records]
+    n = len(records)
+    lengths = np.fromiter(map(len, records), dtype=np.int64, count=n)
+    short = np.flatnonzero(lengths < HEADER_SIZE)
+    if len(short):
+        i = short[0]
+        raise ValueError(f"Registro {i} truncado: {lengths[i]} bytes (cabeçalho de {HEADER_SIZE}).")
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+
+    buf = np.frombuffer(b"".join(records), dtype=np.uint8)
+    header = buf[starts[:, None] + np.arange(HEADER_SIZE)].view(HEADER_DTYPE).ravel()
+    if n and np.any(header["version"] != RECORD_VERSION):
+        raise ValueError("Versão de registro não suportada no lote.")
+
+    # O tamanho de cada registro tem de bater com os campos variáveis do cabeçalho
+    payload_len = header["payload_len"].astype(np.int64)
+    expected = HEADER_SIZE + header["dns_len"].astype(np.int64) + header["fqdn_len"] + payload_len
+    mismatch = np.flatnonzero(expected != lengths)
+    if len(mismatch):
+        i = mismatch[0]
+        raise ValueError(f"Registro {i} com {lengths[i]} bytes; o cabeçalho indica {expected[i]}.")
+
+    flags = header["flags"]
+    v6 = (flags & F_IPV6) != 0
+    has_ports = (flags & F_PORTS) != 0
+
+    src_raw = header["src_ip"].view("S16") if n else np.empty(0, "S16")
+    dst_raw = header["dst_ip"].view("S16") if n else np.empty(0, "S16")
+    src_ip = np.array([unpack_ip(r.ljust(16, b"\x00"), f) for r, f in zip(src_raw, v6)], dtype=object)
+    dst_ip = np.array([unpack_ip(r.ljust(16, b"\x00"), f) for r, f in zip(dst_raw, v6)], dtype=object)
+
+    payload = np.array(
+        [records[i][-int(payload_len[i]):] if payload_len[i] else None for i in range(n)],
+        dtype=object,
+    )
+
+    dns_queries = np.full(n, None, dtype=object)
+    fqdns = np.full(n, None, dtype=object)
+    for i in np.flatnonzero(flags & F_DNS):
+        off = HEADER_SIZE
+        dns_len, fqdn_len = int(header["dns_len"][i]), int(header["fqdn_len"][i])
+        rec = records[i]
+        if flags[i] & F_DNS_QUERY:
+            dns_queries[i] = rec[off:off + dns_len].decode("utf-8", errors="ignore")
+        if flags[i] & F_FQDN:
+            fqdns[i] = rec[off + dns_len:off + dns_len + fqdn_len].decode("utf-8", errors="ignore")
+
+    return {
+        "timestamp": header["timestamp"].copy(),
+        "src_ip": src_ip,
+        "dst_ip": dst_ip,
+        "protocol": header["protocol"].astype(np.int64),
+        "length": header["length"].astype(np.int64),
+        "bytes": header["bytes"].astype(np.int64),
+        "src_port": np.where(has_ports, header["src_port"], 0).astype(np.int64),
+        "dst_port": np.where(has_ports, header["dst_port"], 0).astype(np.int64),
+        "time_to_live": header["ttl"].astype(np.int64),
+        "tcp_flags": header["tcp_flags"].astype(np.int64),
+        "is_blacklisted": (flags & F_BLACKLISTED) != 0,
+        "is_whitelisted": (flags & F_WHITELISTED) != 0,
+        "dns_queries": dns_queries,
+        "fqdns": fqdns,
+        "payload": payload,
+        "payload_len": payload_len,
+    }
+
+
+def invalid_records(records):
+    """
+    Índices dos registros que decode_batch rejeita (truncados, corrompidos
+    ou de versão desconhecida). Decodifica um a um: usar só depois que o
+    lote inteiro falhou.
+    """
+    invalid = []
+    for i, record in enumerate(records):
+        try:
+            decode_batch([record])
+        except ValueError:
+            invalid.append(i)
+    return invalid
+
+
+def to_json_safe(data):
+    """
+    Converte um registro (ou linha de anomalia) para tipos serializáveis em
+    JSON: timestamp em ISO 8601, payload em hexadecimal e escalares NumPy em
+    tipos nativos.
+    """
+    out = {}
+    for key, value in data.items():
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            value = bytes(value).hex()
+        elif key == "timestamp" and isinstance(value, (int, float)):
+            value = datetime.fromtimestamp(value).isoformat()
+        elif hasattr(value, "isoformat"):
+            value = value.isoformat()
+        elif isinstance(value, np.generic):
+            value = value.item()
+        out[key] = value
+    return out
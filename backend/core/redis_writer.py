@@ -0,0 +1,173 @@
+import queue
+import threading
+import time
+import logging
+from app.config import Config
+from core.metrics import SIZE_BUCKETS, counter, gauge, histogram
+from core.packet_stream import RECORD_FIELD, shard_for, shard_streams
+
+WRITER_RECORDS = counter("sehenos_writer_records_total",
+                         "Registros do escritor em lote por resultado (enqueued, dropped, flushed, failed)",
+                         ("writer", "result"))
+WRITER_QUEUE = gauge("sehenos_writer_queue_depth", "Registros na fila do escritor em lote", ("writer",))
+WRITER_BATCH = histogram("sehenos_writer_batch_size", "Registros por descarga no Redis", ("writer",), SIZE_BUCKETS)
+WRITER_FLUSH = histogram("sehenos_writer_flush_seconds", "Duração de cada descarga (pipeline) no Redis", ("writer",))
+
+# Maior espera da thread na fila antes de conferir se stop() foi chamado
+STOP_POLL = 0.1
+
+
+class RedisBatchWriter:
+    """
+    Estágio de escrita da captura: o callback do sniffer apenas enfileira o
+    registro e uma thread em segundo plano descarrega a fila no Redis usando
+    pipelines, quando o lote atinge o tamanho ou o intervalo configurado.
+    """
+
+    def __init__(self, redis_client, key, queue_size=None, batch_size=None, flush_interval=None):
+        self.redis_client = redis_client
+        self.key = key
+        self.batch_size = batch_size or Config.WRITER_BATCH_SIZE
+        self.flush_interval = flush_interval or Config.WRITER_FLUSH_INTERVAL
+        self._queue = queue.Queue(maxsize=queue_size or Config.WRITER_QUEUE_SIZE)
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Contadores expostos via stats()
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failed = 0
+        self.errors = 0
+
+        # Métricas lidas dos contadores acima (nada a mais no put())
+        for result in ("enqueued", "dropped", "flushed", "failed"):
+            WRITER_RECORDS.labels(key, result).set_function(lambda result=result: getattr(self, result))
+        WRITER_QUEUE.labels(key).set_function(self._queue.qsize)
+        self._batch_size = WRITER_BATCH.labels(key)
+        self._flush_time = WRITER_FLUSH.labels(key)
+
+    def start(self):
+        """
+        Inicia a thread de descarga.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="redis-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def put(self, item):
+        """
+        Enfileira um registro sem bloquear. Se a fila estiver cheia o registro
+        é descartado e contabilizado, para nunca travar o callback de captura.
+        """
+        try:
+            self._queue.put_nowait(item)
+            self.enqueued += 1
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def stop(self, timeout=10):
+        """
+        Para a thread e descarrega o que restou na fila.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # Garantir que nada ficou para trás caso a thread não tenha drenado tudo
+        self._drain()
+
+    def stats(self):
+        """
+        Retorna os contadores do escritor.
+        """
+        return {
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "errors": self.errors,
+            "queue_depth": self._queue.qsize(),
+        }
+
+    def _write(self, pipe, batch):
+        pipe.rpush(self.key, *batch)
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        self._batch_size.observe(len(batch))
+        try:
+            with self._flush_time.time():
+                pipe = self.redis_client.pipeline(transaction=False)
+                self._write(pipe, batch)
+                pipe.execute()
+            self.flushed += len(batch)
+            self.flushes += 1
+        except Exception as e:
+            # Redis indisponível: o lote é perdido, mas a captura continua
+            self.errors += 1
+            self.failed += len(batch)
+            logging.error(f"Erro ao descarregar lote no Redis: {e}")
+
+    def _take(self, batch, limit):
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+    def _drain(self):
+        while True:
+            batch = []
+            self._take(batch, self.batch_size)
+            if not batch:
+                return
+            self._flush(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    # Em fatias curtas: com um intervalo longo, o lote parcial
+                    # ficaria preso na thread depois do stop()
+                    batch.append(self._queue.get(timeout=min(remaining, STOP_POLL)))
+                except queue.Empty:
+                    continue
+                # Pegar o que já estiver disponível sem voltar a esperar
+                self._take(batch, self.batch_size)
+            self._flush(batch)
+        self._drain()
+
+
+class StreamBatchWriter(RedisBatchWriter):
+    """
+    Escritor em lote para Redis Streams: cada registro vira uma entrada
+    (XADD) no stream do seu shard e cada stream é limitado a
+    aproximadamente `maxlen` entradas.
+    """
+
+    def __init__(self, redis_client, key, maxlen=None, shards=None, **kwargs):
+        super().__init__(redis_client, key, **kwargs)
+        self.maxlen = maxlen or Config.STREAM_MAXLEN
+        self.streams = shard_streams(key, shards)
+
+    def put(self, item, src_ip="", dst_ip=""):
+        """
+        Enfileira um registro para o shard do par de IPs (sem bloquear).
+        """
+        return super().put((shard_for(src_ip, dst_ip, len(self.streams)), item))
+
+    def _write(self, pipe, batch):
+        for shard, item in batch:
+            pipe.xadd(self.streams[shard], {RECORD_FIELD: item}, maxlen=self.maxlen, approximate=True)
@@ -0,0 +1,376 @@
+import bisect
+import ipaddress
+import logging
+import os
+import socket
+import threading
+import time
+import numpy as np
+import requests
+from app.config import Config
+from config.settings import REMOTE_BLACKLIST_URL
+from config.redis_config import redis_client
+from models.inference import save_npz
+from app.blacklist_whitelist import (LIST_CHANNEL, LIST_FILES, list_state, load_from_file, normalize_entries, parse_delta,
+                                     versioned_snapshot)
+
+
+def _merge(intervals):
+    """
+    Ordena e funde intervalos [início, fim] sobrepostos ou adjacentes.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _v6_bytes(values):
+    return np.array([v.to_bytes(16, "big") for v in values], dtype="S16")
+
+
+def _ipv4_int(ip):
+    try:
+        return int.from_bytes(socket.inet_aton(ip), "big")
+    except (OSError, TypeError):
+        return None
+
+
+def _ipv6_bytes(ip):
+    try:
+        return socket.inet_pton(socket.AF_INET6, ip)
+    except (OSError, TypeError):
+        return None
+
+
+class IPReputationIndex:
+    """
+    Índice de reputação de IPs com suporte a CIDR.
+
+    As redes são guardadas como intervalos inteiros ordenados e fundidos
+    (uint32 para IPv4, bytes big-endian de 16 posições para IPv6), de forma
+    que uma consulta é uma busca binária e um lote inteiro é resolvido com
+    um único np.searchsorted.
+    """
+
+    def __init__(self, v4_start=None, v4_end=None, v6_start=None, v6_end=None):
+        self.v4_start = np.asarray(v4_start if v4_start is not None else [], dtype=np.uint32)
+        self.v4_end = np.asarray(v4_end if v4_end is not None else [], dtype=np.uint32)
+        self.v6_start = np.asarray(v6_start if v6_start is not None else [], dtype="S16")
+        self.v6_end = np.asarray(v6_end if v6_end is not None else [], dtype="S16")
+        # Listas Python para consultas unitárias com bisect (mais rápido que
+        # np.searchsorted para um único valor)
+        self._v4_start = self.v4_start.tolist()
+        self._v4_end = self.v4_end.tolist()
+        self._v6_start = [bytes(v).ljust(16, b"\x00") for v in self.v6_start]
+        self._v6_end = [bytes(v).ljust(16, b"\x00") for v in self.v6_end]
+
+    @classmethod
+    def from_lines(cls, lines):
+        """
+        Constrói o índice a partir de linhas com IPs ou redes CIDR
+        (formato netset: comentários com '#' e linhas vazias são ignorados).
+        """
+        v4, v6 = [], []
+        for line in lines:
+            entry = line.split("#", 1)[0].strip()
+            if not entry:
+                continue
+            try:
+                network = ipaddress.ip_network(entry, strict=False)
+            except ValueError:
+                logging.debug(f"Entrada de lista inválida ignorada: {entry}")
+                continue
+            target = v4 if network.version == 4 else v6
+            target.append((int(network.network_address), int(network.broadcast_address)))
+        return cls.from_intervals(v4, v6)
+
+    @classmethod
+    def from_intervals(cls, v4, v6):
+        v4 = _merge(v4)
+        v6 = _merge(v6)
+        return cls(
+            [s for s, _ in v4], [e for _, e in v4],
+            _v6_bytes(s for s, _ in v6), _v6_bytes(e for _, e in v6),
+        )
+
+    def intervals(self):
+        """
+        Retorna os intervalos (v4, v6) como inteiros Python.
+        """
+        v4 = list(zip(self._v4_start, self._v4_end))
+        v6 = [(int.from_bytes(s, "big"), int.from_bytes(e, "big")) for s, e in zip(self._v6_start, self._v6_end)]
+        return v4, v6
+
+    def union(self, other):
+        """
+        Retorna um novo índice com as redes dos dois índices.
+        """
+        v4, v6 = self.intervals()
+        o4, o6 = other.intervals()
+        return IPReputationIndex.from_intervals(v4 + o4, v6 + o6)
+
+    def __len__(self):
+        return len(self._v4_start) + len(self._v6_start)
+
+    def __contains__(self, ip):
+        return self.contains(ip)
+
+    def contains(self, ip):
+        """
+        Verifica se um IP (texto) pertence a alguma rede do índice.
+        """
+        if ":" in (ip or ""):
+            value = _ipv6_bytes(ip)
+            starts, ends = self._v6_start, self._v6_end
+        else:
+            value = _ipv4_int(ip)
+            starts, ends = self._v4_start, self._v4_end
+        if value is None:
+            return False
+        i = bisect.bisect_right(starts, value) - 1
+        return i >= 0 and value <= ends[i]
+
+    def contains_v4(self, values):
+        """
+        Consulta vetorizada de IPv4 já convertidos para uint32.
+        """
+        values = np.asarray(values, dtype=np.uint32)
+        if not len(self.v4_start):
+            return np.zeros(len(values), dtype=bool)
+        i = np.searchsorted(self.v4_start, values, side="right") - 1
+        valid = i >= 0
+        return valid & (values <= self.v4_end[np.maximum(i, 0)])
+
+    def contains_many(self, ips):
+        """
+        Consulta vetorizada de um lote de IPs em texto (IPv4 e IPv6). IPs
+        inválidos ou ausentes não pertencem a nenhuma rede.
+        :return: np.ndarray booleano com o mesmo tamanho de ips.
+        """
+        n = len(ips)
+        result = np.zeros(n, dtype=bool)
+        is_v6 = np.fromiter((":" in (ip or "") for ip in ips), dtype=bool, count=n)
+
+        v4_idx = np.flatnonzero(~is_v6)
+        if len(v4_idx) and len(self.v4_start):
+            packed = [_ipv4_int(ips[i]) for i in v4_idx]
+            valid = np.fromiter((v is not None for v in packed), dtype=bool, count=len(packed))
+            values = np.fromiter((v or 0 for v in packed), dtype=np.uint32, count=len(packed))
+            result[v4_idx] = self.contains_v4(values) & valid
+
+        v6_idx = np.flatnonzero(is_v6)
+        if len(v6_idx) and len(self.v6_start):
+            packed = [_ipv6_bytes(ips[i]) for i in v6_idx]
+            valid = np.fromiter((v is not None for v in packed), dtype=bool, count=len(packed))
+            values = np.array([v or b"" for v in packed], dtype="S16")
+            i = np.searchsorted(self.v6_start, values, side="right") - 1
+            result[v6_idx] = (i >= 0) & (values <= self.v6_end[np.maximum(i, 0)]) & valid
+        return result
+
+    def save(self, path):
+        """
+        Salva o índice em um arquivo .npz compacto.
+        """
+        save_npz(path, v4_start=self.v4_start, v4_end=self.v4_end, v6_start=self.v6_start, v6_end=self.v6_end)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["v4_start"], data["v4_end"], data["v6_start"], data["v6_end"])
+
+
+def load_remote_index(url, cache_path=None, max_age=None):
+    """
+    Carrega a blacklist remota (netset) usando o cache em disco enquanto ele
+    for mais novo que max_age; só baixa e interpreta a lista quando o cache
+    expira. Se o download falhar, usa o cache antigo se existir.
+    """
+    cache_path = cache_path or Config.REPUTATION_CACHE
+    max_age = Config.REPUTATION_CACHE_MAX_AGE if max_age is None else max_age
+
+    if os.path.exists(cache_path) and time.time() - os.path.getmtime(cache_path) < max_age:
+        return IPReputationIndex.load(cache_path)
+
+    try:
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        index = IPReputationIndex.from_lines(response.text.splitlines())
+        index.save(cache_path)
+        logging.info(f"Blacklist remota atualizada: {len(index)} intervalos")
+        return index
+    except Exception as e:
+        logging.error(f"Erro ao buscar blacklist remota: {e}")
+        if os.path.exists(cache_path):
+            return IPReputationIndex.load(cache_path)
+        return IPReputationIndex()
+
+
+class LiveList:
+    """
+    Lista (blacklist/whitelist) atualizada em tempo real pelos deltas
+    publicados pela API. IPs individuais ficam em um set (O(1) para
+    adicionar/remover); redes CIDR ficam em um índice pequeno reconstruído
+    só quando uma rede muda. A base (blacklist remota) não é editável.
+    """
+
+    def __init__(self, name, base=None):
+        self.name = name
+        self.base = base if base is not None else IPReputationIndex()
+        self.version = 0
+        self.epoch = None
+        self._hosts = set()
+        self._networks = set()
+        self._network_index = IPReputationIndex()
+
+    def reset(self, entries, version, epoch=None):
+        """
+        Substitui todas as entradas locais (sincronização completa).
+        """
+        self._hosts = set()
+        self._networks = set()
+        self._add(entries)
+        self._network_index = IPReputationIndex.from_lines(self._networks)
+        self.version = version
+        self.epoch = epoch
+
+    def _add(self, entries):
+        rebuild = False
+        for entry in entries:
+            if "/" in entry:
+                self._networks.add(entry)
+                rebuild = True
+            else:
+                self._hosts.add(entry)
+        return rebuild
+
+    def _remove(self, entries):
+        rebuild = False
+        for entry in entries:
+            if "/" in entry:
+                self._networks.discard(entry)
+                rebuild = True
+            else:
+                self._hosts.discard(entry)
+        return rebuild
+
+    def apply(self, action, entries, version):
+        """
+        Aplica um delta publicado pela API.
+        """
+        rebuild = self._add(entries) if action == "add" else self._remove(entries)
+        if rebuild:
+            self._network_index = IPReputationIndex.from_lines(self._networks)
+        self.version = version
+
+    def __len__(self):
+        return len(self.base) + len(self._hosts) + len(self._networks)
+
+    def __contains__(self, ip):
+        return self.contains(ip)
+
+    def contains(self, ip):
+        return ip in self._hosts or self.base.contains(ip) or self._network_index.contains(ip)
+
+    def contains_many(self, ips):
+        result = self.base.contains_many(ips) | self._network_index.contains_many(ips)
+        if self._hosts:
+            hosts = self._hosts
+            result |= np.fromiter((ip in hosts for ip in ips), dtype=bool, count=len(ips))
+        return result
+
+
+class ListSync:
+    """
+    Mantém LiveLists sincronizadas com o Redis: carrega um snapshot e depois
+    aplica os deltas do canal de listas. Refaz o snapshot da lista afetada
+    quando uma versão é pulada (mensagem perdida) ou a época muda (Redis
+    limpo com flushdb/clear_data, quando a versão recomeça do zero). A cada
+    `interval` segundos a versão e a época locais são conferidas com o
+    Redis, o que cobre reconexões e limpezas sem edições posteriores.
+    """
+
+    def __init__(self, redis_client, lists, interval=None):
+        self.redis_client = redis_client
+        self.lists = {live.name: live for live in lists}
+        self.interval = interval or Config.LIST_SYNC_INTERVAL
+        self._thread = None
+
+    def resync(self, name):
+        epoch, version, entries = versioned_snapshot(name)
+        self.lists[name].reset(entries, version, epoch)
+        logging.info(f"Lista {name} sincronizada (versão {version}, {len(entries)} entradas)")
+
+    def handle(self, delta):
+        live = self.lists.get(delta["list"])
+        if live is None:
+            return
+        if delta.get("epoch") != live.epoch:
+            self.resync(live.name)
+        elif delta["version"] == live.version + 1:
+            live.apply(delta["action"], delta["entries"], delta["version"])
+        elif delta["version"] > live.version:
+            self.resync(live.name)
+
+    def check(self):
+        """
+        Refaz o snapshot das listas cuja época ou versão difere do Redis.
+        """
+        for name, live in self.lists.items():
+            if list_state(name) != (live.epoch, live.version):
+                self.resync(name)
+
+    def _run(self):
+        while True:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                # Assinar antes do snapshot para não perder deltas entre os dois
+                pubsub.subscribe(LIST_CHANNEL)
+                for name in self.lists:
+                    self.resync(name)
+                checked = time.monotonic()
+                while True:
+                    message = pubsub.get_message(timeout=self.interval)
+                    if message is not None:
+                        self.handle(parse_delta(message["data"]))
+                    if time.monotonic() - checked >= self.interval:
+                        self.check()
+                        checked = time.monotonic()
+            except Exception as e:
+                logging.error(f"Erro na sincronização das listas: {e}")
+                time.sleep(5)
+            finally:
+                pubsub.close()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="list-sync", daemon=True)
+            self._thread.start()
+        return self
+
+
+def load_reputation():
+    """
+    Carrega (blacklist, whitelist) como listas vivas: a blacklist local é
+    unida à blacklist remota (FireHOL level1) em cache, e ambas recebem as
+    edições feitas pela API sem reiniciar o processo. Sem Redis, as listas
+    são lidas dos arquivos.
+    """
+    blacklist = LiveList("blacklist", base=load_remote_index(REMOTE_BLACKLIST_URL))
+    whitelist = LiveList("whitelist")
+    sync = ListSync(redis_client, [blacklist, whitelist])
+    try:
+        for name in sync.lists:
+            sync.resync(name)
+    except Exception as e:
+        logging.error(f"Redis indisponível para as listas ({e}), usando os arquivos.")
+        for live in (blacklist, whitelist):
+            path = LIST_FILES[live.name]
+            live.reset(normalize_entries(load_from_file(path), path), 0)
+    sync.start()
+    return blacklist, whitelist
+
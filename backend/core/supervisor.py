@@ -0,0 +1,108 @@
+import logging
+import multiprocessing
+import signal
+import time
+from app.config import Config
+
+
+class WorkerPool:
+    """
+    Supervisor de processos: inicia `workers` processos executando
+    target(índice, workers) e reinicia os que terminarem. Reinícios seguidos
+    (processo que morre logo após subir) esperam cada vez mais, até
+    max_restart_delay, para não girar em falso quando o erro é permanente.
+
+    Os processos são criados com "spawn": cada filho importa o que precisa
+    e carrega seus próprios modelos, sem herdar o estado do supervisor.
+    """
+
+    def __init__(self, target, workers=None, name="worker", restart_delay=None, max_restart_delay=60,
+                 stable_after=60):
+        self.target = target
+        self.workers = max(1, workers or Config.DETECTOR_WORKERS)
+        self.name = name
+        self.restart_delay = Config.WORKER_RESTART_DELAY if restart_delay is None else restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stable_after = stable_after
+        self._context = multiprocessing.get_context("spawn")
+        self._processes = [None] * self.workers
+        self._started_at = [0.0] * self.workers
+        self._delays = [self.restart_delay] * self.workers
+        self._next_start = [0.0] * self.workers
+        self._stopping = False
+
+        self.restarts = 0
+
+    def _spawn(self, index):
+        process = self._context.Process(target=self.target, args=(index, self.workers),
+                                        name=f"{self.name}-{index}", daemon=True)
+        process.start()
+        self._processes[index] = process
+        self._started_at[index] = time.monotonic()
+        logging.info(f"Processo {process.name} iniciado (pid {process.pid})")
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+        return self
+
+    def check(self):
+        """
+        Reinicia os processos que terminaram (com espera crescente se o
+        processo morreu logo após iniciar).
+        """
+        now = time.monotonic()
+        for index, process in enumerate(self._processes):
+            if self._stopping or process is None or process.is_alive():
+                continue
+            if self._next_start[index] == 0.0:
+                uptime = now - self._started_at[index]
+                if uptime >= self.stable_after:
+                    self._delays[index] = self.restart_delay
+                delay = self._delays[index]
+                self._delays[index] = min(delay * 2 or 1, self.max_restart_delay)
+                self._next_start[index] = now + delay
+                logging.error(f"Processo {process.name} terminou (código {process.exitcode}); "
+                              f"reiniciando em {delay:.1f}s")
+            if now >= self._next_start[index]:
+                self._next_start[index] = 0.0
+                process.close()
+                self.restarts += 1
+                self._spawn(index)
+
+    def alive(self):
+        return sum(1 for p in self._processes if p is not None and p.is_alive())
+
+    def stop(self, timeout=10):
+        """
+        Encerra todos os processos (SIGTERM e, se necessário, SIGKILL).
+        """
+        self._stopping = True
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            if process is not None:
+                process.join(max(0.0, deadline - time.monotonic()))
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+
+    def run(self, interval=1.0):
+        """
+        Inicia os processos e supervisiona até SIGINT/SIGTERM.
+        """
+        def _terminate(signum, frame):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, _terminate)
+        self.start()
+        try:
+            while True:
+                time.sleep(interval)
+                self.check()
+        except KeyboardInterrupt:
+            logging.info(f"Encerrando {self.workers} processos {self.name}...")
+        finally:
+            self.stop()
@@ -0,0 +1,12 @@
+import os
+
+# Servidor da API: workers gevent (um greenlet por conexão), de forma que
+# centenas de clientes SSE ociosos em /anomalies/stream não ocupam uma thread
+# cada. Cada worker mantém uma única leitura do feed de anomalias no Redis.
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", 2))
+worker_class = "gevent"
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+# Conexões SSE ficam abertas indefinidamente; o timeout vale só para workers travados
+timeout = 60
+keepalive = 75
@@ -3,12 +3,14 @@ import os
 from sklearn.ensemble import IsolationForest
 from sklearn.decomposition import PCA
 from sklearn.datasets import make_blobs
-from tensorflow.keras.models import Sequential, load_model, save_model
-from tensorflow.keras.layers import Input, Dense
-from tensorflow.keras.utils import register_keras_serializable, get_custom_objects
-from tensorflow.keras.losses import MeanSquaredError
-from tensorflow import reduce_mean
 import numpy as np  # Corrigido aqui
+import sys
+from app.config import Config
+from models.preprocessing import feature_columns
+from models.inference import CompiledIsolationForest, DenseNetwork, PCAResidual, export_autoencoder, export_model_dir
+
+# O TensorFlow só é importado no treino (e na exportação do .keras); a
+# detecção usa o forward em NumPy de models.inference
 
 # Garantir que o diretório existe
 def ensure_directory_exists(directory):
@@ -16,8 +18,8 @@ def ensure_directory_exists(directory):
         os.makedirs(directory)
 
 # Treinar Isolation Forest
-def train_isolation_forest(data, contamination=0.05):
-    model_dir = "/home/zrdax/SehenOS/backend/models/pipes/"
+def train_isolation_forest(data, contamination=0.05, model_dir=None):
+    model_dir = model_dir or Config.MODEL_DIR
     ensure_directory_exists(model_dir)
     model_path = os.path.join(model_dir, "isolation_forest.pkl")
 
@@ -26,11 +28,16 @@ def train_isolation_forest(data, contamination=0.05):
     with open(model_path, "wb") as f:
         pickle.dump(model, f)
     print(f"Modelo Isolation Forest salvo em: {model_path}")
+    CompiledIsolationForest.compile(model).save(os.path.join(model_dir, "isolation_forest.npz"))
     return model
 
 # Treinar Autoencoder
-def train_autoencoder(data, input_dim):
-    model_dir = "/home/zrdax/SehenOS/backend/models/pipes/"
+def train_autoencoder(data, input_dim, model_dir=None):
+    from tensorflow.keras.models import Sequential, save_model
+    from tensorflow.keras.layers import Input, Dense
+    from tensorflow.keras.losses import MeanSquaredError
+
+    model_dir = model_dir or Config.MODEL_DIR
     ensure_directory_exists(model_dir)
     model_path = os.path.join(model_dir, "autoencoder.keras")
 
@@ -45,28 +52,80 @@ def train_autoencoder(data, input_dim):
     autoencoder.fit(data, data, epochs=50, batch_size=32, verbose=1)
     save_model(autoencoder, model_path)  # Corrigido aqui
     print(f"Modelo Autoencoder salvo em: {model_path}")
+    export_autoencoder(autoencoder, os.path.join(model_dir, "autoencoder.npz"))
     return autoencoder
 
 # Treinar PCA
-def train_pca(data, n_components=2):
-    model_dir = "/home/zrdax/SehenOS/backend/models/pipes/"
+def train_pca(data, n_components=2, model_dir=None):
+    model_dir = model_dir or Config.MODEL_DIR
     ensure_directory_exists(model_dir)
     model_path = os.path.join(model_dir, "pca.pkl")
 
     pca = PCA(n_components=n_components)
     pca.fit(data)
+    # Escalas da pontuação da cascata (medianas do erro e do T² no treino);
+    # o limiar depende dos outros modelos e é definido em calibrate_cascade
+    error, t2 = PCAResidual(pca).statistics(data)
+    pca.cascade_scale_ = (max(float(np.median(error)), 1e-12), max(float(np.median(t2)), 1e-12))
     with open(model_path, "wb") as f:
         pickle.dump(pca, f)
     print(f"Modelo PCA salvo em: {model_path}")
     return pca
 
+# Calibrar o limiar do primeiro nível da cascata: o menor que ainda deixa
+# passar a fração `recall` das linhas que o pipeline completo (Isolation
+# Forest + autoencoder) marca nos dados de treino
+def calibrate_cascade(models, data, recall=None, model_dir=None):
+    from core.detector import detect_anomalies
+
+    model_dir = model_dir or Config.MODEL_DIR
+    recall = Config.CASCADE_RECALL if recall is None else recall
+    pca = models[2]
+    _, _, flagged = detect_anomalies(models, data)
+    if not flagged.any():
+        print("Nenhuma linha marcada nos dados de treino; cascata sem limiar calibrado.")
+        return None
+    scores = PCAResidual(pca).score(data, pca.cascade_scale_)
+    pca.cascade_threshold_ = float(np.nextafter(np.quantile(scores[flagged], 1 - recall), -np.inf))
+    with open(os.path.join(model_dir, "pca.pkl"), "wb") as f:
+        pickle.dump(pca, f)
+    print(f"Limiar da cascata: {pca.cascade_threshold_:.4f} "
+          f"({np.mean(scores > pca.cascade_threshold_):.1%} das linhas de treino seguem para o nível 2)")
+    return pca.cascade_threshold_
+
+# Diretório dos modelos de cada modo de detecção
+def model_dir_for(mode):
+    return os.path.join(Config.MODEL_DIR, "flow") if mode == "flow" else Config.MODEL_DIR
+
+# Carregar o Isolation Forest compilado em arrays; o .npz é gerado a partir
+# do .pkl se ainda não existir ou estiver desatualizado
+def load_isolation_forest(model_dir):
+    npz_path = os.path.join(model_dir, "isolation_forest.npz")
+    pkl_path = os.path.join(model_dir, "isolation_forest.pkl")
+    if os.path.exists(pkl_path) and (
+        not os.path.exists(npz_path) or os.path.getmtime(pkl_path) > os.path.getmtime(npz_path)
+    ):
+        with open(pkl_path, "rb") as f:
+            CompiledIsolationForest.compile(pickle.load(f)).save(npz_path)
+    return CompiledIsolationForest.load(npz_path)
+
+# Carregar o autoencoder para inferência em NumPy; o .npz é gerado a partir
+# do .keras se ainda não existir ou estiver desatualizado
+def load_autoencoder(model_dir):
+    npz_path = os.path.join(model_dir, "autoencoder.npz")
+    keras_path = os.path.join(model_dir, "autoencoder.keras")
+    if os.path.exists(keras_path) and (
+        not os.path.exists(npz_path) or os.path.getmtime(keras_path) > os.path.getmtime(npz_path)
+    ):
+        export_model_dir(model_dir)
+    return DenseNetwork.load(npz_path)
+
 # Carregar Modelos
-def load_models():
-    model_dir = "/home/zrdax/SehenOS/backend/models/pipes/"
+def load_models(model_dir=None):
+    model_dir = model_dir or model_dir_for(Config.DETECTION_MODE)
     try:
-        with open(os.path.join(model_dir, "isolation_forest.pkl"), "rb") as f:
-            isolation_forest = pickle.load(f)
-        autoencoder = load_model(os.path.join(model_dir, "autoencoder.keras"))
+        isolation_forest = load_isolation_forest(model_dir)
+        autoencoder = load_autoencoder(model_dir)
         with open(os.path.join(model_dir, "pca.pkl"), "rb") as f:
             pca = pickle.load(f)
         print("Modelos carregados com sucesso.")
@@ -77,10 +136,16 @@ def load_models():
 
 # Gerar e treinar os modelos
 if __name__ == "__main__":
+    # Uso: python -m models.anomaly_models [packet|flow]
+    mode = sys.argv[1] if len(sys.argv) > 1 else Config.DETECTION_MODE
+    model_dir = model_dir_for(mode)
+    n_features = len(feature_columns(mode))
+
     print("Gerando dados fictícios...")
-    X = np.random.rand(1000, 7)  # Simulando dados com 7 features
+    X = np.random.rand(1000, n_features)  # Simulando dados com as features do modo
 
-    print("Treinando e salvando os modelos...")
-    train_isolation_forest(X)
-    train_autoencoder(X, input_dim=X.shape[1])
-    train_pca(X)
+    print(f"Treinando e salvando os modelos ({mode})...")
+    train_isolation_forest(X, model_dir=model_dir)
+    train_autoencoder(X, input_dim=X.shape[1], model_dir=model_dir)
+    train_pca(X, model_dir=model_dir)
+    calibrate_cascade(load_models(model_dir), X, model_dir=model_dir)
@@ -0,0 +1,417 @@
+import os
+import struct
+import sys
+import tempfile
+import zipfile
+import numpy as np
+from app.config import Config
+
+# Ativações suportadas no forward em NumPy (aplicadas in-place)
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "tanh": lambda x: np.tanh(x, out=x),
+    "sigmoid": lambda x: np.divide(1, np.add(1, np.exp(np.negative(x, out=x), out=x), out=x), out=x),
+}
+
+# Linhas por bloco no Isolation Forest compilado (nós do bloco em cache)
+IFOREST_BLOCK_ROWS = 512
+
+# Cabeçalho local de um arquivo ZIP: 30 bytes, tamanhos do nome e do campo
+# extra nas posições 26 e 28
+_ZIP_LOCAL_HEADER = struct.Struct("<4s22xHH")
+
+
+def mmap_npz(path):
+    """
+    Abre um .npz (não comprimido) mapeando cada array direto do arquivo,
+    sem copiar para a memória: o offset de cada .npy dentro do ZIP é lido
+    do cabeçalho local e o array vira um np.memmap somente leitura.
+    :return: Dicionário nome -> np.ndarray (apoiado no mmap).
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path}: {info.filename} está comprimido e não pode ser mapeado.")
+            f.seek(info.header_offset)
+            signature, name_len, extra_len = _ZIP_LOCAL_HEADER.unpack(f.read(_ZIP_LOCAL_HEADER.size))
+            if signature != b"PK\x03\x04":
+                raise ValueError(f"{path}: cabeçalho ZIP inválido em {info.filename}.")
+            f.seek(info.header_offset + _ZIP_LOCAL_HEADER.size + name_len + extra_len)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if not shape or 0 in shape:
+                # Escalares e arrays vazios não podem ser mapeados
+                arrays[name] = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+                continue
+            arrays[name] = np.asarray(np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                                order="F" if fortran_order else "C"))
+    return arrays
+
+
+def save_npz(path, **arrays):
+    """
+    Grava um .npz (não comprimido) de forma atômica. O temporário tem nome
+    único, então processos gravando o mesmo arquivo ao mesmo tempo não se
+    misturam: o último os.replace vence com um arquivo completo.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+class DenseNetwork:
+    """
+    Rede densa (sequência de camadas Dense) executada em NumPy float32.
+
+    Substitui o Keras na detecção: os pesos vêm de um .npz exportado por
+    export_autoencoder e o forward é feito em blocos de linhas, reutilizando
+    os buffers intermediários de cada camada.
+    """
+
+    def __init__(self, weights, biases, activations):
+        self.weights = [np.asarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.activations = [str(a) for a in activations]
+        for name in self.activations:
+            if name not in ACTIVATIONS:
+                raise ValueError(f"Ativação não suportada: {name}")
+        self._apply = [ACTIVATIONS[name] for name in self.activations]
+        self._buffers = []
+
+    @property
+    def input_dim(self):
+        return self.weights[0].shape[0]
+
+    @property
+    def output_dim(self):
+        return self.weights[-1].shape[1]
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Carrega a rede de um .npz exportado (mapeado em memória por padrão).
+        """
+        if mmap:
+            arrays = mmap_npz(path)
+        else:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        layers = int(arrays["layers"])
+        return cls(
+            [arrays[f"kernel_{i}"] for i in range(layers)],
+            [arrays[f"bias_{i}"] for i in range(layers)],
+            arrays["activations"].tolist(),
+        )
+
+    def save(self, path):
+        arrays = {"layers": np.array(len(self.weights)), "activations": np.array(self.activations)}
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            arrays[f"kernel_{i}"] = w
+            arrays[f"bias_{i}"] = b
+        save_npz(path, **arrays)
+
+    def predict(self, data, batch_size=None, verbose=0):
+        """
+        Forward em float32, no mesmo formato de saída do model.predict.
+        :param data: Matriz (n, input_dim).
+        :param batch_size: Linhas por bloco (padrão: Config.INFERENCE_BATCH_SIZE).
+        """
+        data = np.asarray(data, dtype=np.float32)
+        n = data.shape[0]
+        batch_size = min(batch_size or Config.INFERENCE_BATCH_SIZE, max(n, 1))
+        if not self._buffers or self._buffers[0].shape[0] < batch_size:
+            self._buffers = [np.empty((batch_size, w.shape[1]), dtype=np.float32) for w in self.weights[:-1]]
+
+        output = np.empty((n, self.output_dim), dtype=np.float32)
+        for start in range(0, n, batch_size):
+            x = data[start:start + batch_size]
+            rows = len(x)
+            # Cada camada escreve no seu buffer; a última direto na saída
+            targets = [buf[:rows] for buf in self._buffers] + [output[start:start + rows]]
+            for weight, bias, apply, out in zip(self.weights, self.biases, self._apply, targets):
+                x = np.matmul(x, weight, out=out)
+                x += bias
+                apply(x)
+        return output
+
+
+class PCAResidual:
+    """
+    Estatísticas de um PCA do scikit-learn com duas multiplicações de
+    matrizes: o erro de reconstrução (fora do subespaço,
+    x - reconstrução(x) = (x - média) @ (I - CᵀC)) e o T² de Hotelling
+    (dentro do subespaço, componentes divididas pela variância).
+    """
+
+    def __init__(self, pca):
+        if getattr(pca, "whiten", False):
+            raise ValueError("PCA com whiten não é suportado.")
+        components = np.asarray(pca.components_, dtype=np.float64)
+        self.mean = np.asarray(pca.mean_, dtype=np.float32)
+        self.projector = (np.eye(components.shape[1]) - components.T @ components).astype(np.float32)
+        self.whitener = (components.T / np.sqrt(pca.explained_variance_)).astype(np.float32)
+        # Escalas e limiar calibrados no treino (calibrate_cascade); modelos
+        # antigos não têm e não filtram nada no primeiro nível
+        self.scale = getattr(pca, "cascade_scale_", None)
+        self.threshold = getattr(pca, "cascade_threshold_", None) if self.scale is not None else None
+
+    def error(self, data):
+        """
+        Erro quadrático médio de reconstrução por linha.
+        """
+        residual = (np.asarray(data, dtype=np.float32) - self.mean) @ self.projector
+        np.square(residual, out=residual)
+        return residual.mean(axis=1)
+
+    def statistics(self, data):
+        """
+        :return: (erro de reconstrução, T² médio por componente) por linha.
+        """
+        centered = np.asarray(data, dtype=np.float32) - self.mean
+        residual = centered @ self.projector
+        np.square(residual, out=residual)
+        projected = centered @ self.whitener
+        np.square(projected, out=projected)
+        return residual.mean(axis=1), projected.mean(axis=1)
+
+    def score(self, data, scale=None):
+        """
+        Pontuação do primeiro nível da cascata: o maior entre o erro de
+        reconstrução e o T², cada um dividido pela sua escala (mediana no
+        treino). Pega tanto linhas fora do subespaço quanto valores
+        extremos dentro dele (os que o Isolation Forest costuma marcar).
+        """
+        error, t2 = self.statistics(data)
+        scale = self.scale if scale is None else scale
+        return np.maximum(error / np.float32(scale[0]), t2 / np.float32(scale[1]))
+
+
+def average_path_length(n_samples):
+    """
+    Comprimento médio de caminho c(n) de uma árvore de isolamento com n
+    amostras (mesma fórmula do scikit-learn).
+    """
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    result = np.zeros_like(n_samples)
+    result[n_samples == 2] = 1.0
+    mask = n_samples > 2
+    n = n_samples[mask]
+    result[mask] = 2.0 * (np.log(n - 1.0) + np.euler_gamma) - 2.0 * (n - 1.0) / n
+    return result
+
+
+def _float32_floor(values):
+    """
+    Maior float32 <= valor: para x float32, x <= t64 equivale a x <= t32.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rounded = values.astype(np.float32)
+    above = rounded.astype(np.float64) > values
+    rounded[above] = np.nextafter(rounded[above], np.float32(-np.inf))
+    return rounded
+
+
+class CompiledIsolationForest:
+    """
+    IsolationForest do scikit-learn compilado em arrays contíguos.
+
+    Todas as árvores ficam em um único conjunto de arrays (feature,
+    limiar em float32, filho esquerdo e valor da folha), com os nós
+    renumerados em largura de forma que o filho direito é sempre o esquerdo
+    + 1. As folhas apontam para si mesmas com limiar +inf, então o lote
+    inteiro percorre todas as árvores nível a nível sem máscaras:
+    nó = esquerdo[nó] + (x[feature[nó]] > limiar[nó]). O valor da folha
+    já inclui a profundidade e a correção c(n) das amostras da folha.
+    """
+
+    def __init__(self, feature, threshold, left, value, roots, depth, denominator, offset, n_features):
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float32)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.depth = int(depth)
+        self.denominator = float(denominator)
+        self.offset_ = float(offset)
+        self.n_features = int(n_features)
+        # Filho esquerdo e feature em um único inteiro (uma leitura por nível)
+        self._shift = max(1, (self.n_features - 1).bit_length())
+        self._feature_mask = (1 << self._shift) - 1
+        self._code = (self.left.astype(np.intp) << self._shift) | self.feature
+        self._roots = self.roots.astype(np.intp)
+
+    @classmethod
+    def compile(cls, model):
+        """
+        Converte um IsolationForest treinado.
+        """
+        n_features = model.n_features_in_
+        features, thresholds, lefts, values, roots = [], [], [], [], []
+        max_depth = 0
+        base = 0
+
+        for estimator, estimator_features in zip(model.estimators_, model.estimators_features_):
+            tree = estimator.tree_
+            # Índices da árvore para as colunas de X. Com todas as features
+            # (max_features=1.0) o scikit-learn treina e pontua sobre X
+            # inteiro e estimators_features_ é só uma permutação
+            if len(estimator_features) != n_features:
+                column = np.asarray(estimator_features)
+            else:
+                column = np.arange(n_features)
+            n_nodes = tree.node_count
+            order = [0]
+            depth = {0: 0}
+            new_index = {0: 0}
+            # Renumeração em largura: filhos de cada nó ficam lado a lado
+            for node in order:
+                left, right = tree.children_left[node], tree.children_right[node]
+                if left != -1:
+                    for child in (left, right):
+                        new_index[child] = len(order)
+                        depth[child] = depth[node] + 1
+                        order.append(child)
+
+            feature = np.zeros(n_nodes, dtype=np.int32)
+            threshold = np.full(n_nodes, np.inf, dtype=np.float64)
+            left_child = np.empty(n_nodes, dtype=np.int32)
+            value = np.zeros(n_nodes, dtype=np.float64)
+            leaf_samples = average_path_length(tree.n_node_samples)
+            for node in order:
+                i = new_index[node]
+                if tree.children_left[node] == -1:
+                    left_child[i] = base + i
+                    value[i] = depth[node] + leaf_samples[node]
+                else:
+                    feature[i] = column[tree.feature[node]]
+                    threshold[i] = tree.threshold[node]
+                    left_child[i] = base + new_index[tree.children_left[node]]
+                max_depth = max(max_depth, depth[node])
+
+            features.append(feature)
+            thresholds.append(_float32_floor(threshold))
+            lefts.append(left_child)
+            values.append(value)
+            roots.append(base)
+            base += n_nodes
+
+        denominator = len(model.estimators_) * average_path_length([model.max_samples_])[0]
+        return cls(np.concatenate(features), np.concatenate(thresholds), np.concatenate(lefts),
+                   np.concatenate(values), roots, max_depth, denominator, model.offset_, n_features)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        if mmap:
+            arrays = mmap_npz(path)
+        else:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        return cls(arrays["feature"], arrays["threshold"], arrays["left"], arrays["value"], arrays["roots"],
+                   arrays["depth"], arrays["denominator"], arrays["offset"], arrays["n_features"])
+
+    def save(self, path):
+        save_npz(path, feature=self.feature, threshold=self.threshold, left=self.left, value=self.value,
+                 roots=self.roots, depth=np.array(self.depth), denominator=np.array(self.denominator),
+                 offset=np.array(self.offset_), n_features=np.array(self.n_features))
+
+    def path_lengths(self, data):
+        """
+        Soma, em todas as árvores, do comprimento de caminho de cada linha.
+        """
+        data = np.ascontiguousarray(data, dtype=np.float32)
+        n = data.shape[0]
+        flat = data.ravel()
+        totals = np.empty(n, dtype=np.float64)
+        code, mask, shift, threshold = self._code, self._feature_mask, self._shift, self.threshold
+        for start in range(0, n, IFOREST_BLOCK_ROWS):
+            rows = min(IFOREST_BLOCK_ROWS, n - start)
+            row_base = (np.arange(start, start + rows, dtype=np.intp) * self.n_features)[:, None]
+            node = np.repeat(self._roots[None, :], rows, axis=0)
+            packed = np.empty_like(node)
+            index = np.empty_like(node)
+            limit = np.empty(node.shape, dtype=np.float32)
+            values = np.empty(node.shape, dtype=np.float32)
+            right = np.empty(node.shape, dtype=bool)
+            # Os índices já são válidos: mode="clip" evita a checagem de limites
+            for _ in range(self.depth):
+                np.take(code, node, out=packed, mode="clip")
+                np.take(threshold, node, out=limit, mode="clip")
+                np.bitwise_and(packed, mask, out=index)
+                index += row_base
+                np.take(flat, index, out=values, mode="clip")
+                np.greater(values, limit, out=right)
+                np.right_shift(packed, shift, out=node)
+                node += right
+            totals[start:start + rows] = np.take(self.value, node).sum(axis=1)
+        return totals
+
+    def score_samples(self, data):
+        return -(2.0 ** (-self.path_lengths(data) / self.denominator)) if self.denominator else -np.ones(len(data))
+
+    def decision_function(self, data):
+        return self.score_samples(data) - self.offset_
+
+    def predict(self, data):
+        """
+        1 para normal e -1 para anomalia, como IsolationForest.predict.
+        """
+        return np.where(self.decision_function(data) < 0, -1, 1)
+
+
+def export_autoencoder(model, path):
+    """
+    Exporta um modelo Keras sequencial de camadas Dense para .npz.
+    :param model: Modelo Keras já carregado.
+    :param path: Arquivo .npz de destino.
+    :return: DenseNetwork com os mesmos pesos.
+    """
+    weights, biases, activations = [], [], []
+    for layer in model.layers:
+        params = layer.get_weights()
+        if not params:
+            continue
+        if type(layer).__name__ != "Dense" or len(params) != 2:
+            raise ValueError(f"Camada não suportada na exportação: {layer.name} ({type(layer).__name__})")
+        activation = layer.get_config()["activation"]
+        if not isinstance(activation, str):
+            raise ValueError(f"Ativação não suportada na exportação: {activation}")
+        weights.append(params[0])
+        biases.append(params[1])
+        activations.append(activation)
+
+    network = DenseNetwork(weights, biases, activations)
+    network.save(path)
+    return network
+
+
+def export_model_dir(model_dir):
+    """
+    Converte o autoencoder.keras de um diretório de modelos em
+    autoencoder.npz (requer TensorFlow, apenas nesta etapa).
+    """
+    from tensorflow.keras.models import load_model
+
+    model = load_model(os.path.join(model_dir, "autoencoder.keras"))
+    path = os.path.join(model_dir, "autoencoder.npz")
+    export_autoencoder(model, path)
+    print(f"Autoencoder exportado para: {path}")
+    return path
+
+
+if __name__ == "__main__":
+    # Uso: python -m models.inference [diretório dos modelos]
+    export_model_dir(sys.argv[1] if len(sys.argv) > 1 else Config.MODEL_DIR)
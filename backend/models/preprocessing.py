@@ -1,30 +1,53 @@
+import logging
+import os
+import pickle
+import tempfile
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
 import numpy as np
+from app.config import Config
+
+# Features do conteúdo do payload (payload_features); payload_control é o
+# complemento das demais classes e fica fora da entrada dos modelos
+PAYLOAD_FEATURES = ["payload_len", "payload_entropy", "payload_printable", "payload_null", "payload_high"]
+
+# Features usadas pelos modelos no modo por pacote
+PACKET_FEATURES = [
+    "length", "bytes", "src_port", "dst_port", "time_to_live", "is_blacklisted", "bytes_per_second",
+] + PAYLOAD_FEATURES
 
 # Função para preparar os dados
 def preprocess_data(packets):
     """
     Preprocessa os dados dos pacotes capturados para análise.
+    :param packets: Lista de dicionários ou colunas retornadas por decode_batch.
     """
     df = pd.DataFrame(packets)
 
-    # Converter timestamp para datetime
+    # Converter timestamp para datetime (epoch em segundos no formato binário)
     if "timestamp" in df.columns:
-        df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+        if pd.api.types.is_numeric_dtype(df["timestamp"]):
+            df["timestamp"] = pd.to_datetime(df["timestamp"], unit="s")
+        else:
+            df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
     else:
         raise ValueError("Coluna 'timestamp' está ausente nos dados.")
 
     # Ordenar por timestamp
     df = df.sort_values(by="timestamp").reset_index(drop=True)
 
+    # Features do payload (bytes ou string hexadecimal)
+    if "payload" in df.columns:
+        for name, values in payload_features(df["payload"].to_numpy()).items():
+            df[name] = values
+
     # Criar coluna calculada
     df["bytes_per_second"] = df["bytes"] / (
         df["timestamp"].diff().dt.total_seconds().fillna(1)
     )
 
     # Seleção de colunas relevantes
-    numeric_cols = ["length", "bytes", "src_port", "dst_port", "time_to_live", "is_blacklisted", "bytes_per_second"]
+    numeric_cols = PACKET_FEATURES
     df = df.fillna(0)  # Tratar valores nulos
 
     # Escalonar os dados
@@ -34,9 +57,224 @@ def preprocess_data(packets):
     return df, scaled_data
 
 
+# Features dos registros de fluxo (core.flows)
+FLOW_FEATURES = [
+    "duration", "packets", "bytes", "packets_fwd", "packets_bwd", "bytes_fwd", "bytes_bwd",
+    "bytes_per_second", "packets_per_second", "iat_mean", "iat_std", "iat_min", "iat_max",
+    "syn_count", "ack_count", "fin_count", "rst_count", "psh_count", "urg_count",
+    "payload_entropy", "dst_port", "is_blacklisted",
+]
+
+def feature_columns(mode):
+    """
+    Retorna as features de entrada dos modelos para o modo de detecção.
+    """
+    return FLOW_FEATURES if mode == "flow" else PACKET_FEATURES
+
+def to_columns(records, features):
+    """
+    Converte uma lista de dicionários (ex.: registros de fluxo) em colunas
+    NumPy apenas com as features informadas e o timestamp.
+    """
+    columns = {name: np.array([0 if r.get(name) is None else r[name] for r in records]) for name in features}
+    if records and "timestamp" in records[0]:
+        columns["timestamp"] = np.array([r["timestamp"] for r in records], dtype=np.float64)
+    return columns
+
+
+# Menor intervalo entre pacotes usado em bytes_per_second (resolução da
+# captura); evita divisão por zero em pacotes com o mesmo timestamp
+MIN_INTERVAL = 1e-6
+
+def scaler_path(model_dir, shard=None):
+    """
+    Escalonador compartilhado (scaler.pkl, ajustado offline) ou o de um
+    shard (scaler-<shard>.pkl), atualizado apenas pelo detector do shard.
+    """
+    return os.path.join(model_dir, "scaler.pkl" if shard is None else f"scaler-{shard}.pkl")
+
+def load_scaler(model_dir, shard=None):
+    """
+    Carrega o escalonador do shard; sem ele, o compartilhado (ou None se
+    nenhum existir).
+    """
+    paths = [scaler_path(model_dir, shard)] if shard is None else [scaler_path(model_dir, shard), scaler_path(model_dir)]
+    for path in paths:
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            continue
+    return None
+
+def save_scaler(scaler, model_dir, shard=None):
+    os.makedirs(model_dir, exist_ok=True)
+    path = scaler_path(model_dir, shard)
+    # Temporário com nome único: processos salvando ao mesmo tempo não
+    # escrevem no mesmo arquivo
+    fd, tmp = tempfile.mkstemp(dir=model_dir, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(scaler, f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+class StreamingPreprocessor:
+    """
+    Preprocessamento incremental para a detecção contínua.
+
+    Ao contrário de preprocess_data, não monta DataFrame nem ajusta um
+    escalonador novo por lote: as features são copiadas direto das colunas
+    para um buffer float32 reutilizado, o StandardScaler é atualizado com
+    partial_fit (médias e variâncias acumuladas desde o início) e o último
+    timestamp é mantido entre lotes para o cálculo de bytes_per_second.
+    Assim a mesma entrada gera a mesma escala em lotes diferentes.
+
+    Com vários detectores, cada shard atualiza e salva o seu próprio
+    escalonador (partindo do compartilhado, se existir); com update=False
+    o escalonador carregado fica congelado e não é salvo.
+    """
+
+    def __init__(self, features, model_dir=None, update=None, shard=None):
+        self.features = list(features)
+        self.model_dir = model_dir
+        self.shard = shard
+        self.update = Config.SCALER_UPDATE if update is None else update
+        self.scaler = (load_scaler(model_dir, shard) if model_dir else None) or StandardScaler()
+        self._fitted = hasattr(self.scaler, "mean_")
+        if getattr(self.scaler, "n_features_in_", len(self.features)) != len(self.features):
+            # Escalonador salvo com outro conjunto de features: recomeçar
+            logging.warning(f"Escalonador em {scaler_path(model_dir, shard)} tem {self.scaler.n_features_in_} features "
+                            f"(esperadas {len(self.features)}); criando um novo.")
+            self.scaler = StandardScaler()
+            self._fitted = False
+        self.last_timestamp = None
+        self._buffer = np.empty((0, len(self.features)), dtype=np.float32)
+
+    def _rows(self, n):
+        # Buffer preenchido in-place; só cresce quando chega um lote maior
+        if self._buffer.shape[0] < n:
+            self._buffer = np.empty((max(n, 2 * self._buffer.shape[0]), len(self.features)), dtype=np.float32)
+        return self._buffer[:n]
+
+    def _bytes_per_second(self, columns):
+        timestamps = columns["timestamp"]
+        previous = self.last_timestamp if self.last_timestamp is not None else timestamps[0] - 1
+        interval = np.diff(timestamps, prepend=previous)
+        np.maximum(interval, MIN_INTERVAL, out=interval)
+        self.last_timestamp = max(previous, timestamps[-1])
+        return columns["bytes"] / interval
+
+    def transform(self, columns):
+        """
+        Extrai e escala as features de um lote.
+        :param columns: Colunas retornadas por decode_batch ou to_columns.
+        :return: (colunas ordenadas por timestamp, matriz float32 escalada).
+            A matriz reutiliza o buffer interno e só é válida até o próximo lote.
+        """
+        n = len(columns["timestamp"])
+        if "payload" in columns and any(name not in columns for name in PAYLOAD_FEATURES if name in self.features):
+            columns = dict(columns, **payload_features(columns["payload"]))
+        if "bytes_per_second" in self.features and "bytes_per_second" not in columns:
+            timestamps = np.asarray(columns["timestamp"], dtype=np.float64)
+            if n > 1 and np.any(timestamps[1:] < timestamps[:-1]):
+                order = np.argsort(timestamps, kind="stable")
+                columns = {name: values[order] for name, values in columns.items()}
+                timestamps = timestamps[order]
+            columns["timestamp"] = timestamps
+            columns["bytes_per_second"] = self._bytes_per_second(columns)
+
+        data = self._rows(n)
+        for j, name in enumerate(self.features):
+            data[:, j] = columns[name]
+
+        if self.update or not hasattr(self.scaler, "mean_"):
+            self.scaler.partial_fit(data)
+        data -= self.scaler.mean_.astype(np.float32)
+        data /= self.scaler.scale_.astype(np.float32)
+        return columns, data
+
+    def save(self):
+        """
+        Persiste o escalonador do shard no diretório dos modelos (apenas se
+        ele foi ajustado por este processo).
+        """
+        if self.model_dir and hasattr(self.scaler, "mean_") and (self.update or not self._fitted):
+            save_scaler(self.scaler, self.model_dir, self.shard)
+
+
+# Classes de byte do histograma do payload: 0 = nulo, 1 = controle,
+# 2 = ASCII imprimível (incluindo \t, \n e \r), 3 = acima de 0x7f
+BYTE_CLASSES = np.ones(256, dtype=np.int64)
+BYTE_CLASSES[0] = 0
+BYTE_CLASSES[0x20:0x7F] = 2
+BYTE_CLASSES[[0x09, 0x0A, 0x0D]] = 2
+BYTE_CLASSES[0x80:] = 3
+_CLASS_MATRIX = np.eye(4)[BYTE_CLASSES]
+
+# Linhas por bloco da contagem de bytes (matriz linhas x 256, mantida no cache)
+PAYLOAD_BLOCK_ROWS = 512
+
+def _payload_bytes(payload):
+    # None (ou NaN vindo de um DataFrame) = sem payload
+    if not payload or not isinstance(payload, (bytes, bytearray, str)):
+        return b""
+    return bytes.fromhex(payload) if isinstance(payload, str) else payload
+
+def payload_features(payloads, block_rows=PAYLOAD_BLOCK_ROWS):
+    """
+    Features do conteúdo de um lote de payloads em uma passada vetorizada.
+
+    Os payloads são concatenados em um único buffer; a linha de cada byte
+    vem de np.repeat sobre os tamanhos e um np.bincount de (linha, byte)
+    gera a contagem de bytes de cada payload, da qual saem a entropia de
+    Shannon e o histograma por classe de byte (BYTE_CLASSES).
+    :param payloads: Sequência de payloads (bytes, string hexadecimal ou None).
+    :return: Dicionário com payload_len, payload_entropy, payload_printable,
+             payload_null, payload_control e payload_high (frações do payload).
+    """
+    payloads = [p if p.__class__ is bytes else _payload_bytes(p) for p in payloads]
+    n = len(payloads)
+    lengths = np.fromiter(map(len, payloads), dtype=np.int64, count=n)
+    data = np.frombuffer(b"".join(payloads), dtype=np.uint8)
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    entropy = np.zeros(n)
+    classes = np.zeros((n, 4))
+    for start in range(0, n, block_rows):
+        stop = min(start + block_rows, n)
+        block = data[offsets[start]:offsets[stop]]
+        if not len(block):
+            continue
+        rows = np.repeat(np.arange(stop - start), lengths[start:stop])
+        counts = np.bincount(rows * 256 + block, minlength=(stop - start) * 256).reshape(-1, 256)
+
+        # H = log2(L) - sum(c * log2(c)) / L, com c * log2(c) tabelado
+        xlogx = np.arange(counts.max() + 1, dtype=np.float64)
+        xlogx[1:] *= np.log2(xlogx[1:])
+        total = np.maximum(lengths[start:stop], 1).astype(np.float64)
+        entropy[start:stop] = np.log2(total) - xlogx[counts].sum(axis=1) / total
+        classes[start:stop] = (counts @ _CLASS_MATRIX) / total[:, None]
+
+    # Resíduos de arredondamento em payloads de um único byte repetido
+    np.maximum(entropy, 0.0, out=entropy)
+    return {
+        "payload_len": lengths,
+        "payload_entropy": entropy,
+        "payload_printable": classes[:, 2],
+        "payload_null": classes[:, 0],
+        "payload_control": classes[:, 1],
+        "payload_high": classes[:, 3],
+    }
+
 def calculate_entropy(payload):
+    """
+    Entropia de Shannon do payload (bytes ou string hexadecimal).
+    """
     if not payload:
         return 0
-    counts = np.bincount(bytearray.fromhex(payload))
-    probs = counts / sum(counts)
-    return -np.sum([p * np.log2(p) for p in probs if p > 0])
+    return float(payload_features([payload])["payload_entropy"][0])
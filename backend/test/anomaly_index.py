@@ -0,0 +1,45 @@
+import os
+
+os.environ.setdefault("REDIS_DB", "15")
+
+import json
+import time
+from config.redis_config import redis_client
+from core.anomaly_index import (MINUTES_KEY, fetch_records, ip_entries, ip_key, minute_key, time_entries,
+                                write_anomalies, zrev_scan)
+
+def test_anomaly_index():
+    redis_client.flushdb()
+    now = float(int(time.time()))
+    # 3 anomalias por segundo, várias com o mesmo timestamp
+    anomalies = [(now - 600 + i // 3, f"10.0.0.{i % 5}", "8.8.8.8", json.dumps({"i": i})) for i in range(900)]
+    ids = write_anomalies(redis_client, anomalies, retention=3600, now=now)
+    assert redis_client.llen("network_anomalies") == 900
+    assert all(0 < redis_client.ttl(key) <= 3600 for key in (f"anomaly:{ids[0]}", ip_key("8.8.8.8"),
+                                                             minute_key(int(anomalies[0][0] // 60))))
+
+    # Por IP: todas, da mais recente para a mais antiga, sem repetir nos empates
+    entries = list(zrev_scan(redis_client, ip_key("10.0.0.1"), chunk=7))
+    assert len(entries) == 180 and len({m for _, m in entries}) == 180
+    assert [s for s, _ in entries] == sorted((s for s, _ in entries), reverse=True)
+    records = [json.loads(r)["i"] for r in fetch_records(redis_client, [m for _, m in entries])]
+    assert sorted(records) == [i for i in range(900) if i % 5 == 1]
+
+    # Retomada pelo cursor (score, id) no meio de um empate
+    resumed = list(ip_entries(redis_client, "10.0.0.1", after=entries[100]))
+    assert resumed == entries[101:]
+
+    # Por intervalo de tempo: só os baldes do intervalo
+    window = list(time_entries(redis_client, now - 500, now - 441))
+    assert len(window) == 60 * 3
+    assert list(time_entries(redis_client, now - 500, now - 441, after=window[9])) == window[10:]
+
+    # Retenção: anomalias antigas saem dos índices na próxima escrita
+    write_anomalies(redis_client, [(now + 1, "10.0.0.1", "8.8.8.8", "{}")], retention=300, now=now)
+    assert all(s >= now - 300 for s, _ in ip_entries(redis_client, "10.0.0.1"))
+    assert redis_client.zrangebyscore(MINUTES_KEY, "-inf", (now - 300) // 60 - 1) == []
+    redis_client.flushdb()
+    print("Teste dos índices de anomalias: OK")
+
+# Rodar o teste
+test_anomaly_index()
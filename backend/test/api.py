@@ -0,0 +1,138 @@
+import os
+
+# Banco separado: o teste usa as chaves reais da API
+os.environ.setdefault("REDIS_DB", "15")
+os.environ.setdefault("DETECTOR_WORKERS", "2")
+
+import json
+import time
+from urllib.parse import quote
+from app.routes import app
+from app.config import Config
+from config.redis_config import redis_client
+from core.packet_stream import RECORD_FIELD, shard_for, shard_streams
+from core.record import encode_record, to_json_safe
+from core.anomaly_index import write_anomalies
+
+START = 1732019696.0
+
+def sample_packet(i):
+    return {
+        "timestamp": START + i,
+        "src_ip": f"192.168.0.{i % 4}",
+        "dst_ip": "8.8.8.8",
+        "protocol": 17 if i % 3 == 0 else 6,
+        "length": 128,
+        "bytes": 128,
+        "src_port": 40000 + i,
+        "dst_port": 53 if i % 3 == 0 else 443,
+    }
+
+def populate(n):
+    redis_client.flushdb()
+    streams = shard_streams()
+    anomalies = []
+    for i in range(n):
+        packet = sample_packet(i)
+        stream = streams[shard_for(packet["src_ip"], packet["dst_ip"], len(streams))]
+        # Ids no horário do pacote (gravação logo após a captura)
+        redis_client.xadd(stream, {RECORD_FIELD: encode_record(packet)}, id=f"{int(packet['timestamp'] * 1000)}-0")
+        anomaly = dict(packet, reconstruction_error=0.1)
+        anomalies.append((packet["timestamp"], packet["src_ip"], packet["dst_ip"], json.dumps(to_json_safe(anomaly))))
+    # Retenção contada a partir do horário dos pacotes de teste
+    write_anomalies(redis_client, anomalies, now=START + n)
+
+def pages(client, url):
+    # Percorre todas as páginas pelo cursor
+    items = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200, response.data
+        items = response.get_json() + items
+        cursor = response.headers.get("X-Next-Cursor")
+        url = f"{url.split('&cursor=')[0]}&cursor={quote(cursor)}" if cursor else None
+    return items
+
+def test_paginated_queries():
+    populate(500)
+    client = app.test_client()
+    for endpoint in ("packets", "anomalies"):
+        # Página padrão: as mais recentes, em ordem cronológica
+        first = client.get(f"/{endpoint}?limit=100")
+        items = first.get_json()
+        assert len(items) == 100 and items[-1]["src_port"] == 40499 and items[0]["src_port"] == 40400
+        assert first.headers["X-Next-Cursor"]
+
+        # Cursor percorre tudo sem repetir nem perder
+        everything = pages(client, f"/{endpoint}?limit=70")
+        assert [p["src_port"] for p in everything] == list(range(40000, 40500))
+
+        # Filtros e projeção
+        udp = pages(client, f"/{endpoint}?limit=30&protocol=udp&ip=192.168.0.1&fields=src_ip,protocol,src_port")
+        expected = [40000 + i for i in range(500) if i % 3 == 0 and i % 4 == 1]
+        assert [p["src_port"] for p in udp] == expected
+        assert set(udp[0]) == {"src_ip", "protocol", "src_port"}
+        window = pages(client, f"/{endpoint}?limit=50&port=443&from={START + 100}&to={START + 199}")
+        assert [p["src_port"] for p in window] == [40000 + i for i in range(100, 200) if i % 3]
+
+        # NDJSON em streaming
+        response = client.get(f"/{endpoint}?limit=10&format=ndjson")
+        assert response.mimetype == "application/x-ndjson"
+        lines = response.data.decode().splitlines()
+        assert len(lines) == 10 and json.loads(lines[-1])["src_port"] == 40499
+
+        assert client.get(f"/{endpoint}?ip=bad").status_code == 400
+        assert client.get(f"/{endpoint}?limit={Config.API_MAX_LIMIT + 1}").status_code == 400
+
+    # Anomalias sem projeção são repassadas byte a byte
+    raw = redis_client.lindex("network_anomalies", -1)
+    assert client.get("/anomalies?limit=1").data == b"[" + raw + b"]"
+    redis_client.flushdb()
+    print("Teste de paginação, filtros e NDJSON da API: OK")
+
+def test_shard_cursor():
+    redis_client.flushdb()
+    streams = shard_streams()
+    # Escritor gravando nos dois shards no mesmo ms: ids repetidos entre shards
+    for i in range(60):
+        for shard, stream in enumerate(streams):
+            packet = dict(sample_packet(i), src_port=shard * 1000 + i)
+            redis_client.xadd(stream, {RECORD_FIELD: encode_record(packet)}, id=f"{int(START * 1000) + i}-0")
+    # Entradas mais novas sem registro, por mais de um bloco da varredura
+    for i in range(25):
+        redis_client.xadd(streams[0], {"x": 1}, id=f"{int(START * 1000) + 100 + i}-0")
+    client = app.test_client()
+    scan_chunk, Config.API_SCAN_CHUNK = Config.API_SCAN_CHUNK, 10
+    try:
+        ports = [p["src_port"] for p in pages(client, "/packets?limit=7")]
+    finally:
+        Config.API_SCAN_CHUNK = scan_chunk
+    assert len(ports) == 120 and sorted(ports) == sorted(s * 1000 + i for s in range(2) for i in range(60))
+    # Cursor antigo (só o id) continua aceito
+    assert client.get(f"/packets?limit=5&cursor={int(START * 1000) + 30}-0").status_code == 200
+    assert client.get("/packets?limit=5&cursor=abc|0").status_code == 400
+    redis_client.flushdb()
+    print("Teste do cursor por shard (ids repetidos e entradas sem registro): OK")
+
+def benchmark():
+    populate(0)
+    rows = [json.dumps(to_json_safe(dict(sample_packet(i), reconstruction_error=0.1))) for i in range(200000)]
+    for start in range(0, len(rows), 10000):
+        write_anomalies(redis_client, [(START + i, f"192.168.0.{i % 4}", "8.8.8.8", rows[i])
+                                       for i in range(start, start + 10000)], now=START + len(rows))
+    client = app.test_client()
+    start = time.perf_counter()
+    everything = [json.loads(a) for a in redis_client.lrange("network_anomalies", 0, -1)]
+    json.dumps(everything)
+    legacy = time.perf_counter() - start
+    for url in ("/anomalies", "/anomalies?format=ndjson&limit=10000", "/anomalies?ip=192.168.0.3&limit=1000",
+                f"/anomalies?from={START + 100000}&to={START + 100599}&port=443"):
+        start = time.perf_counter()
+        client.get(url).data
+        print(f"{url:<40} {(time.perf_counter() - start) * 1000:8.1f} ms (lista inteira: {legacy * 1000:.1f} ms)")
+    redis_client.flushdb()
+
+# Rodar o teste e o benchmark
+test_paginated_queries()
+test_shard_cursor()
+benchmark()
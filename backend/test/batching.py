@@ -0,0 +1,83 @@
+import threading
+import time
+from config.redis_config import redis_client
+from core.batching import AdaptiveBatcher
+from core.packet_stream import RECORD_FIELD, StreamConsumer
+
+STREAM = "test_batching_packets"
+
+def add(n):
+    pipe = redis_client.pipeline(transaction=False)
+    for i in range(n):
+        pipe.xadd(STREAM, {RECORD_FIELD: b"x"})
+    pipe.execute()
+
+def consumer(count=100, block_ms=2000):
+    redis_client.delete(STREAM)
+    return StreamConsumer(redis_client, STREAM, "test", "a", count=count, block_ms=block_ms,
+                          claim_idle=3600).ensure_group()
+
+def test_adaptive_batches():
+    # Com fila, o alvo dobra até max_batch
+    batcher = AdaptiveBatcher(consumer(), max_latency_ms=200, max_batch=800, min_batch=50, policy="balanced")
+    add(3000)
+    sizes = []
+    for _ in range(4):
+        ids, _ = batcher.next_batch()
+        batcher.consumer.ack(ids)
+        batcher.done()
+        sizes.append(len(ids))
+    assert sizes == [100, 200, 400, 800], sizes
+    assert batcher.target == 800
+
+    # Tráfego baixo: lotes pequenos encolhem o alvo até min_batch
+    redis_client.xtrim(STREAM, maxlen=0)
+    batcher.consumer.read_batch(block_ms=0)
+    for _ in range(6):
+        add(10)
+        ids, _ = batcher.next_batch()
+        batcher.consumer.ack(ids)
+        batcher.done()
+    assert batcher.target == 50, batcher.target
+    stats = batcher.stats()
+    assert stats["batches"] == 10 and stats["last"]["rows"] == 10
+    print("Teste de crescimento e redução dos lotes: OK")
+
+def test_latency_policy():
+    # Pacotes chegando aos poucos: "latency" entrega o que já chegou,
+    # "throughput" espera até a latência máxima para encher o lote
+    for policy, minimum, maximum in (("latency", 1, 5), ("throughput", 15, 1000)):
+        batcher = AdaptiveBatcher(consumer(), max_latency_ms=300, max_batch=1000, min_batch=10, policy=policy)
+        stop = threading.Event()
+
+        def producer():
+            while not stop.is_set():
+                add(1)
+                time.sleep(0.01)
+
+        thread = threading.Thread(target=producer)
+        thread.start()
+        start = time.monotonic()
+        ids, _ = batcher.next_batch()
+        elapsed = time.monotonic() - start
+        stop.set()
+        thread.join()
+        batcher.done()
+        assert minimum <= len(ids) <= maximum, (policy, len(ids))
+        assert elapsed < 0.3 + 0.2, elapsed
+        print(f"Política {policy}: {len(ids)} pacotes em {elapsed * 1000:.0f} ms | {batcher.last}")
+
+    # Sem dados, a leitura bloqueia no stream (sem espera fixa) e acorda
+    # assim que o primeiro pacote chega
+    batcher = AdaptiveBatcher(consumer(), max_latency_ms=0, policy="latency")
+    threading.Timer(0.2, add, args=(1,)).start()
+    start = time.monotonic()
+    ids, _ = batcher.next_batch()
+    elapsed = time.monotonic() - start
+    assert len(ids) == 1 and 0.15 < elapsed < 1.0, elapsed
+    redis_client.delete(STREAM)
+    print("Teste da política latência x vazão: OK")
+
+# Rodar os testes
+test_adaptive_batches()
+test_latency_policy()
@@ -0,0 +1,127 @@
+import os
+import tempfile
+import threading
+import time
+import numpy as np
+from models.preprocessing import PACKET_FEATURES, StreamingPreprocessor, load_scaler, preprocess_data, save_scaler
+
+def synthetic_batch(n, start=1732019696.0, seed=0):
+    # Colunas no formato de decode_batch, com timestamps crescentes
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(0, 64, n)
+    return {
+        "timestamp": start + np.cumsum(rng.uniform(1e-4, 1e-2, n)),
+        "src_ip": np.array([f"192.168.0.{i % 250}" for i in range(n)], dtype=object),
+        "dst_ip": np.array([f"10.0.{i % 7}.1" for i in range(n)], dtype=object),
+        "protocol": rng.choice([6, 17], n),
+        "length": rng.integers(60, 1500, n),
+        "bytes": rng.integers(60, 1500, n),
+        "src_port": rng.integers(1024, 65535, n),
+        "dst_port": rng.choice([53, 80, 443, 22], n),
+        "time_to_live": rng.choice([64, 128], n),
+        "tcp_flags": rng.integers(0, 32, n),
+        "is_blacklisted": rng.random(n) < 0.01,
+        "is_whitelisted": np.zeros(n, dtype=bool),
+        "dns_queries": np.full(n, None, dtype=object),
+        "fqdns": np.full(n, None, dtype=object),
+        "payload": np.array([rng.integers(0, 256, size, dtype=np.uint8).tobytes() if size else None
+                             for size in sizes], dtype=object),
+        "payload_len": sizes,
+    }
+
+def as_dicts(batch):
+    # Formato antigo: lista de dicionários com timestamp ISO e payload hex
+    n = len(batch["timestamp"])
+    rows = []
+    for i in range(n):
+        row = {name: values[i] for name, values in batch.items()}
+        row["timestamp"] = np.datetime64(int(row["timestamp"] * 1e6), "us").astype(str)
+        row["payload"] = row["payload"].hex() if row["payload"] else None
+        rows.append(row)
+    return rows
+
+def test_streaming_parity():
+    # Com um escalonador novo e um único lote o resultado deve ser o mesmo
+    # do preprocess_data (a menos da precisão float32)
+    batch = synthetic_batch(5000)
+    _, expected = preprocess_data(dict(batch))
+    _, scaled = StreamingPreprocessor(PACKET_FEATURES, update=True).transform(dict(batch))
+    assert scaled.dtype == np.float32
+    assert np.allclose(scaled, expected, atol=1e-3), np.abs(scaled - expected).max()
+
+    # Lotes fora de ordem são ordenados antes do cálculo de bytes_per_second
+    order = np.random.default_rng(1).permutation(5000)
+    shuffled = {name: values[order] for name, values in batch.items()}
+    columns, scaled = StreamingPreprocessor(PACKET_FEATURES, update=True).transform(shuffled)
+    assert np.all(np.diff(columns["timestamp"]) >= 0)
+    assert np.allclose(scaled, expected, atol=1e-3)
+
+    # Escala estável: o mesmo lote, depois de congelado o escalonador, gera
+    # a mesma saída em chamadas diferentes
+    pre = StreamingPreprocessor(PACKET_FEATURES, update=True)
+    pre.transform(synthetic_batch(5000, seed=2))
+    pre.update = False
+    pre.last_timestamp = None
+    first = pre.transform(dict(batch))[1].copy()
+    pre.last_timestamp = None
+    second = pre.transform(dict(batch))[1]
+    assert np.array_equal(first, second)
+    print("Teste de preprocessamento incremental (paridade e estabilidade): OK")
+
+def test_shard_scalers():
+    with tempfile.TemporaryDirectory() as tmp:
+        # Escalonador compartilhado (offline) é o ponto de partida dos shards
+        shared = StreamingPreprocessor(PACKET_FEATURES, update=True)
+        shared.transform(synthetic_batch(2000, seed=3))
+        save_scaler(shared.scaler, tmp)
+        workers = [StreamingPreprocessor(PACKET_FEATURES, model_dir=tmp, update=True, shard=i) for i in range(2)]
+        assert all(w.scaler.n_samples_seen_ == 2000 for w in workers)
+        for i, worker in enumerate(workers):
+            worker.transform(synthetic_batch(1000 * (i + 1), seed=4 + i))
+            worker.save()
+        # Cada shard salva o seu; o compartilhado não é sobrescrito
+        assert [load_scaler(tmp, i).n_samples_seen_ for i in range(2)] == [3000, 4000]
+        assert load_scaler(tmp).n_samples_seen_ == 2000
+        # Congelado: usa o do shard e não salva nada
+        frozen = StreamingPreprocessor(PACKET_FEATURES, model_dir=tmp, update=False, shard=0)
+        frozen.transform(synthetic_batch(500, seed=6))
+        frozen.save()
+        assert load_scaler(tmp, 0).n_samples_seen_ == 3000
+
+        # Gravações simultâneas do mesmo arquivo: sempre um pickle completo
+        scalers = [w.scaler for w in workers]
+        threads = [threading.Thread(target=lambda s=s: [save_scaler(s, tmp, 9) for _ in range(50)]) for s in scalers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert load_scaler(tmp, 9).n_samples_seen_ in (3000, 4000)
+        assert sorted(os.listdir(tmp)) == ["scaler-0.pkl", "scaler-1.pkl", "scaler-9.pkl", "scaler.pkl"]
+    print("Teste dos escalonadores por shard: OK")
+
+def bench(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def benchmark():
+    for n in (1000, 10000, 100000):
+        batch = synthetic_batch(n)
+        rows = as_dicts(batch)
+        pre = StreamingPreprocessor(PACKET_FEATURES, update=True)
+
+        legacy = bench(lambda: preprocess_data(rows))
+        columns = bench(lambda: preprocess_data(dict(batch)))
+        streaming = bench(lambda: pre.transform(dict(batch)))
+        print(f"{n:>7} pacotes | preprocess_data (dicts): {legacy * 1000:8.1f} ms"
+              f" | preprocess_data (colunas): {columns * 1000:8.1f} ms"
+              f" | StreamingPreprocessor: {streaming * 1000:7.2f} ms"
+              f" ({legacy / streaming:.0f}x)")
+
+# Rodar o teste e o benchmark
+test_streaming_parity()
+test_shard_scalers()
+benchmark()
@@ -0,0 +1,87 @@
+import os
+
+# Benchmark isolado em outro banco do Redis e em outro stream; os processos
+# detectores herdam estas variáveis. Requer os modelos do modo por pacote
+# treinados (python -m models.anomaly_models packet).
+os.environ.setdefault("REDIS_DB", "15")
+os.environ.setdefault("PACKET_STREAM", "bench_network_packets")
+os.environ.setdefault("DETECTION_MODE", "packet")
+
+import time
+import numpy as np
+from config.redis_config import redis_client
+from core.detector import prepare_worker_files, run_worker
+from core.packet_stream import shard_streams
+from core.record import encode_record
+from core.redis_writer import StreamBatchWriter
+from core.supervisor import WorkerPool
+from app.config import Config
+
+PACKETS = int(os.getenv("BENCH_PACKETS", 200000))
+
+def synthetic_records(n, seed=0):
+    rng = np.random.default_rng(seed)
+    start = time.time()
+    for i in range(n):
+        yield (f"192.168.{i % 16}.{i % 250}", f"10.0.{i % 7}.1"), encode_record({
+            "timestamp": start + i * 1e-4,
+            "src_ip": f"192.168.{i % 16}.{i % 250}",
+            "dst_ip": f"10.0.{i % 7}.1",
+            "protocol": 6,
+            "length": int(rng.integers(60, 1500)),
+            "bytes": int(rng.integers(60, 1500)),
+            "src_port": int(rng.integers(1024, 65535)),
+            "dst_port": 443,
+            "ttl": 64,
+        })
+
+def group_ready(stream):
+    try:
+        return any(g["name"] == Config.STREAM_GROUP.encode() for g in redis_client.xinfo_groups(stream))
+    except Exception:
+        return False
+
+def drained(stream):
+    info = redis_client.xinfo_stream(stream)
+    for group in redis_client.xinfo_groups(stream):
+        if group["name"] == Config.STREAM_GROUP.encode():
+            return group["pending"] == 0 and group["last-delivered-id"] == info["last-generated-id"]
+    return False
+
+def run(workers):
+    redis_client.flushdb()
+    streams = shard_streams(shards=workers)
+
+    # Subir os detectores (como o supervisor) e esperar todos carregarem os modelos
+    prepare_worker_files()
+    pool = WorkerPool(run_worker, workers, name="bench-detector").start()
+    try:
+        while not all(group_ready(stream) for stream in streams):
+            time.sleep(0.5)
+
+        writer = StreamBatchWriter(redis_client, Config.PACKET_STREAM, shards=workers, queue_size=PACKETS + 1)
+        for (src, dst), record in synthetic_records(PACKETS):
+            writer.put(record, src, dst)
+        start = time.perf_counter()
+        writer.stop()
+
+        while not all(drained(stream) for stream in streams):
+            time.sleep(0.05)
+        return time.perf_counter() - start
+    finally:
+        pool.stop()
+
+def benchmark():
+    cores = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, cores} & set(range(1, cores + 1)))
+    base = None
+    for workers in counts:
+        elapsed = run(workers)
+        rate = PACKETS / elapsed
+        base = base or rate
+        print(f"{workers} detectores: {PACKETS} pacotes em {elapsed:6.2f}s "
+              f"({rate:9.0f} pacotes/s, {rate / base:.2f}x)")
+    redis_client.flushdb()
+
+if __name__ == "__main__":
+    benchmark()
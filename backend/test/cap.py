@@ -0,0 +1,97 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+import scapy.all as scapy
+from scapy.layers.inet import IP, TCP, UDP, ICMP
+from scapy.layers.inet6 import IPv6, IPv6ExtHdrHopByHop
+from scapy.layers.dns import DNS, DNSQR
+from scapy.layers.l2 import Ether, Dot1Q
+from core.capture_engine import PcapReplay, RingCapture, ScapyCapture, scapy_to_record
+
+def sample_frames():
+    eth = Ether(src="00:11:22:33:44:55", dst="66:77:88:99:aa:bb")
+    frames = [
+        eth / IP(src="192.168.0.10", dst="8.8.8.8", ttl=64) / TCP(sport=40000, dport=443, flags="S"),
+        eth / IP(src="8.8.8.8", dst="192.168.0.10") / TCP(sport=443, dport=40000, flags="PA") / (b"x" * 300),
+        eth / IP(src="192.168.0.10", dst="1.1.1.1") / UDP(sport=5353, dport=53) / DNS(qd=DNSQR(qname="sehenos.local")),
+        eth / IP(src="192.168.0.10", dst="1.1.1.1") / TCP(sport=40001, dport=53, flags="PA") / DNS(qd=DNSQR(qname="tcp.example.com")),
+        eth / IP(src="192.168.0.10", dst="10.0.0.1") / ICMP() / b"ping",
+        eth / IP(src="192.168.0.10", dst="10.0.0.1", flags="MF", frag=0) / UDP(sport=1, dport=2) / (b"y" * 64),
+        eth / IP(src="192.168.0.10", dst="10.0.0.1", frag=20) / (b"z" * 32),
+        eth / Dot1Q(vlan=10) / IP(src="10.1.1.1", dst="10.1.1.2") / UDP(sport=123, dport=123) / b"ntp",
+        eth / IPv6(src="fe80::1", dst="ff02::1") / UDP(sport=5353, dport=5353) / DNS(qd=DNSQR(qname="mdns.local")),
+        eth / IPv6(src="2001:db8::1", dst="2001:db8::2") / IPv6ExtHdrHopByHop() / TCP(sport=22, dport=50000, flags="A") / b"ssh",
+        eth / scapy.ARP(),
+    ]
+    # Enquadrar como quadros reais (padding Ethernet incluído)
+    return [Ether(bytes(f)) for f in frames]
+
+def assert_same(fast, slow):
+    assert len(fast) == len(slow), (len(fast), len(slow))
+    for a, b in zip(fast, slow):
+        assert abs(a.pop("timestamp") - b.pop("timestamp")) < 1e-5
+        assert a == b, (a, b)
+
+def test_pcap_replay():
+    frames = sample_frames()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "replay.pcap")
+        scapy.wrpcap(path, frames)
+
+        slow = []
+        sniffer = ScapyCapture(slow.append)
+        for frame in scapy.rdpcap(path):
+            sniffer._handle(frame)
+        fast = []
+        replay = PcapReplay(fast.append, path=path)
+        replay.run()
+
+    assert len(slow) == len(frames) - 1  # ARP não gera registro
+    # Os dois contam todos os quadros lidos (sehenos_capture_frames_total)
+    assert sniffer.packets == replay.packets == len(frames)
+    assert_same(fast, slow)
+    print("Teste de captura (replay pcap vs scapy): OK")
+
+def test_ring_loopback():
+    # Requer Linux e CAP_NET_RAW: reinjeta os quadros no loopback e compara
+    # o que o anel TPACKET_V3 capturou com o scapy.
+    if not hasattr(socket, "AF_PACKET") or os.geteuid() != 0:
+        print("Teste de captura (anel no loopback): ignorado, requer root no Linux")
+        return
+
+    frames = sample_frames()
+    captured = []
+    ring = RingCapture(captured.append, iface="lo", block_size=1 << 16, block_nr=4, timeout_ms=10)
+    thread = threading.Thread(target=ring.run, daemon=True)
+    thread.start()
+
+    sender = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+    sender.bind(("lo", 0))
+    for frame in frames:
+        sender.send(bytes(frame))
+    sender.close()
+
+    deadline = time.time() + 5
+    while len(captured) < len(frames) - 1 and time.time() < deadline:
+        time.sleep(0.05)
+    ring.stop()
+    thread.join()
+    ring.close()
+
+    # Filtrar apenas o tráfego injetado (o loopback pode ter outros pacotes)
+    macs = {"00:11:22:33:44:55"}
+    fast = [r for r in captured if r["mac_src"] in macs]
+    slow = [scapy_to_record(f) for f in frames]
+    slow = [r for r in slow if r is not None]
+    for r in fast:
+        r["timestamp"] = 0.0
+    for r in slow:
+        r["timestamp"] = 0.0
+    assert_same(fast, slow)
+    print("Teste de captura (anel no loopback): OK")
+
+# Rodar o teste
+test_pcap_replay()
+test_ring_loopback()
@@ -0,0 +1,163 @@
+import os
+
+os.environ.setdefault("REDIS_DB", "15")
+
+import gzip
+import json
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from config.redis_config import redis_client
+from app.queries import parse_query
+from backup.columnar import BackupManifest, BloomFilter, convert_pending, query_page, scan
+from backup.segments import BackupJob, StreamSource
+from core.packet_stream import RECORD_FIELD
+from core.record import encode_record
+
+STREAM = "test_columnar_packets"
+START = 1732017600.0  # 2024-11-19 12:00 UTC
+
+def sample_packet(i):
+    return {
+        "timestamp": START + i * 0.5,
+        "src_ip": f"10.0.{i % 7}.{i % 50}",
+        "dst_ip": "8.8.8.8" if i % 3 else "1.1.1.1",
+        "protocol": 17 if i % 3 == 0 else 6,
+        "length": 60 + i % 1400,
+        "bytes": 60 + i % 1400,
+        "src_port": 40000 + i % 1000,
+        "dst_port": 53 if i % 3 == 0 else 443,
+        "payload": bytes([i % 256]) * (i % 5),
+    }
+
+def build(n, directory):
+    redis_client.delete(STREAM)
+    pipe = redis_client.pipeline(transaction=False)
+    for i in range(n):
+        pipe.xadd(STREAM, {RECORD_FIELD: encode_record(sample_packet(i))})
+    pipe.execute()
+    # Segmentos de ~2 MB finalizados e convertidos para Parquet por hora
+    job = BackupJob(StreamSource(redis_client, [STREAM], legacy_cursor=False), directory, "packets",
+                    chunk=5000, max_bytes=2 * 1024 * 1024)
+    job.run_once()
+    job.rotate()
+    return convert_pending(directory, "packets", os.path.join(directory, "parquet"))
+
+def brute_force(directory, ip=None, start=None, end=None):
+    # Referência: descompactar e decodificar todos os segmentos JSON
+    rows = []
+    for name in sorted(os.listdir(directory)):
+        if name.startswith("packets_"):
+            with gzip.open(os.path.join(directory, name), "rt") as f:
+                for line in f:
+                    row = json.loads(line)
+                    if ip and ip not in (row["src_ip"], row["dst_ip"]):
+                        continue
+                    rows.append(row)
+    return rows
+
+def test_bloom():
+    bloom = BloomFilter.build([f"10.0.0.{i}" for i in range(200)], fpr=0.01)
+    assert all(f"10.0.0.{i}" in bloom for i in range(200))
+    false_positives = sum(f"172.16.{i // 256}.{i % 256}" in bloom for i in range(10000))
+    assert false_positives < 300, false_positives
+    assert BloomFilter.from_dict(bloom.to_dict()).data.tobytes() == bloom.data.tobytes()
+    print(f"Teste do filtro de Bloom: OK ({false_positives / 100:.2f}% de falsos positivos)")
+
+def test_conversion_and_query():
+    directory = tempfile.mkdtemp()
+    parquet_dir = os.path.join(directory, "parquet")
+    converted = build(20000, directory)
+    assert converted
+    manifest = BackupManifest(parquet_dir)
+    entries = manifest.entries()
+    # 20000 pacotes a cada 0,5 s: 10000 s, 3 ou 4 partições por hora
+    hours = {os.path.dirname(entry["file"]) for entry in entries}
+    assert len(hours) == 3 and sum(entry["rows"] for entry in entries) == 20000, hours
+    assert all(entry["end"] - entry["start"] < 3600 for entry in entries)
+    # Reconversão ignorada (segmentos já no manifesto)
+    assert convert_pending(directory, "packets", parquet_dir) == []
+
+    reference = brute_force(directory)
+    rows = [row for _, row in scan("packets", directory=parquet_dir)]
+    assert rows == reference, (rows[0], reference[0])
+
+    # IP + intervalo: arquivos descartados pelo manifesto, colunas projetadas
+    ip, start, end = "10.0.3.10", START + 3600, START + 7200
+    expected = [row for row in reference if ip in (row["src_ip"], row["dst_ip"])
+                and start <= datetime.fromisoformat(row["timestamp"]).timestamp() <= end]
+    assert len(manifest.select("packets", start, end, ip)) < len(entries)
+    found = [row for _, row in scan("packets", start, end, ip, fields=["timestamp", "src_ip", "length"],
+                                    directory=parquet_dir)]
+    assert found == [{key: row[key] for key in ("timestamp", "src_ip", "length")} for row in expected]
+    assert all(set(row) == {"timestamp", "src_ip", "length"} for row in found)
+
+    # IP ausente: nenhum arquivo lido (filtro de Bloom)
+    assert manifest.select("packets", ip="192.0.2.1") == []
+
+    # Paginação pela API com cursor
+    pages = []
+    cursor = None
+    while True:
+        args = {"limit": "900", "ip": "1.1.1.1", "port": "53"}
+        if cursor:
+            args["cursor"] = cursor
+        items, cursor = query_page(parse_query(args, 100), "packets", parquet_dir)
+        pages += [json.loads(item) for item in items]
+        if cursor is None:
+            break
+    assert pages == [row for row in reference if row["dst_ip"] == "1.1.1.1"], len(pages)
+    shutil.rmtree(directory)
+    print("Teste da conversão e das consultas Parquet: OK")
+
+def test_remove_loaded():
+    import app.analytics as analytics
+    directory = tempfile.mkdtemp()
+    parquet_dir = os.path.join(directory, "parquet")
+    build(4000, directory)
+    segments = sorted(name for name in os.listdir(directory) if name.startswith("packets_"))
+    # Os segmentos NDJSON ficam para o bulk_loader depois da conversão
+    assert segments and all(name.endswith(".ndjson.gz") for name in segments)
+
+    # Só os já carregados no banco são apagados; sem banco, nenhum
+    real_loaded = analytics.loaded_files
+
+    def unavailable(names):
+        raise analytics.AnalyticsUnavailable("Banco fora do ar")
+    try:
+        analytics.loaded_files = unavailable
+        convert_pending(directory, "packets", parquet_dir, remove=True)
+        assert sorted(name for name in os.listdir(directory) if name.startswith("packets_")) == segments
+        analytics.loaded_files = lambda names: set(segments[:1]) & set(names)
+        convert_pending(directory, "packets", parquet_dir, remove=True)
+    finally:
+        analytics.loaded_files = real_loaded
+    assert sorted(name for name in os.listdir(directory) if name.startswith("packets_")) == segments[1:]
+    shutil.rmtree(directory)
+    print("Teste da remoção dos segmentos carregados: OK")
+
+def benchmark():
+    directory = tempfile.mkdtemp()
+    parquet_dir = os.path.join(directory, "parquet")
+    build(200000, directory)
+    start = time.perf_counter()
+    expected = brute_force(directory, ip="10.0.3.10")
+    json_time = time.perf_counter() - start
+    start = time.perf_counter()
+    found = [row for _, row in scan("packets", ip="10.0.3.10", directory=parquet_dir)]
+    parquet_time = time.perf_counter() - start
+    assert len(found) == len(expected)
+    json_size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)
+                    if name.startswith("packets_"))
+    parquet_size = sum(entry["bytes"] for entry in BackupManifest(parquet_dir).entries())
+    print(f"IP em 200000 pacotes: NDJSON gzip {json_time * 1000:.0f} ms ({json_size / 1e6:.1f} MB) | "
+          f"Parquet {parquet_time * 1000:.0f} ms ({parquet_size / 1e6:.1f} MB), {len(found)} linhas")
+    redis_client.delete(STREAM)
+    shutil.rmtree(directory)
+
+# Rodar os testes
+test_bloom()
+test_conversion_and_query()
+test_remove_loaded()
+benchmark()
@@ -0,0 +1,95 @@
+import time
+from core.flows import FlowTable
+from core.record import decode_batch, encode_record
+
+CLIENT, SERVER = "10.0.0.5", "93.184.216.34"
+
+def packet(ts, flags, outbound=True, payload=b"", client_port=50000, server=SERVER):
+    src, dst = (CLIENT, server) if outbound else (server, CLIENT)
+    sport, dport = (client_port, 443) if outbound else (443, client_port)
+    return encode_record({"timestamp": ts, "src_ip": src, "dst_ip": dst, "protocol": 6, "length": 60 + len(payload),
+                          "bytes": 60 + len(payload), "src_port": sport, "dst_port": dport, "tcp_flags": flags,
+                          "payload": payload})
+
+def connection(start, client_port=50000):
+    # Handshake, dados nos dois sentidos e encerramento com FIN dos dois lados
+    return [
+        packet(start, "S", client_port=client_port),
+        packet(start + 0.01, "SA", False, client_port=client_port),
+        packet(start + 0.02, "A", client_port=client_port),
+        packet(start + 0.03, "PA", payload=b"GET / HTTP/1.1\r\n", client_port=client_port),
+        packet(start + 0.05, "PA", False, payload=b"HTTP/1.1 200 OK\r\n", client_port=client_port),
+        packet(start + 0.06, "FA", client_port=client_port),
+        packet(start + 0.07, "A", False, client_port=client_port),
+        packet(start + 0.08, "FA", False, client_port=client_port),
+        packet(start + 0.09, "A", client_port=client_port),
+    ]
+
+def test_teardown():
+    table = FlowTable(idle_timeout=30, active_timeout=300, max_flows=100, close_linger=2)
+    packets = connection(100.0)
+    # O primeiro FIN fecha só metade da conexão: o fluxo continua aberto
+    assert table.update_batch(decode_batch(packets[:6])) == [] and table.expire() == []
+    table.update_batch(decode_batch(packets[6:8]))
+    # FIN dos dois lados: aguarda o close_linger para o ACK final
+    assert table.expire() == []
+    table.update_batch(decode_batch(packets[8:]))
+    assert table.expire(now=101.0) == [] and len(table) == 1
+    (flow,) = table.expire(now=102.1)
+    assert flow["end_reason"] == "closed" and flow["packets"] == 9 and len(table) == 0
+    assert (flow["src_ip"], flow["src_port"], flow["packets_fwd"], flow["packets_bwd"]) == (CLIENT, 50000, 5, 4)
+    assert (flow["syn_count"], flow["fin_count"], flow["ack_count"]) == (2, 2, 8)
+    assert flow["payload_bytes"] == 33 and abs(flow["duration"] - 0.09) < 1e-6
+
+    # RST encerra de uma vez (depois do close_linger)
+    table.update_batch(decode_batch([packet(200.0, "S", client_port=50001),
+                                     packet(200.01, "RA", False, client_port=50001)]))
+    (flow,) = table.expire(now=202.1)
+    assert flow["end_reason"] == "closed" and flow["packets"] == 2 and flow["rst_count"] == 1
+    assert table.stats()["emitted"] == 2 and table.stats()["packets_per_flow"] == 5.5
+    print("Teste do encerramento TCP (handshake e FIN dos dois lados): OK")
+
+def test_idle_and_active():
+    table = FlowTable(idle_timeout=10, active_timeout=60, max_flows=100, close_linger=2)
+    table.update_batch(decode_batch([packet(0.0, "S", client_port=1), packet(5.0, "A", client_port=2)]))
+    # Inatividade: só o fluxo sem pacotes há 10 s sai
+    assert [f["src_port"] for f in table.expire(now=12.0)] == [1]
+    assert table.expire(now=12.0) == [] and len(table) == 1
+    # Timeout ativo: fluxo com pacotes constantes sai 60 s depois do primeiro
+    for ts in range(6, 70, 4):
+        table.update_batch(decode_batch([packet(float(ts), "A", client_port=2)]))
+        emitted = table.expire()
+        if emitted:
+            break
+    assert ts >= 65 and [(f["end_reason"], f["src_port"]) for f in emitted] == [("active", 2)]
+    assert emitted[0]["duration"] >= 60 and len(table) == 0
+    print("Teste da expiração por inatividade e timeout ativo: OK")
+
+def test_memory_eviction():
+    table = FlowTable(idle_timeout=30, active_timeout=300, max_flows=3, close_linger=2)
+    table.update_batch(decode_batch([packet(0.0, "S", client_port=1000), packet(0.1, "S", client_port=1001)]))
+    table.update_batch(decode_batch([packet(0.5, "A", client_port=1000)]))
+    emitted = table.update_batch(decode_batch([packet(1.0 + i, "S", client_port=1002 + i) for i in range(3)]))
+    # Os menos recentes saem primeiro: o 1001 antes do 1000, que recebeu outro pacote
+    assert [(f["end_reason"], f["src_port"]) for f in emitted] == [("memory", 1001), ("memory", 1000)]
+    assert len(table) == 3 and table.stats()["evicted"] == 2
+    assert sorted(f["src_port"] for f in table.flush()) == [1002, 1003, 1004] and len(table) == 0
+    print("Teste do limite de memória: OK")
+
+def benchmark(n=20000):
+    packets = []
+    for i in range(n // 9):
+        packets.extend(connection(i * 0.01, client_port=1024 + i % 60000))
+    batch = decode_batch(packets)
+    table = FlowTable(idle_timeout=30, active_timeout=300, max_flows=100000, close_linger=2)
+    start = time.perf_counter()
+    table.update_batch(batch)
+    emitted = table.expire(now=1e9)
+    elapsed = time.perf_counter() - start
+    print(f"{len(packets)} pacotes em {len(emitted)} fluxos: {len(packets) / elapsed:,.0f} pacotes/s")
+
+# Rodar os testes
+test_teardown()
+test_idle_and_active()
+test_memory_eviction()
+benchmark()
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import time
+import numpy as np
+from sklearn.ensemble import IsolationForest
+from models.inference import CompiledIsolationForest
+
+def test_compiled_parity():
+    rng = np.random.default_rng(0)
+    train = rng.normal(size=(2000, 7))
+    test = np.vstack([rng.normal(size=(5000, 7)), rng.normal(5, 3, size=(500, 7))])
+
+    # Parâmetros de train_isolation_forest e variações com subamostragem
+    for params in ({}, {"max_features": 0.5}, {"max_samples": 64, "n_estimators": 30}):
+        model = IsolationForest(contamination=0.05, random_state=42, **params).fit(train)
+        compiled = CompiledIsolationForest.compile(model)
+        assert np.allclose(compiled.score_samples(test), model.score_samples(test), rtol=0, atol=1e-12)
+        assert np.array_equal(compiled.predict(test), model.predict(test))
+
+        # Ida e volta pelo .npz mapeado em memória
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "isolation_forest.npz")
+            compiled.save(path)
+            loaded = CompiledIsolationForest.load(path)
+            assert np.array_equal(loaded.score_samples(test), compiled.score_samples(test))
+    print("Teste de paridade do Isolation Forest compilado: OK")
+
+def timed(predict, data):
+    start = time.perf_counter()
+    predict(data)
+    return time.perf_counter() - start
+
+def benchmark():
+    rng = np.random.default_rng(1)
+    model = IsolationForest(contamination=0.05, random_state=42).fit(rng.normal(size=(1000, 7)))
+    compiled = CompiledIsolationForest.compile(model)
+    for rows in (1000, 10000, 100000):
+        data = rng.normal(size=(rows, 7))
+        # Melhor de 3 execuções de cada (menos ruído na máquina compartilhada)
+        sklearn_time = min(timed(model.predict, data) for _ in range(3))
+        compiled_time = min(timed(compiled.predict, data) for _ in range(3))
+        print(f"{rows:>7} linhas | sklearn: {sklearn_time * 1000:8.1f} ms | compilado: {compiled_time * 1000:7.1f} ms"
+              f" ({sklearn_time / compiled_time:.1f}x)")
+
+# Rodar o teste e o benchmark
+test_compiled_parity()
+benchmark()
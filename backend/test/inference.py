@@ -0,0 +1,65 @@
+import os
+import tempfile
+import time
+import numpy as np
+from tensorflow.keras.models import Sequential, load_model
+from tensorflow.keras.layers import Input, Dense
+from models.inference import DenseNetwork, export_autoencoder, mmap_npz
+
+def build_autoencoder(input_dim):
+    # Mesma arquitetura de models.anomaly_models.train_autoencoder
+    model = Sequential([
+        Input(shape=(input_dim,)),
+        Dense(16, activation='relu'),
+        Dense(8, activation='relu'),
+        Dense(16, activation='relu'),
+        Dense(input_dim, activation='linear')
+    ])
+    model.compile(optimizer='adam', loss='mse')
+    data = np.random.default_rng(0).random((512, input_dim)).astype(np.float32)
+    model.fit(data, data, epochs=2, batch_size=64, verbose=0)
+    return model
+
+def test_numpy_parity():
+    rng = np.random.default_rng(1)
+    for input_dim in (7, 22):
+        model = build_autoencoder(input_dim)
+        with tempfile.TemporaryDirectory() as tmp:
+            keras_path = os.path.join(tmp, "autoencoder.keras")
+            npz_path = os.path.join(tmp, "autoencoder.npz")
+            model.save(keras_path)
+            export_autoencoder(load_model(keras_path), npz_path)
+
+            network = DenseNetwork.load(npz_path)
+            assert isinstance(mmap_npz(npz_path)["kernel_0"].base, np.memmap)
+            for rows in (1, 10, 5000):
+                data = rng.normal(size=(rows, input_dim)).astype(np.float32)
+                expected = model.predict(data, verbose=0)
+                result = network.predict(data, batch_size=1024)
+                assert result.dtype == np.float32 and result.shape == expected.shape
+                assert np.allclose(result, expected, rtol=1e-5, atol=1e-5), np.abs(result - expected).max()
+
+            # Mapeado e carregado na memória dão o mesmo resultado
+            data = rng.normal(size=(100, input_dim))
+            assert np.array_equal(network.predict(data), DenseNetwork.load(npz_path, mmap=False).predict(data))
+    print("Teste de paridade do autoencoder (NumPy vs Keras): OK")
+
+def benchmark():
+    model = build_autoencoder(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "autoencoder.npz")
+        network = export_autoencoder(model, path)
+        network = DenseNetwork.load(path)
+        for rows in (10, 1000, 100000):
+            data = np.random.rand(rows, 7).astype(np.float32)
+            start = time.perf_counter()
+            model.predict(data, verbose=0)
+            keras_time = time.perf_counter() - start
+            start = time.perf_counter()
+            network.predict(data)
+            numpy_time = time.perf_counter() - start
+            print(f"{rows:>7} linhas | Keras: {keras_time * 1000:8.2f} ms | NumPy: {numpy_time * 1000:7.2f} ms")
+
+# Rodar o teste e o benchmark
+test_numpy_parity()
+benchmark()
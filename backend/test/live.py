@@ -0,0 +1,113 @@
+import os
+
+os.environ.setdefault("REDIS_DB", "15")
+
+import json
+import time
+from config.redis_config import redis_client
+from app.live import AnomalyBroadcaster
+from core.anomaly_index import write_anomalies
+
+def write_batch(i, size=3):
+    write_anomalies(redis_client, [(time.time(), "10.0.0.1", "8.8.8.8", json.dumps({"batch": i, "n": n}))
+                                   for n in range(size)])
+
+def next_event(client):
+    # Próximo evento com dados (ignora retry e heartbeats)
+    while True:
+        chunk = next(client)
+        if chunk.startswith(b"id: "):
+            lines = chunk.decode().splitlines()
+            return lines[0][4:], json.loads(lines[1][6:])
+
+def test_live_feed():
+    redis_client.flushdb()
+    write_batch(-1)
+    broadcaster = AnomalyBroadcaster(redis_client, coalesce_ms=300, buffer=3, block_ms=100).start()
+    connections = len(redis_client.client_list())
+
+    # Centenas de clientes com uma única leitura do Redis
+    clients = [broadcaster.subscribe(heartbeat=0.2) for _ in range(300)]
+    assert all(next(client) == b"retry: 3000\n\n" for client in clients)
+
+    # Rajada de lotes vira um único evento
+    for i in range(5):
+        write_batch(i)
+    events = [next_event(client) for client in clients]
+    event_id, anomalies = events[0]
+    assert all(event == events[0] for event in events)
+    assert [a["batch"] for a in anomalies] == [i for i in range(5) for _ in range(3)]
+    assert broadcaster.clients == 300
+    assert len(redis_client.client_list()) <= connections + 1
+
+    # Heartbeat sem anomalias novas
+    assert next(clients[0]) == b": ping\n\n"
+
+    # Retomada pelo Last-Event-ID: da memória e, depois que os eventos saem
+    # do buffer, relendo o stream
+    resumed = broadcaster.subscribe("0-0", heartbeat=0.2)
+    next(resumed)
+    assert [a["batch"] for a in next_event(resumed)[1]] == [-1] * 3 + [a["batch"] for a in anomalies]
+    for i in range(5, 10):
+        write_batch(i)
+        time.sleep(0.5)
+    late = broadcaster.subscribe(event_id, heartbeat=0.2)
+    next(late)
+    late_id, late_anomalies = next_event(late)
+    assert sorted({a["batch"] for a in late_anomalies}) == list(range(5, 10))
+
+    for client in clients + [resumed, late]:
+        client.close()
+    assert broadcaster.clients == 0
+
+    # Endpoint da API
+    from app.routes import app
+    response = app.test_client().get("/anomalies/stream", headers={"Last-Event-ID": "0-0"}, buffered=False)
+    assert response.mimetype == "text/event-stream"
+    chunks = iter(response.response)
+    next(chunks)
+    assert len(next_event(chunks)[1]) == 33
+    response.close()
+    redis_client.flushdb()
+    print("Teste do feed de anomalias (SSE): OK")
+
+def test_server(url, clients=200):
+    # O mesmo feed através de um servidor em execução (ex.: gunicorn com
+    # workers gevent, no mesmo banco do Redis): conexões SSE reais abertas
+    # ao mesmo tempo, todas recebendo a mesma rajada
+    import threading
+    import requests
+    connected = threading.Barrier(clients + 1)
+    received = [[] for _ in range(clients)]
+
+    def listen(i):
+        with requests.get(f"{url}/anomalies/stream", stream=True, timeout=30) as response:
+            assert response.headers["Content-Type"].startswith("text/event-stream")
+            lines = response.iter_lines()
+            assert next(lines) == b"retry: 3000"
+            connected.wait()
+            for line in lines:
+                if line.startswith(b"data: "):
+                    received[i] += json.loads(line[6:])
+                    if len(received[i]) >= 15:
+                        return
+
+    threads = [threading.Thread(target=listen, args=(i,), daemon=True) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    connected.wait(timeout=30)
+    connections = len(redis_client.client_list())
+    for i in range(5):
+        write_batch(i)
+    start = time.time()
+    for thread in threads:
+        thread.join(max(0.0, 30 - (time.time() - start)))
+    expected = [i for i in range(5) for _ in range(3)]
+    assert all([a["batch"] for a in anomalies] == expected for anomalies in received)
+    print(f"Teste do feed de anomalias em {url} ({clients} clientes, {connections} conexões no Redis, "
+          f"{time.time() - start:.2f}s até o último cliente): OK")
+
+# Rodar o teste (LIVE_URL: também contra um servidor em execução)
+test_live_feed()
+if os.getenv("LIVE_URL"):
+    test_server(os.environ["LIVE_URL"])
@@ -0,0 +1,167 @@
+import os
+
+os.environ.setdefault("REDIS_DB", "15")
+
+import json
+import threading
+import time
+from config.redis_config import redis_client
+from core.metrics import (PROCESS_PREFIX, PROCESSES_KEY, MetricsPublisher, Registry, counter, gauge, histogram, merge,
+                          process_key, process_snapshots, render)
+
+def test_thread_safety():
+    registry = Registry()
+    packets = counter("test_packets_total", "Pacotes", registry=registry)
+    latency = histogram("test_latency_seconds", "Latência", buckets=(0.1, 1), registry=registry)
+
+    def work():
+        for i in range(100000):
+            packets.inc()
+            latency.observe(0.5 if i % 2 else 0.05)
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Sem lock e sem perder incrementos: um valor por thread, somados na leitura
+    snapshot = registry.snapshot()
+    assert snapshot["test_packets_total"]["samples"] == [[{}, 800000]]
+    value = snapshot["test_latency_seconds"]["samples"][0][1]
+    assert value["counts"] == [400000, 400000, 0] and value["buckets"] == (0.1, 1.0)
+    assert abs(value["sum"] - 220000) < 1e-3
+    print("Teste de contadores e histogramas entre threads: OK")
+
+def test_registry():
+    registry = Registry()
+    requests = counter("test_requests_total", "Requisições", ("route", "status"), registry=registry)
+    requests.labels("/a", 200).inc(3)
+    requests.labels("/a", "200").inc()
+    queue = gauge("test_queue_depth", "Fila", registry=registry)
+    queue.set_function(lambda: 42)
+    assert counter("test_requests_total", "Requisições", ("route", "status"), registry=registry) is requests
+    try:
+        gauge("test_requests_total", "Outro tipo", registry=registry)
+        assert False
+    except ValueError:
+        pass
+    calls = []
+    registry.add_collector(lambda: calls.append(1))
+    snapshot = json.loads(json.dumps(registry.snapshot()))
+    assert snapshot["test_requests_total"]["samples"] == [[{"route": "/a", "status": "200"}, 4]]
+    assert snapshot["test_queue_depth"]["samples"] == [[{}, 42]] and calls == [1]
+    print("Teste do registro de métricas: OK")
+
+def test_merge_and_render():
+    registry = Registry()
+    frames = counter("test_frames_total", "Quadros \"lidos\"", ("iface",), registry=registry)
+    frames.labels("eth0").inc(5)
+    seconds = histogram("test_stage_seconds", "Etapas", ("stage",), buckets=(0.01, 0.1), registry=registry)
+    seconds.labels("save").observe(0.005)
+    seconds.labels("save").observe(0.05)
+    snapshot = json.loads(json.dumps(registry.snapshot()))
+    # Dois workers da API e um detector: uma série por processo
+    families = merge([("api", 11, snapshot), ("api", 12, snapshot), ("detector-0", 13, snapshot)])
+    text = render(families)
+    assert '# TYPE test_frames_total counter' in text
+    assert '# HELP test_frames_total Quadros \\"lidos\\"' in text
+    assert 'test_frames_total{iface="eth0",pid="11",process="api"} 5' in text
+    assert 'test_frames_total{iface="eth0",pid="12",process="api"} 5' in text
+    assert 'test_frames_total{iface="eth0",pid="13",process="detector-0"} 5' in text
+    assert 'test_stage_seconds_bucket{pid="11",process="api",stage="save",le="0.01"} 1' in text
+    assert 'test_stage_seconds_bucket{pid="11",process="api",stage="save",le="0.1"} 2' in text
+    assert 'test_stage_seconds_bucket{pid="12",process="api",stage="save",le="+Inf"} 2' in text
+    assert 'test_stage_seconds_count{pid="13",process="detector-0",stage="save"} 2' in text
+    assert 'test_stage_seconds_sum{pid="13",process="detector-0",stage="save"} 0.055' in text
+
+    # Detector reiniciado: o processo novo começa do zero numa série nova,
+    # sem diminuir o contador já exportado pelo antigo
+    restarted = Registry()
+    counter("test_frames_total", "Quadros", ("iface",), registry=restarted).labels("eth0").inc()
+    text = render(merge([("detector-0", 13, snapshot), ("detector-0", 14, restarted.snapshot())]))
+    assert 'test_frames_total{iface="eth0",pid="13",process="detector-0"} 5' in text
+    assert 'test_frames_total{iface="eth0",pid="14",process="detector-0"} 1' in text
+    print("Teste da agregação e do formato Prometheus: OK")
+
+def test_publish():
+    redis_client.delete(PROCESSES_KEY)
+    registry = Registry()
+    counter("test_published_total", "Publicado", registry=registry).inc(7)
+    MetricsPublisher(redis_client, "capture", registry, interval=1).publish()
+    # Processo que parou de publicar há mais de 3 intervalos é ignorado
+    redis_client.zadd(PROCESSES_KEY, {process_key("detector-9", 1): time.time() - 60})
+    snapshots = process_snapshots(redis_client, interval=1)
+    assert [(role, pid, s["test_published_total"]["samples"]) for role, pid, s in snapshots] == [
+        ("capture", str(os.getpid()), [[{}, 7]])]
+    assert redis_client.zcard(PROCESSES_KEY) == 1
+    assert redis_client.ttl(process_key("capture")) <= 3
+    redis_client.delete(PROCESSES_KEY, process_key("capture"))
+    print("Teste da publicação no Redis: OK")
+
+def sample_value(text, series):
+    """
+    Valor de uma série no formato Prometheus (0 se ainda não existe).
+    """
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+def test_endpoint():
+    from app.config import Config
+    # Sem a thread de publicação: o /metrics lê o registro do próprio
+    # processo na hora e o teste não deixa chaves metrics:process:api:* no Redis
+    enabled, Config.METRICS_ENABLED = Config.METRICS_ENABLED, False
+    try:
+        from app import create_app
+        client = create_app().test_client()
+        pid = os.getpid()
+        series = (f'sehenos_http_requests_total{{endpoint="/system_info",method="GET",pid="{pid}",process="api",'
+                  f'status="200"}}')
+        # O REGISTRY é global: compara com o valor antes das requisições
+        before = sample_value(client.get("/metrics").data.decode(), series)
+        client.get("/system_info")
+        client.get("/redis/stats")
+        response = client.get("/metrics")
+        text = response.data.decode()
+        assert response.status_code == 200 and response.mimetype == "text/plain"
+        assert sample_value(text, series) == before + 1
+        assert f'sehenos_redis_command_seconds_count{{command="PING",pid="{pid}",process="api"}}' in text
+        assert 'sehenos_stream_length{stream="network_packets"}' in text
+        assert "sehenos_anomaly_list_length " in text
+    finally:
+        Config.METRICS_ENABLED = enabled
+        keys = list(redis_client.scan_iter(f"{PROCESS_PREFIX}api:*"))
+        if keys:
+            redis_client.zrem(PROCESSES_KEY, *keys)
+            redis_client.delete(*keys)
+    print("Teste do endpoint /metrics: OK")
+
+def benchmark(n=1000000):
+    registry = Registry()
+    packets = counter("bench_total", "Pacotes", registry=registry)
+    latency = histogram("bench_seconds", "Latência", registry=registry)
+    lock = threading.Lock()
+    value = [0]
+    start = time.perf_counter()
+    for _ in range(n):
+        packets.inc()
+    sharded = (time.perf_counter() - start) / n
+    start = time.perf_counter()
+    for _ in range(n):
+        with lock:
+            value[0] += 1
+    locked = (time.perf_counter() - start) / n
+    start = time.perf_counter()
+    for _ in range(n):
+        latency.observe(0.003)
+    observe = (time.perf_counter() - start) / n
+    print(f"inc(): {sharded * 1e9:.0f} ns | contador com lock: {locked * 1e9:.0f} ns | "
+          f"observe(): {observe * 1e9:.0f} ns")
+
+# Rodar os testes
+test_thread_safety()
+test_registry()
+test_merge_and_render()
+test_publish()
+test_endpoint()
+benchmark()
@@ -0,0 +1,63 @@
+import time
+import numpy as np
+from models.preprocessing import BYTE_CLASSES, payload_features
+
+def reference(payload):
+    # Cálculo antigo, um payload por vez
+    if not payload:
+        return 0.0, 0.0
+    values = np.frombuffer(payload, dtype=np.uint8)
+    counts = np.bincount(values)
+    probs = counts / sum(counts)
+    entropy = -np.sum([p * np.log2(p) for p in probs if p > 0])
+    return entropy, np.mean(BYTE_CLASSES[values] == 2)
+
+def synthetic_payloads(n, seed=0):
+    rng = np.random.default_rng(seed)
+    payloads = []
+    for i in range(n):
+        size = int(rng.integers(0, 1500))
+        if i % 5 == 0:
+            payloads.append(None)
+        elif i % 5 == 1:
+            payloads.append(b"GET /index.html HTTP/1.1\r\nHost: example.com\r\n\r\n"[:size])
+        elif i % 5 == 2:
+            payloads.append(b"\x00" * size)
+        else:
+            payloads.append(rng.integers(0, 256, size, dtype=np.uint8).tobytes())
+    return np.array(payloads, dtype=object)
+
+def test_payload_features():
+    payloads = synthetic_payloads(3000)
+    features = payload_features(payloads, block_rows=256)
+    for i, payload in enumerate(payloads):
+        entropy, printable = reference(payload)
+        assert abs(features["payload_entropy"][i] - entropy) < 1e-9, (i, features["payload_entropy"][i], entropy)
+        assert abs(features["payload_printable"][i] - printable) < 1e-12
+        assert features["payload_len"][i] == (len(payload) if payload else 0)
+
+    # Classes somam 1 para payloads não vazios; string hexadecimal equivale a bytes
+    classes = sum(features[name] for name in ("payload_null", "payload_control", "payload_printable", "payload_high"))
+    assert np.allclose(classes[features["payload_len"] > 0], 1.0)
+    assert features["payload_null"][2] == 1.0 or features["payload_len"][2] == 0
+    as_hex = payload_features([p.hex() if p else None for p in payloads[:50]])
+    assert np.array_equal(as_hex["payload_entropy"], features["payload_entropy"][:50])
+    assert all(len(values) == 0 for values in payload_features([]).values())
+    print("Teste das features de payload em lote: OK")
+
+def benchmark():
+    for rows in (1000, 10000, 50000):
+        payloads = synthetic_payloads(rows, seed=1)
+        start = time.perf_counter()
+        for payload in payloads:
+            reference(payload)
+        loop_time = time.perf_counter() - start
+        start = time.perf_counter()
+        payload_features(payloads)
+        batch_time = time.perf_counter() - start
+        print(f"{rows:>6} payloads | um por vez: {loop_time * 1000:8.1f} ms | lote: {batch_time * 1000:7.1f} ms"
+              f" ({loop_time / batch_time:.1f}x)")
+
+# Rodar o teste e o benchmark
+test_payload_features()
+benchmark()
@@ -1,5 +1,6 @@
-import json
 from config.redis_config import redis_client
+from core.record import encode_record, decode_batch, decode_record, invalid_records
+from core.packet_stream import RECORD_FIELD
 
 def test_packet_capture():
     # Limpar banco antes do teste
@@ -7,7 +8,7 @@ def test_packet_capture():
 
     # Capturar um pacote simulado (ou real, dependendo do ambiente)
     sample_packet = {
-        "timestamp": "2024-11-19T12:34:56.789",
+        "timestamp": 1732019696.789,
         "src_ip": "192.168.0.1",
         "dst_ip": "8.8.8.8",
         "protocol": 6,
@@ -18,21 +19,42 @@ def test_packet_capture():
         "dst_port": 53,
         "tcp_flags": "S",
         "dns_queries": "meuCC.com",
-        "payload": "48656c6c6f20776f726c64",
-        "blacklist_flag": False,
-        "whitelist_flag": True,
+        "payload": b"Hello world",
+        "is_blacklisted": False,
+        "is_whitelisted": True,
         "bytes": 128
     }
 
     # Inserir no Redis manualmente para teste
-    redis_client.rpush("network_packets", json.dumps(sample_packet))
+    redis_client.xadd("network_packets", {RECORD_FIELD: encode_record(sample_packet)})
 
     # Verificar se foi salvo corretamente
-    packets = redis_client.lrange("network_packets", 0, -1)
+    packets = redis_client.xrange("network_packets")
     assert len(packets) == 1
-    assert json.loads(packets[0])["src_ip"] == "192.168.0.1"
+    packet = decode_record(packets[0][1][RECORD_FIELD])
+    assert packet["src_ip"] == "192.168.0.1"
+    assert packet["tcp_flags"] == "S"
+    assert packet["payload"] == b"Hello world"
+    assert packet["timestamp"] == sample_packet["timestamp"]
 
     print("Teste de captura de pacotes: OK")
 
+def test_truncated_record():
+    record = encode_record({"timestamp": 1732019696.0, "src_ip": "10.0.0.1", "dst_ip": "8.8.8.8",
+                            "protocol": 6, "length": 80, "bytes": 80, "payload": b"x" * 20})
+    # Cortado no payload, cortado no cabeçalho e com bytes a mais no fim
+    broken = [record[:-5], record[:30], record + b"\x00"]
+    for raw in broken:
+        for decode in (decode_record, lambda r: decode_batch([record, r])):
+            try:
+                decode(raw)
+                assert False, "registro inválido aceito"
+            except ValueError:
+                pass
+    assert invalid_records([record, broken[0], record, broken[1], b'{"src_ip": 1}']) == [1, 3, 4]
+    assert decode_batch([record, record])["payload"][1] == b"x" * 20
+    print("Teste de registro truncado (ValueError): OK")
+
 # Rodar o teste
 test_packet_capture()
+test_truncated_record()
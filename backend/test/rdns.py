@@ -0,0 +1,92 @@
+import socket
+import threading
+import time
+from collections import Counter
+from core.dns_enrichment import ReverseDNSResolver
+
+class StubResolver:
+    """
+    Substitui o socket.gethostbyaddr: responde de um dicionário, conta as
+    chamadas por IP e pode segurar as consultas até release.set().
+    """
+
+    def __init__(self, names, delay=0.0):
+        self.names = names
+        self.delay = delay
+        self.calls = Counter()
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, ip):
+        self.calls[ip] += 1
+        self.release.wait()
+        time.sleep(self.delay)
+        if ip not in self.names:
+            raise socket.herror(1, "Unknown host")
+        return self.names[ip], [], [ip]
+
+def test_cache_ttl_and_lru():
+    stub = StubResolver({"1.1.1.1": "one.one.one.one", "8.8.8.8": "dns.google", "9.9.9.9": "dns9.quad9.net"})
+    resolver = ReverseDNSResolver(max_entries=2, ttl=0.3, negative_ttl=0.1, workers=2, resolver=stub)
+    assert resolver.resolve_many(["1.1.1.1", "8.8.8.8"]) == {"1.1.1.1": "one.one.one.one", "8.8.8.8": "dns.google"}
+    assert resolver.lookup_nowait("1.1.1.1") == "one.one.one.one"
+    # LRU: o 8.8.8.8 é o menos recente e sai quando entra o terceiro IP
+    resolver.resolve_many(["9.9.9.9"])
+    assert resolver.stats()["cache_size"] == 2
+    resolver.resolve_many(["1.1.1.1", "8.8.8.8"])
+    assert stub.calls == {"1.1.1.1": 1, "8.8.8.8": 2, "9.9.9.9": 1}
+    # TTL: depois de expirar, o IP é consultado de novo
+    time.sleep(0.35)
+    assert resolver.resolve_many(["1.1.1.1"]) == {"1.1.1.1": "one.one.one.one"} and stub.calls["1.1.1.1"] == 2
+    resolver.close()
+    print("Teste do cache com TTL e LRU: OK")
+
+def test_negative_cache():
+    stub = StubResolver({})
+    resolver = ReverseDNSResolver(ttl=60, negative_ttl=0.2, workers=1, resolver=stub)
+    assert resolver.resolve_many(["10.0.0.1"]) == {"10.0.0.1": None}
+    # A falha fica no cache pelo TTL negativo (menor que o normal)
+    assert resolver.resolve_many(["10.0.0.1"]) == {"10.0.0.1": None} and stub.calls["10.0.0.1"] == 1
+    time.sleep(0.25)
+    resolver.resolve_many(["10.0.0.1"])
+    stats = resolver.stats()
+    assert stub.calls["10.0.0.1"] == 2 and (stats["lookups"], stats["failures"], stats["hits"]) == (2, 2, 1)
+    resolver.close()
+    print("Teste do cache negativo: OK")
+
+def test_inflight_dedup():
+    stub = StubResolver({"1.1.1.1": "one.one.one.one"})
+    stub.release.clear()
+    resolver = ReverseDNSResolver(workers=4, max_inflight=2, resolver=stub)
+    # Várias consultas ao mesmo IP enquanto a primeira está pendente
+    assert [resolver.lookup_nowait("1.1.1.1") for _ in range(5)] == [None] * 5
+    assert resolver.stats()["inflight"] == 1
+    # Acima do limite de consultas pendentes o IP é pulado
+    resolver.lookup_nowait("2.2.2.2")
+    assert resolver.lookup_nowait("3.3.3.3") is None and resolver.stats()["skipped"] == 1
+    stub.release.set()
+    assert resolver.resolve_many(["1.1.1.1", "1.1.1.1"]) == {"1.1.1.1": "one.one.one.one"}
+    time.sleep(0.05)
+    assert stub.calls == {"1.1.1.1": 1, "2.2.2.2": 1} and resolver.stats()["inflight"] == 0
+    resolver.close()
+    print("Teste da deduplicação de consultas pendentes: OK")
+
+def test_time_budget():
+    stub = StubResolver({"1.1.1.1": "one.one.one.one", "8.8.8.8": "dns.google"}, delay=0.5)
+    resolver = ReverseDNSResolver(workers=2, resolver=stub)
+    start = time.perf_counter()
+    # Quem consulta não espera além do orçamento; a consulta segue em segundo plano
+    assert resolver.resolve_many(["1.1.1.1", "8.8.8.8"], timeout=0.1) == {"1.1.1.1": None, "8.8.8.8": None}
+    assert time.perf_counter() - start < 0.3
+    time.sleep(0.6)
+    assert resolver.resolve_many(["1.1.1.1", "8.8.8.8"], timeout=0) == {"1.1.1.1": "one.one.one.one",
+                                                                         "8.8.8.8": "dns.google"}
+    assert sum(stub.calls.values()) == 2
+    resolver.close()
+    print("Teste do orçamento de tempo do resolve_many: OK")
+
+# Rodar os testes
+test_cache_ttl_and_lru()
+test_negative_cache()
+test_inflight_dedup()
+test_time_budget()
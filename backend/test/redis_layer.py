@@ -0,0 +1,96 @@
+import os
+
+os.environ.setdefault("REDIS_DB", "15")
+
+import time
+from redis.connection import _RESP2Parser
+from config.redis_config import (CommandStats, bulk_push, command_stats, create_pool, get_redis_connection,
+                                 parser_class, range_chunks, redis_client, redis_stats, trim_until)
+
+KEY = "test_redis_layer"
+
+def reset():
+    redis_client.delete(KEY, f"{KEY}:trimmed", f"{KEY}:epoch")
+
+def test_bulk_and_chunks():
+    reset()
+    assert bulk_push(redis_client, KEY, []) is None
+    assert bulk_push(redis_client, KEY, [str(i) for i in range(2500)], chunk=1000) == 2500
+    blocks = list(range_chunks(redis_client, KEY, chunk=300, window=3))
+    assert [len(b) for b in blocks] == [300] * 8 + [100]
+    assert [int(x) for b in blocks for x in b] == list(range(2500))
+    # Intervalos parciais e negativos, como no LRANGE
+    assert [int(x) for b in range_chunks(redis_client, KEY, 10, 19, chunk=4) for x in b] == list(range(10, 20))
+    assert [int(x) for b in range_chunks(redis_client, KEY, -5, chunk=2) for x in b] == list(range(2495, 2500))
+    assert list(range_chunks(redis_client, "test_redis_layer_vazia")) == []
+    print("Teste de escrita e leitura em blocos: OK")
+
+def test_trim_until():
+    reset()
+    redis_client.set(f"{KEY}:trimmed", 10)
+    # Remoção até um índice absoluto, condicionada à época da lista
+    bulk_push(redis_client, KEY, [str(i) for i in range(10, 20)])
+    redis_client.set(f"{KEY}:epoch", "a")
+    assert trim_until(redis_client, KEY, f"{KEY}:trimmed", f"{KEY}:epoch", "b", 15) == 0
+    assert trim_until(redis_client, KEY, f"{KEY}:trimmed", f"{KEY}:epoch", "a", 15) == 5
+    assert trim_until(redis_client, KEY, f"{KEY}:trimmed", f"{KEY}:epoch", "a", 15) == 0
+    assert trim_until(redis_client, KEY, f"{KEY}:trimmed", f"{KEY}:epoch", "a", 99) == 5
+    assert int(redis_client.get(f"{KEY}:trimmed")) == 20 and redis_client.llen(KEY) == 0
+    reset()
+    print("Teste da remoção condicionada à época (Lua): OK")
+
+def test_stats_and_reconnect():
+    stats = CommandStats()
+    client = get_redis_connection(create_pool(max_connections=4))
+    client.stats = stats
+    client.set(KEY, 1)
+    client.get(KEY)
+    pipe = client.pipeline(transaction=True)
+    pipe.incr(KEY)
+    pipe.incr(KEY)
+    assert pipe.execute() == [2, 3]
+    try:
+        client.execute_command("COMANDO_INVALIDO")
+    except Exception:
+        pass
+    snapshot = stats.snapshot()
+    assert snapshot["SET"]["calls"] == 1 and snapshot["GET"]["calls"] == 1
+    assert snapshot["MULTI"]["calls"] == 1 and snapshot["MULTI"]["commands"] == 2
+    assert snapshot["COMANDO_INVALIDO"]["errors"] == 1
+
+    # Conexão derrubada pelo servidor: o comando seguinte reconecta
+    client_id = client.client_id()
+    redis_client.client_kill_filter(_id=client_id)
+    assert int(client.get(KEY)) == 3 and client.client_id() != client_id
+
+    info = redis_stats(client)
+    assert info["healthy"] and info["max_connections"] == 4 and "PING" in info["commands"]
+    assert parser_class("python") is _RESP2Parser
+    assert "GET" in command_stats.snapshot()
+    client.delete(KEY)
+    print("Teste de contadores de latência e reconexão: OK")
+
+def benchmark(n=20000):
+    values = [f'{{"n": {i}}}' for i in range(n)]
+    reset()
+    start = time.perf_counter()
+    for value in values:
+        redis_client.rpush(KEY, value)
+    single = time.perf_counter() - start
+    reset()
+    start = time.perf_counter()
+    bulk_push(redis_client, KEY, values)
+    bulk = time.perf_counter() - start
+    start = time.perf_counter()
+    read = sum(len(block) for block in range_chunks(redis_client, KEY))
+    chunks = time.perf_counter() - start
+    assert read == n
+    reset()
+    print(f"RPUSH por item: {n / single:.0f} itens/s | bulk_push: {n / bulk:.0f} itens/s | "
+          f"range_chunks: {n / chunks:.0f} itens/s")
+
+# Rodar os testes
+test_bulk_and_chunks()
+test_trim_until()
+test_stats_and_reconnect()
+benchmark()
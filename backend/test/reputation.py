@@ -0,0 +1,165 @@
+import os
+import tempfile
+
+os.environ.setdefault("REDIS_DB", "15")
+LIST_DIR = tempfile.mkdtemp()
+os.environ["BLACKLIST_FILE"] = os.path.join(LIST_DIR, "blacklist.txt")
+os.environ["WHITELIST_FILE"] = os.path.join(LIST_DIR, "whitelist.txt")
+with open(os.environ["BLACKLIST_FILE"], "w") as f:
+    f.write("# blacklist\n1.2.3.1\nnão-é-ip\n10.9.0.0/16\n")
+
+import json
+import time
+from config.redis_config import redis_client
+from app.blacklist_whitelist import LIST_CHANNEL, epoch_key, list_key, update_list, versioned_snapshot
+from core.reputation import IPReputationIndex, ListSync, LiveList, load_reputation
+
+def next_delta(pubsub):
+    message = pubsub.get_message(timeout=1)
+    while message is None or message["type"] != "message":
+        message = pubsub.get_message(timeout=1)
+    return json.loads(message["data"])
+
+def test_apply_delta():
+    redis_client.flushdb()
+    pubsub = redis_client.pubsub()
+    pubsub.subscribe(LIST_CHANNEL)
+    # A primeira leitura popula o Redis com o arquivo (linha inválida ignorada)
+    epoch, version, entries = versioned_snapshot("blacklist")
+    assert version == 0 and entries == {"1.2.3.1", "10.9.0.0/16"} and epoch
+    assert update_list("blacklist", ["5.5.5.5", "1.2.3.1"], "add") == (1, 1)
+    delta = next_delta(pubsub)
+    assert delta == {"list": "blacklist", "action": "add", "version": 1, "epoch": epoch,
+                     "entries": ["1.2.3.1", "5.5.5.5"]}
+    assert update_list("blacklist", ["10.9.0.0/16"], "remove") == (1, 2)
+    assert next_delta(pubsub)["version"] == 2
+    assert redis_client.smembers(list_key("blacklist")) == {b"1.2.3.1", b"5.5.5.5"}
+    # Sem a época (lista apagada depois do seed), o script cria uma nova
+    redis_client.delete(epoch_key("blacklist"))
+    update_list("blacklist", ["6.6.6.6"], "add")
+    assert next_delta(pubsub)["epoch"] == redis_client.get(epoch_key("blacklist")).decode() != epoch
+    pubsub.close()
+    print("Teste do script de deltas das listas: OK")
+
+def test_index():
+    index = IPReputationIndex.from_lines([
+        "# netset", "10.0.0.0/24", "10.0.1.0/24", "10.0.0.128/25", "192.168.1.7", "",
+        "0.0.0.0/32", "255.255.255.255", "2001:db8::/48", "2001:db8:1::/48", "::/128", "lixo",
+    ])
+    # Redes sobrepostas ou adjacentes viram um intervalo só
+    v4, v6 = index.intervals()
+    assert v4 == [(0, 0), (0x0A000000, 0x0A0001FF), (0xC0A80107, 0xC0A80107), (0xFFFFFFFF, 0xFFFFFFFF)]
+    assert len(v6) == 2 and len(index) == 6
+    ips = ["10.0.0.0", "10.0.1.255", "10.0.2.0", "9.255.255.255", "192.168.1.7", "192.168.1.8",
+           "0.0.0.0", "255.255.255.255", "255.255.255.254", "2001:db8::", "2001:db8:1:ffff:ffff:ffff:ffff:ffff",
+           "2001:db8:2::", "::", "::1", "não-é-ip", "300.1.1.1", "2001:db8::zz", "", None]
+    expected = [True, True, False, False, True, False,
+                True, True, False, True, True,
+                False, True, False, False, False, False, False, False]
+    assert index.contains_many(ips).tolist() == expected
+    assert [ip in index for ip in ips] == expected
+
+    # Ida e volta pelo cache .npz
+    path = os.path.join(LIST_DIR, "index.npz")
+    index.save(path)
+    loaded = IPReputationIndex.load(path)
+    assert loaded.intervals() == (v4, v6) and loaded.contains_many(ips).tolist() == expected
+    assert IPReputationIndex().contains_many(ips).tolist() == [False] * len(ips)
+    print("Teste do índice de reputação (intervalos, limites e cache): OK")
+
+def test_live_list():
+    live = LiveList("blacklist")
+    live.reset({"1.2.3.4", "10.0.0.0/8"}, 5, "a")
+    assert "10.1.2.3" in live and "1.2.3.4" in live and "1.2.3.5" not in live
+    live.apply("add", ["2001:db8::/32", "1.2.3.5"], 6)
+    live.apply("remove", ["10.0.0.0/8", "1.2.3.4"], 7)
+    ips = ["10.1.2.3", "1.2.3.4", "1.2.3.5", "2001:db8::1", "2001:db9::1"]
+    assert live.contains_many(ips).tolist() == [False, False, True, True, False]
+    assert [ip in live for ip in ips] == [False, False, True, True, False]
+    assert (live.version, live.epoch, len(live)) == (7, "a", 2)
+    print("Teste da lista viva: OK")
+
+def test_list_sync():
+    redis_client.flushdb()
+    live = LiveList("blacklist")
+    sync = ListSync(redis_client, [live])
+    sync.resync("blacklist")
+    epoch = live.epoch
+    update_list("blacklist", ["3.3.3.3"], "add")
+    update_list("blacklist", ["4.4.4.4"], "add")
+    update_list("blacklist", ["1.2.3.1"], "remove")
+
+    # Deltas em ordem são aplicados; repetidos são ignorados
+    sync.handle({"list": "blacklist", "action": "add", "version": 1, "epoch": epoch, "entries": ["3.3.3.3"]})
+    sync.handle({"list": "blacklist", "action": "add", "version": 1, "epoch": epoch, "entries": ["9.9.9.9"]})
+    assert live.version == 1 and "3.3.3.3" in live and "9.9.9.9" not in live and "4.4.4.4" not in live
+
+    # Versão pulada (a 2 se perdeu): snapshot completo
+    sync.handle({"list": "blacklist", "action": "remove", "version": 3, "epoch": epoch, "entries": ["1.2.3.1"]})
+    assert live.version == 3 and "4.4.4.4" in live and "1.2.3.1" not in live
+
+    # clear_data: a versão volta a 0 com outra época; a edição seguinte
+    # (versão 1 < 3) não pode ser descartada e o que foi apagado some
+    redis_client.flushdb()
+    version = update_list("blacklist", ["9.9.9.9"], "add")[1]
+    new_epoch = redis_client.get(epoch_key("blacklist")).decode()
+    assert version == 1 and new_epoch != epoch
+    sync.handle({"list": "blacklist", "action": "add", "version": 1, "epoch": new_epoch, "entries": ["9.9.9.9"]})
+    assert (live.epoch, live.version) == (new_epoch, 1)
+    assert "9.9.9.9" in live and "3.3.3.3" not in live and "1.2.3.1" in live
+
+    # Limpeza sem edições posteriores: detectada pela conferência periódica
+    redis_client.flushdb()
+    redis_client.sadd(list_key("blacklist"), "7.7.7.7")
+    redis_client.set("lists:blacklist:version", 0)
+    sync.check()
+    assert live.epoch is None and "7.7.7.7" in live and "9.9.9.9" not in live
+    sync.check()
+    print("Teste da sincronização das listas (versão pulada e flushdb): OK")
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+def test_sync_thread():
+    redis_client.flushdb()
+    live = LiveList("blacklist")
+    ListSync(redis_client, [live], interval=0.2).start()
+    assert wait_for(lambda: "1.2.3.1" in live)
+    update_list("blacklist", ["8.8.4.4"], "add")
+    assert wait_for(lambda: "8.8.4.4" in live)
+    # clear_data sem edições: a conferência periódica recarrega a lista
+    redis_client.flushdb()
+    redis_client.sadd(list_key("blacklist"), "7.7.7.7")
+    assert wait_for(lambda: "7.7.7.7" in live and "8.8.4.4" not in live)
+    print("Teste da thread de sincronização: OK")
+
+def test_fallback_files():
+    # Redis indisponível: listas lidas dos arquivos, ignorando linhas inválidas
+    import core.reputation as reputation
+    from redis.exceptions import ConnectionError
+    real_snapshot, real_start, real_remote = (reputation.versioned_snapshot, ListSync.start,
+                                              reputation.load_remote_index)
+
+    def unavailable(name):
+        raise ConnectionError("Redis fora do ar")
+    reputation.versioned_snapshot = unavailable
+    reputation.load_remote_index = lambda url: reputation.IPReputationIndex()
+    ListSync.start = lambda self: self
+    try:
+        blacklist, whitelist = load_reputation()
+    finally:
+        reputation.versioned_snapshot, ListSync.start, reputation.load_remote_index = (real_snapshot, real_start,
+                                                                                      real_remote)
+    assert "1.2.3.1" in blacklist and "10.9.8.7" in blacklist and len(whitelist) == 0
+    print("Teste das listas sem Redis: OK")
+
+# Rodar os testes
+test_apply_delta()
+test_index()
+test_live_list()
+test_list_sync()
+test_sync_thread()
+test_fallback_files()
@@ -0,0 +1,155 @@
+import os
+
+os.environ.setdefault("REDIS_DB", "15")
+
+import gzip
+import json
+import shutil
+import tempfile
+import time
+import tracemalloc
+from config.redis_config import bulk_push, redis_client
+from backup.segments import BackupJob, ListSource, PART_SUFFIX, StreamSource, export_snapshot
+from core.packet_stream import RECORD_FIELD
+from core.record import encode_record
+
+LIST = "test_backup_anomalies"
+STREAM = "test_backup_packets"
+
+def read_segments(directory, prefix):
+    # Segmentos (inclusive o .part em escrita) em ordem: um gzip com vários membros
+    lines = []
+    for name in sorted(os.listdir(directory)):
+        if name.startswith(prefix):
+            with gzip.open(os.path.join(directory, name), "rt") as f:
+                lines += [json.loads(line) for line in f]
+    return lines
+
+def push(start, n):
+    bulk_push(redis_client, LIST, [json.dumps({"n": i}) for i in range(start, start + n)])
+
+def reset():
+    redis_client.delete(LIST, f"{LIST}:trimmed", f"{LIST}:epoch", STREAM)
+    return tempfile.mkdtemp()
+
+def test_list_backup():
+    directory = reset()
+    push(0, 2500)
+    job = BackupJob(ListSource(redis_client, LIST), directory, "anomalies", chunk=1000)
+    assert job.run_once() == 2500
+    # Lista esvaziada só depois do fsync + checkpoint
+    assert redis_client.llen(LIST) == 0 and int(redis_client.get(f"{LIST}:trimmed")) == 2500
+    push(2500, 10)
+    assert job.run_once() == 10
+    assert [item["n"] for item in read_segments(directory, "anomalies")] == list(range(2510))
+    shutil.rmtree(directory)
+    print("Teste do backup da lista em blocos: OK")
+
+def test_crash_recovery():
+    directory = reset()
+    push(0, 300)
+    job = BackupJob(ListSource(redis_client, LIST), directory, "anomalies", chunk=100)
+    job.run_once()
+    segment = job.writer.path
+    size = os.path.getsize(segment)
+
+    # Queda no meio de uma escrita: bytes depois do offset confirmado e
+    # lista ainda não removida
+    push(300, 50)
+    with open(segment, "ab") as f:
+        f.write(gzip.compress(b'{"n": -1}\n')[:15])
+    source = ListSource(redis_client, LIST)
+    recovered = BackupJob(source, directory, "anomalies", chunk=100)
+    assert recovered.run_once() == 50
+    assert os.path.getsize(segment) > size
+    assert [item["n"] for item in read_segments(directory, "anomalies")] == list(range(350))
+
+    # Queda entre o checkpoint e a remoção: a retomada só remove, sem duplicar
+    push(350, 20)
+    lines, position = source.read(recovered.position, 100)
+    recovered.writer.write(lines)
+    recovered.position = position
+    recovered._checkpoint()
+    assert redis_client.llen(LIST) == 20
+    again = BackupJob(ListSource(redis_client, LIST), directory, "anomalies", chunk=100)
+    assert again.run_once() == 0 and redis_client.llen(LIST) == 0
+    assert [item["n"] for item in read_segments(directory, "anomalies")] == list(range(370))
+
+    # Lista apagada (clear_data): a posição antiga não remove dados novos
+    redis_client.delete(LIST, f"{LIST}:trimmed", f"{LIST}:epoch")
+    push(0, 5)
+    assert again.run_once() == 5
+    assert len(read_segments(directory, "anomalies")) == 375
+    shutil.rmtree(directory)
+    print("Teste de retomada após queda: OK")
+
+def test_rotation():
+    directory = reset()
+    pipe = redis_client.pipeline(transaction=False)
+    for i in range(3000):
+        record = {"timestamp": 1732019696.0 + i, "src_ip": "10.0.0.1", "dst_ip": "8.8.8.8", "protocol": 6,
+                  "length": 60 + i % 1400, "src_port": 40000 + i % 20000, "dst_port": 443}
+        pipe.xadd(STREAM, {RECORD_FIELD: encode_record(record)})
+    pipe.execute()
+    job = BackupJob(StreamSource(redis_client, [STREAM], legacy_cursor=False), directory, "packets",
+                    chunk=500, max_bytes=8 * 1024)
+    assert job.run_once() == 3000
+    names = sorted(os.listdir(directory))
+    segments = [name for name in names if name.startswith("packets")]
+    assert len(segments) > 1 and not any(name.endswith(PART_SUFFIX) for name in segments), names
+    packets = read_segments(directory, "packets")
+    assert [packet["src_port"] for packet in packets] == [40000 + i % 20000 for i in range(3000)]
+    assert redis_client.xlen(STREAM) == 3000
+
+    # Rotação por idade com o mesmo checkpoint
+    job.writer.max_bytes, job.writer.max_age = float("inf"), 0.05
+    redis_client.xadd(STREAM, {RECORD_FIELD: encode_record(record)})
+    job.run_once()
+    time.sleep(0.1)
+    job.run_once()
+    assert job.writer.path is None and len(read_segments(directory, "packets")) == 3001
+    shutil.rmtree(directory)
+    print("Teste de rotação dos segmentos: OK")
+
+def test_stream_gap():
+    directory = reset()
+    for i in range(100):
+        redis_client.xadd(STREAM, {RECORD_FIELD: encode_record({"timestamp": 1732019696.0 + i, "src_ip": "10.0.0.1",
+                                                              "dst_ip": "8.8.8.8", "protocol": 6, "length": 60})})
+    source = StreamSource(redis_client, [STREAM], legacy_cursor=False)
+    job = BackupJob(source, directory, "packets", chunk=40)
+    assert job.run_once() == 100 and source.gaps == 0
+    # Sem backup por um tempo e o MAXLEN da captura descarta entradas não salvas
+    for i in range(50):
+        redis_client.xadd(STREAM, {RECORD_FIELD: encode_record({"timestamp": 1732019796.0 + i, "src_ip": "10.0.0.1",
+                                                              "dst_ip": "8.8.8.8", "protocol": 6, "length": 60})},
+                          maxlen=30, approximate=False)
+    assert job.run_once() == 30 and source.gaps == 1
+    assert job.run_once() == 0 and source.gaps == 1
+    shutil.rmtree(directory)
+    print("Teste da lacuna no stream (MAXLEN antes do backup): OK")
+
+def test_constant_memory():
+    # Memória de pico independente do tamanho do acúmulo
+    peaks = []
+    for n in (20000, 80000):
+        directory = reset()
+        push(0, n)
+        tracemalloc.start()
+        path, total = export_snapshot(ListSource(redis_client, LIST), directory, "anomalies", chunk=2000)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert total == n and redis_client.llen(LIST) == n
+        peaks.append(peak)
+        print(f"{n} anomalias: pico de {peak / 1024:.0f} KiB, {os.path.getsize(path) / 1024:.0f} KiB em disco")
+        shutil.rmtree(directory)
+    assert peaks[1] < peaks[0] * 1.5, peaks
+    reset()
+    print("Teste de memória constante: OK")
+
+# Rodar os testes
+test_list_backup()
+test_crash_recovery()
+test_rotation()
+test_stream_gap()
+test_constant_memory()
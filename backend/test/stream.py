@@ -0,0 +1,125 @@
+from config.redis_config import redis_client
+from core.packet_stream import StreamConsumer, shard_for, shard_streams, stream_records
+from core.redis_writer import StreamBatchWriter
+from core.record import encode_record, decode_record
+
+STREAM = "test_network_packets"
+
+def sample_record(i):
+    return encode_record({
+        "timestamp": 1732019696.0 + i,
+        "src_ip": "192.168.0.1",
+        "dst_ip": "8.8.8.8",
+        "protocol": 6,
+        "length": 128,
+        "bytes": 128,
+        "src_port": 40000 + i,
+        "dst_port": 443,
+    })
+
+def test_stream_transport():
+    redis_client.delete(STREAM)
+
+    # Escritor: XADD em pipeline com MAXLEN
+    writer = StreamBatchWriter(redis_client, STREAM, maxlen=1000, shards=1, batch_size=10,
+                               flush_interval=0.05).start()
+    for i in range(25):
+        writer.put(sample_record(i))
+    writer.stop()
+    assert redis_client.xlen(STREAM) == 25
+
+    # Dois consumidores dividem o stream em lotes limitados
+    a = StreamConsumer(redis_client, STREAM, "test", "a", count=10, block_ms=10, claim_idle=0).ensure_group()
+    b = StreamConsumer(redis_client, STREAM, "test", "b", count=10, block_ms=10, claim_idle=3600).ensure_group()
+    ids_a, records_a = a.read_batch()
+    ids_b, records_b = b.read_batch()
+    assert len(records_a) == 10 and len(records_b) == 10
+    assert not set(ids_a) & set(ids_b)
+    assert decode_record(records_a[0])["src_port"] == 40000
+
+    # "b" morre sem confirmar: "a" reassume as pendências de "b"
+    a.ack(ids_a)
+    ids, records = a.read_batch()
+    assert sorted(ids) == sorted(ids_b)
+    a.ack(ids)
+    assert a.reclaimed == 10
+
+    # Restante do stream e nada mais pendente
+    a.claim_idle = 3600
+    ids, records = a.read_batch()
+    a.ack(ids)
+    assert len(records) == 5
+    assert a.read_batch() == ([], [])
+    assert redis_client.xpending(STREAM, "test")["pending"] == 0
+
+    # Leitura sem consumir (backup/API) continua vendo todas as entradas
+    assert len(list(stream_records(redis_client, STREAM, chunk=7))) == 25
+
+    redis_client.delete(STREAM)
+    print("Teste de transporte por Redis Streams: OK")
+
+def test_restart_pending():
+    redis_client.delete(STREAM)
+    for i in range(10):
+        redis_client.xadd(STREAM, {b"r": sample_record(i)})
+    a = StreamConsumer(redis_client, STREAM, "test", "a", count=4, block_ms=10, claim_idle=3600).ensure_group()
+    ids, _ = a.read_batch(count=10)
+    assert len(ids) == 10
+    for i in range(10, 15):
+        redis_client.xadd(STREAM, {b"r": sample_record(i)})
+
+    # Reinício com as 10 entradas pendentes: cada uma volta uma única vez,
+    # mesmo com várias leituras antes do ack (como faz o AdaptiveBatcher)
+    from core.batching import AdaptiveBatcher
+    restarted = StreamConsumer(redis_client, STREAM, "test", "a", count=4, block_ms=10, claim_idle=3600)
+    batcher = AdaptiveBatcher(restarted, max_latency_ms=50, min_batch=1000, max_batch=1000, policy="throughput")
+    ids, records = batcher.next_batch()
+    assert len(ids) == len(set(ids)) == 15 and len(records) == 15
+    restarted.ack(ids)
+    assert restarted.read_batch() == ([], [])
+    assert redis_client.xpending(STREAM, "test")["pending"] == 0
+    redis_client.delete(STREAM)
+    print("Teste de reinício com pendências (ids únicos): OK")
+
+def test_invalid_records():
+    redis_client.delete(STREAM)
+    for i in range(6):
+        redis_client.xadd(STREAM, {b"r": sample_record(i)[:-3] if i in (1, 4) else sample_record(i)})
+
+    # Só os registros que não decodificam são confirmados na leitura; o
+    # resto do lote segue pendente até o processamento
+    from core import detector
+    from core.batching import AdaptiveBatcher
+    from core.reputation import IPReputationIndex
+    detector.blacklist = detector.whitelist = IPReputationIndex()
+    consumer = StreamConsumer(redis_client, STREAM, "test", "a", count=10, block_ms=10, claim_idle=3600).ensure_group()
+    batcher = AdaptiveBatcher(consumer, max_latency_ms=10, policy="throughput")
+    ids, batch = detector.fetch_packets(batcher)
+    assert len(ids) == 4 and list(batch["src_port"]) == [40000, 40002, 40003, 40005]
+    assert consumer.acked == 2 and redis_client.xpending(STREAM, "test")["pending"] == 4
+    consumer.ack(ids)
+    redis_client.delete(STREAM)
+    print("Teste de registros inválidos no lote: OK")
+
+def test_sharding():
+    # Os dois sentidos de um fluxo vão para o mesmo shard
+    assert shard_for("10.0.0.1", "8.8.8.8", 4) == shard_for("8.8.8.8", "10.0.0.1", 4)
+    assert shard_for("10.0.0.1", "8.8.8.8", 1) == 0
+
+    streams = shard_streams(STREAM, 4)
+    redis_client.delete(*streams)
+    writer = StreamBatchWriter(redis_client, STREAM, shards=4)
+    pairs = [(f"192.168.0.{i}", "8.8.8.8") for i in range(200)]
+    for i, (src, dst) in enumerate(pairs):
+        writer.put(sample_record(i), src, dst)
+    writer.stop()
+    lengths = [redis_client.xlen(stream) for stream in streams]
+    assert sum(lengths) == 200 and min(lengths) > 0
+    redis_client.delete(*streams)
+    print("Teste de shards do stream de pacotes: OK")
+
+# Rodar os testes
+test_stream_transport()
+test_restart_pending()
+test_invalid_records()
+test_sharding()
@@ -0,0 +1,95 @@
+import os
+
+os.environ.setdefault("REDIS_DB", "15")
+
+import json
+import shutil
+import tempfile
+import time
+from app.system_info import FIELDS, HistoryError, SystemSampler, sampler, thermal_zones
+
+def fake_thermal(temperatures):
+    # Mesma estrutura de /sys/class/thermal (temperaturas em miligraus)
+    directory = tempfile.mkdtemp()
+    for i, (name, value) in enumerate(temperatures.items()):
+        zone = os.path.join(directory, f"thermal_zone{i}")
+        os.makedirs(zone)
+        with open(os.path.join(zone, "type"), "w") as f:
+            f.write(name + "\n")
+        with open(os.path.join(zone, "temp"), "w") as f:
+            f.write(f"{value}\n")
+    return directory
+
+def test_snapshot():
+    directory = fake_thermal({"cpu-thermal": 45200, "gpu-thermal": 43800})
+    assert [name for name, _ in thermal_zones(directory)] == ["cpu-thermal", "gpu-thermal"]
+    telemetry = SystemSampler(interval=60, capacity=10, thermal_dir=directory)
+    snapshot = telemetry.start().snapshot
+    # Campos antigos do /system_info mantidos
+    assert snapshot["temperature"] == "45.2°C" and snapshot["cpu_usage"].endswith("%")
+    assert snapshot["memory_usage"].endswith("GB") and snapshot["disk_usage"].endswith("GB")
+    assert snapshot["temperatures"] == {"cpu-thermal": 45.2, "gpu-thermal": 43.8}
+    assert snapshot["network"]["interfaces"] and json.loads(telemetry.snapshot_json) == snapshot
+    # Sem zonas térmicas (ex.: contêiner): sem subprocesso, apenas "N/A"
+    assert SystemSampler(capacity=2, thermal_dir=tempfile.gettempdir()).sample()["temperature"] == "N/A"
+    shutil.rmtree(directory)
+    print("Teste do snapshot da telemetria: OK")
+
+def test_ring_buffer():
+    telemetry = SystemSampler(capacity=5, thermal_dir=tempfile.gettempdir())
+    for _ in range(8):
+        telemetry.sample()
+    rows = telemetry.rows()
+    assert rows.shape == (5, len(FIELDS)) and (rows[1:, 0] >= rows[:-1, 0]).all()
+    assert rows[-1, 0] == telemetry.snapshot["timestamp"]
+    history = telemetry.history()
+    assert len(history["timestamp"]) == 5 and history["temperature"] == [None] * 5
+    print("Teste do buffer circular: OK")
+
+def test_history_downsample():
+    telemetry = SystemSampler(capacity=100, thermal_dir=tempfile.gettempdir())
+    # Amostras sintéticas: 1 por segundo, CPU = índice, temperatura ausente na metade
+    for i in range(100):
+        row = [1000.0 + i, float(i), 1, 2, 3, 4, 10.0, 20.0, 50.0 if i % 2 else float("nan")]
+        telemetry.buffer[i] = row
+    telemetry.count, telemetry.index = 100, 0
+    history = telemetry.history(points=10)
+    assert history["timestamp"] == [1009.0 + 10 * i for i in range(10)]
+    assert history["cpu_percent"] == [4.5 + 10 * i for i in range(10)]
+    assert history["temperature"] == [50.0] * 10 and history["net_recv_rate"] == [20.0] * 10
+    recent = telemetry.history(seconds=19, points=4)
+    assert recent["timestamp"] == [1084.0, 1089.0, 1094.0, 1099.0]
+    assert recent["cpu_percent"] == [82.0, 87.0, 92.0, 97.0]
+    try:
+        telemetry.history(points=-1)
+        assert False
+    except HistoryError:
+        pass
+    print("Teste do histórico reduzido: OK")
+
+def benchmark(n=10000):
+    from app import create_app
+    client = create_app().test_client()
+    assert client.get("/system_info").json["cpu_usage"]
+    assert len(client.get("/system_info/history?points=1").json["timestamp"]) == 1
+    assert client.get("/system_info/history?seconds=-5").status_code == 400
+    start = time.perf_counter()
+    for _ in range(n):
+        sampler.start().snapshot_json
+    cached = (time.perf_counter() - start) / n
+    start = time.perf_counter()
+    for _ in range(100):
+        sampler.sample()
+    sample = (time.perf_counter() - start) / 100
+    start = time.perf_counter()
+    for _ in range(200):
+        client.get("/system_info")
+    request = (time.perf_counter() - start) / 200
+    print(f"Snapshot em cache: {cached * 1e6:.2f} µs | leitura completa: {sample * 1e3:.2f} ms | "
+          f"requisição /system_info: {request * 1e3:.2f} ms")
+
+# Rodar os testes
+test_snapshot()
+test_ring_buffer()
+test_history_downsample()
+benchmark()
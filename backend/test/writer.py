@@ -0,0 +1,98 @@
+import os
+
+os.environ.setdefault("REDIS_DB", "15")
+
+import time
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+from config.redis_config import redis_client
+from core.redis_writer import RedisBatchWriter
+
+KEY = "test_writer_packets"
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_overflow():
+    redis_client.delete(KEY)
+    # Sem a thread ninguém esvazia a fila: o excesso é descartado e contado
+    writer = RedisBatchWriter(redis_client, KEY, queue_size=5, batch_size=2, flush_interval=1)
+    results = [writer.put(f"r{i}") for i in range(8)]
+    assert results == [True] * 5 + [False] * 3
+    assert writer.stats()["dropped"] == 3 and writer.stats()["queue_depth"] == 5
+    writer.stop()
+    assert redis_client.lrange(KEY, 0, -1) == [f"r{i}".encode() for i in range(5)]
+    assert (writer.flushed, writer.flushes) == (5, 3)
+    print("Teste da fila cheia (descarte contabilizado): OK")
+
+def test_flush_on_size():
+    redis_client.delete(KEY)
+    writer = RedisBatchWriter(redis_client, KEY, batch_size=10, flush_interval=30).start()
+    for i in range(25):
+        writer.put(i)
+    # Dois lotes cheios saem sem esperar o intervalo; o resto fica na fila
+    assert wait_for(lambda: writer.flushed == 20)
+    time.sleep(0.2)
+    assert redis_client.llen(KEY) == 20 and writer.flushes == 2
+    writer.stop()
+    assert redis_client.llen(KEY) == 25 and writer.stats()["queue_depth"] == 0
+    print("Teste da descarga por tamanho: OK")
+
+def test_flush_on_interval():
+    redis_client.delete(KEY)
+    writer = RedisBatchWriter(redis_client, KEY, batch_size=1000, flush_interval=0.3).start()
+    start = time.monotonic()
+    for i in range(3):
+        writer.put(i)
+    assert redis_client.llen(KEY) == 0
+    assert wait_for(lambda: redis_client.llen(KEY) == 3)
+    assert 0.1 < time.monotonic() - start < 1 and writer.flushes == 1
+    writer.stop()
+    print("Teste da descarga por intervalo: OK")
+
+def test_shutdown_drain():
+    redis_client.delete(KEY)
+    writer = RedisBatchWriter(redis_client, KEY, queue_size=100000, batch_size=500, flush_interval=30).start()
+    for i in range(10001):
+        writer.put(i)
+    writer.stop()
+    stats = writer.stats()
+    assert redis_client.llen(KEY) == 10001 and stats["flushed"] == 10001 and stats["queue_depth"] == 0
+    redis_client.delete(KEY)
+    print("Teste do encerramento (fila drenada): OK")
+
+def test_redis_down():
+    # Redis fora do ar: o lote é perdido e contado, sem derrubar a thread
+    offline = redis.Redis(host="127.0.0.1", port=1, socket_connect_timeout=0.2, retry=Retry(NoBackoff(), 0))
+    writer = RedisBatchWriter(offline, KEY, batch_size=2, flush_interval=0.1).start()
+    for i in range(3):
+        writer.put(i)
+    assert wait_for(lambda: writer.failed == 3)
+    assert writer._thread.is_alive() and writer.errors == 2 and writer.flushed == 0
+    writer.stop()
+    print("Teste do Redis indisponível: OK")
+
+def benchmark(n=200000):
+    redis_client.delete(KEY)
+    writer = RedisBatchWriter(redis_client, KEY, queue_size=n).start()
+    record = b"x" * 120
+    start = time.perf_counter()
+    for _ in range(n):
+        writer.put(record)
+    put = (time.perf_counter() - start) / n
+    writer.stop()
+    elapsed = time.perf_counter() - start
+    print(f"put(): {put * 1e9:.0f} ns | {n / elapsed:,.0f} registros/s até o Redis")
+    redis_client.delete(KEY)
+
+# Rodar os testes
+test_overflow()
+test_flush_on_size()
+test_flush_on_interval()
+test_shutdown_drain()
+test_redis_down()
+benchmark()
@@ -0,0 +1,133 @@
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
+
+# Consultas sobre os agregados e as partições do init_db.sql, para a API e
+# relatórios: cada função chama a função SQL correspondente (sem varrer os
+# pacotes brutos, exceto host_packets, que usa os índices de IP e a poda
+# de partições pelo tempo).
+#
+# Este módulo é a única implementação das consultas: o bulk_loader e a API
+# (backend/app/analytics.py, que o carrega de DATABASE_DIR) usam as mesmas
+# funções, cada um com a sua conexão. Por isso nada além da biblioteca
+# padrão é importado no nível do módulo (o psycopg2 e o DB_CONFIG do
+# bulk_loader só entram na primeira conexão/consulta).
+
+KEEP_DAYS = int(os.getenv("DB_KEEP_DAYS", 30))
+ROLLUP_KEEP_DAYS = int(os.getenv("DB_ROLLUP_KEEP_DAYS", 365))
+
+
+def connect(db_config=None):
+    import psycopg2
+    from bulk_loader import DB_CONFIG
+
+    return psycopg2.connect(**(db_config or DB_CONFIG))
+
+
+def _rows(conn, sql, params):
+    from psycopg2.extras import RealDictCursor
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def host_activity(conn, host, start, end):
+    """
+    Tráfego de um host por minuto e par (direção "in"/"out").
+    """
+    return _rows(conn, "SELECT * FROM host_activity(%s, %s, %s)", (host, start, end))
+
+
+def top_talkers(conn, start, end, n=10):
+    """
+    Hosts com mais bytes (enviados + recebidos) no intervalo.
+    """
+    return _rows(conn, "SELECT * FROM top_talkers(%s, %s, %s)", (start, end, n))
+
+
+def traffic_series(conn, start, end, bucket="1 minute"):
+    """
+    Pacotes e bytes totais por balde de tempo.
+    """
+    return _rows(conn, "SELECT * FROM traffic_series(%s, %s, %s::INTERVAL)", (start, end, bucket))
+
+
+def anomaly_hosts(conn, start, end, n=10):
+    """
+    Hosts com mais anomalias no intervalo.
+    """
+    return _rows(conn, "SELECT * FROM anomaly_hosts(%s, %s, %s)", (start, end, n))
+
+
+def host_packets(conn, host, start, end, n=1000):
+    """
+    Pacotes brutos de um host (mais recentes primeiro).
+    """
+    return _rows(conn, "SELECT * FROM host_packets(%s, %s, %s, %s)", (host, start, end, n))
+
+
+def loaded_files(conn, names):
+    """
+    Arquivos de backup que o bulk_loader já carregou por completo
+    (ingest_checkpoints.done).
+    :param names: Nomes dos arquivos (sem diretório).
+    :return: Conjunto com os nomes concluídos.
+    """
+    if not names:
+        return set()
+    rows = _rows(conn, "SELECT file FROM ingest_checkpoints WHERE done AND file = ANY(%s)", (list(names),))
+    return {row["file"] for row in rows}
+
+
+def maintain(conn, keep_days=None, rollup_keep_days=None, days_ahead=2):
+    """
+    Cria as partições dos próximos dias e remove as que passaram da retenção
+    (executado pelo bulk_loader ao final de cada carga).
+    :param keep_days: Dias de dados brutos mantidos (0 = só o dia atual).
+    :return: Partições removidas.
+    """
+    keep_days = KEEP_DAYS if keep_days is None else keep_days
+    rollup_keep_days = ROLLUP_KEEP_DAYS if rollup_keep_days is None else rollup_keep_days
+    rows = _rows(conn, "SELECT maintain_partitions(%s, %s, %s) AS dropped", (keep_days, rollup_keep_days, days_ahead))
+    return [row["dropped"] for row in rows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consultas e manutenção do banco do SehenOS")
+    commands = parser.add_subparsers(dest="command", required=True)
+    maintenance = commands.add_parser("maintain", help="partições futuras e retenção (também feito pelo bulk_loader)")
+    maintenance.add_argument("--keep-days", type=int, default=KEEP_DAYS)
+    maintenance.add_argument("--rollup-keep-days", type=int, default=ROLLUP_KEEP_DAYS)
+    for name in ("top", "anomalies", "host", "series"):
+        command = commands.add_parser(name)
+        command.add_argument("--hours", type=float, default=1, help="janela até agora")
+        if name == "host":
+            command.add_argument("ip")
+    args = parser.parse_args(argv)
+
+    conn = connect()
+    try:
+        if args.command == "maintain":
+            rows = maintain(conn, args.keep_days, args.rollup_keep_days)
+        else:
+            end = datetime.now()
+            start = end - timedelta(hours=args.hours)
+            rows = {
+                "top": lambda: top_talkers(conn, start, end),
+                "anomalies": lambda: anomaly_hosts(conn, start, end),
+                "host": lambda: host_activity(conn, args.ip, start, end),
+                "series": lambda: traffic_series(conn, start, end),
+            }[args.command]()
+        for row in rows:
+            print(json.dumps(row, default=str))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    # Uso: python database/analytics.py maintain | top --hours 24 | host 10.0.0.5
+    main()
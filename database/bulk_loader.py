@@ -0,0 +1,370 @@
+import argparse
+import gzip
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from psycopg2.pool import ThreadedConnectionPool
+
+# Carga em massa dos backups (segmentos NDJSON gzip e backups JSON antigos)
+# no PostgreSQL com COPY FROM STDIN.
+#
+# Os arquivos são lidos linha a linha e enviados em lotes de BATCH_ROWS
+# linhas (memória limitada ao lote). Cada lote é gravado na mesma transação
+# que o checkpoint do arquivo (ingest_checkpoints: linhas já carregadas),
+# então uma carga interrompida continua de onde parou sem duplicar linhas e
+# arquivos já concluídos são ignorados. Vários arquivos são carregados em
+# paralelo, um por conexão do pool; um advisory lock por arquivo impede que
+# dois processos carreguem o mesmo arquivo.
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+DB_CONFIG = {
+    "dbname": os.getenv("DB_NAME", "sehenos-db"),
+    "user": os.getenv("DB_USER", "cypher"),
+    "password": os.getenv("DB_PASSWORD", "piswos"),
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": os.getenv("DB_PORT", "5432"),
+}
+BATCH_ROWS = int(os.getenv("LOADER_BATCH_ROWS", 20000))
+WORKERS = int(os.getenv("LOADER_WORKERS", 4))
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(os.path.dirname(__file__), "..", "backend", "backup"))
+INIT_SQL = os.path.join(os.path.dirname(__file__), "init_db.sql")
+
+# Colunas da tabela -> campo do registro (to_json_safe da captura/detecção)
+PACKET_COLUMNS = {
+    "timestamp": "timestamp",
+    "src_ip": "src_ip",
+    "dst_ip": "dst_ip",
+    "src_hostname": "src_hostname",
+    "dst_hostname": "dst_hostname",
+    "src_mac": "mac_src",
+    "dst_mac": "mac_dst",
+    "protocol": "protocol",
+    "src_port": "src_port",
+    "dst_port": "dst_port",
+    "length": "length",
+    "bytes": "bytes",
+    "time_to_live": "time_to_live",
+    "tcp_flags": "tcp_flags",
+    "is_blacklisted": "is_blacklisted",
+    "is_whitelisted": "is_whitelisted",
+    "dns_queries": "dns_queries",
+    "fqdns": "fqdns",
+    "payload": "payload",
+}
+ANOMALY_COLUMNS = dict(PACKET_COLUMNS, **{
+    "isolation_anomaly": "isolation_anomaly",
+    "reconstruction_anomaly": "reconstruction_anomaly",
+    "reconstruction_error": "reconstruction_error",
+})
+DATASETS = {
+    "packets": ("network_traffic", PACKET_COLUMNS),
+    "anomalies": ("anomalies", ANOMALY_COLUMNS),
+}
+SUFFIXES = (".ndjson.gz", ".json.gz", ".json")
+
+_SPECIAL = re.compile(r"[\\\t\n\r]")
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def copy_value(value, column=None):
+    """
+    Valor no formato texto do COPY (\\N para nulo).
+    """
+    if value is None:
+        return "\\N"
+    if value is True or value is False:
+        return "t" if value else "f"
+    if column == "payload":
+        # bytea em hexadecimal; a barra é escapada no formato texto
+        return "\\\\x" + (value.hex() if isinstance(value, bytes) else value)
+    if column == "timestamp" and isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value).isoformat()
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return str(value).translate(_ESCAPES)
+
+
+def _text(value):
+    # Caminho rápido das colunas de texto/número
+    if value is None:
+        return "\\N"
+    if type(value) is str:
+        return value.translate(_ESCAPES) if _SPECIAL.search(value) else value
+    if type(value) is int or type(value) is float:
+        return str(value)
+    return copy_value(value)
+
+
+def converters(columns):
+    """
+    (campo, conversor) de cada coluna, na ordem do COPY.
+    """
+    special = {"payload", "timestamp"}
+    return [(field, (lambda v, c=column: copy_value(v, c)) if column in special else _text)
+            for column, field in columns.items()]
+
+
+def copy_line(record, fields, known):
+    """
+    Linha do COPY para um registro; campos sem coluna própria (fora de
+    known) vão para details (jsonb).
+    :param fields: Resultado de converters().
+    """
+    line = [convert(record.get(field)) for field, convert in fields]
+    extra = {key: value for key, value in record.items() if key not in known}
+    line.append(copy_value(extra) if extra else "\\N")
+    return "\t".join(line) + "\n"
+
+
+def read_records(path, skip=0):
+    """
+    Registros de um backup, a partir da linha skip (retomada).
+    :return: Gerador de (número da linha, registro).
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        if path.endswith(".ndjson.gz"):
+            for number, line in enumerate(f, 1):
+                # Linhas já carregadas são apenas descompactadas, sem decodificar
+                if number > skip and line.strip():
+                    yield number, json.loads(line)
+        else:
+            # Backup antigo: uma lista JSON por arquivo
+            for number, record in enumerate(json.load(f), 1):
+                if number > skip:
+                    yield number, record
+
+
+def dataset_for(path):
+    name = os.path.basename(path)
+    for dataset in DATASETS:
+        if name.startswith(f"{dataset}_"):
+            return dataset
+    raise ValueError(f"Tipo de backup desconhecido: {name}")
+
+
+def backup_files(paths):
+    """
+    Arquivos finalizados (sem .part) dos caminhos informados (arquivos ou
+    diretórios), em ordem.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += [os.path.join(path, name) for name in sorted(os.listdir(path))
+                      if name.startswith(tuple(f"{d}_" for d in DATASETS)) and name.endswith(SUFFIXES)]
+        else:
+            files.append(path)
+    return files
+
+
+class BulkLoader:
+    """
+    Carga paralela de backups com COPY e checkpoints por arquivo.
+    """
+
+    def __init__(self, db_config=None, workers=None, batch_rows=None):
+        self.workers = workers or WORKERS
+        self.batch_rows = batch_rows or BATCH_ROWS
+        self.pool = ThreadedConnectionPool(1, self.workers, **(db_config or DB_CONFIG))
+        self.rows = 0
+        self._lock = threading.Lock()
+        # Intervalos de dias com partições já garantidas nesta carga
+        self._days = set()
+
+    def close(self):
+        self.pool.closeall()
+
+    def init_schema(self, path=INIT_SQL):
+        conn = self.pool.getconn()
+        try:
+            with conn, conn.cursor() as cur, open(path) as f:
+                cur.execute(f.read())
+        finally:
+            self.pool.putconn(conn)
+
+    def maintain(self):
+        """
+        Partições dos próximos dias e retenção (analytics.maintain).
+        :return: Partições removidas.
+        """
+        import analytics  # analytics importa DB_CONFIG deste módulo
+
+        conn = self.pool.getconn()
+        try:
+            dropped = analytics.maintain(conn)
+        finally:
+            self.pool.putconn(conn)
+        if dropped:
+            logging.info(f"Partições removidas pela retenção: {', '.join(dropped)}")
+        return dropped
+
+    def _copy(self, cur, table, columns, buffer):
+        buffer.seek(0)
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}, details) FROM STDIN", buffer)
+
+    def _ensure_partitions(self, conn, cur, low, high):
+        # Partições diárias (init_db.sql) do intervalo do lote, em transação própria
+        days = (low[:10], high[:10])
+        if days not in self._days:
+            cur.execute("SELECT ensure_day_partitions(%s, %s)", (low, high))
+            conn.commit()
+            self._days.add(days)
+
+    def _checkpoint(self, cur, name, dataset, size, lines, done):
+        cur.execute(
+            "INSERT INTO ingest_checkpoints (file, dataset, size, lines, done, updated_at) "
+            "VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP) "
+            "ON CONFLICT (file) DO UPDATE SET lines = EXCLUDED.lines, done = EXCLUDED.done, "
+            "size = EXCLUDED.size, updated_at = EXCLUDED.updated_at",
+            (name, dataset, size, lines, done),
+        )
+
+    def load_file(self, path):
+        """
+        Carrega um arquivo a partir do checkpoint.
+        :return: Linhas carregadas nesta execução (None se o arquivo já está
+                 concluído ou em carga por outro processo).
+        """
+        dataset = dataset_for(path)
+        table, columns = DATASETS[dataset]
+        name = os.path.basename(path)
+        size = os.path.getsize(path)
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (name,))
+                if not cur.fetchone()[0]:
+                    conn.commit()
+                    logging.info(f"{name} em carga por outro processo; ignorado.")
+                    return None
+                try:
+                    cur.execute("SELECT lines, done FROM ingest_checkpoints WHERE file = %s", (name,))
+                    row = cur.fetchone()
+                    conn.commit()
+                    if row and row[1]:
+                        return None
+                    lines = row[0] if row else 0
+                    return self._load(conn, cur, path, name, dataset, size, table, columns, lines)
+                finally:
+                    conn.rollback()
+                    cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (name,))
+                    conn.commit()
+        finally:
+            self.pool.putconn(conn)
+
+    def _load(self, conn, cur, path, name, dataset, size, table, columns, lines):
+        start = time.perf_counter()
+        known = set(columns.values())
+        fields = converters(columns)
+        loaded = 0
+        buffer = io.StringIO()
+        count = 0
+        low = high = None
+        for lines, record in read_records(path, lines):
+            stamp = copy_value(record.get("timestamp"), "timestamp")
+            low = stamp if low is None or stamp < low else low
+            high = stamp if high is None or stamp > high else high
+            buffer.write(copy_line(record, fields, known))
+            count += 1
+            if count == self.batch_rows:
+                self._ensure_partitions(conn, cur, low, high)
+                # Lote e checkpoint na mesma transação
+                self._copy(cur, table, columns, buffer)
+                self._checkpoint(cur, name, dataset, size, lines, False)
+                conn.commit()
+                loaded += count
+                self._count(count)
+                buffer = io.StringIO()
+                count = 0
+                low = high = None
+        if count:
+            self._ensure_partitions(conn, cur, low, high)
+            self._copy(cur, table, columns, buffer)
+            loaded += count
+        self._checkpoint(cur, name, dataset, size, lines, True)
+        conn.commit()
+        self._count(count)
+        elapsed = time.perf_counter() - start
+        logging.info(f"{name}: {loaded} linhas em {elapsed:.1f} s ({loaded / max(elapsed, 1e-9):.0f} linhas/s)")
+        return loaded
+
+    def _count(self, rows):
+        with self._lock:
+            self.rows += rows
+
+    def load(self, paths):
+        """
+        Carrega os arquivos em paralelo (um por conexão do pool).
+        :return: Estatísticas da carga.
+        """
+        files = backup_files(paths)
+        start = time.perf_counter()
+        loaded, skipped, failed = 0, 0, []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.load_file, path): path for path in files}
+            for future in as_completed(futures):
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    # O checkpoint mantém o que já foi carregado do arquivo
+                    logging.error(f"Erro ao carregar {futures[future]}: {e}")
+                    failed.append(futures[future])
+                    continue
+                if rows is None:
+                    skipped += 1
+                else:
+                    loaded += 1
+        elapsed = time.perf_counter() - start
+        stats = {
+            "files": loaded,
+            "skipped": skipped,
+            "failed": failed,
+            "rows": self.rows,
+            "seconds": round(elapsed, 2),
+            "rows_per_sec": round(self.rows / elapsed) if elapsed else 0,
+        }
+        logging.info(f"Carga concluída: {stats}")
+        return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Carga dos backups do SehenOS no PostgreSQL (COPY)")
+    parser.add_argument("paths", nargs="*", default=[BACKUP_DIR], help="arquivos ou diretórios de backup")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--batch", type=int, default=BATCH_ROWS, help="linhas por COPY")
+    parser.add_argument("--init", action="store_true", help="aplica o init_db.sql antes da carga")
+    parser.add_argument("--watch", type=float, default=0, help="repete a carga a cada N segundos")
+    args = parser.parse_args(argv)
+
+    loader = BulkLoader(workers=args.workers, batch_rows=args.batch)
+    try:
+        if args.init:
+            loader.init_schema()
+        while True:
+            stats = loader.load(args.paths)
+            # Partições futuras e retenção a cada carga
+            try:
+                loader.maintain()
+            except Exception as e:
+                if not args.watch:
+                    raise
+                logging.error(f"Erro na manutenção das partições: {e}")
+            if not args.watch:
+                break
+            time.sleep(args.watch)
+    finally:
+        loader.close()
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    # Uso: python database/bulk_loader.py [--init] [--workers 4] [--watch 3600] [backend/backup ...]
+    raise SystemExit(main())
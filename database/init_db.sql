@@ -1,30 +1,347 @@
-CREATE TABLE network_traffic (
-    id SERIAL PRIMARY KEY,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    src_ip VARCHAR(45),
+-- Esquema do SehenOS: tabelas particionadas por dia (timestamp), índices
+-- BRIN no tempo e btree nos IPs (inet), agregados por minuto mantidos por
+-- triggers de instrução e funções de consulta e de retenção.
+--
+-- Partições: <tabela>_pAAAAMMDD, criadas por ensure_day_partitions (antes
+-- de cada lote do bulk_loader e, adiantadas, por maintain_partitions) e
+-- removidas por drop_old_partitions. O script pode ser reaplicado; tabelas
+-- antigas (sem partições) são migradas.
+
+-- |-------------------------↓ MIGRAÇÃO ↓----------------------------------|
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass('network_traffic') AND relkind = 'r') THEN
+        ALTER TABLE network_traffic RENAME TO network_traffic_legacy;
+        ALTER SEQUENCE IF EXISTS network_traffic_id_seq RENAME TO network_traffic_legacy_id_seq;
+    END IF;
+    IF EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass('anomalies') AND relkind = 'r') THEN
+        ALTER TABLE anomalies RENAME TO anomalies_legacy;
+        ALTER SEQUENCE IF EXISTS anomalies_id_seq RENAME TO anomalies_legacy_id_seq;
+    END IF;
+END $$;
+
+-- |-------------------------↓ TABELAS ↓-----------------------------------|
+
+CREATE TABLE IF NOT EXISTS network_traffic (
+    id BIGSERIAL,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    src_ip INET,
     src_hostname VARCHAR(255),
     src_mac VARCHAR(60),
-    dst_ip VARCHAR(45),
+    dst_ip INET,
     dst_hostname VARCHAR(255),
-    dst_mac VARCHAR(60)
-);
+    dst_mac VARCHAR(60),
+    protocol SMALLINT,
+    src_port INTEGER,
+    dst_port INTEGER,
+    length INTEGER,
+    bytes INTEGER,
+    time_to_live SMALLINT,
+    tcp_flags VARCHAR(16),
+    is_blacklisted BOOLEAN,
+    is_whitelisted BOOLEAN,
+    dns_queries TEXT,
+    fqdns TEXT,
+    payload BYTEA,
+    details JSONB,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
 
-CREATE TABLE anomalies ( 
-    id SERIAL PRIMARY KEY, 
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, 
-    src_ip VARCHAR(45), 
-    dst_ip VARCHAR(45), 
-    src_hostname VARCHAR(255), 
+CREATE TABLE IF NOT EXISTS anomalies (
+    id BIGSERIAL,
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    src_ip INET,
+    dst_ip INET,
+    src_hostname VARCHAR(255),
     dst_hostname VARCHAR(255),
     src_mac VARCHAR(60),
-    dst_mac VARCHAR(60) 
+    dst_mac VARCHAR(60),
+    protocol SMALLINT,
+    src_port INTEGER,
+    dst_port INTEGER,
+    length INTEGER,
+    bytes INTEGER,
+    time_to_live SMALLINT,
+    tcp_flags VARCHAR(16),
+    is_blacklisted BOOLEAN,
+    is_whitelisted BOOLEAN,
+    dns_queries TEXT,
+    fqdns TEXT,
+    payload BYTEA,
+    isolation_anomaly BOOLEAN,
+    reconstruction_anomaly BOOLEAN,
+    reconstruction_error DOUBLE PRECISION,
+    details JSONB,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+-- Agregados por minuto (mantidos pelos triggers abaixo)
+CREATE TABLE IF NOT EXISTS traffic_minute (
+    minute TIMESTAMP NOT NULL,
+    src_ip INET NOT NULL,
+    dst_ip INET NOT NULL,
+    packets BIGINT NOT NULL,
+    bytes BIGINT NOT NULL,
+    PRIMARY KEY (minute, src_ip, dst_ip)
+) PARTITION BY RANGE (minute);
+
+CREATE TABLE IF NOT EXISTS anomaly_minute (
+    minute TIMESTAMP NOT NULL,
+    host INET NOT NULL,
+    anomalies BIGINT NOT NULL,
+    max_error DOUBLE PRECISION,
+    PRIMARY KEY (minute, host)
+) PARTITION BY RANGE (minute);
+
+-- Progresso da carga por arquivo de backup (linhas já gravadas)
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    file VARCHAR(255) PRIMARY KEY,
+    dataset VARCHAR(20) NOT NULL,
+    size BIGINT,
+    lines BIGINT NOT NULL DEFAULT 0,
+    done BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- |-------------------------↓ ÍNDICES ↓-----------------------------------|
+
+-- Criados na tabela pai e herdados por todas as partições. BRIN: o tempo
+-- cresce com a ordem de inserção, poucas páginas de índice por partição
+CREATE INDEX IF NOT EXISTS network_traffic_timestamp_brin ON network_traffic USING brin (timestamp) WITH (pages_per_range = 32);
+CREATE INDEX IF NOT EXISTS network_traffic_src_ip_idx ON network_traffic (src_ip, timestamp);
+CREATE INDEX IF NOT EXISTS network_traffic_dst_ip_idx ON network_traffic (dst_ip, timestamp);
+
+CREATE INDEX IF NOT EXISTS anomalies_timestamp_brin ON anomalies USING brin (timestamp) WITH (pages_per_range = 32);
+CREATE INDEX IF NOT EXISTS anomalies_src_ip_idx ON anomalies (src_ip, timestamp);
+CREATE INDEX IF NOT EXISTS anomalies_dst_ip_idx ON anomalies (dst_ip, timestamp);
+
+CREATE INDEX IF NOT EXISTS traffic_minute_src_ip_idx ON traffic_minute (src_ip, minute);
+CREATE INDEX IF NOT EXISTS traffic_minute_dst_ip_idx ON traffic_minute (dst_ip, minute);
+CREATE INDEX IF NOT EXISTS anomaly_minute_host_idx ON anomaly_minute (host, minute);
+
+-- |-------------------------↓ PARTIÇÕES ↓---------------------------------|
+
+CREATE OR REPLACE FUNCTION create_day_partition(parent TEXT, day DATE) RETURNS VOID AS $$
+BEGIN
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                   parent || '_p' || to_char(day, 'YYYYMMDD'), parent, day, day + 1);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partições diárias de todas as tabelas para o intervalo (inclusive)
+CREATE OR REPLACE FUNCTION ensure_day_partitions(from_ts TIMESTAMP, to_ts TIMESTAMP) RETURNS VOID AS $$
+DECLARE
+    day DATE;
+    parent TEXT;
+BEGIN
+    -- Carregadores em paralelo: uma criação por vez
+    PERFORM pg_advisory_xact_lock(hashtext('sehenos_partitions'));
+    FOR day IN SELECT generate_series(from_ts::DATE, to_ts::DATE, INTERVAL '1 day')::DATE LOOP
+        FOREACH parent IN ARRAY ARRAY['network_traffic', 'anomalies', 'traffic_minute', 'anomaly_minute'] LOOP
+            IF to_regclass(parent || '_p' || to_char(day, 'YYYYMMDD')) IS NULL THEN
+                PERFORM create_day_partition(parent, day);
+            END IF;
+        END LOOP;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Remove as partições das tabelas com dia anterior a hoje - keep_days
+CREATE OR REPLACE FUNCTION drop_old_partitions(parents TEXT[], keep_days INTEGER) RETURNS SETOF TEXT AS $$
+DECLARE
+    part TEXT;
+BEGIN
+    FOR part IN
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent IN (SELECT to_regclass(name) FROM unnest(parents) name)
+          AND child.relname ~ '_p\d{8}$'
+          AND to_date(right(child.relname, 8), 'YYYYMMDD') < CURRENT_DATE - keep_days
+        ORDER BY child.relname
+    LOOP
+        EXECUTE format('DROP TABLE %I', part);
+        RETURN NEXT part;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Rotina periódica: partições dos próximos dias e retenção (dados brutos e
+-- agregados com prazos próprios)
+CREATE OR REPLACE FUNCTION maintain_partitions(keep_days INTEGER DEFAULT 30, rollup_keep_days INTEGER DEFAULT 365,
+                                               days_ahead INTEGER DEFAULT 2) RETURNS SETOF TEXT AS $$
+BEGIN
+    PERFORM ensure_day_partitions(CURRENT_DATE::TIMESTAMP, (CURRENT_DATE + days_ahead)::TIMESTAMP);
+    RETURN QUERY SELECT drop_old_partitions(ARRAY['network_traffic', 'anomalies'], keep_days);
+    RETURN QUERY SELECT drop_old_partitions(ARRAY['traffic_minute', 'anomaly_minute'], rollup_keep_days);
+END;
+$$ LANGUAGE plpgsql;
+
+-- |-------------------------↓ AGREGADOS ↓---------------------------------|
+
+-- Triggers de instrução: um agregado por INSERT/COPY (lote inteiro), não
+-- por linha. Atualizações e remoções nos dados brutos não são refletidas.
+CREATE OR REPLACE FUNCTION rollup_traffic() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO traffic_minute AS t (minute, src_ip, dst_ip, packets, bytes)
+    SELECT date_trunc('minute', timestamp), src_ip, dst_ip, count(*), coalesce(sum(bytes), 0)
+    FROM new_rows
+    WHERE src_ip IS NOT NULL AND dst_ip IS NOT NULL
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (minute, src_ip, dst_ip) DO UPDATE
+        SET packets = t.packets + EXCLUDED.packets, bytes = t.bytes + EXCLUDED.bytes;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION rollup_anomalies() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO anomaly_minute AS a (minute, host, anomalies, max_error)
+    SELECT date_trunc('minute', timestamp), host, count(*), max(reconstruction_error)
+    FROM (
+        SELECT timestamp, src_ip AS host, reconstruction_error FROM new_rows
+        UNION ALL
+        SELECT timestamp, dst_ip, reconstruction_error FROM new_rows WHERE dst_ip IS DISTINCT FROM src_ip
+    ) hosts
+    WHERE host IS NOT NULL
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+    ON CONFLICT (minute, host) DO UPDATE
+        SET anomalies = a.anomalies + EXCLUDED.anomalies, max_error = GREATEST(a.max_error, EXCLUDED.max_error);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS network_traffic_rollup ON network_traffic;
+CREATE TRIGGER network_traffic_rollup AFTER INSERT ON network_traffic
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_traffic();
+
+DROP TRIGGER IF EXISTS anomalies_rollup ON anomalies;
+CREATE TRIGGER anomalies_rollup AFTER INSERT ON anomalies
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION rollup_anomalies();
+
+-- |-------------------------↓ CONSULTAS ↓---------------------------------|
+
+-- Tráfego de um host por minuto e par (agregados, nos dois sentidos)
+CREATE OR REPLACE FUNCTION host_activity(host INET, from_ts TIMESTAMP, to_ts TIMESTAMP)
+RETURNS TABLE (minute TIMESTAMP, peer INET, direction TEXT, packets BIGINT, bytes BIGINT) AS $$
+    SELECT t.minute, t.dst_ip, 'out', t.packets, t.bytes FROM traffic_minute t
+    WHERE t.src_ip = host AND t.minute >= from_ts AND t.minute < to_ts
+    UNION ALL
+    SELECT t.minute, t.src_ip, 'in', t.packets, t.bytes FROM traffic_minute t
+    WHERE t.dst_ip = host AND t.minute >= from_ts AND t.minute < to_ts
+    ORDER BY 1, 2;
+$$ LANGUAGE sql STABLE;
+
+-- Hosts com mais bytes enviados + recebidos no intervalo
+CREATE OR REPLACE FUNCTION top_talkers(from_ts TIMESTAMP, to_ts TIMESTAMP, n INTEGER DEFAULT 10)
+RETURNS TABLE (host INET, packets NUMERIC, bytes NUMERIC) AS $$
+    SELECT host, sum(packets), sum(bytes) FROM (
+        SELECT src_ip AS host, packets, bytes FROM traffic_minute WHERE minute >= from_ts AND minute < to_ts
+        UNION ALL
+        SELECT dst_ip, packets, bytes FROM traffic_minute WHERE minute >= from_ts AND minute < to_ts
+    ) hosts
+    GROUP BY host
+    ORDER BY 3 DESC, 1
+    LIMIT n;
+$$ LANGUAGE sql STABLE;
+
+-- Série temporal do tráfego total em baldes de bucket (múltiplo de 1 minuto)
+CREATE OR REPLACE FUNCTION traffic_series(from_ts TIMESTAMP, to_ts TIMESTAMP, bucket INTERVAL DEFAULT '1 minute')
+RETURNS TABLE (bucket_start TIMESTAMP, packets NUMERIC, bytes NUMERIC) AS $$
+    SELECT date_bin(bucket, minute, from_ts), sum(packets), sum(bytes) FROM traffic_minute
+    WHERE minute >= from_ts AND minute < to_ts
+    GROUP BY 1
+    ORDER BY 1;
+$$ LANGUAGE sql STABLE;
+
+-- Hosts com mais anomalias no intervalo
+CREATE OR REPLACE FUNCTION anomaly_hosts(from_ts TIMESTAMP, to_ts TIMESTAMP, n INTEGER DEFAULT 10)
+RETURNS TABLE (host INET, anomalies NUMERIC, max_error DOUBLE PRECISION) AS $$
+    SELECT a.host, sum(a.anomalies), max(a.max_error) FROM anomaly_minute a
+    WHERE a.minute >= from_ts AND a.minute < to_ts
+    GROUP BY a.host
+    ORDER BY 2 DESC, 1
+    LIMIT n;
+$$ LANGUAGE sql STABLE;
+
+-- Pacotes brutos de um host (índices de IP + poda de partições pelo tempo)
+CREATE OR REPLACE FUNCTION host_packets(host INET, from_ts TIMESTAMP, to_ts TIMESTAMP, n INTEGER DEFAULT 1000)
+RETURNS SETOF network_traffic AS $$
+    SELECT * FROM (
+        (SELECT * FROM network_traffic WHERE src_ip = host AND timestamp >= from_ts AND timestamp < to_ts
+         ORDER BY timestamp DESC LIMIT n)
+        UNION ALL
+        (SELECT * FROM network_traffic WHERE dst_ip = host AND src_ip IS DISTINCT FROM host
+         AND timestamp >= from_ts AND timestamp < to_ts ORDER BY timestamp DESC LIMIT n)
+    ) packets
+    ORDER BY timestamp DESC
+    LIMIT n;
+$$ LANGUAGE sql STABLE;
+
+-- |-------------------------↓ MIGRAÇÃO DOS DADOS ↓------------------------|
+
+CREATE OR REPLACE FUNCTION try_inet(value TEXT) RETURNS INET AS $$
+BEGIN
+    RETURN value::INET;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- Copia as colunas em comum da tabela antiga (IPs convertidos para inet)
+-- e remove-a
+CREATE OR REPLACE FUNCTION migrate_legacy(legacy TEXT, target TEXT) RETURNS BIGINT AS $$
+DECLARE
+    cols TEXT;
+    exprs TEXT;
+    low TIMESTAMP;
+    high TIMESTAMP;
+    moved BIGINT := 0;
+BEGIN
+    SELECT string_agg(quote_ident(c.column_name), ', ' ORDER BY c.ordinal_position),
+           string_agg(CASE
+                          WHEN c.column_name IN ('src_ip', 'dst_ip') THEN format('try_inet(%I::TEXT)', c.column_name)
+                          WHEN c.column_name = 'timestamp' THEN 'coalesce(timestamp, CURRENT_TIMESTAMP)'
+                          ELSE quote_ident(c.column_name)
+                      END, ', ' ORDER BY c.ordinal_position)
+    INTO cols, exprs
+    FROM information_schema.columns c
+    WHERE c.table_schema = current_schema() AND c.table_name = legacy AND c.column_name <> 'id'
+      AND EXISTS (SELECT 1 FROM information_schema.columns t
+                  WHERE t.table_schema = current_schema() AND t.table_name = target AND t.column_name = c.column_name);
+    EXECUTE format('SELECT min(coalesce(timestamp, CURRENT_TIMESTAMP)), max(coalesce(timestamp, CURRENT_TIMESTAMP)) FROM %I',
+                   legacy) INTO low, high;
+    IF low IS NOT NULL THEN
+        PERFORM ensure_day_partitions(low, high);
+        EXECUTE format('INSERT INTO %I (%s) SELECT %s FROM %I', target, cols, exprs, legacy);
+        GET DIAGNOSTICS moved = ROW_COUNT;
+    END IF;
+    EXECUTE format('DROP TABLE %I', legacy);
+    RETURN moved;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    IF to_regclass('network_traffic_legacy') IS NOT NULL THEN
+        PERFORM migrate_legacy('network_traffic_legacy', 'network_traffic');
+    END IF;
+    IF to_regclass('anomalies_legacy') IS NOT NULL THEN
+        PERFORM migrate_legacy('anomalies_legacy', 'anomalies');
+    END IF;
+END $$;
+
+-- Partições de hoje e dos próximos dias (a retenção fica com maintain_partitions)
+SELECT ensure_day_partitions(CURRENT_DATE::TIMESTAMP, (CURRENT_DATE + 2)::TIMESTAMP);
+
 -- Conceder permissões ao usuário
 GRANT ALL PRIVILEGES ON TABLE network_traffic TO cypher;
 GRANT ALL PRIVILEGES ON TABLE anomalies TO cypher;
+GRANT ALL PRIVILEGES ON TABLE traffic_minute TO cypher;
+GRANT ALL PRIVILEGES ON TABLE anomaly_minute TO cypher;
+GRANT ALL PRIVILEGES ON TABLE ingest_checkpoints TO cypher;
 
 GRANT ALL PRIVILEGES ON SEQUENCE network_traffic_id_seq TO cypher;
 GRANT ALL PRIVILEGES ON SEQUENCE anomalies_id_seq TO cypher;
-
-
@@ -0,0 +1,141 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+import psycopg2
+from bulk_loader import DB_CONFIG, BulkLoader
+
+# Requer um PostgreSQL local (ex.: docker compose up db); usa as mesmas
+# variáveis DB_* do bulk_loader
+
+START = 1732019696.0
+
+def sample(i, anomaly=False):
+    record = {
+        "timestamp": datetime.fromtimestamp(START + i * 0.01).isoformat(),
+        "src_ip": f"192.168.0.{i % 250}",
+        "dst_ip": "2001:db8::1" if i % 5 == 0 else "8.8.8.8",
+        "protocol": 17 if i % 3 == 0 else 6,
+        "length": 60 + i % 1400,
+        "mac_src": "aa:bb:cc:dd:ee:ff",
+        "mac_dst": None,
+        "time_to_live": 64,
+        "is_blacklisted": i % 97 == 0,
+        "is_whitelisted": False,
+        "src_port": 40000 + i % 20000,
+        "dst_port": 53 if i % 3 == 0 else 443,
+        "tcp_flags": "PA" if i % 3 else None,
+        "dns_queries": "exa\tmple.com\n" if i % 3 == 0 else None,
+        "payload": bytes([i % 256, 0, 92]).hex() if i % 2 else None,
+        "bytes": 60 + i % 1400,
+    }
+    if anomaly:
+        record.update(isolation_anomaly=True, reconstruction_error=0.5 + i, reconstruction_anomaly=False,
+                      payload_entropy=1.5)
+    return record
+
+def write_segment(path, records, chunk=1000):
+    # Mesmo formato do backup.segments: um membro gzip por bloco
+    with open(path, "wb") as f:
+        for i in range(0, len(records), chunk):
+            lines = "".join(json.dumps(r) + "\n" for r in records[i:i + chunk])
+            f.write(gzip.compress(lines.encode()))
+
+def reset(conn):
+    with conn, conn.cursor() as cur:
+        cur.execute("TRUNCATE network_traffic, anomalies, traffic_minute, anomaly_minute, ingest_checkpoints RESTART IDENTITY")
+
+def count(conn, table):
+    with conn, conn.cursor() as cur:
+        cur.execute(f"SELECT count(*), count(DISTINCT (timestamp, src_port)) FROM {table}")
+        return cur.fetchone()
+
+def test_load_and_resume():
+    directory = tempfile.mkdtemp()
+    loader = BulkLoader(workers=3, batch_rows=1000)
+    loader.init_schema()
+    conn = psycopg2.connect(**DB_CONFIG)
+    reset(conn)
+
+    for n in range(3):
+        write_segment(os.path.join(directory, f"packets_20241119_1{n}0000.ndjson.gz"),
+                      [sample(i) for i in range(n * 5000, (n + 1) * 5000)])
+    with open(os.path.join(directory, "anomalies_20241119_100000.json"), "w") as f:
+        json.dump([sample(i, anomaly=True) for i in range(300)], f)
+    # Segmento em escrita: ignorado
+    write_segment(os.path.join(directory, "packets_20241119_130000.ndjson.gz.part"), [sample(0)])
+
+    # Linha inválida no meio do último segmento: carga parcial com checkpoint
+    broken = os.path.join(directory, "packets_20241119_120000.ndjson.gz")
+    records = [sample(i) for i in range(10000, 15000)]
+    with open(broken, "wb") as f:
+        f.write(gzip.compress("".join(json.dumps(r) + "\n" for r in records[:2500]).encode()))
+        f.write(gzip.compress(b"{quebrado\n"))
+        f.write(gzip.compress("".join(json.dumps(r) + "\n" for r in records[2500:]).encode()))
+    stats = loader.load([directory])
+    assert stats["failed"] == [broken], stats
+    assert count(conn, "network_traffic") == (12000, 12000)
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT lines, done FROM ingest_checkpoints WHERE file = %s", (os.path.basename(broken),))
+        assert cur.fetchone() == (2000, False)
+
+    # Arquivo corrigido: retomada a partir do checkpoint, sem duplicar
+    write_segment(broken, records)
+    loader.rows = 0
+    stats = loader.load([directory])
+    assert stats["files"] == 1 and stats["skipped"] == 3 and stats["rows"] == 3000, stats
+    assert count(conn, "network_traffic") == (15000, 15000)
+    assert count(conn, "anomalies") == (300, 300)
+    # Nova execução: nada a carregar
+    loader.rows = 0
+    assert loader.load([directory])["rows"] == 0
+
+    # Todas as colunas capturadas (e os demais campos em details)
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT src_ip, dst_ip, protocol, src_port, dst_port, length, time_to_live, tcp_flags, "
+                    "dns_queries, payload, src_mac, is_blacklisted FROM network_traffic "
+                    "WHERE timestamp = %s", (datetime.fromtimestamp(START + 0.03),))
+        row = cur.fetchone()
+        assert row[:9] == ("192.168.0.3", "8.8.8.8", 17, 40003, 53, 63, 64, None, "exa\tmple.com\n"), row
+        assert bytes(row[9]) == bytes([3, 0, 92]) and row[10] == "aa:bb:cc:dd:ee:ff" and row[11] is False
+        cur.execute("SELECT reconstruction_error, isolation_anomaly, details FROM anomalies ORDER BY id LIMIT 1")
+        assert cur.fetchone() == (0.5, True, {"payload_entropy": 1.5})
+    conn.close()
+    loader.close()
+    shutil.rmtree(directory)
+    print("Teste de carga com COPY e retomada por checkpoint: OK")
+
+def benchmark(n=200000):
+    directory = tempfile.mkdtemp()
+    records = [sample(i) for i in range(n)]
+    for part in range(4):
+        write_segment(os.path.join(directory, f"packets_20241119_1{part}0000.ndjson.gz"),
+                      records[part::4])
+    conn = psycopg2.connect(**DB_CONFIG)
+    reset(conn)
+
+    # Referência: um INSERT por linha (como o backup_insert_POS.py antigo)
+    sample_size = 5000
+    start = time.perf_counter()
+    with conn, conn.cursor() as cur:
+        for r in records[:sample_size]:
+            cur.execute("INSERT INTO network_traffic (timestamp, src_ip, dst_ip) VALUES (%s, %s, %s)",
+                        (r["timestamp"], r["src_ip"], r["dst_ip"]))
+    insert_rate = sample_size / (time.perf_counter() - start)
+    reset(conn)
+
+    loader = BulkLoader(workers=4)
+    stats = loader.load([directory])
+    assert count(conn, "network_traffic")[0] == n
+    print(f"COPY: {stats['rows_per_sec']} linhas/s com todas as colunas | INSERT por linha: {insert_rate:.0f} linhas/s")
+    reset(conn)
+    conn.close()
+    loader.close()
+    shutil.rmtree(directory)
+
+# Rodar os testes
+test_load_and_resume()
+benchmark()
@@ -0,0 +1,156 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+import psycopg2
+import analytics
+from bulk_loader import DB_CONFIG, BulkLoader
+
+# Requer um PostgreSQL local (ex.: docker compose up db). Roda em um schema
+# próprio, removido no final
+SCHEMA = "sehenos_test"
+CONFIG = dict(DB_CONFIG, options=f"-c search_path={SCHEMA}")
+DAY = datetime(2024, 11, 19)
+
+def packet(i, day_offset=0):
+    return {
+        "timestamp": (DAY + timedelta(days=day_offset, seconds=i * 2)).isoformat(),
+        "src_ip": f"10.0.0.{i % 4}",
+        "dst_ip": "8.8.8.8" if i % 2 else "2001:db8::1",
+        "protocol": 6,
+        "length": 100,
+        "bytes": 100 + i % 10,
+        "src_port": 40000 + i,
+        "dst_port": 443,
+    }
+
+def write_segment(path, records):
+    with open(path, "wb") as f:
+        f.write(gzip.compress("".join(json.dumps(r) + "\n" for r in records).encode()))
+
+def query(conn, sql, params=()):
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+def setup():
+    conn = psycopg2.connect(**DB_CONFIG)
+    with conn, conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+    conn.close()
+    conn = psycopg2.connect(**CONFIG)
+    # Tabelas antigas (sem partições, IPs em texto) com dados a migrar
+    with conn, conn.cursor() as cur:
+        cur.execute("CREATE TABLE network_traffic (id SERIAL PRIMARY KEY, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+                    "src_ip VARCHAR(45), src_hostname VARCHAR(255), src_mac VARCHAR(60), dst_ip VARCHAR(45), "
+                    "dst_hostname VARCHAR(255), dst_mac VARCHAR(60), protocol SMALLINT, bytes INTEGER)")
+        cur.execute("CREATE TABLE anomalies (id SERIAL PRIMARY KEY, timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+                    "src_ip VARCHAR(45), dst_ip VARCHAR(45), src_hostname VARCHAR(255), dst_hostname VARCHAR(255), "
+                    "src_mac VARCHAR(60), dst_mac VARCHAR(60))")
+        cur.execute("INSERT INTO network_traffic (timestamp, src_ip, dst_ip, protocol, bytes) VALUES "
+                    "(%s, '10.9.9.9', '8.8.8.8', 17, 50), (%s, 'inválido', '8.8.8.8', 17, 50)",
+                    (DAY - timedelta(days=40), DAY - timedelta(days=40)))
+    return conn
+
+def test_schema_and_migration(conn):
+    loader = BulkLoader(db_config=CONFIG, workers=2, batch_rows=500)
+    loader.init_schema()
+    # Reaplicar o script não altera nada
+    loader.init_schema()
+    kinds = dict(query(conn, "SELECT relname, relkind FROM pg_class WHERE relnamespace = %s::regnamespace "
+                             "AND relname IN ('network_traffic', 'anomalies', 'traffic_minute', 'anomaly_minute')",
+                       (SCHEMA,)))
+    assert set(kinds.values()) == {"p"} and len(kinds) == 4, kinds
+    rows = query(conn, "SELECT src_ip, protocol, bytes FROM network_traffic ORDER BY src_ip NULLS LAST")
+    assert rows == [("10.9.9.9", 17, 50), (None, 17, 50)], rows
+    assert query(conn, "SELECT packets, bytes FROM traffic_minute") == [(1, 50)]
+    loader.close()
+    print("Teste do esquema particionado e da migração: OK")
+
+def test_rollups_and_queries(conn):
+    directory = tempfile.mkdtemp()
+    # Três dias de pacotes em arquivos carregados em paralelo
+    for day in range(3):
+        write_segment(os.path.join(directory, f"packets_2024111{9 + day}_000000.ndjson.gz"),
+                      [packet(i, day) for i in range(3000)])
+    write_segment(os.path.join(directory, "anomalies_20241119_000000.ndjson.gz"),
+                  [dict(packet(i), reconstruction_error=0.1 * i) for i in range(10)])
+    loader = BulkLoader(db_config=CONFIG, workers=3, batch_rows=700)
+    assert loader.load([directory])["rows"] == 9010
+    partitions = {name for (name,) in query(conn, "SELECT relname FROM pg_class WHERE relname LIKE 'network_traffic_p%%' "
+                                                  "AND relnamespace = %s::regnamespace", (SCHEMA,))}
+    assert {"network_traffic_p20241119", "network_traffic_p20241120", "network_traffic_p20241121"} <= partitions
+
+    # Agregados iguais ao GROUP BY dos dados brutos
+    expected = query(conn, "SELECT date_trunc('minute', timestamp), src_ip, dst_ip, count(*), sum(bytes) "
+                           "FROM network_traffic WHERE src_ip IS NOT NULL GROUP BY 1, 2, 3 ORDER BY 1, 2, 3")
+    assert query(conn, "SELECT minute, src_ip, dst_ip, packets, bytes FROM traffic_minute ORDER BY 1, 2, 3") == expected
+    assert sum(row[3] for row in expected) == 9001
+
+    start, end = DAY, DAY + timedelta(days=1)
+    top = analytics.top_talkers(conn, start, end, 3)
+    assert top[0]["host"] in ("8.8.8.8", "2001:db8::1") and top[0]["packets"] == 1500, top
+    activity = analytics.host_activity(conn, "10.0.0.1", start, start + timedelta(minutes=10))
+    assert activity and all(row["direction"] == "out" and row["peer"] == "8.8.8.8" for row in activity)
+    assert sum(row["packets"] for row in activity) == 75
+    series = analytics.traffic_series(conn, start, end, "1 hour")
+    assert len(series) == 2 and sum(row["packets"] for row in series) == 3000, series
+    hosts = analytics.anomaly_hosts(conn, start, end)
+    assert {row["host"]: row["anomalies"] for row in hosts}["10.0.0.1"] == 3
+    packets = analytics.host_packets(conn, "2001:db8::1", start, end, 5)
+    assert len(packets) == 5 and packets[0]["timestamp"] > packets[-1]["timestamp"]
+
+    # Consulta por tempo lê só a partição do dia; por host usa o índice de IP
+    plan = "\n".join(row[0] for row in query(conn, "EXPLAIN SELECT count(*) FROM network_traffic "
+                                                   "WHERE timestamp >= %s AND timestamp < %s",
+                                             (DAY + timedelta(days=1), DAY + timedelta(days=1, hours=1))))
+    assert "network_traffic_p20241120" in plan and "network_traffic_p20241119" not in plan, plan
+    with conn.cursor() as cur:
+        cur.execute("SET enable_seqscan = off")
+    plan = "\n".join(row[0] for row in query(conn, "EXPLAIN SELECT * FROM network_traffic WHERE src_ip = '10.0.0.1' "
+                                                   "AND timestamp >= %s AND timestamp < %s", (start, end)))
+    assert "Index Scan using network_traffic_p20241119_src_ip" in plan and "p20241120" not in plan, plan
+    loader.close()
+    shutil.rmtree(directory)
+    print("Teste dos agregados, consultas e poda de partições: OK")
+
+def test_retention(conn):
+    # Partições de dados brutos com mais de keep_days dias removidas; agregados mantidos
+    dropped = analytics.maintain(conn, keep_days=(datetime.now() - DAY).days - 1, rollup_keep_days=10000)
+    assert "network_traffic_p20241119" in dropped and "traffic_minute_p20241119" not in dropped, dropped
+    assert "network_traffic_p20241121" not in dropped
+    assert query(conn, "SELECT count(*) FROM network_traffic WHERE timestamp < %s", (DAY + timedelta(days=1),)) == [(0,)]
+    assert query(conn, "SELECT count(*) FROM traffic_minute WHERE minute >= %s AND minute < %s",
+                 (DAY, DAY + timedelta(days=1)))[0][0] > 0
+    today = f"network_traffic_p{datetime.now():%Y%m%d}"
+    assert query(conn, "SELECT to_regclass(%s) IS NOT NULL", (f"{SCHEMA}.{today}",)) == [(True,)]
+
+    # keep_days=0 mantém só o dia atual (não é o padrão KEEP_DAYS)
+    dropped = analytics.maintain(conn, keep_days=0, rollup_keep_days=10000)
+    assert "network_traffic_p20241121" in dropped and today not in dropped
+    assert query(conn, "SELECT count(*) FROM network_traffic") == [(0,)]
+
+    # A manutenção feita pelo bulk_loader a cada carga usa a retenção padrão
+    loader = BulkLoader(CONFIG, workers=1)
+    try:
+        dropped = loader.maintain()
+    finally:
+        loader.close()
+    assert "traffic_minute_p20241119" in dropped, dropped
+    print("Teste de retenção por partição: OK")
+
+# Rodar os testes
+connection = setup()
+try:
+    test_schema_and_migration(connection)
+    test_rollups_and_queries(connection)
+    test_retention(connection)
+finally:
+    connection.rollback()
+    with connection, connection.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    connection.close()
@@ -46,10 +46,14 @@ export default function Dashboard() {
       setPacketTimes((prevTimes) => [...prevTimes, newPacket.timestamp]);
     });
 
-    socket.on("anomalies", (newAnomaly) => {
-      setAnomalyData((prevData) => [...prevData, newAnomaly.value]);
-      setAnomalyTimes((prevTimes) => [...prevTimes, newAnomaly.timestamp]);
-    });
+    // Anomalias novas chegam por SSE (um array por evento); o EventSource
+    // reconecta sozinho e retoma a partir do último evento recebido
+    const anomalyFeed = new EventSource(`${API_BASE}/anomalies/stream`);
+    anomalyFeed.onmessage = (event) => {
+      const newAnomalies = JSON.parse(event.data);
+      setAnomalyData((prevData) => [...prevData, ...newAnomalies.map((a) => a.value)]);
+      setAnomalyTimes((prevTimes) => [...prevTimes, ...newAnomalies.map((a) => a.timestamp)]);
+    };
 
     const fetchData = async () => {
       try {
@@ -93,6 +97,7 @@ export default function Dashboard() {
 
     return () => {
       socket.disconnect();
+      anomalyFeed.close();
     };
   }, []);
 
@@ -1,3 +1,4 @@
+from datetime import datetime, timedelta
 import psycopg2
 
 # Estabelecendo a conexão
@@ -12,8 +13,10 @@ conn = psycopg2.connect(
 # Criando um cursor
 cur = conn.cursor()
 
-# Executando uma consulta SQL
-cur.execute("SELECT * FROM network_traffic;")
+# Consulta nos agregados por minuto (init_db.sql), sem varrer os pacotes:
+# hosts com mais tráfego na última hora
+end = datetime.now()
+cur.execute("SELECT * FROM top_talkers(%s, %s, %s);", (end - timedelta(hours=1), end, 10))
 
 # Obtendo os resultados
 rows = cur.fetchall()
@@ -24,4 +27,4 @@ for row in rows:
     
 # Fechando o cursor e a conexão
 cur.close()
-conn.close()
\ No newline at end of file
+conn.close()